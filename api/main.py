@@ -1,22 +1,46 @@
 import logging
 import os
-from pathlib import Path
+import time
 
-from dotenv import load_dotenv
-from fastapi import FastAPI
+from core.env import load_env
+
+dotenv_path = load_env()
+
+from fastapi import FastAPI, Request
 
 from api.db import apply_migrations
 
-from api.routers import common_backend, line_webhook, stripe, tg_prince
+from api.routers import common_backend, line_webhook, metrics, stripe, tg_prince, tg_webhook
+from core.metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
-dotenv_path = Path(
-    os.getenv("DOTENV_FILE", Path(__file__).resolve().parents[1] / ".env")
+app = FastAPI()
+
+API_REQUEST_SECONDS = REGISTRY.histogram(
+    "api_request_duration_seconds",
+    "HTTP request latency by route",
+    labelnames=("method", "route", "status"),
 )
-load_dotenv(dotenv_path, override=False)
 
-app = FastAPI()
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates, not raw paths, so the label set stays bounded.
+        route = request.scope.get("route")
+        API_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
 
 
 def _log_env_status() -> None:
@@ -39,7 +63,31 @@ def run_migrations() -> None:
     apply_migrations()
 
 
+def _telegram_webhook_enabled() -> bool:
+    return os.getenv("BOT_RUNTIME", "polling").strip().lower() == "webhook"
+
+
+@app.on_event("startup")
+async def start_telegram_webhook() -> None:
+    if not _telegram_webhook_enabled():
+        return
+    from bot.main import start_webhook_runtime
+
+    await start_webhook_runtime()
+
+
+@app.on_event("shutdown")
+async def stop_telegram_webhook() -> None:
+    if not _telegram_webhook_enabled():
+        return
+    from bot.main import stop_webhook_runtime
+
+    await stop_webhook_runtime()
+
+
 app.include_router(line_webhook.router)
 app.include_router(stripe.router)
 app.include_router(tg_prince.router)
+app.include_router(tg_webhook.router)
 app.include_router(common_backend.router)
+app.include_router(metrics.router)
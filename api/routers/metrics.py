@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import hmac
+import os
+
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from core.metrics import CONTENT_TYPE, REGISTRY, render_text
+
+router = APIRouter()
+
+
+def verify_bearer_token(expected: str, authorization: str | None) -> bool:
+    scheme, _, provided = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not provided:
+        return False
+    return hmac.compare_digest(expected.encode("utf-8"), provided.strip().encode("utf-8"))
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(authorization: str | None = Header(default=None)) -> PlainTextResponse:
+    # Webhook と同じ公開アプリに載るので、METRICS_TOKEN を設定したときだけ Bearer 認証つきで公開する。
+    token = os.getenv("METRICS_TOKEN", "").strip()
+    if not token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not verify_bearer_token(token, authorization):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return PlainTextResponse(render_text(REGISTRY), media_type=CONTENT_TYPE)
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import hmac
+import logging
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+
+from bot.webhook import SECRET_TOKEN_HEADER, WEBHOOK_PATH, ActivePool, get_update_pool
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def get_worker_pool() -> ActivePool | None:  # pragma: no cover - dependency hook
+    return get_update_pool()
+
+
+def verify_secret_token(expected: str, provided: str | None) -> bool:
+    if not provided:
+        return False
+    return hmac.compare_digest(expected.encode("utf-8"), provided.encode("utf-8"))
+
+
+@router.post(WEBHOOK_PATH)
+async def handle_telegram_update(
+    request: Request,
+    x_telegram_bot_api_secret_token: str | None = Header(default=None, alias=SECRET_TOKEN_HEADER),
+    pool: ActivePool | None = Depends(get_worker_pool),
+) -> dict[str, bool]:
+    if pool is None or not pool.running:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Telegram webhook runtime is not running",
+        )
+    secret = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+    if not secret:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="TELEGRAM_WEBHOOK_SECRET is not configured",
+        )
+    if not verify_secret_token(secret, x_telegram_bot_api_secret_token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid secret token",
+        )
+
+    try:
+        update = pool.parse_update(await request.json())
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid update"
+        ) from exc
+
+    if not pool.submit(update):
+        # A non-2xx answer makes Telegram redeliver the update later.
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Update queue is full",
+        )
+    return {"ok": True}
@@ -15,6 +15,8 @@ from openai import (
     RateLimitError,
 )
 
+from core.singleflight import SingleFlight, coalesce_key_from_env, prompt_key
+
 DEFAULT_SYSTEM_PROMPT = """あなたは「星の王子さま」の価値観を大切にする語り手です。
 - 原作の長文引用や台詞の丸写しは避け、エッセンスや心の動きを短く伝えてください。
 - 返答は日本語で、3〜8行の短め中心。深呼吸が必要なら少し長くしても構いません。
@@ -23,6 +25,12 @@ DEFAULT_SYSTEM_PROMPT = """あなたは「星の王子さま」の価値観を
 """
 
 
+# サービスは依存注入でリクエストごとに作られるので、まとめ役はモジュールで 1 つ持つ。
+PRINCE_FLIGHTS: SingleFlight[str] = SingleFlight("line_prince")
+# core.config は Telegram のトークンを必須にするので、API では同じ検証済みの読み込みを直接使う。
+LLM_COALESCE_KEY = coalesce_key_from_env()
+
+
 def _get_system_prompt() -> str:
     return os.getenv("PRINCE_SYSTEM_PROMPT", DEFAULT_SYSTEM_PROMPT)
 
@@ -30,7 +38,15 @@ def _get_system_prompt() -> str:
 class PrinceChatService:
     def __init__(self, client: OpenAI | None = None) -> None:
         api_key = os.getenv("OPENAI_API_KEY")
-        self.client = client or (OpenAI(api_key=api_key) if api_key else None)
+        self.client = client or (
+            OpenAI(
+                api_key=api_key,
+                base_url=os.getenv("OPENAI_BASE_URL", "").strip() or None,
+                timeout=float(os.getenv("OPENAI_TIMEOUT_SEC", "600")),
+            )
+            if api_key
+            else None
+        )
         self.system_prompt = _get_system_prompt()
 
     async def generate_reply(self, user_message: str) -> str:
@@ -38,7 +54,16 @@ class PrinceChatService:
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": user_message},
         )
-        return await self._call_openai(messages)
+        # 王子さまのプロンプトは固定の system とユーザーの一言だけなので、同じ一言（挨拶など）はまとめて答える。
+        key = prompt_key(
+            messages,
+            mode=LLM_COALESCE_KEY,
+            model=os.getenv("LINE_OPENAI_MODEL", "gpt-4o-mini"),
+            base_url=os.getenv("OPENAI_BASE_URL", ""),
+        )
+        if key is None or not self.client:
+            return await self._call_openai(messages)
+        return await PRINCE_FLIGHTS.do(key, lambda: self._call_openai(messages))
 
     async def _call_openai(self, messages: Iterable[dict[str, str]]) -> str:
         max_attempts = 3
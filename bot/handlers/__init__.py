@@ -1 +1,27 @@
 # flake8: noqa
+import importlib
+
+from aiogram import Router
+
+# モードごとに読み込むハンドラーモジュール。登録順がそのままマッチ順になるので、
+# テキストを何でも拾う tarot（handle_message）は最後に置く。
+# consult は tarot の catch-all から呼ばれるフローなので、ルーターは持たない。
+ROUTER_MODULES: dict[str, tuple[str, ...]] = {
+    "default": ("admin", "store", "tarot"),
+    "arisa": ("arisa",),
+}
+
+
+def build_router(mode: str) -> Router:
+    """``mode`` のハンドラーモジュールだけを import し、まとめたルーターを返す。
+
+    使わないモードのモジュールは import されないので、起動時間とメモリが減る。
+    """
+    root = Router(name=f"bot:{mode}")
+    for name in ROUTER_MODULES.get(mode, ROUTER_MODULES["default"]):
+        module = importlib.import_module(f"bot.handlers.{name}")
+        root.include_router(module.router)
+    return root
+
+
+__all__ = ["ROUTER_MODULES", "build_router"]
@@ -0,0 +1,376 @@
+import logging
+from datetime import datetime, timezone
+from typing import Sequence
+
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from bot.utils.events import safe_log_audit, safe_log_payment_event
+from bot.utils.inflight import should_process_message
+from bot.utils.state import is_admin_user, usage_today, utcnow
+from bot.utils.telegram import get_bot
+from core.db import (
+    USAGE_TIMEZONE,
+    UserRecord,
+    audit_arisa_credits,
+    ensure_user,
+    get_daily_stats,
+    get_payment_by_charge_id,
+    get_recent_feedback,
+    get_user,
+    grant_purchase,
+    mark_payment_refunded,
+    rebuild_arisa_credits,
+    revoke_purchase,
+)
+from core.monetization import effective_pass_expires_at
+from core.store.catalog import Product, get_product, iter_products
+from core.tracing import TRACER, Trace
+
+logger = logging.getLogger(__name__)
+router = Router(name="admin")
+
+
+def _build_admin_grant_summary(user: UserRecord, product: Product, now: datetime) -> str:
+    pass_until = effective_pass_expires_at(user.user_id, user, now)
+    if pass_until:
+        pass_label = pass_until.astimezone(USAGE_TIMEZONE).strftime("%Y-%m-%d %H:%M JST")
+    else:
+        pass_label = "なし"
+    ticket_line = f"3枚={user.tickets_3} / 7枚={user.tickets_7} / 10枚={user.tickets_10}"
+    lines = [
+        f"付与が完了しました。{product.title}（SKU: {product.sku}）",
+        f"対象ユーザーID: {user.user_id}",
+        f"・パス有効期限: {pass_label}",
+        f"・チケット残数: {ticket_line}",
+        f"・画像オプション: {'有効' if user.images_enabled else '無効'}",
+        "ユーザーには /status のご案内をお願いします。迷子になった場合は /menu から戻れます。",
+    ]
+    return "\n".join(lines)
+
+
+def _build_admin_revoke_summary(user: UserRecord, product: Product, now: datetime) -> str:
+    pass_until = effective_pass_expires_at(user.user_id, user, now)
+    pass_label = (
+        pass_until.astimezone(USAGE_TIMEZONE).strftime("%Y-%m-%d %H:%M JST")
+        if pass_until
+        else "なし"
+    )
+    ticket_line = f"3枚={user.tickets_3} / 7枚={user.tickets_7} / 10枚={user.tickets_10}"
+    lines = [
+        f"権限の取り消しが完了しました。{product.title}（SKU: {product.sku}）",
+        f"対象ユーザーID: {user.user_id}",
+        f"・パス有効期限: {pass_label}",
+        f"・チケット残数: {ticket_line}",
+        f"・画像オプション: {'有効' if user.images_enabled else '無効'}",
+        "ご不便をおかけしますが、ユーザーには /status で状況確認を促してください。",
+    ]
+    return "\n".join(lines)
+
+
+def _format_slow_traces(traces: Sequence[Trace]) -> str:
+    if not traces:
+        return "まだトレースがありません。"
+    blocks = []
+    for trace in traces:
+        root = trace.root
+        started = datetime.fromtimestamp(root.start_time, timezone.utc).astimezone(USAGE_TIMEZONE)
+        header = (
+            f"{started:%H:%M:%S} {root.duration_ms:.0f}ms {root.name}"
+            f" handler={root.attributes.get('handler', '-')} rid={root.attributes.get('request_id', '-')}"
+        )
+        parts = [
+            f"  {name} x{count}: {total:.0f}ms" for name, count, total in trace.breakdown()[:6]
+        ]
+        blocks.append("\n".join([header, *parts]))
+    return "🐢 Slowest recent requests\n" + "\n\n".join(blocks)
+
+
+@router.message(Command("admin"))
+async def cmd_admin(message: Message) -> None:
+    if not should_process_message(message, handler="admin"):
+        return
+
+    admin_id = message.from_user.id if message.from_user else None
+    if not is_admin_user(admin_id):
+        await message.answer("このコマンドは管理者専用です。")
+        return
+
+    parts = (message.text or "").split()
+    if len(parts) < 2:
+        valid_skus = ", ".join(product.sku for product in iter_products())
+        await message.answer(
+            "管理者メニューです。サポート中のサブコマンド:\n"
+            "・/admin grant <user_id> <SKU> : 指定ユーザーに付与します。\n"
+            "・/admin revoke <user_id> <SKU> : 指定ユーザーの権限を剥奪します。\n"
+            "・/admin feedback_recent [N] : 直近のフィードバックを確認します。\n"
+            "・/admin stats [days] : 日次の占い/相談/決済/エラー件数を確認します。\n"
+            "・/admin credits <user_id> [rebuild] : Arisaクレジット残高を台帳と照合します（rebuildで台帳から再構築）。\n"
+            "・/admin traces [N] : 直近で遅かったリクエストの内訳（DB/LLM/整形/送信）を表示します。\n"
+            f"SKU候補: {valid_skus}"
+        )
+        return
+
+    subcommand = parts[1].lower()
+    if subcommand == "feedback_recent":
+        limit = 10
+        if len(parts) >= 3:
+            try:
+                limit = max(1, min(50, int(parts[2])))
+            except ValueError:
+                await message.answer("件数は数字で指定してください。例: /admin feedback_recent 20")
+                return
+        records = get_recent_feedback(limit)
+        if not records:
+            await message.answer("まだフィードバックが登録されていません。")
+            return
+        lines = []
+        for record in records:
+            created_local = record.created_at.astimezone(USAGE_TIMEZONE).strftime("%Y-%m-%d %H:%M")
+            preview = record.text if len(record.text) <= 120 else record.text[:117] + "..."
+            lines.append(
+                f"{created_local} | uid={record.user_id} | mode={record.mode} | rid={record.request_id or '-'}\n{preview}"
+            )
+        await message.answer("直近のフィードバックです：\n" + "\n\n".join(lines))
+        return
+
+    if subcommand == "stats":
+        days = 7
+        if len(parts) >= 3:
+            try:
+                days = max(1, min(14, int(parts[2])))
+            except ValueError:
+                await message.answer("日数は数字で指定してください。例: /admin stats 7")
+                return
+        stats_rows = get_daily_stats(days=days)
+        if not stats_rows:
+            await message.answer("日次集計を取得できませんでした。")
+            return
+
+        today_jst = usage_today(utcnow()).isoformat()
+        stats_by_date = {row["date"]: row for row in stats_rows}
+        today_stats = stats_by_date.get(today_jst, stats_rows[0])
+        sorted_rows = sorted(stats_rows, key=lambda row: row["date"])
+        lines = [
+            "📊 Admin stats (JST)",
+            (
+                f"Today {today_stats['date']}: "
+                f"DAU={today_stats.get('dau', 0)} uses={today_stats.get('uses', 0)} "
+                f"⭐stars={today_stats.get('stars_sales', 0)} (tx={today_stats.get('payments', 0)}) "
+                f"tarot={today_stats.get('tarot', 0)} consult={today_stats.get('consult', 0)} errors={today_stats.get('errors', 0)}"
+            ),
+            f"---- last {days} days ----",
+        ]
+        lines.extend(
+            [
+                (
+                    f"{row['date']}: dau={row.get('dau', 0)} uses={row.get('uses', 0)} "
+                    f"stars={row.get('stars_sales', 0)} tx={row.get('payments', 0)} "
+                    f"tarot={row.get('tarot', 0)} consult={row.get('consult', 0)} errors={row.get('errors', 0)}"
+                )
+                for row in sorted_rows
+            ]
+        )
+        await message.answer("\n".join(lines))
+        return
+
+    if subcommand == "traces":
+        limit = 5
+        if len(parts) >= 3:
+            try:
+                limit = max(1, min(20, int(parts[2])))
+            except ValueError:
+                await message.answer("件数は数字で指定してください。例: /admin traces 5")
+                return
+        await message.answer(_format_slow_traces(TRACER.slowest(limit)))
+        return
+
+    if subcommand == "credits":
+        try:
+            target_user_id = int(parts[2]) if len(parts) >= 3 else None
+        except ValueError:
+            target_user_id = None
+        if target_user_id is None:
+            await message.answer("使い方: /admin credits <user_id> [rebuild]")
+            return
+        now = utcnow()
+        if get_user(target_user_id, now=now) is None:
+            await message.answer("指定されたユーザーが見つかりませんでした。")
+            return
+        rebuild = len(parts) >= 4 and parts[3].lower() == "rebuild"
+        if rebuild:
+            try:
+                rebuild_arisa_credits(target_user_id, now=now)
+            except ValueError:
+                await message.answer("台帳より前の残高があるため、このユーザーは再構築できません。")
+                return
+            safe_log_audit(
+                action="admin_credits_rebuild",
+                actor_user_id=admin_id,
+                target_user_id=target_user_id,
+                payload=message.text,
+                status="success",
+            )
+        report = audit_arisa_credits(target_user_id, now=now)
+        lines = [f"Arisaクレジット照合 uid={target_user_id}{'（再構築済み）' if rebuild else ''}"]
+        for key, values in report.items():
+            mark = "ok" if values["stored"] == values["ledger"] else "MISMATCH"
+            lines.append(f"・{key}: stored={values['stored']} ledger={values['ledger']} {mark}")
+        await message.answer("\n".join(lines))
+        return
+
+    if subcommand not in {"grant", "revoke"}:
+        await message.answer(
+            "現在サポートしているのは grant / revoke / feedback_recent / stats / credits / traces です。"
+        )
+        return
+
+    if len(parts) < 4:
+        valid_skus = ", ".join(product.sku for product in iter_products())
+        await message.answer(
+            "使い方:\n"
+            "・付与: /admin grant <user_id> <SKU>\n"
+            "・剥奪: /admin revoke <user_id> <SKU>\n"
+            "例: /admin grant 123456789 PASS_7D\n"
+            f"SKU候補: {valid_skus}"
+        )
+        return
+
+    target_raw = parts[2].strip()
+    try:
+        target_user_id = int(target_raw)
+    except ValueError:
+        await message.answer("ユーザーIDは数字でご指定ください。")
+        return
+
+    sku = parts[3].strip().upper()
+    product = get_product(sku)
+    if not product:
+        valid_skus = ", ".join(prod.sku for prod in iter_products())
+        await message.answer(f"SKUが認識できませんでした。利用可能なSKU: {valid_skus}")
+        return
+
+    if subcommand == "grant":
+        try:
+            ensure_user(target_user_id)
+            updated_user = grant_purchase(target_user_id, product.sku, now=utcnow())
+            safe_log_payment_event(
+                user_id=target_user_id,
+                event_type="admin_grant",
+                sku=product.sku,
+                payload=message.text,
+            )
+        except Exception:
+            logger.exception(
+                "Failed to grant purchase via admin",
+                extra={"admin_id": admin_id, "target_user_id": target_user_id, "sku": sku},
+            )
+            safe_log_audit(
+                action="admin_grant",
+                actor_user_id=admin_id,
+                target_user_id=target_user_id,
+                payload=message.text,
+                status="failed",
+            )
+            await message.answer("恐れ入ります、付与処理でエラーが発生しました。ログをご確認ください。")
+            return
+
+        summary = _build_admin_grant_summary(updated_user, product, utcnow())
+        safe_log_audit(
+            action="admin_grant",
+            actor_user_id=admin_id,
+            target_user_id=target_user_id,
+            payload=message.text,
+            status="success",
+        )
+        await message.answer(summary)
+        return
+
+    existing_user = get_user(target_user_id)
+    if not existing_user:
+        await message.answer(
+            "まだ登録履歴が見つかりませんでした。ユーザーが一度も利用していない可能性があります。"
+        )
+        return
+
+    try:
+        updated_user = revoke_purchase(target_user_id, product.sku, now=utcnow())
+        safe_log_payment_event(
+            user_id=target_user_id,
+            event_type="admin_revoke",
+            sku=product.sku,
+            payload=message.text,
+        )
+    except Exception:
+        logger.exception(
+            "Failed to revoke purchase via admin",
+            extra={"admin_id": admin_id, "target_user_id": target_user_id, "sku": sku},
+        )
+        safe_log_audit(
+            action="admin_revoke",
+            actor_user_id=admin_id,
+            target_user_id=target_user_id,
+            payload=message.text,
+            status="failed",
+        )
+        await message.answer("恐れ入ります、取り消し処理でエラーが発生しました。ログをご確認ください。")
+        return
+
+    summary = _build_admin_revoke_summary(updated_user, product, utcnow())
+    safe_log_audit(
+        action="admin_revoke",
+        actor_user_id=admin_id,
+        target_user_id=target_user_id,
+        payload=message.text,
+        status="success",
+    )
+    await message.answer(summary)
+
+
+@router.message(Command("refund"))
+async def cmd_refund(message: Message) -> None:
+    if not should_process_message(message, handler="refund"):
+        return
+
+    user_id = message.from_user.id if message.from_user else None
+    if not is_admin_user(user_id):
+        await message.answer("このコマンドは管理者専用です。")
+        return
+
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2 or not parts[1].strip():
+        await message.answer("使い方: /refund <telegram_payment_charge_id>")
+        return
+
+    charge_id = parts[1].strip()
+    payment = get_payment_by_charge_id(charge_id)
+    if not payment:
+        await message.answer("指定の決済が見つかりませんでした。IDをご確認ください。")
+        return
+
+    try:
+        await get_bot().refund_star_payment(
+            user_id=payment.user_id,
+            telegram_payment_charge_id=charge_id,
+        )
+    except Exception:
+        logger.exception("Failed to refund payment %s", charge_id)
+        await message.answer("返金処理に失敗しました。ログを確認してください。")
+        return
+
+    updated = mark_payment_refunded(charge_id)
+    safe_log_payment_event(
+        user_id=payment.user_id,
+        event_type="refund",
+        sku=payment.sku,
+        payload=charge_id,
+    )
+    status_line = f"status={updated.status}" if updated else "status=refunded"
+    await message.answer(
+        "返金処理が完了しました。\n"
+        f"ユーザーID: {payment.user_id}\n"
+        f"SKU: {payment.sku}\n"
+        f"決済ID: {charge_id}\n"
+        f"{status_line}"
+    )
@@ -0,0 +1,1042 @@
+import json
+import logging
+import math
+import random
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandStart
+from aiogram.fsm.context import FSMContext
+from aiogram.types import (
+    CallbackQuery,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    LabeledPrice,
+    Message,
+    PreCheckoutQuery,
+)
+
+from bot.keyboards.common import arisa_menu_kb, build_charge_retry_keyboard, build_lang_keyboard
+from bot.texts.i18n import normalize_lang, t
+from bot.utils.events import preview_text, safe_log_app_event, safe_log_payment_event
+from bot.utils.inflight import (
+    Superseded,
+    acquire_inflight,
+    record_superseded_refund,
+    run_supersedable,
+    should_process_message,
+)
+from bot.utils.language import (
+    VARIATION_SELECTOR_RE,
+    is_language_reply_button,
+    normalize_language_button_base,
+)
+from bot.utils.llm import call_openai_with_retry_and_usage, fit_user_input
+from bot.utils.menus import build_arisa_menu
+from bot.utils.payments import (
+    PAYWALL_BLOCKS,
+    build_store_keyboard,
+    check_purchase_dedup,
+    get_product_description,
+    get_product_title,
+    is_arisa_product,
+    parse_invoice_payload,
+    safe_answer_pre_checkout,
+    send_store_menu,
+)
+from bot.utils.state import (
+    SUPPORTED_LANGS,
+    get_user_lang_or_default,
+    is_admin_user,
+    mark_user_active,
+    reset_state_for_explicit_command,
+    resolve_user_lang,
+    set_user_mode,
+    store_user_lang,
+    usage_today,
+    utcnow,
+)
+from bot.utils.telegram import (
+    get_bot,
+    handle_stale_interaction,
+    is_stale_query_error,
+    safe_answer_callback,
+)
+from bot.utils.themes import build_help_text
+from core.config import (
+    ARISA_MAX_TOKENS,
+    ONE_MESSAGE_TOKENS,
+    PASS_30D_DAILY_LIMIT,
+    PASS_7D_DAILY_LIMIT,
+    TRIAL_FREE_CREDITS,
+)
+from core.db import (
+    USAGE_TIMEZONE,
+    ArisaLedgerEntry,
+    UserRecord,
+    ensure_user,
+    grant_arisa_credits,
+    has_app_event,
+    has_payment_event,
+    log_payment,
+    release_arisa_reservation,
+    reserve_arisa_credits,
+    settle_arisa_reservation,
+    update_arisa_pass,
+)
+from core.logging import request_id_var
+from core.monetization import get_user_with_default
+from core.prompts import get_character_boundary_lines, get_consult_system_prompt
+from core.store.catalog import Product, get_product
+from core.tokens import estimate_messages_tokens
+
+logger = logging.getLogger(__name__)
+router = Router(name="arisa")
+
+
+ARISA_BLOCKED_COMMANDS = {
+    "read1",
+    "love1",
+    "buy",
+    "terms",
+    "support",
+    "paysupport",
+    "refund",
+    "admin",
+}
+ARISA_ALLOWED_COMMANDS = {
+    "/start",
+    "/help",
+    "/language",
+    "/lang",
+    "/status",
+    "/store",
+}
+ARISA_TAROT_KEYWORDS = (
+    "占い",
+    "タロット",
+    "チャージ",
+    "課金",
+    "決済",
+    "購入",
+    "買う",
+    "read1",
+    "love1",
+    "tarot",
+    "charge",
+    "status",
+    "buy",
+    "payment",
+)
+ARISA_CREDIT_PACKS: dict[str, int] = {
+    "ARISA_CREDIT_100": 15,
+    "ARISA_CREDIT_300": 50,
+    "ARISA_CREDIT_500": 100,
+}
+ARISA_FIRST_100_BONUS = 15
+ARISA_PASS_PRODUCTS: dict[str, dict[str, int]] = {
+    "ARISA_PASS_7D": {"days": 7, "daily_limit": PASS_7D_DAILY_LIMIT},
+    "ARISA_PASS_30D": {"days": 30, "daily_limit": PASS_30D_DAILY_LIMIT},
+}
+ARISA_MENU_ACTION_ALIASES = {
+    "love": ("love", "恋愛", "amor"),
+    "sexy": ("sexy", "セクシー"),
+    "store": ("store", "charge", "チャージ", "ストア", "loja"),
+    "status": ("status", "ステータス", "estado"),
+    "language": ("language", "lang", "言語設定", "言語", "idioma"),
+}
+
+
+def build_arisa_messages(
+    user_query: str,
+    *,
+    lang: str | None = "ja",
+    paid: bool = False,
+    first_paid_turn: bool = False,
+) -> list[dict[str, str]]:
+    """Arisaモードの system prompt を組み立てる。
+
+    キャラクター本文は全リクエストで同一の先頭 system メッセージに置き、
+    MODE などの内部フラグは後続の system メッセージで渡す。
+    """
+    lang_code = normalize_lang(lang)
+    system_prompt = get_consult_system_prompt(lang_code)
+    boundary_lines = get_character_boundary_lines()
+    internal_flags = (
+        f'MODE: "{ "PAID" if paid else "FREE" }"\n'
+        f'FIRST_PAID_TURN: "{ "true" if first_paid_turn else "false" }"\n'
+        f'LANG: "{lang_code}"'
+    )
+    parts = [system_prompt]
+    if boundary_lines:
+        parts.append(boundary_lines.strip())
+    return [
+        {"role": "system", "content": "\n\n".join(parts)},
+        {"role": "system", "content": internal_flags},
+        {"role": "user", "content": user_query},
+    ]
+
+
+def _normalize_arisa_action_text(text: str) -> str:
+    if not text:
+        return ""
+    normalized = normalize_language_button_base(text)
+    normalized = VARIATION_SELECTOR_RE.sub("", normalized)
+    normalized = "".join(
+        ch for ch in normalized if unicodedata.category(ch) != "So"
+    )
+    normalized = re.sub(r"\s+", "", normalized)
+    return normalized.strip().casefold()
+
+
+def _resolve_arisa_menu_action(text: str, lang: str | None) -> str | None:
+    token = _normalize_arisa_action_text(text)
+    if not token:
+        return None
+    menu_labels = _get_arisa_menu_labels(lang)
+    candidates_map = {
+        "love": (menu_labels["love"], *ARISA_MENU_ACTION_ALIASES["love"]),
+        "sexy": (menu_labels["sexy"], *ARISA_MENU_ACTION_ALIASES["sexy"]),
+        "store": (menu_labels["charge"], *ARISA_MENU_ACTION_ALIASES["store"]),
+        "status": (menu_labels["status"], *ARISA_MENU_ACTION_ALIASES["status"]),
+        "language": (menu_labels["language"], *ARISA_MENU_ACTION_ALIASES["language"]),
+    }
+    for action, candidates in candidates_map.items():
+        normalized_candidates = {
+            _normalize_arisa_action_text(candidate)
+            for candidate in candidates
+            if candidate
+        }
+        if token in normalized_candidates:
+            return action
+    return None
+
+
+def _get_arisa_menu_labels(lang: str | None) -> dict[str, str]:
+    lang_code = normalize_lang(lang)
+    return {
+        "love": t(lang_code, "ARISA_MENU_LOVE_LABEL"),
+        "sexy": t(lang_code, "ARISA_MENU_SEXY_LABEL"),
+        "charge": t(lang_code, "MENU_STORE_LABEL"),
+        "status": t(lang_code, "MENU_STATUS_LABEL"),
+        "language": t(lang_code, "MENU_LANGUAGE_LABEL"),
+    }
+
+
+async def prompt_arisa_charge_menu(message: Message) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    set_user_mode(user_id, "charge")
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(t(lang, "CHARGE_MODE_PROMPT"), reply_markup=build_arisa_menu(user_id))
+    await send_store_menu(message)
+
+
+async def prompt_arisa_status(message: Message, *, now: datetime) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    set_user_mode(user_id, "status")
+    mark_user_active(user_id, now=now)
+    lang = get_user_lang_or_default(user_id)
+    if user_id is None:
+        await message.answer(
+            t(lang, "USER_INFO_DM_REQUIRED"),
+            reply_markup=build_arisa_menu(user_id),
+        )
+        return
+    ensure_arisa_trial(user_id, now=now)
+    admin_user = ensure_arisa_admin_pass(user_id, now=now)
+    user = admin_user or get_user_with_default(user_id, now=now) or ensure_user(user_id, now=now)
+    await message.answer(
+        format_arisa_status(user, now=now, lang=lang),
+        reply_markup=build_arisa_menu(user_id),
+    )
+
+
+def get_arisa_start_text(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    return t(lang_code, "ARISA_START_TEXT")
+
+
+def _get_arisa_prompt_variants(prompt_key: str, lang: str | None) -> list[str]:
+    lang_code = normalize_lang(lang)
+    variants = t(lang_code, prompt_key)
+    if isinstance(variants, (list, tuple)) and variants:
+        return [str(item) for item in variants if str(item).strip()]
+    if isinstance(variants, str) and variants.strip():
+        return [variants]
+    return []
+
+
+def get_arisa_prompt(prompt_key: str, fallback_key: str, lang: str | None = "ja") -> str:
+    variants = _get_arisa_prompt_variants(prompt_key, lang)
+    if not variants:
+        fallback = t(normalize_lang(lang), fallback_key)
+        return fallback if isinstance(fallback, str) else ""
+    return random.choice(variants)
+
+
+def _arisa_pass_label(
+    user: UserRecord,
+    *,
+    now: datetime,
+    lang: str | None = "ja",
+    is_admin: bool = False,
+) -> str:
+    if not user.arisa_pass_until:
+        return t(lang, "ARISA_STATUS_PASS_NONE")
+    if is_admin:
+        return t(lang, "ARISA_STATUS_PASS_TESTER")
+    pass_until = user.arisa_pass_until.astimezone(USAGE_TIMEZONE).strftime(
+        "%Y-%m-%d %H:%M JST"
+    )
+    label = pass_until
+    if user.arisa_pass_daily_limit == PASS_7D_DAILY_LIMIT:
+        product = get_product("ARISA_PASS_7D")
+        if product:
+            label = f"{get_product_title(product, normalize_lang(lang))} / {pass_until}"
+    elif user.arisa_pass_daily_limit == PASS_30D_DAILY_LIMIT:
+        product = get_product("ARISA_PASS_30D")
+        if product:
+            label = f"{get_product_title(product, normalize_lang(lang))} / {pass_until}"
+    return label
+
+
+def _arisa_pass_remaining(user: UserRecord, *, now: datetime) -> int:
+    if not user.arisa_pass_until or user.arisa_pass_until <= now:
+        return 0
+    used_today = user.arisa_pass_used_today
+    if user.arisa_pass_usage_date != usage_today(now):
+        used_today = 0
+    pass_limit = user.arisa_pass_daily_limit or 0
+    return max(pass_limit - used_today, 0)
+
+
+def is_arisa_paid_user(
+    user_id: int, *, user: UserRecord | None = None, now: datetime | None = None
+) -> bool:
+    now = now or utcnow()
+    if is_admin_user(user_id):
+        return True
+    if user is None:
+        user = get_user_with_default(user_id, now=now)
+    if user and user.arisa_pass_until and user.arisa_pass_until > now:
+        return True
+    return has_payment_event(
+        user_id=user_id, event_type="successful_payment", sku_prefix="ARISA_"
+    )
+
+
+def ensure_arisa_trial(user_id: int, *, now: datetime | None = None) -> None:
+    if TRIAL_FREE_CREDITS <= 0:
+        return
+    now = now or utcnow()
+    if has_app_event(user_id=user_id, event_type="arisa_trial_granted"):
+        return
+    grant_arisa_credits(
+        user_id, source="trial", credits=TRIAL_FREE_CREDITS, now=now, request_id=request_id_var.get("-")
+    )
+    safe_log_app_event(
+        event_type="arisa_trial_granted",
+        user_id=user_id,
+        payload=json.dumps({"credits": TRIAL_FREE_CREDITS}),
+    )
+
+
+def ensure_arisa_admin_pass(
+    user_id: int, *, now: datetime | None = None
+) -> UserRecord | None:
+    if not is_admin_user(user_id):
+        return None
+    now = now or utcnow()
+    user = get_user_with_default(user_id, now=now) or ensure_user(user_id, now=now)
+    pass_active = bool(user.arisa_pass_until and user.arisa_pass_until > now)
+    pass_matches = pass_active and user.arisa_pass_daily_limit == PASS_30D_DAILY_LIMIT
+    if pass_matches:
+        return user
+    return update_arisa_pass(
+        user_id,
+        pass_until=now + timedelta(days=30),
+        daily_limit=PASS_30D_DAILY_LIMIT,
+        now=now,
+    )
+
+
+def _arisa_credits_used(total_tokens: int | None) -> int:
+    if not total_tokens or total_tokens <= 0:
+        return 1
+    return max(1, math.ceil(total_tokens / ONE_MESSAGE_TOKENS))
+
+
+def _arisa_available_credits(user: UserRecord, *, now: datetime) -> int:
+    return (
+        _arisa_pass_remaining(user, now=now)
+        + user.arisa_credits
+        + user.arisa_trial_remaining
+    )
+
+
+def _arisa_reservation_credits(prompt_tokens: int) -> int:
+    """呼び出し前に確保するクレジット。推定プロンプト分と返信の上限分を見込む。
+
+    残高がこれより少なければ残高分だけを確保する（``reserve_arisa_credits(partial=True)``）。
+    実際の消費は応答の ``usage`` で精算し、足りない分は従来どおり shortfall として記録する。
+    """
+    return _arisa_credits_used(prompt_tokens + (ARISA_MAX_TOKENS or ONE_MESSAGE_TOKENS))
+
+
+def _ledger_sources(entry: ArisaLedgerEntry) -> dict[str, int]:
+    sources = {
+        "pass": entry.pass_credits,
+        "ticket": entry.ticket_credits,
+        "trial": entry.trial_credits,
+    }
+    return {source: amount for source, amount in sources.items() if amount > 0}
+
+
+def _extend_arisa_pass(user: UserRecord, *, days: int, now: datetime) -> datetime:
+    base = user.arisa_pass_until if user.arisa_pass_until and user.arisa_pass_until > now else now
+    return base + timedelta(days=days)
+
+
+def format_arisa_status(
+    user: UserRecord, *, now: datetime | None = None, lang: str | None = "ja"
+) -> str:
+    now = now or utcnow()
+    lang_code = normalize_lang(lang)
+    admin_mode = is_admin_user(user.user_id)
+    pass_active = bool(user.arisa_pass_until and user.arisa_pass_until > now)
+    remaining_today = _arisa_pass_remaining(user, now=now) if pass_active else 0
+    paid_user = is_arisa_paid_user(user.user_id, user=user, now=now)
+    lines = [
+        t(lang_code, "ARISA_STATUS_TITLE"),
+        t(lang_code, "ARISA_STATUS_CREDITS_LINE", credits=user.arisa_credits),
+    ]
+    if user.arisa_trial_remaining > 0 and not pass_active:
+        lines.append(
+            t(lang_code, "ARISA_STATUS_TRIAL_LINE", trial=user.arisa_trial_remaining)
+        )
+    if pass_active:
+        lines.append(
+            t(
+                lang_code,
+                "ARISA_STATUS_PASS_ACTIVE",
+                pass_label=_arisa_pass_label(
+                    user, now=now, lang=lang_code, is_admin=admin_mode
+                ),
+                remaining=remaining_today,
+            )
+        )
+    else:
+        lines.append(t(lang_code, "ARISA_STATUS_PASS_NONE"))
+    lines.append(
+        t(
+            lang_code,
+            "ARISA_STATUS_SEXY_UNLOCKED" if paid_user else "ARISA_STATUS_SEXY_LOCKED",
+        )
+    )
+    lines.append(
+        t(
+            lang_code,
+            "ARISA_STATUS_NOTE_TOKENS",
+            tokens=ONE_MESSAGE_TOKENS,
+        )
+    )
+    return "\n".join(lines)
+
+
+def build_arisa_purchase_followup_keyboard(
+    lang: str | None = "ja",
+) -> InlineKeyboardMarkup:
+    lang_code = normalize_lang(lang)
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=t(lang_code, "VIEW_STATUS_BUTTON"), callback_data="nav:status")],
+            [InlineKeyboardButton(text=t(lang_code, "GO_TO_STORE_BUTTON"), callback_data="nav:charge")],
+        ]
+    )
+
+
+def _grant_arisa_product(
+    user_id: int, product: Product, *, now: datetime
+) -> tuple[UserRecord, dict[str, int]]:
+    ensure_user(user_id, now=now)
+    user = get_user_with_default(user_id, now=now) or ensure_user(user_id, now=now)
+    summary: dict[str, int] = {}
+    if product.sku in ARISA_CREDIT_PACKS:
+        credits = ARISA_CREDIT_PACKS[product.sku]
+        bonus = 0
+        if product.sku == "ARISA_CREDIT_100" and not has_payment_event(
+            user_id=user_id,
+            event_type="first_100_bonus_granted",
+            sku_prefix="ARISA_CREDIT_100",
+        ):
+            bonus = ARISA_FIRST_100_BONUS
+            safe_log_payment_event(
+                user_id=user_id,
+                event_type="first_100_bonus_granted",
+                sku=product.sku,
+                payload=str(bonus),
+            )
+        grant_arisa_credits(
+            user_id,
+            source="ticket",
+            credits=credits + bonus,
+            now=now,
+            request_id=request_id_var.get("-"),
+        )
+        summary = {"credits": credits, "bonus": bonus}
+    elif product.sku in ARISA_PASS_PRODUCTS:
+        pass_info = ARISA_PASS_PRODUCTS[product.sku]
+        new_until = _extend_arisa_pass(user, days=pass_info["days"], now=now)
+        update_arisa_pass(
+            user_id,
+            pass_until=new_until,
+            daily_limit=pass_info["daily_limit"],
+            now=now,
+        )
+        summary = {
+            "days": pass_info["days"],
+            "daily_limit": pass_info["daily_limit"],
+        }
+    else:
+        raise ValueError(f"Unsupported Arisa SKU: {product.sku}")
+    updated = get_user_with_default(user_id, now=now) or ensure_user(user_id, now=now)
+    return updated, summary
+
+
+def _is_arisa_tarot_trigger(text: str) -> bool:
+    lowered = text.strip().lower()
+    return any(keyword in lowered for keyword in ARISA_TAROT_KEYWORDS)
+
+
+def _arisa_block_notice(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    return t(lang_code, "ARISA_BLOCK_NOTICE")
+
+
+def _extract_command_token(text: str | None) -> str | None:
+    if not text:
+        return None
+    stripped = text.strip()
+    if not stripped.startswith("/"):
+        return None
+    token = stripped.split(maxsplit=1)[0]
+    if "@" in token:
+        token = token.split("@", maxsplit=1)[0]
+    return token.lower()
+
+
+def _is_arisa_blockable_command(text: str | None) -> bool:
+    token = _extract_command_token(text)
+    return token is not None and token not in ARISA_ALLOWED_COMMANDS
+
+
+async def handle_arisa_chat(message: Message, user_query: str) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    total_start = perf_counter()
+    openai_latency_ms: float | None = None
+    event_success = False
+    token_usage: int | None = None
+    credits_used = 0
+    credit_sources: dict[str, int] = {}
+    credit_shortfall = 0
+    reservation: ArisaLedgerEntry | None = None
+    now = utcnow()
+
+    if user_id is None:
+        await message.answer(t("ja", "USER_INFO_MISSING"))
+        return
+    try:
+        ensure_user(user_id, now=now)
+        ensure_arisa_trial(user_id, now=now)
+        admin_user = ensure_arisa_admin_pass(user_id, now=now)
+        user = admin_user or get_user_with_default(user_id, now=now) or ensure_user(user_id, now=now)
+    except Exception:
+        logger.exception("Failed to load Arisa user")
+        await message.answer(
+            t(lang, "ARISA_USER_LOAD_ERROR"), reply_markup=build_arisa_menu(user_id)
+        )
+        return
+    if _arisa_available_credits(user, now=now) <= 0:
+        PAYWALL_BLOCKS.inc(mode="arisa", reason="no_credits")
+        await message.answer(
+            t(lang, "ARISA_OUT_OF_CREDITS"),
+            reply_markup=build_store_keyboard(lang=lang),
+        )
+        return
+    paid_user = is_arisa_paid_user(user_id, user=user, now=now)
+
+    prompt_start = perf_counter()
+    arisa_messages = build_arisa_messages(
+        fit_user_input(user_query, lang=lang, mode="arisa", user_id=user_id),
+        lang=lang,
+        paid=paid_user,
+    )
+    prompt_build_ms = (perf_counter() - prompt_start) * 1000
+
+    logger.info(
+        "Handling Arisa message",
+        extra={
+            "mode": "arisa",
+            "user_id": user_id,
+            "text_preview": preview_text(user_query),
+            "max_tokens": ARISA_MAX_TOKENS or None,
+        },
+    )
+
+    try:
+        release_inflight = await acquire_inflight(
+            user_id, message, busy_message="少し待ってね。すぐ返すよ。", lang=lang, mode="arisa"
+        )
+    except Superseded:
+        return
+
+    try:
+        # 先にクレジットを確保しておき、同時に届いたメッセージで二重消費しないようにする。
+        # 残高はロック前に読んだ値ではなく、確保のトランザクション内で読んだものを使う。
+        reservation = reserve_arisa_credits(
+            user_id,
+            credits=_arisa_reservation_credits(estimate_messages_tokens(arisa_messages, lang)),
+            partial=True,
+            now=now,
+            request_id=request_id_var.get("-"),
+        )
+        if reservation is None:
+            PAYWALL_BLOCKS.inc(mode="arisa", reason="reservation_failed")
+            await message.answer(
+                t(lang, "ARISA_OUT_OF_CREDITS"),
+                reply_markup=build_store_keyboard(lang=lang),
+            )
+            return
+        openai_start = perf_counter()
+        answer, fatal, token_usage = await run_supersedable(
+            user_id,
+            "arisa",
+            call_openai_with_retry_and_usage(arisa_messages, lang=lang, max_tokens=ARISA_MAX_TOKENS or None),
+        )
+        openai_latency_ms = (perf_counter() - openai_start) * 1000
+        if fatal:
+            await message.answer(
+                "ごめんね、今うまく返せないみたい。少し待ってもう一度送って。",
+                reply_markup=build_arisa_menu(user_id),
+            )
+            return
+        credits_used = _arisa_credits_used(token_usage)
+        settled = settle_arisa_reservation(reservation.id, used_credits=credits_used, now=now)
+        reservation = None
+        credit_sources = _ledger_sources(settled)
+        credit_shortfall = settled.shortfall
+        await message.answer(answer, reply_markup=build_arisa_menu(user_id))
+        event_success = True
+    except Superseded:
+        # 確保したクレジットは下の finally で解放される。
+        if reservation is not None:
+            record_superseded_refund("arisa", "credits", reservation.reserved_credits)
+    except Exception:
+        logger.exception("Unexpected error during Arisa chat")
+        await message.answer(
+            "すみません、今ちょっと調子が悪いみたいです…\n少し時間をおいてから、もう一度話しかけてください。",
+            reply_markup=build_arisa_menu(user_id),
+        )
+    finally:
+        if reservation is not None:
+            try:
+                release_arisa_reservation(reservation.id)
+            except Exception:
+                logger.exception(
+                    "Failed to release Arisa credit reservation",
+                    extra={"user_id": user_id, "reservation_id": reservation.id},
+                )
+        total_ms = (perf_counter() - total_start) * 1000
+        logger.info(
+            "Arisa handler finished",
+            extra={
+                "mode": "arisa",
+                "user_id": user_id,
+                "message_id": getattr(message, "message_id", None),
+                "prompt_build_ms": round(prompt_build_ms or 0, 3),
+                "openai_latency_ms": round(openai_latency_ms or 0, 2),
+                "total_handler_ms": round(total_ms, 2),
+            },
+        )
+        if event_success:
+            safe_log_app_event(
+                event_type="arisa_usage",
+                user_id=user_id,
+                payload=json.dumps(
+                    {
+                        "mode": "arisa",
+                        "total_tokens": token_usage,
+                        "credits_used": credits_used,
+                        "sources": credit_sources,
+                        "shortfall": credit_shortfall,
+                    }
+                ),
+            )
+        release_inflight()
+
+
+@router.message(CommandStart())
+async def arisa_start(message: Message) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    mark_user_active(user_id)
+    if user_id is not None:
+        ensure_user(user_id)
+        ensure_arisa_trial(user_id)
+    lang, is_persisted = resolve_user_lang(message)
+    start_text = get_arisa_start_text(lang=lang)
+    if not is_persisted:
+        prompt = f"{t(lang, 'LANGUAGE_SELECT_PROMPT')}\n\n{start_text}"
+        await message.answer(prompt, reply_markup=build_lang_keyboard(lang=lang))
+        return
+    await message.answer(start_text, reply_markup=build_arisa_menu(user_id))
+
+
+@router.message(Command("help"))
+async def arisa_help(message: Message) -> None:
+    if not should_process_message(message, handler="arisa_help"):
+        return
+
+    user_id = message.from_user.id if message.from_user else None
+    reset_state_for_explicit_command(user_id)
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(build_help_text(lang=lang), reply_markup=build_arisa_menu(user_id))
+
+
+@router.message(Command("lang", "language"))
+async def arisa_cmd_lang(message: Message, *, skip_dedup: bool = False) -> None:
+    if not skip_dedup and not should_process_message(message, handler="lang"):
+        return
+    user_id = message.from_user.id if message.from_user else None
+    if user_id is None:
+        await message.answer(t("ja", "USER_INFO_MISSING"))
+        return
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(
+        t(lang, "LANGUAGE_SELECT_PROMPT"),
+        reply_markup=build_lang_keyboard(lang=lang),
+    )
+
+
+@router.message(Command("store"))
+async def arisa_cmd_store(message: Message) -> None:
+    if not should_process_message(message, handler="arisa_store"):
+        return
+    reset_state_for_explicit_command(message.from_user.id if message.from_user else None)
+    await prompt_arisa_charge_menu(message)
+
+
+@router.message(Command("status"))
+async def arisa_cmd_status(message: Message) -> None:
+    if not should_process_message(message, handler="arisa_status"):
+        return
+    reset_state_for_explicit_command(message.from_user.id if message.from_user else None)
+    now = utcnow()
+    await prompt_arisa_status(message, now=now)
+
+
+@router.callback_query(F.data.startswith("lang:set:"))
+async def arisa_handle_lang_set(query: CallbackQuery) -> None:
+    await safe_answer_callback(query, cache_time=1)
+    data = query.data or ""
+    lang_code = data.split(":", maxsplit=2)[-1] if ":" in data else None
+    normalized = normalize_lang(lang_code) if lang_code else None
+    user_id = query.from_user.id if query.from_user else None
+
+    if normalized not in SUPPORTED_LANGS or user_id is None:
+        if query.message:
+            await query.message.answer(t("ja", "LANGUAGE_SET_FAILED"))
+        return
+
+    store_user_lang(user_id, normalized)
+    mark_user_active(user_id)
+    lang_label_map = {
+        "ja": t("ja", "LANGUAGE_OPTION_JA"),
+        "en": t("en", "LANGUAGE_OPTION_EN"),
+        "pt": t("pt", "LANGUAGE_OPTION_PT"),
+    }
+    lang_label = lang_label_map.get(normalized, normalized)
+    confirmation = t(normalized, "LANGUAGE_SET_CONFIRMATION", language=lang_label)
+    reply_markup = arisa_menu_kb(lang=normalized)
+    start_text = get_arisa_start_text(lang=normalized)
+    if query.message:
+        await query.message.answer(confirmation, reply_markup=reply_markup)
+        await query.message.answer(start_text, reply_markup=reply_markup)
+    else:
+        await get_bot().send_message(user_id, confirmation, reply_markup=reply_markup)
+        await get_bot().send_message(user_id, start_text, reply_markup=reply_markup)
+
+
+@router.callback_query(F.data == "nav:status")
+async def arisa_handle_nav_status(query: CallbackQuery, state: FSMContext) -> None:
+    await safe_answer_callback(query, cache_time=1)
+    user_id = query.from_user.id if query.from_user else None
+    if user_id is None:
+        return
+    now = utcnow()
+    ensure_arisa_trial(user_id, now=now)
+    set_user_mode(user_id, "status")
+    mark_user_active(user_id, now=now)
+    await state.clear()
+    admin_user = ensure_arisa_admin_pass(user_id, now=now)
+    user = admin_user or get_user_with_default(user_id, now=now) or ensure_user(user_id, now=now)
+    formatted = format_arisa_status(user, now=now, lang=get_user_lang_or_default(user_id))
+    if query.message:
+        await query.message.answer(formatted, reply_markup=build_arisa_menu(user_id))
+
+
+@router.callback_query(F.data == "nav:charge")
+async def arisa_handle_nav_charge(query: CallbackQuery, state: FSMContext) -> None:
+    await safe_answer_callback(query, cache_time=1)
+    user_id = query.from_user.id if query.from_user else None
+    if user_id is None:
+        return
+    set_user_mode(user_id, "charge")
+    mark_user_active(user_id)
+    await state.clear()
+    if query.message:
+        lang = get_user_lang_or_default(user_id)
+        await query.message.answer(
+            t(lang, "CHARGE_MODE_PROMPT"), reply_markup=build_arisa_menu(user_id)
+        )
+        await send_store_menu(query.message)
+
+
+@router.callback_query(F.data.startswith("buy:"))
+async def arisa_handle_buy(query: CallbackQuery) -> None:
+    await safe_answer_callback(query, cache_time=1)
+    data = query.data or ""
+    _, _, sku = data.partition(":")
+    product = get_product(sku) if sku else None
+    user_id = query.from_user.id if query.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    if not product or not is_arisa_product(product) or user_id is None:
+        safe_log_payment_event(
+            user_id=user_id,
+            event_type="buy_invalid_product",
+            sku=sku if sku else None,
+            payload=data,
+        )
+        await safe_answer_callback(query, t(lang, "PRODUCT_INFO_MISSING"), show_alert=True)
+        return
+
+    if check_purchase_dedup(user_id, product.sku):
+        safe_log_payment_event(
+            user_id=user_id, event_type="buy_dedup_hit", sku=product.sku, payload=query.data
+        )
+        await safe_answer_callback(
+            query,
+            t(lang, "PURCHASE_DEDUP_ALERT"),
+            show_alert=True,
+        )
+        if query.message:
+            await query.message.answer(
+                t(lang, "PURCHASE_DEDUP_MESSAGE"),
+                reply_markup=build_arisa_menu(user_id),
+            )
+        return
+
+    payload = json.dumps({"sku": product.sku, "user_id": user_id})
+    title_localized = get_product_title(product, lang)
+    description_localized = get_product_description(product, lang)
+    prices = [LabeledPrice(label=title_localized, amount=product.price_stars)]
+
+    if query.message:
+        try:
+            await query.message.answer_invoice(
+                title=title_localized,
+                description=description_localized,
+                payload=payload,
+                provider_token="",
+                currency="XTR",
+                prices=prices,
+            )
+        except TelegramBadRequest as exc:
+            if is_stale_query_error(exc):
+                await handle_stale_interaction(
+                    query, user_id=user_id, sku=product.sku, payload=query.data
+                )
+                return
+            logger.exception(
+                "Failed to send invoice",
+                extra={"user_id": user_id, "sku": product.sku, "error": str(exc)},
+            )
+            await query.message.answer(
+                t(lang, "INVOICE_DISPLAY_FAILED"),
+                reply_markup=build_charge_retry_keyboard(lang),
+            )
+            return
+    await safe_answer_callback(query, t(lang, "OPENING_PAYMENT_SCREEN"))
+
+
+@router.pre_checkout_query()
+async def arisa_process_pre_checkout(pre_checkout_query: PreCheckoutQuery):
+    sku, payload_user_id = parse_invoice_payload(pre_checkout_query.invoice_payload or "")
+    product = get_product(sku) if sku else None
+    user_id = pre_checkout_query.from_user.id if pre_checkout_query.from_user else None
+    log_user_id = user_id or payload_user_id
+    lang = get_user_lang_or_default(log_user_id)
+    if not product or not is_arisa_product(product):
+        safe_log_payment_event(
+            user_id=log_user_id,
+            event_type="pre_checkout_invalid_product",
+            sku=sku if sku else None,
+            payload=pre_checkout_query.invoice_payload,
+        )
+        logger.warning(
+            "Pre-checkout received without product",
+            extra={"payload": pre_checkout_query.invoice_payload},
+        )
+        await safe_answer_pre_checkout(
+            pre_checkout_query,
+            ok=False,
+            error_message=t(lang, "PRODUCT_INFO_MISSING"),
+        )
+        return
+    if payload_user_id is None or user_id is None or payload_user_id != user_id:
+        safe_log_payment_event(
+            user_id=log_user_id,
+            event_type="pre_checkout_rejected",
+            sku=product.sku,
+            payload=pre_checkout_query.invoice_payload,
+        )
+        await safe_answer_pre_checkout(
+            pre_checkout_query,
+            ok=False,
+            error_message=t(lang, "PURCHASER_INFO_MISSING"),
+        )
+        return
+
+    ensure_user(user_id)
+    safe_log_payment_event(
+        user_id=user_id,
+        event_type="pre_checkout",
+        sku=product.sku,
+        payload=pre_checkout_query.invoice_payload,
+    )
+    await safe_answer_pre_checkout(pre_checkout_query, ok=True)
+
+
+@router.message(F.successful_payment)
+async def arisa_process_successful_payment(message: Message):
+    payment = message.successful_payment
+    sku, payload_user_id = parse_invoice_payload(payment.invoice_payload or "")
+    product = get_product(sku) if sku else None
+    user_id_message = message.from_user.id if message.from_user else None
+    user_id = payload_user_id if payload_user_id is not None else user_id_message
+    lang = get_user_lang_or_default(user_id)
+    lang_code = normalize_lang(lang)
+    if user_id_message is not None and user_id is not None and user_id != user_id_message:
+        await message.answer(
+            t(lang_code, "PAYMENT_INFO_MISMATCH")
+        )
+        return
+
+    if not product or not is_arisa_product(product) or user_id is None:
+        await message.answer(
+            t(lang_code, "PAYMENT_VERIFICATION_DELAY")
+        )
+        return
+
+    ensure_user(user_id)
+    _, created = log_payment(
+        user_id=user_id,
+        sku=product.sku,
+        stars=payment.total_amount,
+        telegram_payment_charge_id=payment.telegram_payment_charge_id,
+        provider_payment_charge_id=payment.provider_payment_charge_id,
+    )
+    safe_log_payment_event(
+        user_id=user_id,
+        event_type="successful_payment" if created else "successful_payment_duplicate",
+        sku=product.sku,
+        payload=payment.telegram_payment_charge_id,
+    )
+    if not created:
+        await message.answer(
+            t(lang_code, "PAYMENT_ALREADY_PROCESSED"),
+            reply_markup=build_arisa_purchase_followup_keyboard(lang=lang_code),
+        )
+        return
+    now = utcnow()
+    _grant_arisa_product(user_id, product, now=now)
+    title_localized = get_product_title(product, lang_code)
+    thank_you_lines = [
+        t(lang_code, "PURCHASE_THANK_YOU", product=title_localized),
+        t(lang_code, "PURCHASE_STATUS_REMINDER"),
+        t(lang_code, "ARISA_PURCHASE_NAVIGATION_HINT"),
+    ]
+    await message.answer(
+        "\n".join(thank_you_lines),
+        reply_markup=build_arisa_purchase_followup_keyboard(lang=lang_code),
+    )
+
+
+@router.message(Command(commands=sorted(ARISA_BLOCKED_COMMANDS)))
+async def arisa_blocked_command(message: Message) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(_arisa_block_notice(lang), reply_markup=build_arisa_menu(user_id))
+
+
+@router.message(F.text.func(_is_arisa_blockable_command))
+async def arisa_other_command(message: Message) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(_arisa_block_notice(lang), reply_markup=build_arisa_menu(user_id))
+
+
+@router.message(F.text)
+async def arisa_text(message: Message) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    text = message.text or ""
+    action = _resolve_arisa_menu_action(text, lang)
+    now = utcnow()
+
+    if action == "love":
+        await message.answer(
+            get_arisa_prompt("ARISA_LOVE_PROMPTS", "ARISA_LOVE_PROMPT", lang=lang),
+            reply_markup=build_arisa_menu(user_id),
+        )
+        return
+    if action == "sexy":
+        if user_id is None or not is_arisa_paid_user(user_id, now=now):
+            await message.answer(
+                "\n".join(
+                    [
+                        t(lang, "ARISA_SEXY_LOCKED_TEASER"),
+                        t(lang, "ARISA_SEXY_LOCKED_CTA"),
+                    ]
+                ),
+                reply_markup=build_store_keyboard(lang=lang),
+            )
+            return
+        await message.answer(
+            get_arisa_prompt("ARISA_SEXY_PROMPTS", "ARISA_SEXY_PROMPT", lang=lang),
+            reply_markup=build_arisa_menu(user_id),
+        )
+        return
+    if action == "store":
+        await prompt_arisa_charge_menu(message)
+        return
+    if action == "status":
+        await prompt_arisa_status(message, now=now)
+        return
+    if action == "language":
+        await arisa_cmd_lang(message, skip_dedup=True)
+        return
+    is_language_button, _ = is_language_reply_button(text)
+    if is_language_button:
+        await arisa_cmd_lang(message, skip_dedup=True)
+        return
+    if _is_arisa_tarot_trigger(text):
+        await message.answer(_arisa_block_notice(lang), reply_markup=build_arisa_menu(user_id))
+        return
+    await handle_arisa_chat(message, user_query=text)
@@ -0,0 +1,331 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from aiogram import Router
+from aiogram.types import Message
+
+from bot.texts.i18n import normalize_lang, t
+from bot.utils.events import preview_text, safe_log_app_event
+from bot.utils.formatting import append_caution_note, format_long_answer
+from bot.utils.inflight import Superseded, acquire_inflight, record_superseded_refund, run_supersedable
+from bot.utils.llm import call_openai_with_retry, fit_user_input
+from bot.utils.menus import build_base_menu
+from bot.utils.payments import PAYWALL_BLOCKS, build_store_keyboard
+from bot.utils.safety import respond_with_safety_notice
+from bot.utils.state import (
+    TAROT_FLOW,
+    get_tarot_theme,
+    get_user_lang_or_default,
+    is_admin_user,
+    mark_user_active,
+    reset_tarot_state,
+    set_user_mode,
+    utcnow,
+)
+from bot.utils.telegram import send_long_text
+from bot.utils.usage import FREE_GENERAL_CHAT_PER_DAY, is_in_general_chat_trial
+from core.config import CONSULT_MAX_TOKENS
+from core.db import (
+    UserRecord,
+    decrement_general_chat_count,
+    ensure_user,
+    increment_general_chat_count,
+    set_last_general_chat_block_notice,
+)
+from core.monetization import effective_has_pass
+from core.prompts import get_consult_system_prompt
+from core.tarot import contains_tarot_like, strip_tarot_sentences
+
+logger = logging.getLogger(__name__)
+router = Router(name="consult")
+
+
+GENERAL_CHAT_BLOCK_NOTICE_COOLDOWN = timedelta(hours=1)
+REWRITE_PROMPTS = {
+    "ja": (
+        "次の文章から、タロット・カード・占いに関する言及をすべて取り除いて日本語で書き直してください。"
+        "丁寧で落ち着いた敬語を維持し、相談の意図や励ましは残してください。"
+    ),
+    "en": (
+        "Rewrite the text in English, removing any mention of tarot, cards, or divination."
+        " Keep a calm, supportive tone and preserve the intent of the consultation."
+    ),
+    "pt": (
+        "Reescreva o texto em português, removendo qualquer menção a tarô, cartas ou adivinhação."
+        " Mantenha um tom calmo e acolhedor e preserve a intenção da conversa."
+    ),
+}
+
+
+def get_rewrite_prompt(lang: str | None = "ja") -> str:
+    return REWRITE_PROMPTS.get(normalize_lang(lang), REWRITE_PROMPTS["ja"])
+
+
+def build_general_chat_messages(user_query: str, *, lang: str | None = "ja") -> list[dict[str, str]]:
+    """通常チャットモードの system prompt を組み立てる。"""
+    return [
+        {"role": "system", "content": get_consult_system_prompt(lang)},
+        {"role": "user", "content": user_query},
+    ]
+
+
+async def prompt_consult_mode(message: Message) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    set_user_mode(user_id, "consult")
+    reset_tarot_state(user_id)
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(t(lang, "CONSULT_MODE_PROMPT"), reply_markup=build_base_menu(user_id))
+
+
+async def rewrite_chat_response(original: str, *, lang: str | None = "ja") -> tuple[str, bool]:
+    rewrite_prompt = get_rewrite_prompt(lang)
+
+    messages = [
+        {"role": "system", "content": rewrite_prompt},
+        {"role": "user", "content": original},
+    ]
+
+    return await call_openai_with_retry(messages, lang=lang)
+
+
+async def ensure_general_chat_safety(
+    answer: str, *, rewrite_func=rewrite_chat_response, lang: str | None = "ja"
+) -> str:
+    if not contains_tarot_like(answer):
+        return answer
+
+    try:
+        rewritten, fatal = await rewrite_func(answer, lang=lang)
+    except TypeError as exc:
+        try:
+            rewritten, fatal = await rewrite_func(answer)
+        except Exception:
+            logger.exception("Unexpected error during chat rewrite", exc_info=True)
+            rewritten, fatal = "", False
+        else:
+            logger.warning("Rewrite function does not accept lang parameter: %s", exc)
+    except Exception:
+        logger.exception("Unexpected error during chat rewrite")
+        rewritten, fatal = "", False
+
+    if rewritten and not fatal and not contains_tarot_like(rewritten):
+        return rewritten
+
+    cleaned = strip_tarot_sentences(rewritten or answer)
+    if cleaned:
+        return cleaned
+
+    return "落ち着いてお話ししましょう。あなたの気持ちを大切に受け止めます。"
+
+
+def _is_consult_intent(text: str) -> bool:
+    stripped = text.strip()
+    if stripped.startswith(("相談:", "相談：")):
+        return True
+
+    lowered = stripped.lower()
+    consult_keywords = [
+        "悩み",
+        "相談",
+        "不安",
+        "辛い",
+        "つらい",
+        "どうすれば",
+        "復縁",
+        "別れ",
+        "仕事",
+        "人間関係",
+        "お金",
+    ]
+    return any(keyword in lowered for keyword in consult_keywords)
+
+
+def _should_show_general_chat_full_notice(user: UserRecord, now: datetime) -> bool:
+    if not user.last_general_chat_block_notice_at:
+        return True
+    return (now - user.last_general_chat_block_notice_at) >= GENERAL_CHAT_BLOCK_NOTICE_COOLDOWN
+
+
+def _build_consult_block_message(*, trial_active: bool, short: bool = False) -> str:
+    if trial_active:
+        if short:
+            return "ご相談は本日の無料枠を使い切りました。パスは /buy からご利用いただけます。"
+        return (
+            "trial中の相談チャット無料枠（1日2通）は本日分を使い切りました。\n"
+            "/buy から7日/30日パスを購入すると回数無制限でご利用いただけます。"
+        )
+    if short:
+        return "相談チャットはパス専用です。/buy からご検討ください。"
+    return "6日目以降の相談チャットはパス専用です。/buy から7日または30日のパスをご検討ください。"
+
+
+async def handle_general_chat(message: Message, user_query: str) -> None:
+    now = utcnow()
+    user_id = message.from_user.id if message.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    total_start = perf_counter()
+    openai_latency_ms: float | None = None
+    consult_intent = _is_consult_intent(user_query)
+    admin_mode = is_admin_user(user_id)
+    chat_id_value = getattr(getattr(message, "chat", None), "id", None)
+    can_use_bot = chat_id_value is not None
+    user: UserRecord | None = ensure_user(user_id, now=now) if user_id is not None else None
+    paywall_triggered = False
+    charged = False
+    event_success = False
+    event_error: str | None = None
+
+    if await respond_with_safety_notice(message, user_query):
+        logger.info(
+            "Safety notice triggered",
+            extra={
+                "mode": "chat",
+                "user_id": user_id,
+                "text_preview": preview_text(user_query),
+                "tarot_flow": TAROT_FLOW.get(user_id),
+                "tarot_theme": get_tarot_theme(user_id),
+                "route": "consult_safety",
+                "paywall_triggered": paywall_triggered,
+            },
+        )
+        return
+
+    if user is not None:
+        trial_active = is_in_general_chat_trial(user, now)
+        out_of_quota = user.general_chat_count_today >= FREE_GENERAL_CHAT_PER_DAY
+        has_pass = effective_has_pass(user_id, user, now=now)
+
+        if (trial_active and out_of_quota and not has_pass) or (
+            not trial_active and not has_pass
+        ):
+            paywall_triggered = True
+            PAYWALL_BLOCKS.inc(mode="consult", reason="trial_quota" if trial_active else "no_pass")
+            full_notice = _should_show_general_chat_full_notice(user, now)
+            block_message = _build_consult_block_message(
+                trial_active=trial_active, short=not full_notice
+            )
+            reply_markup = build_store_keyboard(lang=lang) if full_notice else None
+            await message.answer(block_message, reply_markup=reply_markup)
+            if full_notice and user_id is not None:
+                set_last_general_chat_block_notice(user_id, now=now)
+            return
+
+        if not admin_mode:
+            increment_general_chat_count(user_id, now=now)
+            charged = True
+
+    logger.info(
+        "Handling message",
+        extra={
+            "mode": "chat",
+            "user_id": message.from_user.id if message.from_user else None,
+            "admin_mode": admin_mode,
+            "text_preview": preview_text(user_query),
+            "route": "consult",
+            "tarot_flow": TAROT_FLOW.get(user_id),
+            "tarot_theme": get_tarot_theme(user_id),
+            "paywall_triggered": paywall_triggered,
+        },
+    )
+
+    def _refund() -> None:
+        # 取り消された相談は、無料枠の 1 通として数えない。
+        if charged and user_id is not None:
+            decrement_general_chat_count(user_id, now=now)
+            record_superseded_refund("consult", "general_chat")
+
+    try:
+        release_inflight = await acquire_inflight(
+            user_id, message, busy_message=t(lang, "BUSY_CHAT_MESSAGE"), lang=lang, mode="consult"
+        )
+    except Superseded:
+        _refund()
+        return
+
+    prompt_build_ms: float | None = None
+    try:
+        prompt_start = perf_counter()
+        chat_messages = build_general_chat_messages(
+            fit_user_input(user_query, lang=lang, mode="consult", user_id=user_id),
+            lang=lang,
+        )
+        prompt_build_ms = (perf_counter() - prompt_start) * 1000
+        openai_start = perf_counter()
+        try:
+            answer, fatal = await run_supersedable(
+                user_id,
+                "consult",
+                # 履歴やプロフィールを含まないので、同じ相談文は同時に届いた分をまとめて 1 回で答える。
+                call_openai_with_retry(
+                    chat_messages, lang=lang, max_tokens=CONSULT_MAX_TOKENS, coalesce=True
+                ),
+            )
+        except TypeError:
+            answer, fatal = await call_openai_with_retry(chat_messages)
+        openai_latency_ms = (perf_counter() - openai_start) * 1000
+        if fatal:
+            error_text = (
+                answer
+                + "\n\nご不便をおかけしてごめんなさい。時間をおいて再度お試しください。"
+            )
+            if can_use_bot and chat_id_value is not None:
+                await send_long_text(
+                    chat_id_value, error_text, reply_to=message.message_id
+                )
+            else:
+                await message.answer(error_text)
+            event_error = "fatal_consult"
+            return
+        safe_answer = await ensure_general_chat_safety(answer, lang=lang)
+        safe_answer = format_long_answer(safe_answer, "consult", lang=lang)
+        safe_answer = append_caution_note(user_query, safe_answer, lang=lang)
+        if can_use_bot and chat_id_value is not None:
+            await send_long_text(
+                chat_id_value,
+                safe_answer,
+                reply_to=message.message_id,
+                reply_markup_first=build_base_menu(user_id),
+                reply_markup_last=build_base_menu(user_id),
+            )
+        else:
+            await message.answer(safe_answer, reply_markup=build_base_menu(user_id))
+        event_success = True
+    except Superseded:
+        _refund()
+        event_error = "superseded"
+    except Exception:
+        logger.exception("Unexpected error during general chat")
+        fallback = (
+            "すみません、今ちょっと調子が悪いみたいです…\n"
+            "少し時間をおいてから、もう一度メッセージを送ってもらえると助かります。"
+        )
+        await message.answer(fallback)
+        event_error = "consult_exception"
+    finally:
+        total_ms = (perf_counter() - total_start) * 1000
+        logger.info(
+            "Consult handler finished",
+            extra={
+                "mode": "chat",
+                "user_id": user_id,
+                "message_id": getattr(message, "message_id", None),
+                "prompt_build_ms": round(prompt_build_ms or 0, 3),
+                "openai_latency_ms": round(openai_latency_ms or 0, 2),
+                "total_handler_ms": round(total_ms, 2),
+            },
+        )
+        safe_log_app_event(
+            event_type="consult",
+            user_id=user_id,
+            payload=json.dumps({"success": event_success, "intent": "consult" if consult_intent else "general"}),
+        )
+        if event_error:
+            safe_log_app_event(
+                event_type="error",
+                user_id=user_id,
+                payload=event_error,
+            )
+        release_inflight()
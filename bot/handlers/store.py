@@ -0,0 +1,546 @@
+import json
+import logging
+import os
+
+from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.types import (
+    CallbackQuery,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    LabeledPrice,
+    Message,
+    PreCheckoutQuery,
+)
+
+from bot.keyboards.common import build_charge_retry_keyboard
+from bot.texts.i18n import normalize_lang, t
+from bot.utils.events import safe_log_payment_event
+from bot.utils.inflight import should_process_message
+from bot.utils.menus import build_base_menu, build_quick_menu
+from bot.utils.payments import (
+    IMAGE_ADDON_ENABLED,
+    build_store_keyboard,
+    check_purchase_dedup,
+    get_product_description,
+    get_product_title,
+    get_store_intro_text,
+    parse_invoice_payload,
+    safe_answer_pre_checkout,
+    send_store_menu,
+)
+from bot.utils.state import (
+    get_user_lang_or_default,
+    mark_user_active,
+    reset_state_for_explicit_command,
+    set_user_mode,
+    usage_today,
+    utcnow,
+)
+from bot.utils.telegram import (
+    get_bot,
+    handle_stale_interaction,
+    is_stale_query_error,
+    safe_answer_callback,
+)
+from core.config import SUPPORT_EMAIL
+from core.db import (
+    USAGE_TIMEZONE,
+    TicketColumn,
+    UserRecord,
+    ensure_user,
+    grant_purchase,
+    has_accepted_terms,
+    log_payment,
+    set_terms_accepted,
+)
+from core.monetization import effective_has_pass
+from core.store.catalog import Product, get_product
+
+logger = logging.getLogger(__name__)
+router = Router(name="store")
+
+
+async def prompt_charge_menu(message: Message) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    set_user_mode(user_id, "charge")
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(t(lang, "CHARGE_MODE_PROMPT"), reply_markup=build_base_menu(user_id))
+    await send_store_menu(message)
+
+
+TICKET_SKU_TO_COLUMN: dict[str, TicketColumn] = {
+    "TICKET_3": "tickets_3",
+    "TICKET_7": "tickets_7",
+    "TICKET_10": "tickets_10",
+}
+
+
+def get_support_email() -> str:
+    env_email = os.getenv("SUPPORT_EMAIL")
+    if env_email:
+        return env_email
+    return SUPPORT_EMAIL
+
+
+def build_unlock_text(product: Product, user: UserRecord, *, lang: str | None = "ja") -> str:
+    now = utcnow()
+    lang_code = normalize_lang(lang)
+    title = get_product_title(product, lang_code)
+    if product.sku in TICKET_SKU_TO_COLUMN:
+        column = TICKET_SKU_TO_COLUMN[product.sku]
+        balance = getattr(user, column)
+        return t(lang_code, "UNLOCK_TICKET_ADDED", product=title, balance=balance)
+
+    if product.sku.startswith("PASS_"):
+        until = user.premium_until or user.pass_until
+        duration = title
+        if until:
+            until_local = until.astimezone(USAGE_TIMEZONE)
+            remaining_days = (usage_today(until) - usage_today(now)).days
+            remaining_hint = (
+                t(lang_code, "STATUS_PASS_REMAINING", remaining_days=remaining_days)
+                if remaining_days >= 0
+                else ""
+            )
+            until_text = until_local.strftime("%Y-%m-%d %H:%M JST")
+        else:
+            until_text = t(lang_code, "PASS_EXTENDED_TEXT")
+            remaining_hint = ""
+        return t(
+            lang_code,
+            "UNLOCK_PASS_GRANTED",
+            duration=duration,
+            until_text=until_text,
+            remaining_hint=remaining_hint,
+        )
+
+    if product.sku == "ADDON_IMAGES":
+        return t(lang_code, "UNLOCK_IMAGES_ENABLED")
+
+    return t(lang_code, "PURCHASE_GENERIC_THANKS")
+
+
+TERMS_CALLBACK_SHOW = "terms:show"
+TERMS_CALLBACK_AGREE = "terms:agree"
+TERMS_CALLBACK_AGREE_AND_BUY = "terms:agree_and_buy"
+
+
+def get_terms_text(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    support_email = get_support_email()
+    return t(lang_code, "TERMS_TEXT", support_email=support_email)
+
+
+def get_support_text(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    support_email = get_support_email()
+    return t(lang_code, "SUPPORT_TEXT", support_email=support_email)
+
+
+def get_pay_support_text(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    support_email = get_support_email()
+    return t(lang_code, "PAY_SUPPORT_TEXT", support_email=support_email)
+
+
+def get_terms_prompt_before_buy(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    return t(lang_code, "TERMS_PROMPT_BEFORE_BUY")
+
+
+def build_terms_keyboard(include_buy_option: bool = False, *, lang: str | None = "ja") -> InlineKeyboardMarkup:
+    lang_code = normalize_lang(lang)
+    rows = [[InlineKeyboardButton(text=t(lang_code, "TERMS_BUTTON_AGREE"), callback_data=TERMS_CALLBACK_AGREE)]]
+    if include_buy_option:
+        rows.append(
+            [InlineKeyboardButton(text=t(lang_code, "TERMS_BUTTON_AGREE_AND_BUY"), callback_data=TERMS_CALLBACK_AGREE_AND_BUY)]
+        )
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def build_terms_prompt_keyboard(lang: str | None = "ja") -> InlineKeyboardMarkup:
+    lang_code = normalize_lang(lang)
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=t(lang_code, "TERMS_BUTTON_VIEW"), callback_data=TERMS_CALLBACK_SHOW)],
+            [InlineKeyboardButton(text=t(lang_code, "TERMS_BUTTON_AGREE"), callback_data=TERMS_CALLBACK_AGREE)],
+            [
+                InlineKeyboardButton(
+                    text=t(lang_code, "TERMS_BUTTON_AGREE_AND_BUY"), callback_data=TERMS_CALLBACK_AGREE_AND_BUY
+                )
+            ],
+        ]
+    )
+
+
+def build_purchase_followup_keyboard(lang: str | None = "ja") -> InlineKeyboardMarkup:
+    lang_code = normalize_lang(lang)
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=t(lang_code, "RETURN_TO_TAROT_BUTTON"), callback_data="nav:menu")],
+            [InlineKeyboardButton(text=t(lang_code, "VIEW_STATUS_BUTTON"), callback_data="nav:status")],
+        ]
+    )
+
+
+@router.message(Command("terms"))
+async def cmd_terms(message: Message) -> None:
+    if not should_process_message(message, handler="terms"):
+        return
+
+    user_id = message.from_user.id if message.from_user else None
+    reset_state_for_explicit_command(user_id)
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    if user_id is not None:
+        ensure_user(user_id)
+
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) > 1 and parts[1].strip().lower() == "agree" and user_id is not None:
+        set_terms_accepted(user_id)
+        await message.answer(
+            t(lang, "TERMS_AGREED_RECORDED"),
+            reply_markup=build_quick_menu(user_id),
+        )
+        return
+
+    await message.answer(get_terms_text(lang=lang), reply_markup=build_terms_keyboard(lang=lang))
+    await message.answer(t(lang, "TERMS_NEXT_STEP_REMINDER"), reply_markup=build_quick_menu(user_id))
+
+
+@router.callback_query(F.data == TERMS_CALLBACK_SHOW)
+async def handle_terms_show(query: CallbackQuery):
+    await safe_answer_callback(query, cache_time=1)
+    lang = get_user_lang_or_default(query.from_user.id if query.from_user else None)
+    if query.message:
+        await query.message.answer(
+            get_terms_text(lang=lang),
+            reply_markup=build_terms_prompt_keyboard(lang=lang)
+        )
+
+
+@router.callback_query(F.data == TERMS_CALLBACK_AGREE)
+async def handle_terms_agree(query: CallbackQuery):
+    await safe_answer_callback(query, cache_time=1)
+    user_id = query.from_user.id if query.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    if user_id is None:
+        await safe_answer_callback(query, t(lang, "USER_INFO_MISSING"), show_alert=True)
+        return
+
+    set_terms_accepted(user_id)
+    await safe_answer_callback(query, t(lang, "TERMS_AGREED_RECORDED"), show_alert=True)
+    if query.message:
+        await query.message.answer(
+            t(lang, "TERMS_AGREED_RECORDED"),
+            reply_markup=build_quick_menu(user_id),
+        )
+
+
+@router.callback_query(F.data == TERMS_CALLBACK_AGREE_AND_BUY)
+async def handle_terms_agree_and_buy(query: CallbackQuery):
+    await safe_answer_callback(query, cache_time=1)
+    user_id = query.from_user.id if query.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    if user_id is None:
+        await safe_answer_callback(query, t(lang, "USER_INFO_MISSING"), show_alert=True)
+        return
+
+    set_terms_accepted(user_id)
+    await safe_answer_callback(query, t(lang, "TERMS_AGREED_RECORDED"), show_alert=True)
+    if query.message:
+        await send_store_menu(query.message)
+    else:
+        await get_bot().send_message(
+            user_id,
+            get_store_intro_text(lang=lang),
+            reply_markup=build_store_keyboard(lang=lang),
+        )
+
+
+@router.message(Command("support"))
+async def cmd_support(message: Message) -> None:
+    if not should_process_message(message, handler="support"):
+        return
+
+    user_id = message.from_user.id if message.from_user else None
+    reset_state_for_explicit_command(user_id)
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(
+        get_support_text(lang=lang), reply_markup=build_quick_menu(user_id)
+    )
+
+
+@router.message(Command("paysupport"))
+async def cmd_pay_support(message: Message) -> None:
+    if not should_process_message(message, handler="paysupport"):
+        return
+
+    reset_state_for_explicit_command(message.from_user.id if message.from_user else None)
+    mark_user_active(message.from_user.id if message.from_user else None)
+    lang = get_user_lang_or_default(message.from_user.id if message.from_user else None)
+    await message.answer(get_pay_support_text(lang=lang))
+
+
+@router.message(Command("buy"))
+async def cmd_buy(message: Message) -> None:
+    if not should_process_message(message, handler="buy"):
+        return
+
+    user_id = message.from_user.id if message.from_user else None
+    reset_state_for_explicit_command(user_id)
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    if user_id is not None:
+        ensure_user(user_id)
+        if not has_accepted_terms(user_id):
+            followup = t(lang, "TERMS_PROMPT_REMINDER")
+            await message.answer(
+                followup,
+                reply_markup=build_terms_prompt_keyboard(lang=lang),
+            )
+            return
+
+    await prompt_charge_menu(message)
+
+
+@router.callback_query(F.data == "nav:charge")
+async def handle_nav_charge(query: CallbackQuery, state: FSMContext) -> None:
+    await safe_answer_callback(query, cache_time=1)
+    user_id = query.from_user.id if query.from_user else None
+    if user_id is not None:
+        ensure_user(user_id)
+        set_user_mode(user_id, "charge")
+        mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    await state.clear()
+    if query.message:
+        await prompt_charge_menu(query.message)
+    elif user_id is not None:
+        await get_bot().send_message(
+            user_id, t(lang, "CHARGE_MODE_PROMPT"), reply_markup=build_base_menu(user_id)
+        )
+        await get_bot().send_message(
+            user_id,
+            get_store_intro_text(lang=lang),
+            reply_markup=build_store_keyboard(lang=lang),
+        )
+
+
+@router.callback_query(F.data.startswith("buy:"))
+async def handle_buy_callback(query: CallbackQuery):
+    await safe_answer_callback(query, cache_time=1)
+    data = query.data or ""
+    sku = data.split(":", maxsplit=1)[1] if ":" in data else None
+    product = get_product(sku) if sku else None
+    if not product:
+        await safe_answer_callback(
+            query, "商品情報を取得できませんでした。少し時間をおいてお試しください。", show_alert=True
+        )
+        return
+
+    user_id = query.from_user.id if query.from_user else None
+    if user_id is None:
+        await safe_answer_callback(
+            query, "ユーザーを特定できませんでした。個別チャットからお試しください。", show_alert=True
+        )
+        return
+
+    now = utcnow()
+    user = ensure_user(user_id, now=now)
+    lang = get_user_lang_or_default(user_id)
+    safe_log_payment_event(
+        user_id=user_id, event_type="buy_click", sku=product.sku, payload=query.data
+    )
+    if product.sku == "ADDON_IMAGES" and not IMAGE_ADDON_ENABLED:
+        await safe_answer_callback(
+            query, t(lang, "ADDON_PENDING_ALERT"), show_alert=True
+        )
+        return
+    if not has_accepted_terms(user_id):
+        terms_prompt = get_terms_prompt_before_buy(lang)
+        await safe_answer_callback(query, terms_prompt, show_alert=True)
+        if query.message:
+            followup = t(lang, "TERMS_PROMPT_REMINDER")
+            await query.message.answer(
+                followup,
+                reply_markup=build_terms_prompt_keyboard(lang=lang),
+            )
+        return
+
+    if product.sku == "TICKET_3":
+        has_pass = effective_has_pass(user_id, user, now=now)
+        if has_pass:
+            await safe_answer_callback(
+                query,
+                t(lang, "PASS_ALREADY_ACTIVE_ALERT"),
+                show_alert=True,
+            )
+            if query.message:
+                await query.message.answer(
+                    t(lang, "PASS_ALREADY_ACTIVE_MESSAGE"),
+                    reply_markup=build_base_menu(user_id),
+                )
+            return
+
+    if check_purchase_dedup(user_id, product.sku):
+        safe_log_payment_event(
+            user_id=user_id, event_type="buy_dedup_hit", sku=product.sku, payload=query.data
+        )
+        await safe_answer_callback(
+            query,
+            t(lang, "PURCHASE_DEDUP_ALERT"),
+            show_alert=True,
+        )
+        if query.message:
+            await query.message.answer(
+                t(lang, "PURCHASE_DEDUP_MESSAGE"),
+                reply_markup=build_base_menu(user_id),
+            )
+        return
+    payload = json.dumps({"sku": product.sku, "user_id": user_id})
+    title_localized = get_product_title(product, lang)
+    description_localized = get_product_description(product, lang)
+    prices = [LabeledPrice(label=title_localized, amount=product.price_stars)]
+
+    if query.message:
+        try:
+            await query.message.answer_invoice(
+                title=title_localized,
+                description=description_localized,
+                payload=payload,
+                provider_token="",
+                currency="XTR",
+                prices=prices,
+            )
+        except TelegramBadRequest as exc:
+            if is_stale_query_error(exc):
+                await handle_stale_interaction(
+                    query, user_id=user_id, sku=product.sku, payload=query.data
+                )
+                return
+            logger.exception(
+                "Failed to send invoice",
+                extra={"user_id": user_id, "sku": product.sku, "error": str(exc)},
+            )
+            await query.message.answer(
+                t(lang, "INVOICE_DISPLAY_FAILED"),
+                reply_markup=build_charge_retry_keyboard(lang),
+            )
+            return
+    await safe_answer_callback(query, t(lang, "OPENING_PAYMENT_SCREEN"))
+
+
+@router.callback_query(F.data == "addon:pending")
+async def handle_addon_pending(query: CallbackQuery):
+    await safe_answer_callback(query, cache_time=1)
+    lang = get_user_lang_or_default(query.from_user.id if query.from_user else None)
+    await safe_answer_callback(query, t(lang, "ADDON_PENDING_ALERT"), show_alert=True)
+
+
+@router.pre_checkout_query()
+async def process_pre_checkout(pre_checkout_query: PreCheckoutQuery):
+    sku, payload_user_id = parse_invoice_payload(pre_checkout_query.invoice_payload or "")
+    product = get_product(sku) if sku else None
+    user_id = pre_checkout_query.from_user.id if pre_checkout_query.from_user else None
+    log_user_id = user_id or payload_user_id
+    lang = get_user_lang_or_default(log_user_id)
+    if not product:
+        safe_log_payment_event(
+            user_id=log_user_id,
+            event_type="pre_checkout_invalid_product",
+            sku=sku if sku else None,
+            payload=pre_checkout_query.invoice_payload,
+        )
+        logger.warning(
+            "Pre-checkout received without product",
+            extra={"payload": pre_checkout_query.invoice_payload},
+        )
+        await safe_answer_pre_checkout(
+            pre_checkout_query,
+            ok=False,
+            error_message=t(lang, "PRODUCT_INFO_MISSING"),
+        )
+        return
+    if payload_user_id is None or user_id is None or payload_user_id != user_id:
+        safe_log_payment_event(
+            user_id=log_user_id,
+            event_type="pre_checkout_rejected",
+            sku=product.sku,
+            payload=pre_checkout_query.invoice_payload,
+        )
+        await safe_answer_pre_checkout(
+            pre_checkout_query,
+            ok=False,
+            error_message=t(lang, "PURCHASER_INFO_MISSING"),
+        )
+        return
+
+    ensure_user(user_id)
+    safe_log_payment_event(
+        user_id=user_id,
+        event_type="pre_checkout",
+        sku=product.sku,
+        payload=pre_checkout_query.invoice_payload,
+    )
+    await safe_answer_pre_checkout(pre_checkout_query, ok=True)
+
+
+@router.message(F.successful_payment)
+async def process_successful_payment(message: Message):
+    payment = message.successful_payment
+    sku, payload_user_id = parse_invoice_payload(payment.invoice_payload or "")
+    product = get_product(sku) if sku else None
+    user_id_message = message.from_user.id if message.from_user else None
+    user_id = payload_user_id if payload_user_id is not None else user_id_message
+    lang = get_user_lang_or_default(user_id)
+    lang_code = normalize_lang(lang)
+    if user_id_message is not None and user_id is not None and user_id != user_id_message:
+        await message.answer(
+            t(lang_code, "PAYMENT_INFO_MISMATCH")
+        )
+        return
+
+    if not product or user_id is None:
+        await message.answer(
+            t(lang_code, "PAYMENT_VERIFICATION_DELAY")
+        )
+        return
+
+    ensure_user(user_id)
+    _, created = log_payment(
+        user_id=user_id,
+        sku=product.sku,
+        stars=payment.total_amount,
+        telegram_payment_charge_id=payment.telegram_payment_charge_id,
+        provider_payment_charge_id=payment.provider_payment_charge_id,
+    )
+    safe_log_payment_event(
+        user_id=user_id,
+        event_type="successful_payment" if created else "successful_payment_duplicate",
+        sku=product.sku,
+        payload=payment.telegram_payment_charge_id,
+    )
+    if not created:
+        await message.answer(
+            t(lang_code, "PAYMENT_ALREADY_PROCESSED"),
+            reply_markup=build_purchase_followup_keyboard(lang=lang_code),
+        )
+        return
+    updated_user = grant_purchase(user_id, product.sku)
+    unlock_message = build_unlock_text(product, updated_user, lang=lang_code)
+    title_localized = get_product_title(product, lang_code)
+    thank_you_lines = [
+        t(lang_code, "PURCHASE_THANK_YOU", product=title_localized),
+        unlock_message,
+        t(lang_code, "PURCHASE_STATUS_REMINDER"),
+        t(lang_code, "PURCHASE_NAVIGATION_HINT"),
+    ]
+    await message.answer(
+        "\n".join(thank_you_lines), reply_markup=build_purchase_followup_keyboard(lang=lang_code)
+    )
@@ -0,0 +1,1288 @@
+import json
+import logging
+import random
+from datetime import datetime
+from time import perf_counter
+from urllib.parse import urlencode
+
+from aiogram import F, Router
+from aiogram.filters import Command, CommandStart
+from aiogram.fsm.context import FSMContext
+from aiogram.types import (
+    CallbackQuery,
+    ContentType,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    Message,
+)
+
+from bot.handlers.consult import handle_general_chat, prompt_consult_mode
+from bot.handlers.store import prompt_charge_menu
+from bot.keyboards.common import base_menu_kb, build_lang_keyboard, merge_inline_keyboards_compact
+from bot.texts.i18n import normalize_lang, t
+from bot.utils.events import preview_text, safe_log_app_event
+from bot.utils.formatting import (
+    append_caution_note,
+    format_drawn_cards,
+    format_long_answer,
+    get_card_line_prefix,
+    get_caution_note,
+    get_time_range_text,
+)
+from bot.utils.inflight import (
+    Superseded,
+    acquire_inflight,
+    record_superseded_refund,
+    run_supersedable,
+    should_process_message,
+)
+from bot.utils.language import is_language_reply_button
+from bot.utils.llm import call_openai_with_retry, fit_user_input
+from bot.utils.menus import build_base_menu, build_quick_menu, restore_base_menu
+from bot.utils.payments import PAYWALL_BLOCKS, build_store_keyboard, get_product_title
+from bot.utils.safety import respond_with_safety_notice
+from bot.utils.state import (
+    STATE_TIMEOUT,
+    SUPPORTED_LANGS,
+    TAROT_FLOW,
+    USER_STATE_LAST_ACTIVE,
+    get_tarot_theme,
+    get_user_lang_or_default,
+    get_user_mode,
+    is_admin_user,
+    mark_user_active,
+    reset_conversation_state,
+    reset_state_for_explicit_command,
+    reset_tarot_state,
+    resolve_user_lang,
+    set_tarot_flow,
+    set_tarot_theme,
+    set_user_mode,
+    store_user_lang,
+    usage_today,
+    utcnow,
+)
+from bot.utils.tarot_output import finalize_tarot_answer, format_time_axis_tarot_answer
+from bot.utils.telegram import (
+    delete_status_message,
+    get_bot,
+    safe_answer_callback,
+    send_long_text,
+    send_status_message,
+)
+from bot.utils.themes import (
+    DEFAULT_THEME,
+    TAROT_THEME_EXAMPLES,
+    build_help_text,
+    get_tarot_theme_label,
+    get_theme_examples,
+    get_theme_labels,
+)
+from bot.utils.usage import (
+    FREE_GENERAL_CHAT_PER_DAY,
+    FREE_ONE_ORACLE_POST_TRIAL_PER_DAY,
+    FREE_ONE_ORACLE_TRIAL_PER_DAY,
+    ONE_ORACLE_MEMORY,
+    format_next_reset,
+    general_chat_trial_days_left,
+    is_in_general_chat_trial,
+    trial_day_number,
+)
+from bot.utils.validators import validate_question_text
+from core.config import TAROT_MAX_TOKENS
+from core.db import (
+    USAGE_TIMEZONE,
+    TicketColumn,
+    UserRecord,
+    consume_ticket,
+    decrement_one_oracle_count,
+    ensure_user,
+    get_latest_payment,
+    get_user,
+    increment_one_oracle_count,
+    log_feedback,
+    refund_ticket,
+)
+from core.logging import request_id_var
+from core.monetization import (
+    PAYWALL_ENABLED,
+    effective_has_pass,
+    effective_pass_expires_at,
+    get_user_with_default,
+)
+from core.prompts import get_tarot_prompt_pair
+from core.store.catalog import get_product
+from core.tarot import (
+    CELTIC_CROSS,
+    HEXAGRAM,
+    ONE_CARD,
+    THREE_CARD_TIME_AXIS,
+    draw_cards,
+    is_tarot_request,
+    orientation_label,
+    orientation_label_by_lang,
+)
+from core.tarot.spreads import Spread
+
+logger = logging.getLogger(__name__)
+router = Router(name="tarot")
+
+
+POSITION_LABELS_I18N: dict[str, dict[str, str]] = {
+    "main": {"en": "Main message", "pt": "Mensagem principal"},
+    "past": {"en": "Past", "pt": "Passado"},
+    "present": {"en": "Present", "pt": "Presente"},
+    "future": {"en": "Future", "pt": "Futuro"},
+    "your_feelings": {"en": "Your feelings", "pt": "Seus sentimentos"},
+    "partner_feelings": {"en": "Partner's feelings", "pt": "Sentimentos da outra pessoa"},
+    "current_situation": {"en": "Current situation", "pt": "Situação atual"},
+    "obstacle": {"en": "Obstacle", "pt": "Obstáculo"},
+    "near_future": {"en": "Near future", "pt": "Futuro próximo"},
+    "advice": {"en": "Advice", "pt": "Conselho"},
+    "outcome": {"en": "Outcome", "pt": "Resultado"},
+    "challenge": {"en": "Challenge", "pt": "Desafio"},
+    "conscious": {"en": "Conscious motives", "pt": "Motivações conscientes"},
+    "subconscious": {"en": "Subconscious", "pt": "Subconsciente"},
+    "self_position": {"en": "Advice (your stance)", "pt": "Conselho (sua postura)"},
+    "environment": {"en": "Environment", "pt": "Ambiente"},
+    "hopes_fears": {"en": "Hopes / Fears", "pt": "Esperanças / medos"},
+}
+POSITION_MEANINGS_I18N: dict[str, dict[str, str]] = {
+    "main": {"en": "Main message for you.", "pt": "Mensagem principal para você."},
+    "past": {"en": "How past events or feelings shape the present.", "pt": "Como o passado influencia o presente."},
+    "present": {"en": "Clarifies current hesitation, stagnation, or crossroads.", "pt": "Organiza dúvidas ou travas do momento."},
+    "future": {
+        "en": "Upcoming flow, possibilities, and cautions, including hints for past/present.",
+        "pt": "Fluxo futuro, possibilidades e cuidados, incluindo alertas sobre passado/presente.",
+    },
+    "your_feelings": {"en": "Your true feelings and emotional flow.", "pt": "Seus sentimentos verdadeiros e o fluxo deles."},
+    "partner_feelings": {"en": "The other person's honest feelings toward you.", "pt": "O que a outra pessoa sente por você."},
+    "current_situation": {"en": "The current relationship status and atmosphere around you two.", "pt": "O estado atual e o clima ao redor de vocês."},
+    "obstacle": {"en": "Causes of distance, friction, or obstacles.", "pt": "Causas de distância, atrito ou obstáculos."},
+    "near_future": {"en": "Near-term flow and signs of change.", "pt": "Fluxo de curto prazo e sinais de mudança."},
+    "advice": {"en": "Actions or mindset you can take for a better future.", "pt": "Ações ou posturas que você pode tomar para melhorar."},
+    "outcome": {"en": "Likely result or landing point if the current flow continues.", "pt": "Resultado provável se o fluxo atual continuar."},
+    "challenge": {"en": "Obstacle or issue to overcome.", "pt": "Obstáculo ou questão a superar."},
+    "conscious": {"en": "What you are aware of—recognized aims or wishes.", "pt": "O que você percebe: objetivos ou desejos conscientes."},
+    "subconscious": {"en": "Unseen motives or deeper desires.", "pt": "Motivações ocultas ou desejos mais profundos."},
+    "self_position": {"en": "Your stance or role and how to engage.", "pt": "Sua postura ou papel e como agir."},
+    "environment": {"en": "Influences and support/constraints around you.", "pt": "Influências e apoios/limitações ao redor."},
+    "hopes_fears": {"en": "Hopes and what you wish to avoid.", "pt": "Esperanças e o que deseja evitar."},
+}
+
+
+def _get_position_label_translation(position_id: str, lang: str) -> str | None:
+    lang_code = normalize_lang(lang)
+    return (POSITION_LABELS_I18N.get(position_id) or {}).get(lang_code)
+
+
+def _get_position_meaning_translation(position_id: str, lang: str) -> str | None:
+    lang_code = normalize_lang(lang)
+    return (POSITION_MEANINGS_I18N.get(position_id) or {}).get(lang_code)
+
+
+def build_tarot_question_prompt(theme: str, *, lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    theme_labels = get_theme_labels(lang_code)
+    theme_label = theme_labels.get(theme, theme_labels.get(DEFAULT_THEME, get_tarot_theme_label(DEFAULT_THEME)))
+    examples = get_theme_examples(lang_code).get(theme, TAROT_THEME_EXAMPLES[DEFAULT_THEME])
+    if lang_code == "ja":
+        example_text = "』『".join(examples)
+    else:
+        example_text = "” / “".join(examples)
+    return t(lang_code, "TAROT_QUESTION_PROMPT", theme_label=theme_label, example_text=example_text)
+
+
+def get_chat_id(message: Message) -> int | None:
+    chat = getattr(message, "chat", None)
+    if chat and getattr(chat, "id", None) is not None:
+        return chat.id
+    if message.from_user:
+        return message.from_user.id
+    return None
+
+
+async def reset_state_if_inactive(message: Message, *, now: datetime) -> bool:
+    user_id = message.from_user.id if message.from_user else None
+    if user_id is None:
+        return False
+    last_active = USER_STATE_LAST_ACTIVE.get(user_id)
+    if last_active is None:
+        return False
+    if now - last_active < STATE_TIMEOUT:
+        return False
+    reset_conversation_state(user_id)
+    await message.answer(
+        t(get_user_lang_or_default(user_id), "INACTIVE_RESET_NOTICE"),
+        reply_markup=build_base_menu(user_id),
+    )
+    return True
+
+
+def build_tarot_theme_keyboard(*, lang: str | None = "ja") -> InlineKeyboardMarkup:
+    lang_code = normalize_lang(lang)
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=t(lang_code, "TAROT_THEME_BUTTON_LOVE"), callback_data="tarot_theme:love")],
+            [InlineKeyboardButton(text=t(lang_code, "TAROT_THEME_BUTTON_MARRIAGE"), callback_data="tarot_theme:marriage")],
+            [InlineKeyboardButton(text=t(lang_code, "TAROT_THEME_BUTTON_WORK"), callback_data="tarot_theme:work")],
+            [InlineKeyboardButton(text=t(lang_code, "TAROT_THEME_BUTTON_LIFE"), callback_data="tarot_theme:life")],
+        ]
+    )
+
+
+# --- Share funnel (Step3) ---
+BOT_PUBLIC_LINK = "https://t.me/tarot78_catbot"
+
+SHARE_TEXT_BY_LANG: dict[str, str] = {
+    "en": "Daily Tarot in 1 tap 🐈✨ Try @tarot78_catbot",
+    "ja": "1タップで今日のタロット🐈✨ 試してみて → @tarot78_catbot",
+    "pt": "Tarô diário em 1 toque 🐈✨ Experimente @tarot78_catbot",
+}
+
+
+def build_share_url(*, lang: str | None = "en") -> str:
+    try:
+        lang_code = normalize_lang(lang or "en")
+    except Exception:
+        lang_code = (lang or "en").lower()
+    text = SHARE_TEXT_BY_LANG.get(lang_code, SHARE_TEXT_BY_LANG["en"])
+    query = urlencode({"url": BOT_PUBLIC_LINK, "text": text})
+    return f"https://t.me/share/url?{query}"
+
+
+def build_share_start_keyboard(*, lang: str | None = "en") -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="Share", url=build_share_url(lang=lang)),
+            ]
+        ]
+    )
+
+
+def build_upgrade_keyboard(*, lang: str | None = "ja") -> InlineKeyboardMarkup:
+    lang_code = normalize_lang(lang)
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=t(lang_code, "UPGRADE_BUTTON_TEXT"), callback_data="upgrade_to_three")]
+        ]
+    )
+
+
+async def prompt_tarot_mode(message: Message) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    set_user_mode(user_id, "tarot")
+    set_tarot_theme(user_id, DEFAULT_THEME)
+    set_tarot_flow(user_id, "awaiting_theme")
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(t(lang, "TAROT_THEME_PROMPT"), reply_markup=build_base_menu(user_id))
+    await message.answer(
+        t(lang, "TAROT_THEME_SELECT_PROMPT"),
+        reply_markup=build_tarot_theme_keyboard(lang=lang),
+    )
+
+
+async def prompt_status(message: Message, *, now: datetime) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    set_user_mode(user_id, "status")
+    mark_user_active(user_id, now=now)
+    lang = get_user_lang_or_default(user_id)
+    if user_id is None:
+        await message.answer(
+            t(lang, "USER_INFO_DM_REQUIRED"),
+            reply_markup=build_base_menu(user_id),
+        )
+        return
+    user = get_user_with_default(user_id) or ensure_user(user_id, now=now)
+    await message.answer(
+        format_status(user, now=now, lang=lang), reply_markup=build_base_menu(user_id)
+    )
+
+
+COMMAND_SPREAD_MAP: dict[str, Spread] = {
+    "/love1": ONE_CARD,
+    "/read1": ONE_CARD,
+    "/love3": THREE_CARD_TIME_AXIS,
+    "/read3": THREE_CARD_TIME_AXIS,
+    "/hexa": HEXAGRAM,
+    "/celtic": CELTIC_CROSS,
+}
+
+
+PAID_SPREAD_IDS: set[str] = {THREE_CARD_TIME_AXIS.id, HEXAGRAM.id, CELTIC_CROSS.id}
+
+SPREAD_TICKET_COLUMNS: dict[str, TicketColumn] = {
+    THREE_CARD_TIME_AXIS.id: "tickets_3",
+    HEXAGRAM.id: "tickets_7",
+    CELTIC_CROSS.id: "tickets_10",
+}
+
+
+def _evaluate_one_oracle_access(
+    *, user: UserRecord, user_id: int, now: datetime
+) -> tuple[bool, bool, UserRecord]:
+    latest_user = get_user(user_id, now=now) or user
+    is_admin = is_admin_user(user_id)
+    has_pass = effective_has_pass(user_id, latest_user, now=now)
+    date_key = usage_today(now).isoformat()
+    memory_key = (user_id, date_key)
+    base_count = ONE_ORACLE_MEMORY.get(memory_key, latest_user.one_oracle_count_today)
+
+    limit = (
+        FREE_ONE_ORACLE_TRIAL_PER_DAY
+        if is_in_general_chat_trial(latest_user, now)
+        else FREE_ONE_ORACLE_POST_TRIAL_PER_DAY
+    )
+
+    if is_admin:
+        return True, False, latest_user
+
+    if not has_pass and base_count >= limit:
+        return False, False, latest_user
+
+    new_count = base_count + 1
+    ONE_ORACLE_MEMORY[memory_key] = new_count
+    updated_user = increment_one_oracle_count(user_id, now=now)
+    short_response = not has_pass and new_count <= limit
+    return True, short_response, updated_user
+
+
+def choose_spread(_: str) -> Spread:
+    return ONE_CARD
+
+
+def parse_spread_command(text: str) -> tuple[Spread | None, str]:
+    if not text:
+        return None, ""
+
+    parts = text.split(maxsplit=1)
+    command = parts[0].lower()
+    spread = COMMAND_SPREAD_MAP.get(command)
+    if not spread:
+        return None, text
+
+    remainder = parts[1].strip() if len(parts) > 1 else ""
+    return spread, remainder
+
+
+def is_paid_spread(spread: Spread) -> bool:
+    return spread.id in PAID_SPREAD_IDS
+
+
+def get_bot_display_name() -> str:
+    return "akolasia_tarot_bot"
+
+
+def build_paid_hint(text: str) -> str | None:
+    hints = ["3枚", "３枚", "三枚", "3card", "3 カード", "ヘキサ", "ケルト", "十字", "7枚", "７枚", "10枚", "１０枚"]
+    if any(hint in text for hint in hints):
+        return "複数枚はコマンド指定です：/read3 /hexa /celtic（無料は『占って』で1枚）"
+    return None
+
+
+def determine_action_count(user_id: int | None, message_id: int | None) -> int:
+    seed = (user_id or 0) * 31 + (message_id or 0)
+    rng = random.Random(seed)
+    roll = rng.random()
+    if roll < 0.15:
+        return 4
+    return 2 if rng.random() < 0.5 else 3
+
+
+async def execute_tarot_request(
+    message: Message,
+    user_query: str,
+    *,
+    spread: Spread | None = None,
+    guidance_note: str | None = None,
+    theme: str | None = None,
+) -> None:
+    now = utcnow()
+    user_id = message.from_user.id if message.from_user else None
+    user: UserRecord | None = ensure_user(user_id, now=now) if user_id is not None else None
+    spread_to_use = spread or choose_spread(user_query)
+    paywall_triggered = False
+    short_response = False
+    allowed = True
+    charge: str | None = None
+    effective_theme = theme or get_tarot_theme(user_id)
+
+    if await respond_with_safety_notice(message, user_query):
+        logger.info(
+            "Safety notice triggered",
+            extra={
+                "mode": "tarot",
+                "user_id": user_id,
+                "admin_mode": is_admin_user(user_id),
+                "text_preview": preview_text(user_query),
+                "route": "tarot_safety",
+                "tarot_flow": TAROT_FLOW.get(user_id),
+                "tarot_theme": effective_theme,
+                "paywall_triggered": paywall_triggered,
+            },
+        )
+        return
+
+    if spread_to_use == ONE_CARD:
+        if user_id is not None and user is not None:
+            allowed, short_response, user = _evaluate_one_oracle_access(
+                user=user, user_id=user_id, now=now
+            )
+            if allowed and not is_admin_user(user_id):
+                charge = "one_oracle"
+    if not allowed:
+        paywall_triggered = True
+        PAYWALL_BLOCKS.inc(mode="tarot", reason="free_quota")
+        await message.answer(
+            "本日の無料枠は使い切りました。続けるには🛒チャージから"
+            "チケット/パスを選んでください。次回リセット: "
+            f"{format_next_reset(now)}",
+        )
+        logger.info(
+            "Tarot request blocked",
+            extra={
+                "mode": "tarot",
+                "user_id": user_id,
+                "admin_mode": is_admin_user(user_id),
+                "text_preview": preview_text(user_query),
+                "route": "tarot",
+                "tarot_flow": TAROT_FLOW.get(user_id),
+                "tarot_theme": effective_theme,
+                "paywall_triggered": paywall_triggered,
+            },
+        )
+        return
+    elif PAYWALL_ENABLED and is_paid_spread(spread_to_use):
+        has_pass = effective_has_pass(user_id, user, now=now)
+        if not has_pass:
+            if user_id is None or not consume_ticket_for_spread(user_id, spread_to_use):
+                paywall_triggered = True
+                PAYWALL_BLOCKS.inc(mode="tarot", reason="paid_spread")
+                await message.answer(
+                    "こちらは有料メニューです。\n"
+                    "ご購入は /buy からお進みいただけます（無料の1枚引きは /read1 または『占って』でお楽しみください）。"
+                )
+                logger.info(
+                    "Tarot request blocked",
+                    extra={
+                        "mode": "tarot",
+                        "user_id": user_id,
+                        "admin_mode": is_admin_user(user_id),
+                        "text_preview": preview_text(user_query),
+                        "route": "tarot",
+                        "tarot_flow": TAROT_FLOW.get(user_id),
+                        "tarot_theme": effective_theme,
+                        "paywall_triggered": paywall_triggered,
+                    },
+                )
+                return
+            charge = "ticket"
+
+    logger.info(
+        "Handling message",
+        extra={
+            "mode": "tarot",
+            "user_id": user_id,
+            "admin_mode": is_admin_user(user_id),
+            "text_preview": preview_text(user_query),
+            "route": "tarot",
+            "tarot_flow": TAROT_FLOW.get(user_id),
+            "tarot_theme": effective_theme,
+            "paywall_triggered": paywall_triggered,
+        },
+    )
+
+    await handle_tarot_reading(
+        message,
+        user_query=user_query,
+        spread=spread_to_use,
+        guidance_note=guidance_note or build_paid_hint(user_query),
+        short_response=short_response,
+        theme=effective_theme,
+        charge=charge,
+    )
+
+
+def get_start_text(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    return t(lang_code, "START_TEXT")
+
+
+def consume_ticket_for_spread(user_id: int, spread: Spread) -> bool:
+    column = SPREAD_TICKET_COLUMNS.get(spread.id)
+    if not column:
+        return False
+    return consume_ticket(user_id, ticket=column)
+
+
+def refund_tarot_charge(user_id: int, spread: Spread, charge: str | None, *, now: datetime) -> None:
+    """execute_tarot_request で差し引いた分（無料枠かチケット）を戻す。取り消された鑑定用。"""
+    if charge == "one_oracle":
+        memory_key = (user_id, usage_today(now).isoformat())
+        count = ONE_ORACLE_MEMORY.get(memory_key)
+        if count:
+            ONE_ORACLE_MEMORY[memory_key] = count - 1
+        decrement_one_oracle_count(user_id, now=now)
+    elif charge == "ticket" and spread.id in SPREAD_TICKET_COLUMNS:
+        refund_ticket(user_id, ticket=SPREAD_TICKET_COLUMNS[spread.id])
+    else:
+        return
+    record_superseded_refund("tarot", charge)
+
+
+def format_status(user: UserRecord, *, now: datetime | None = None, lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    now = now or utcnow()
+    pass_until = effective_pass_expires_at(user.user_id, user, now)
+    has_pass = effective_has_pass(user.user_id, user, now=now)
+    admin_mode = is_admin_user(user.user_id)
+    trial_days_left = general_chat_trial_days_left(user, now)
+    trial_day = trial_day_number(user, now)
+    general_remaining = max(
+        FREE_GENERAL_CHAT_PER_DAY - user.general_chat_count_today, 0
+    )
+    one_oracle_limit = (
+        FREE_ONE_ORACLE_TRIAL_PER_DAY
+        if is_in_general_chat_trial(user, now)
+        else FREE_ONE_ORACLE_POST_TRIAL_PER_DAY
+    )
+    one_remaining = max(one_oracle_limit - user.one_oracle_count_today, 0)
+
+    status_title = t(lang_code, "STATUS_TITLE_ADMIN" if admin_mode else "STATUS_TITLE")
+    general_line_localized: str
+    if has_pass:
+        general_line_localized = t(lang_code, "STATUS_GENERAL_PASS")
+    elif trial_days_left > 0:
+        general_line_localized = t(
+            lang_code,
+            "STATUS_GENERAL_TRIAL",
+            trial_days_left=trial_days_left,
+            remaining=general_remaining,
+        )
+    else:
+        general_line_localized = t(lang_code, "STATUS_GENERAL_LOCKED")
+
+    pass_label_localized: str
+    if pass_until:
+        remaining_days = (usage_today(pass_until) - usage_today(now)).days
+        remaining_hint = (
+            t(lang_code, "STATUS_PASS_REMAINING", remaining_days=remaining_days)
+            if remaining_days >= 0
+            else ""
+        )
+        pass_label_localized = (
+            f"{pass_until.astimezone(USAGE_TIMEZONE).strftime('%Y-%m-%d %H:%M JST')} {remaining_hint}".strip()
+        )
+        if admin_mode:
+            pass_label_localized = f"{pass_label_localized} ({t(lang_code, 'STATUS_ADMIN_LABEL')})"
+    else:
+        pass_label_localized = t(lang_code, "STATUS_PASS_NONE")
+
+    latest_payment = get_latest_payment(user.user_id)
+    recent_purchase_line = ""
+    if latest_payment:
+        product = get_product(latest_payment.sku)
+        label = get_product_title(product, lang_code) if product else latest_payment.sku
+        purchased_at = latest_payment.created_at.astimezone(USAGE_TIMEZONE).strftime("%Y-%m-%d %H:%M JST")
+        recent_purchase_line = t(
+            lang_code,
+            "STATUS_LATEST_PURCHASE",
+            label=label,
+            sku=latest_payment.sku,
+            purchased_at=purchased_at,
+        )
+
+    lines = [
+        status_title,
+        t(lang_code, "STATUS_TRIAL_LINE", trial_day=trial_day),
+        t(lang_code, "STATUS_PASS_LABEL", pass_label=pass_label_localized),
+        t(
+            lang_code,
+            "STATUS_ONE_ORACLE",
+            limit=one_oracle_limit,
+            remaining=one_remaining,
+        ),
+        t(lang_code, "STATUS_GENERAL", text=general_line_localized),
+        t(lang_code, "STATUS_TICKET_3", count=user.tickets_3),
+        t(lang_code, "STATUS_TICKET_7", count=user.tickets_7),
+        t(lang_code, "STATUS_TICKET_10", count=user.tickets_10),
+        t(
+            lang_code,
+            "STATUS_IMAGES",
+            state=t(lang_code, "STATUS_IMAGES_ON" if user.images_enabled else "STATUS_IMAGES_OFF"),
+        ),
+        t(lang_code, "STATUS_RESET", reset_time=format_next_reset(now)),
+    ]
+    if recent_purchase_line:
+        lines.append(recent_purchase_line)
+    if admin_mode:
+        lines.insert(1, t(lang_code, "STATUS_ADMIN_FLAG"))
+    return "\n".join(lines)
+
+
+def build_tarot_messages(
+    *,
+    spread: Spread,
+    user_query: str,
+    drawn_cards: list[dict[str, str]],
+    short: bool = False,
+    theme: str | None = None,
+    action_count: int | None = None,
+    lang: str | None = "ja",
+) -> list[dict[str, str]]:
+    lang_code = normalize_lang(lang)
+    is_time_axis = spread.id == THREE_CARD_TIME_AXIS.id
+    static_prompt, request_directives = get_tarot_prompt_pair(
+        theme,
+        time_axis=is_time_axis,
+        short=short,
+        action_count=action_count,
+        lang=lang_code,
+    )
+
+    tarot_payload = {
+        "spread_id": spread.id,
+        "spread_name_ja": spread.name_ja,
+        "positions": drawn_cards,
+        "user_question": user_query,
+        "user_lang": lang_code,
+    }
+
+    # Stable text first, then the per-reading directives and the compact card
+    # payload; the question itself stays the final plain-text user turn, as
+    # before. The stable part is about 700-960 tokens, below the 1024-token
+    # minimum for upstream prompt caching, so tarot readings are not cached
+    # today (see tools/prompt_prefix_report).
+    return [
+        {"role": "system", "content": static_prompt},
+        {"role": "system", "content": request_directives},
+        {
+            "role": "assistant",
+            "content": json.dumps(tarot_payload, ensure_ascii=False, separators=(",", ":")),
+        },
+        {"role": "user", "content": user_query},
+    ]
+
+
+@router.message(Command("help"))
+async def cmd_help(message: Message) -> None:
+    if not should_process_message(message, handler="help"):
+        return
+
+    user_id = message.from_user.id if message.from_user else None
+    reset_state_for_explicit_command(user_id)
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(build_help_text(lang=lang), reply_markup=build_quick_menu(user_id))
+
+
+@router.message(Command("status"))
+async def cmd_status(message: Message) -> None:
+    if not should_process_message(message, handler="status"):
+        return
+
+    reset_state_for_explicit_command(message.from_user.id if message.from_user else None)
+    mark_user_active(message.from_user.id if message.from_user else None)
+    now = utcnow()
+    await prompt_status(message, now=now)
+
+
+@router.message(Command("feedback"))
+async def cmd_feedback(message: Message) -> None:
+    if not should_process_message(message, handler="feedback"):
+        return
+
+    user_id = message.from_user.id if message.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    if user_id is None:
+        await message.answer(t(lang, "FEEDBACK_DM_REQUIRED"))
+        return
+    reset_state_for_explicit_command(user_id)
+    mark_user_active(user_id)
+    menu = build_base_menu(user_id)
+
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2 or not parts[1].strip():
+        await message.answer(
+            t(lang, "FEEDBACK_PROMPT"),
+            reply_markup=menu,
+        )
+        return
+
+    feedback_text = parts[1].strip()
+    mode = get_user_mode(user_id)
+    try:
+        log_feedback(
+            user_id=user_id,
+            mode=mode,
+            text=feedback_text,
+            request_id=request_id_var.get("-"),
+        )
+        safe_log_app_event(
+            event_type="feedback",
+            user_id=user_id,
+            payload=json.dumps({"mode": mode}),
+        )
+    except Exception:
+        logger.exception("Failed to record feedback", extra={"user_id": user_id})
+        await message.answer(
+            t(lang, "FEEDBACK_SAVE_ERROR"),
+            reply_markup=menu,
+        )
+        return
+
+    await message.answer(
+        t(lang, "FEEDBACK_THANKS"), reply_markup=menu
+    )
+
+
+@router.message(Command("read1"))
+async def cmd_read1(message: Message) -> None:
+    if not should_process_message(message, handler="read1"):
+        return
+
+    reset_state_for_explicit_command(message.from_user.id if message.from_user else None)
+    mark_user_active(message.from_user.id if message.from_user else None)
+    await prompt_tarot_mode(message)
+
+
+@router.message(Command("love1"))
+async def cmd_love1(message: Message) -> None:
+    if not should_process_message(message, handler="love1"):
+        return
+
+    user_id = message.from_user.id if message.from_user else None
+    reset_state_for_explicit_command(user_id)
+    set_user_mode(user_id, "tarot")
+    set_tarot_theme(user_id, "love")
+    set_tarot_flow(user_id, "awaiting_question")
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(
+        build_tarot_question_prompt("love", lang=lang), reply_markup=build_base_menu(user_id)
+    )
+
+
+@router.message(CommandStart())
+async def cmd_start(message: Message) -> None:
+    if not should_process_message(message, handler="start"):
+        return
+
+    user_id = message.from_user.id if message.from_user else None
+    reset_state_for_explicit_command(user_id)
+    set_user_mode(user_id, "consult")
+    reset_tarot_state(user_id)
+    mark_user_active(user_id)
+    lang, is_persisted = resolve_user_lang(message)
+    if not is_persisted:
+        prompt = f"{t(lang, 'LANGUAGE_SELECT_PROMPT')}\n\n{get_start_text(lang=lang)}"
+        await message.answer(
+            prompt,
+            reply_markup=build_lang_keyboard(lang=lang),
+        )
+        return
+
+    await message.answer(get_start_text(lang=lang), reply_markup=base_menu_kb(lang=lang))
+
+
+@router.message(Command("lang"))
+async def cmd_lang(message: Message, *, skip_dedup: bool = False) -> None:
+    if not skip_dedup and not should_process_message(message, handler="lang"):
+        return
+    logger.info(
+        "Entered /lang handler",
+        extra={
+            "mode": "language",
+            "route": "command",
+            "user_id": getattr(getattr(message, "from_user", None), "id", None),
+            "skip_dedup": skip_dedup,
+            "message_id": getattr(message, "message_id", None),
+        },
+    )
+
+    user_id = message.from_user.id if message.from_user else None
+    if user_id is None:
+        await message.answer(t("ja", "USER_INFO_MISSING"))
+        return
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(
+        t(lang, "LANGUAGE_SELECT_PROMPT"),
+        reply_markup=build_lang_keyboard(lang=lang),
+    )
+
+
+@router.callback_query(F.data == "nav:menu")
+async def handle_nav_menu(query: CallbackQuery, state: FSMContext) -> None:
+    await safe_answer_callback(query, cache_time=1)
+    user_id = query.from_user.id if query.from_user else None
+    reset_tarot_state(user_id)
+    set_user_mode(user_id, "consult")
+    mark_user_active(user_id)
+    await state.clear()
+    if query.message:
+        await query.message.answer(
+            t(get_user_lang_or_default(user_id), "MENU_RETURNED_TEXT"),
+            reply_markup=build_base_menu(user_id),
+        )
+
+
+@router.callback_query(F.data.startswith("lang:set:"))
+async def handle_lang_set(query: CallbackQuery) -> None:
+    await safe_answer_callback(query, cache_time=1)
+    data = query.data or ""
+    lang_code = data.split(":", maxsplit=2)[-1] if ":" in data else None
+    normalized = normalize_lang(lang_code) if lang_code else None
+    user_id = query.from_user.id if query.from_user else None
+
+    if normalized not in SUPPORTED_LANGS or user_id is None:
+        if query.message:
+            await query.message.answer(t("ja", "LANGUAGE_SET_FAILED"))
+        return
+
+    store_user_lang(user_id, normalized)
+    set_user_mode(user_id, "consult")
+    reset_tarot_state(user_id)
+    mark_user_active(user_id)
+    lang_label_map = {
+        "ja": t("ja", "LANGUAGE_OPTION_JA"),
+        "en": t("en", "LANGUAGE_OPTION_EN"),
+        "pt": t("pt", "LANGUAGE_OPTION_PT"),
+    }
+    lang_label = lang_label_map.get(normalized, normalized)
+    confirmation = t(normalized, "LANGUAGE_SET_CONFIRMATION", language=lang_label)
+    reply_markup = base_menu_kb(lang=normalized)
+    start_text = get_start_text(lang=normalized)
+    if query.message:
+        await query.message.answer(confirmation, reply_markup=reply_markup)
+        await query.message.answer(start_text, reply_markup=reply_markup)
+    else:
+        await get_bot().send_message(user_id, confirmation, reply_markup=reply_markup)
+        await get_bot().send_message(user_id, start_text, reply_markup=reply_markup)
+
+
+@router.callback_query(F.data == "nav:status")
+async def handle_nav_status(query: CallbackQuery, state: FSMContext) -> None:
+    await safe_answer_callback(query, cache_time=1)
+    user_id = query.from_user.id if query.from_user else None
+    if user_id is None:
+        await safe_answer_callback(query, t("ja", "USER_INFO_MISSING"), show_alert=True)
+        return
+    await state.clear()
+    set_user_mode(user_id, "status")
+    mark_user_active(user_id)
+    now = utcnow()
+    lang = get_user_lang_or_default(user_id)
+    user = get_user_with_default(user_id) or ensure_user(user_id, now=now)
+    formatted = format_status(user, now=now, lang=lang)
+    if query.message:
+        await query.message.answer(formatted, reply_markup=build_base_menu(user_id))
+    else:
+        await get_bot().send_message(user_id, formatted, reply_markup=build_base_menu(user_id))
+
+
+@router.callback_query(F.data.startswith("tarot_theme:"))
+async def handle_tarot_theme_select(query: CallbackQuery):
+    await safe_answer_callback(query, cache_time=1)
+    data = query.data or ""
+    _, _, theme = data.partition(":")
+    user_id = query.from_user.id if query.from_user else None
+    mark_user_active(user_id)
+    if theme not in {"love", "marriage", "work", "life"}:
+        lang = get_user_lang_or_default(user_id)
+        await safe_answer_callback(query, t(lang, "UNKNOWN_THEME"), show_alert=True)
+        return
+
+    set_user_mode(user_id, "tarot")
+    set_tarot_theme(user_id, theme)
+    set_tarot_flow(user_id, "awaiting_question")
+    lang = get_user_lang_or_default(user_id)
+    await safe_answer_callback(query, t(lang, "TAROT_THEME_SET_CONFIRMATION"))
+    if query.message:
+        prompt_text = build_tarot_question_prompt(theme, lang=lang)
+        await query.message.edit_text(prompt_text)
+    elif user_id is not None:
+        await get_bot().send_message(user_id, build_tarot_question_prompt(theme, lang=lang))
+
+
+@router.callback_query(F.data == "upgrade_to_three")
+async def handle_upgrade_to_three(query: CallbackQuery):
+    await safe_answer_callback(query, cache_time=1)
+    if query.message:
+        lang = get_user_lang_or_default(query.from_user.id if query.from_user else None)
+        await query.message.answer(
+            "3枚スプレッドで深掘りするには /buy からチケットを購入してください。\n"
+            "決済が未開放の場合は少しお待ちください。",
+            reply_markup=build_store_keyboard(lang=lang),
+        )
+
+
+async def handle_tarot_reading(
+    message: Message,
+    user_query: str,
+    *,
+    spread: Spread | None = None,
+    guidance_note: str | None = None,
+    short_response: bool = False,
+    theme: str | None = None,
+    charge: str | None = None,
+) -> None:
+    total_start = perf_counter()
+    openai_latency_ms: float | None = None
+    user_id = message.from_user.id if message.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    lang_code = normalize_lang(lang)
+    chat_id = get_chat_id(message)
+    can_use_bot = hasattr(message, "chat") and getattr(message.chat, "id", None) is not None
+    spread_to_use = spread or choose_spread(user_query)
+    try:
+        release_inflight = await acquire_inflight(user_id, message, lang=lang_code, mode="tarot")
+    except Superseded:
+        refund_tarot_charge(user_id, spread_to_use, charge, now=utcnow())
+        return
+    event_success = False
+    event_error: str | None = None
+
+    effective_theme = theme or get_tarot_theme(user_id)
+    rng = random.Random()
+    drawn = draw_cards(spread_to_use, rng=rng)
+
+    drawn_payload: list[dict[str, str]] = []
+    position_lookup = {pos.id: pos for pos in spread_to_use.positions}
+    for item in drawn:
+        position = position_lookup[item.position_id]
+        keywords = (
+            item.card.keywords_reversed_ja
+            if item.is_reversed
+            else item.card.keywords_upright_ja
+        )
+        drawn_payload.append(
+            {
+                "id": position.id,
+                "label_ja": position.label_ja,
+                "label_en": _get_position_label_translation(position.id, "en"),
+                "label_pt": _get_position_label_translation(position.id, "pt"),
+                "meaning_ja": position.meaning_ja,
+                "meaning_en": _get_position_meaning_translation(position.id, "en"),
+                "meaning_pt": _get_position_meaning_translation(position.id, "pt"),
+                "card": {
+                    "id": item.card.id,
+                    "name_ja": item.card.name_ja,
+                    "name_en": item.card.name_en,
+                    "orientation": "reversed" if item.is_reversed else "upright",
+                    "orientation_label_ja": orientation_label(item.is_reversed),
+                    "orientation_label_en": orientation_label_by_lang(item.is_reversed, "en"),
+                    "orientation_label_pt": orientation_label_by_lang(item.is_reversed, "pt"),
+                    "keywords_ja": list(keywords),
+                },
+            }
+        )
+
+    action_count = determine_action_count(user_id, getattr(message, "message_id", None))
+    prompt_start = perf_counter()
+    messages = build_tarot_messages(
+        spread=spread_to_use,
+        user_query=fit_user_input(user_query, lang=lang_code, mode="tarot", user_id=user_id),
+        drawn_cards=drawn_payload,
+        short=short_response,
+        theme=effective_theme,
+        action_count=action_count,
+        lang=lang,
+    )
+    prompt_build_ms = (perf_counter() - prompt_start) * 1000
+
+    status_message: Message | None = None
+    try:
+        status_message = await send_status_message(
+            message,
+            t(lang_code, "READING_IN_PROGRESS_NOTICE"),
+            reply_markup=build_quick_menu(user_id),
+        )
+        openai_start = perf_counter()
+        try:
+            answer, fatal = await run_supersedable(
+                user_id,
+                "tarot",
+                call_openai_with_retry(messages, lang=lang_code, max_tokens=TAROT_MAX_TOKENS),
+            )
+        except TypeError:
+            answer, fatal = await call_openai_with_retry(messages)
+        openai_latency_ms = (perf_counter() - openai_start) * 1000
+        if fatal:
+            error_text = (
+                answer
+                + "\n\n"
+                + t(lang_code, "APOLOGY_RETRY_NOTE")
+            )
+            if can_use_bot and chat_id is not None:
+                await send_long_text(
+                    chat_id,
+                    error_text,
+                    reply_to=getattr(message, "message_id", None),
+                    reply_markup_first=build_quick_menu(user_id),
+                )
+            else:
+                await message.answer(error_text, reply_markup=build_quick_menu(user_id))
+            event_error = "fatal_tarot"
+            return
+
+        if spread_to_use.id == THREE_CARD_TIME_AXIS.id:
+            base_answer = answer
+            if guidance_note:
+                base_answer = f"{base_answer}\n\n{guidance_note}"
+            base_answer = append_caution_note(user_query, base_answer, lang=lang_code)
+            formatted_answer = format_time_axis_tarot_answer(
+                base_answer,
+                drawn_cards=drawn_payload,
+                time_range_text=get_time_range_text(lang_code),
+                caution_note=get_caution_note(lang_code),
+                lang=lang_code,
+                card_line_prefix=get_card_line_prefix(lang_code),
+            )
+        else:
+            formatted_answer = format_long_answer(
+                answer,
+                "tarot",
+                card_line=format_drawn_cards(drawn_payload, lang=lang_code),
+                position_labels=spread_to_use.position_labels if lang_code == "ja" else None,
+                lang=lang_code,
+                card_line_prefix=get_card_line_prefix(lang_code),
+            )
+            if guidance_note:
+                formatted_answer = f"{formatted_answer}\n\n{guidance_note}"
+            formatted_answer = append_caution_note(user_query, formatted_answer, lang=lang_code)
+            formatted_answer = finalize_tarot_answer(
+                formatted_answer,
+                card_line_prefix=get_card_line_prefix(lang_code),
+                caution_note=get_caution_note(lang_code),
+            )
+        bullet_count = sum(
+            1 for line in formatted_answer.splitlines() if line.lstrip().startswith("・")
+        )
+        logger.info(
+            "Tarot bullet count",
+            extra={
+                "action_count": action_count,
+                "bullet_count": bullet_count,
+            },
+        )
+        upgrade_markup = build_upgrade_keyboard(lang=lang_code) if spread_to_use.id == ONE_CARD.id else None
+        share_markup = build_share_start_keyboard(lang=lang_code)
+        final_markup = merge_inline_keyboards_compact(upgrade_markup, share_markup)
+        if can_use_bot and chat_id is not None:
+            await send_long_text(
+                chat_id,
+                formatted_answer,
+                reply_to=getattr(message, "message_id", None),
+                reply_markup_first=build_quick_menu(user_id),
+                reply_markup_last=final_markup,
+            )
+        else:
+            await message.answer(
+                formatted_answer, reply_markup=final_markup or build_quick_menu(user_id)
+            )
+        await restore_base_menu(message, user_id, lang_code)
+        event_success = True
+    except Superseded:
+        # 新しいメッセージの方を返すので、こちらは何も送らない。
+        refund_tarot_charge(user_id, spread_to_use, charge, now=utcnow())
+        event_error = "superseded"
+    except Exception:
+        logger.exception("Unexpected error during tarot reading")
+        fallback = (
+            "占いの準備で少しつまずいてしまいました。\n"
+            "時間をおいて、もう一度話しかけてもらえるとうれしいです。"
+        )
+        if can_use_bot and chat_id is not None:
+            await send_long_text(
+                chat_id,
+                fallback,
+                reply_to=getattr(message, "message_id", None),
+                reply_markup_first=build_quick_menu(user_id),
+            )
+        else:
+            await message.answer(fallback, reply_markup=build_quick_menu(user_id))
+        event_error = "tarot_exception"
+    finally:
+        await delete_status_message(status_message)
+        total_ms = (perf_counter() - total_start) * 1000
+        logger.info(
+            "Tarot handler finished",
+            extra={
+                "mode": "tarot",
+                "user_id": user_id,
+                "message_id": getattr(message, "message_id", None),
+                "tarot_theme": effective_theme,
+                "prompt_build_ms": round(prompt_build_ms, 3),
+                "openai_latency_ms": round(openai_latency_ms or 0, 2),
+                "total_handler_ms": round(total_ms, 2),
+            },
+        )
+        safe_log_app_event(
+            event_type="tarot",
+            user_id=user_id,
+            payload=json.dumps(
+                {
+                    "spread": spread_to_use.id,
+                    "theme": effective_theme,
+                    "success": event_success,
+                }
+            ),
+        )
+        if event_error:
+            safe_log_app_event(
+                event_type="error",
+                user_id=user_id,
+                payload=event_error,
+            )
+        release_inflight()
+
+
+# Catch-all handler for non-command text messages
+@router.message(
+    ~Command(
+        commands=[
+            "terms",
+            "support",
+            "paysupport",
+            "buy",
+            "status",
+            "read1",
+            "love1",
+            "refund",
+            "start",
+            "help",
+            "feedback",
+            "admin",
+        ]
+    )
+)
+async def handle_message(message: Message) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    content_type = getattr(message, "content_type", ContentType.TEXT)
+    is_text = content_type == ContentType.TEXT
+    if not is_text:
+        ok, error_message = validate_question_text(None, is_text=False, lang=lang)
+        if not ok and error_message:
+            await message.answer(error_message, reply_markup=build_base_menu(user_id))
+        return
+
+    text = (message.text or "").strip()
+    is_language_button, normalized_language_hint = is_language_reply_button(text)
+    now = utcnow()
+    if not should_process_message(
+        message,
+        handler="router",
+        allow_language_duplicate=is_language_button,
+        language_button_hint=normalized_language_hint,
+    ):
+        return
+    if await reset_state_if_inactive(message, now=now):
+        return
+    mark_user_active(user_id, now=now)
+    lang = get_user_lang_or_default(user_id)
+    menu_markup = build_base_menu(user_id)
+    quick_menu = build_quick_menu(user_id)
+    admin_mode = is_admin_user(user_id)
+    user_mode = get_user_mode(user_id)
+    tarot_flow = TAROT_FLOW.get(user_id)
+    tarot_theme = get_tarot_theme(user_id)
+
+    logger.info(
+        "Received message",
+        extra={
+            "mode": "router",
+            "user_id": user_id,
+            "admin_mode": admin_mode,
+            "text_preview": preview_text(text),
+            "tarot_flow": tarot_flow,
+            "tarot_theme": tarot_theme,
+            "route": "received",
+            "paywall_triggered": False,
+        },
+    )
+
+    if not text:
+        await message.answer(
+            t(lang, "ASK_FOR_MORE_DETAIL"),
+            reply_markup=menu_markup,
+        )
+        return
+
+    if text.startswith("🎩"):
+        await prompt_tarot_mode(message)
+        return
+
+    if text.startswith("💬"):
+        await prompt_consult_mode(message)
+        return
+
+    if text.startswith("🛒"):
+        await prompt_charge_menu(message)
+        return
+
+    if text.startswith("📊"):
+        await prompt_status(message, now=now)
+        return
+
+    if is_language_button:
+        await cmd_lang(message, skip_dedup=True)
+        return
+
+    spread_from_command, cleaned = parse_spread_command(text)
+
+    if spread_from_command:
+        set_user_mode(user_id, "tarot")
+        if text.lower().startswith("/love1"):
+            set_tarot_theme(user_id, "love")
+        user_query = cleaned or t(lang, "DEFAULT_TAROT_QUERY_FALLBACK")
+        await execute_tarot_request(
+            message,
+            user_query=user_query,
+            spread=spread_from_command,
+            theme=get_tarot_theme(user_id),
+        )
+        return
+
+    if tarot_flow == "awaiting_theme":
+        await message.answer(
+            t(lang, "TAROT_THEME_PROMPT"), reply_markup=build_tarot_theme_keyboard(lang=lang)
+        )
+        return
+
+    if tarot_flow == "awaiting_question":
+        ok, error_message = validate_question_text(text, is_text=is_text, lang=lang)
+        if not ok and error_message:
+            await message.answer(error_message, reply_markup=quick_menu)
+            return
+        set_tarot_flow(user_id, None)
+        await execute_tarot_request(
+            message,
+            user_query=text,
+            spread=ONE_CARD,
+            theme=tarot_theme,
+        )
+        return
+
+    if user_mode == "tarot" or is_tarot_request(text):
+        ok, error_message = validate_question_text(text, is_text=is_text, lang=lang)
+        if not ok and error_message:
+            await message.answer(error_message, reply_markup=quick_menu)
+            return
+        set_user_mode(user_id, "tarot")
+        await execute_tarot_request(
+            message,
+            user_query=text,
+            spread=ONE_CARD,
+            theme=tarot_theme,
+        )
+        return
+
+    ok, error_message = validate_question_text(text, is_text=is_text, lang=lang)
+    if not ok and error_message:
+        await message.answer(error_message, reply_markup=quick_menu)
+        return
+
+    await handle_general_chat(message, user_query=text)
@@ -73,3 +73,64 @@ def arisa_menu_kb(lang: str | None = "ja") -> ReplyKeyboardMarkup:
         is_persistent=True,
         resize_keyboard=True,
     )
+
+
+
+
+def build_charge_retry_keyboard(lang: str | None = "ja") -> InlineKeyboardMarkup:
+    lang_code = normalize_lang(lang)
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=t(lang_code, "GO_TO_STORE_BUTTON"), callback_data="nav:charge")],
+            [InlineKeyboardButton(text=t(lang_code, "VIEW_STATUS_BUTTON"), callback_data="nav:status")],
+        ]
+    )
+
+
+def build_lang_keyboard(lang: str | None = "ja") -> InlineKeyboardMarkup:
+    lang_code = normalize_lang(lang)
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=t(lang_code, "LANGUAGE_OPTION_JA"), callback_data="lang:set:ja")],
+            [InlineKeyboardButton(text=t(lang_code, "LANGUAGE_OPTION_EN"), callback_data="lang:set:en")],
+            [InlineKeyboardButton(text=t(lang_code, "LANGUAGE_OPTION_PT"), callback_data="lang:set:pt")],
+        ]
+    )
+
+
+def merge_inline_keyboards(*markups: InlineKeyboardMarkup | None) -> InlineKeyboardMarkup | None:
+    rows: list[list[InlineKeyboardButton]] = []
+    for markup in markups:
+        if not markup:
+            continue
+        kb = getattr(markup, "inline_keyboard", None)
+        if kb:
+            rows.extend(kb)
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
+
+def merge_inline_keyboards_compact(
+    base_markup: InlineKeyboardMarkup | None,
+    extra_markup: InlineKeyboardMarkup | None,
+) -> InlineKeyboardMarkup | None:
+    if not base_markup:
+        return extra_markup
+    if not extra_markup:
+        return base_markup
+
+    base_rows = list(getattr(base_markup, "inline_keyboard", []) or [])
+    extra_rows = list(getattr(extra_markup, "inline_keyboard", []) or [])
+
+    if (
+        base_rows
+        and len(base_rows[-1]) == 1
+        and len(extra_rows) == 1
+        and len(extra_rows[0]) == 1
+    ):
+        merged_rows = [list(row) for row in base_rows]
+        merged_rows[-1] = merged_rows[-1] + extra_rows[0]
+        return InlineKeyboardMarkup(inline_keyboard=merged_rows)
+
+    merged_rows = list(base_rows)
+    merged_rows.extend(extra_rows)
+    return InlineKeyboardMarkup(inline_keyboard=merged_rows) if merged_rows else None
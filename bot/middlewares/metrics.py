@@ -0,0 +1,45 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from core.metrics import REGISTRY, MetricsRegistry
+from core.tracing import set_attribute
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Records handler latency labelled by the handler function and outcome.
+
+    Register it as an inner middleware after the throttle so that dropped
+    updates are not counted as handler calls.
+    """
+
+    def __init__(self, event: str, registry: MetricsRegistry = REGISTRY) -> None:
+        super().__init__()
+        self.event = event
+        self.latency = registry.histogram(
+            "bot_handler_duration_seconds",
+            "Telegram handler latency",
+            labelnames=("event", "handler", "outcome"),
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        set_attribute("handler", name)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await handler(event, data)
+            outcome = "ok"
+            return result
+        finally:
+            self.latency.observe(
+                time.perf_counter() - started, event=self.event, handler=name, outcome=outcome
+            )
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    ForwardMessage,
+    SendDocument,
+    SendInvoice,
+    SendMessage,
+    SendPhoto,
+    TelegramMethod,
+)
+
+from core.expiring_map import ExpiringMap
+from core.metrics import REGISTRY
+from core.tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SEND_WAIT_SECONDS = REGISTRY.histogram(
+    "bot_telegram_send_wait_seconds",
+    "Time a chat-bound Bot API call waited for its per-chat and global budget",
+    (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+)
+SEND_LATENCY_SECONDS = REGISTRY.histogram(
+    "bot_telegram_send_duration_seconds",
+    "Chat-bound Bot API call latency from enqueue to result, including waits and retries",
+    (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0),
+    labelnames=("outcome",),
+)
+SEND_RETRY_AFTER = REGISTRY.counter(
+    "bot_telegram_retry_after_total", "Flood-control (429) replies from the Bot API"
+)
+
+# Bot API methods that post (or rewrite) a message in a chat and therefore count
+# towards Telegram's per-chat and global flood limits.
+SCHEDULED_METHODS = (
+    SendMessage,
+    SendPhoto,
+    SendDocument,
+    SendInvoice,
+    CopyMessage,
+    ForwardMessage,
+    EditMessageText,
+    EditMessageReplyMarkup,
+)
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of refusing.
+
+    ``reserve`` always takes a token, letting the balance go negative, and
+    returns how long the caller has to wait before its token is actually due.
+    Waiters are therefore served in reservation order without extra locking.
+    """
+
+    def __init__(
+        self, rate_per_sec: float, capacity: float, *, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.rate_per_sec = rate_per_sec
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self._updated_at)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_sec)
+        self._updated_at = now
+
+    def reserve(self) -> float:
+        if self.rate_per_sec <= 0:
+            return 0.0
+        now = self._clock()
+        self._refill(now)
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate_per_sec
+
+    def pause(self, seconds: float) -> None:
+        """Drain the bucket so that nothing is granted for ``seconds``."""
+        now = self._clock()
+        self._refill(now)
+        self._tokens = min(self._tokens, -seconds * self.rate_per_sec)
+
+    def is_full(self) -> bool:
+        self._refill(self._clock())
+        return self._tokens >= self.capacity
+
+
+@dataclass
+class SendSchedulerStats:
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    sent: int = 0
+    failed: int = 0
+    retry_after_hits: int = 0
+    latency_ms_total: float = 0.0
+    latency_ms_max: float = 0.0
+
+    @property
+    def latency_ms_avg(self) -> float:
+        return self.latency_ms_total / self.sent if self.sent else 0.0
+
+
+class SendScheduler:
+    """Serialises outbound sends per chat and paces them per chat and globally."""
+
+    def __init__(
+        self,
+        *,
+        global_rate_per_sec: float = 30.0,
+        global_burst: float = 30.0,
+        chat_rate_per_sec: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+        max_tracked_chats: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ) -> None:
+        self.chat_rate_per_sec = chat_rate_per_sec
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        self._global = TokenBucket(global_rate_per_sec, global_burst, clock=clock)
+        # A bucket that has refilled completely carries no information, so it
+        # expires after one refill time; paused or overdrawn buckets are kept.
+        self._chat_buckets: ExpiringMap[int | str, TokenBucket] = ExpiringMap(
+            ttl_sec=chat_burst / chat_rate_per_sec if chat_rate_per_sec > 0 else 0.0,
+            max_size=max_tracked_chats,
+            can_evict=TokenBucket.is_full,
+            clock=clock,
+        )
+        self._chat_locks: Dict[int | str, asyncio.Lock] = {}
+        self._chat_pending: Dict[int | str, int] = {}
+        self.stats = SendSchedulerStats()
+
+    def set_global_rate(self, rate_per_sec: float, burst: float | None = None) -> None:
+        """Replace the global bucket, e.g. to split the bot-wide limit across workers."""
+        self._global = TokenBucket(
+            rate_per_sec, rate_per_sec if burst is None else burst, clock=self._clock
+        )
+
+    @property
+    def chat_buckets(self) -> ExpiringMap[int | str, TokenBucket]:
+        return self._chat_buckets
+
+    def queue_depth(self, chat_id: int | str | None = None) -> int:
+        if chat_id is None:
+            return self.stats.queue_depth
+        return self._chat_pending.get(chat_id, 0)
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "queue_depth": self.stats.queue_depth,
+            "max_queue_depth": self.stats.max_queue_depth,
+            "active_chats": len(self._chat_pending),
+            "tracked_chats": len(self._chat_buckets),
+            "sent": self.stats.sent,
+            "failed": self.stats.failed,
+            "retry_after_hits": self.stats.retry_after_hits,
+            "latency_ms_avg": round(self.stats.latency_ms_avg, 2),
+            "latency_ms_max": round(self.stats.latency_ms_max, 2),
+        }
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate_per_sec, self.chat_burst, clock=self._clock)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _enter(self, chat_id: int | str) -> asyncio.Lock:
+        self._chat_pending[chat_id] = self._chat_pending.get(chat_id, 0) + 1
+        self.stats.queue_depth += 1
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+        return self._chat_locks.setdefault(chat_id, asyncio.Lock())
+
+    def _leave(self, chat_id: int | str) -> None:
+        self.stats.queue_depth -= 1
+        pending = self._chat_pending.get(chat_id, 1) - 1
+        if pending > 0:
+            self._chat_pending[chat_id] = pending
+            return
+        self._chat_pending.pop(chat_id, None)
+        self._chat_locks.pop(chat_id, None)
+
+    async def submit(self, chat_id: int | str, send: Callable[[], Awaitable[T]]) -> T:
+        """Run ``send`` once the chat and global budgets allow it.
+
+        Sends for the same chat run one at a time in submission order.
+        ``TelegramRetryAfter`` pauses the chat and the global budget for the
+        advertised delay (the reply does not say whether the limit was per chat
+        or bot-wide, and sending on in other chats would extend a bot-wide
+        flood wait) and retries up to ``max_retries`` times.
+        """
+        enqueued_at = self._clock()
+        lock = self._enter(chat_id)
+        outcome = "error"
+        try:
+            async with lock:
+                bucket = self._chat_bucket(chat_id)
+                attempt = 0
+                while True:
+                    waited_from = self._clock()
+                    delay = bucket.reserve()
+                    if delay > 0:
+                        await self._sleep(delay)
+                    delay = self._global.reserve()
+                    if delay > 0:
+                        await self._sleep(delay)
+                    SEND_WAIT_SECONDS.observe(self._clock() - waited_from)
+                    try:
+                        result = await send()
+                    except TelegramRetryAfter as exc:
+                        attempt += 1
+                        self.stats.retry_after_hits += 1
+                        SEND_RETRY_AFTER.inc()
+                        logger.warning(
+                            "Telegram flood control hit",
+                            extra={
+                                "chat_id": chat_id,
+                                "retry_after": exc.retry_after,
+                                "attempt": attempt,
+                                "queue_depth": self.stats.queue_depth,
+                            },
+                        )
+                        if attempt > self.max_retries:
+                            raise
+                        bucket.pause(exc.retry_after)
+                        self._global.pause(exc.retry_after)
+                        continue
+                    latency_ms = (self._clock() - enqueued_at) * 1000
+                    self.stats.sent += 1
+                    self.stats.latency_ms_total += latency_ms
+                    self.stats.latency_ms_max = max(self.stats.latency_ms_max, latency_ms)
+                    outcome = "ok"
+                    return result
+        except Exception:
+            self.stats.failed += 1
+            raise
+        finally:
+            SEND_LATENCY_SECONDS.observe(self._clock() - enqueued_at, outcome=outcome)
+            self._leave(chat_id)
+
+
+class SendSchedulerMiddleware(BaseRequestMiddleware):
+    """Routes chat-bound Bot API calls through a :class:`SendScheduler`."""
+
+    def __init__(self, scheduler: SendScheduler) -> None:
+        self.scheduler = scheduler
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[Any],
+        bot: Any,
+        method: TelegramMethod[Any],
+    ) -> Any:
+        with TRACER.span(f"telegram.{type(method).__name__}"):
+            chat_id = getattr(method, "chat_id", None)
+            if chat_id is None or not isinstance(method, SCHEDULED_METHODS):
+                return await make_request(bot, method)
+            return await self.scheduler.submit(chat_id, lambda: make_request(bot, method))
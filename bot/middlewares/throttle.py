@@ -1,19 +1,109 @@
+import logging
 import time
-from typing import Any, Awaitable, Callable, Dict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable
 
 from aiogram import BaseMiddleware
 from aiogram.types import CallbackQuery, Message
 
 from bot.texts.i18n import normalize_lang, t
-from core.db import get_user_lang
+from core.expiring_map import ExpiringMap
+from core.metrics import REGISTRY
+from core.user_scope import scoped_user
+
+THROTTLE_DROPS = REGISTRY.counter(
+    "bot_throttle_drops_total", "Updates dropped by the per-user throttle", ("event", "shed")
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoadSignal:
+    """A load metric (e.g. LLM requests in flight) and the value at which to shed."""
+
+    name: str
+    probe: Callable[[], float]
+    threshold: float
+
+
+class LoadShedder:
+    """Tells throttles to tighten while any load signal is over its threshold."""
+
+    def __init__(self, signals: Iterable[LoadSignal] = (), *, factor: float = 0.25) -> None:
+        self.signals = list(signals)
+        self.factor = factor
+        self._active: str | None = None
+
+    def add(self, signal: LoadSignal) -> None:
+        self.signals.append(signal)
+
+    def overloaded_by(self) -> str | None:
+        reason = None
+        for signal in self.signals:
+            try:
+                value = signal.probe()
+            except Exception:
+                logger.exception("Load probe failed", extra={"signal": signal.name})
+                continue
+            if signal.threshold > 0 and value >= signal.threshold:
+                reason = signal.name
+                break
+        if reason != self._active:
+            if reason:
+                logger.warning("Load shedding engaged", extra={"mode": "throttle", "signal": reason})
+            else:
+                logger.info("Load shedding released", extra={"mode": "throttle", "signal": self._active})
+            self._active = reason
+        return reason
+
+    def multiplier(self) -> float:
+        return self.factor if self.overloaded_by() else 1.0
 
 
 class ThrottleMiddleware(BaseMiddleware):
-    def __init__(self, min_interval_sec: float = 1.2, apply_to_callbacks: bool = True) -> None:
+    """Per-user token bucket: ``burst`` events at once, refilled every ``min_interval_sec``.
+
+    With the default ``burst=1`` this behaves like the old fixed-interval
+    throttle; a larger burst lets a quick double tap through. While the
+    shedder reports overload, the refill rate is multiplied by its factor and
+    the burst drops to one.
+    """
+
+    def __init__(
+        self,
+        min_interval_sec: float = 1.2,
+        apply_to_callbacks: bool = True,
+        max_tracked_users: int = 100_000,
+        *,
+        burst: float = 1.0,
+        shedder: LoadShedder | None = None,
+        lang_resolver: Callable[[int], str | None] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
         super().__init__()
         self.min_interval_sec = min_interval_sec
+        self.rate_per_sec = 1.0 / min_interval_sec if min_interval_sec > 0 else float("inf")
+        self.burst = max(1.0, burst)
         self.apply_to_callbacks = apply_to_callbacks
-        self._last_seen: Dict[int, float] = {}
+        self.shedder = shedder
+        self.lang_resolver = lang_resolver
+        self._clock = clock
+        self.throttled = 0
+        self.shed = 0
+        # (bot scope, user_id) -> (tokens, updated_at). Once a bucket has had time
+        # to refill completely (at the slowest, shedding rate) it carries no information.
+        slowest = shedder.factor if shedder and 0 < shedder.factor < 1 else 1.0
+        self._buckets: ExpiringMap[tuple[str, int], tuple[float, float]] = ExpiringMap(
+            ttl_sec=self.burst * min_interval_sec / slowest,
+            max_size=max_tracked_users,
+            touch_on_get=False,
+            clock=clock,
+        )
+
+    @property
+    def tracked_users(self) -> ExpiringMap[tuple[str, int], tuple[float, float]]:
+        return self._buckets
 
     async def __call__(
         self,
@@ -25,16 +115,33 @@ class ThrottleMiddleware(BaseMiddleware):
             return await handler(event, data)
 
         user_id = self._get_user_id(event)
-        now = time.monotonic()
         if user_id is not None:
-            last = self._last_seen.get(user_id)
-            if last is not None and (now - last) < self.min_interval_sec:
+            multiplier = self.shedder.multiplier() if self.shedder else 1.0
+            if not self._take(user_id, multiplier):
+                self.throttled += 1
+                if multiplier < 1.0:
+                    self.shed += 1
+                THROTTLE_DROPS.inc(
+                    event="callback_query" if isinstance(event, CallbackQuery) else "message",
+                    shed="yes" if multiplier < 1.0 else "no",
+                )
                 await self._handle_throttled(event)
                 return
-            self._last_seen[user_id] = now
 
         return await handler(event, data)
 
+    def _take(self, user_id: int, multiplier: float = 1.0) -> bool:
+        now = self._clock()
+        capacity = self.burst if multiplier >= 1.0 else 1.0
+        key = scoped_user(user_id)
+        tokens, updated_at = self._buckets.get(key, (self.burst, now))
+        tokens = min(capacity, tokens + (now - updated_at) * self.rate_per_sec * multiplier)
+        allowed = tokens >= 1.0
+        if allowed:
+            tokens -= 1.0
+        self._buckets[key] = (tokens, now)
+        return allowed
+
     def _get_user_id(self, event: CallbackQuery | Message) -> int | None:
         if isinstance(event, CallbackQuery):
             return event.from_user.id if event.from_user else None
@@ -53,8 +160,11 @@ class ThrottleMiddleware(BaseMiddleware):
             return
 
     def _resolve_lang(self, event: CallbackQuery | Message) -> str:
+        # Only cached languages here: a user hammering the bot must not turn into DB reads.
         user_id = self._get_user_id(event)
-        saved_lang = get_user_lang(user_id) if user_id is not None else None
+        saved_lang = (
+            self.lang_resolver(user_id) if self.lang_resolver and user_id is not None else None
+        )
         if saved_lang:
             return saved_lang
         language_code = getattr(getattr(event, "from_user", None), "language_code", None)
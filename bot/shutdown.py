@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Collection
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from bot.utils.telegram import interrupt_status_messages
+from core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_UPDATES = REGISTRY.counter(
+    "bot_shutdown_updates_total", "Updates still running when shutdown began", ("outcome",)
+)
+SHUTDOWN_STATUS_MESSAGES = REGISTRY.counter(
+    "bot_shutdown_status_messages_total", "Status messages rewritten as interrupted at shutdown"
+)
+
+
+@dataclass
+class DrainReport:
+    drained: int = 0
+    abandoned: int = 0
+    inflight_users: int = 0
+    status_messages: int = 0
+    elapsed_sec: float = 0.0
+
+
+class ShutdownCoordinator(BaseMiddleware):
+    """Tracks the updates being handled so shutdown can wait for them.
+
+    Registered as an outer ``update`` middleware. ``drain()`` is called after
+    the update source has stopped (polling ended, webhook pool stopped): it
+    waits until every tracked update and every user in ``inflight_users`` is
+    done, up to ``timeout_sec``. Whatever is still running then is abandoned:
+    its status messages are rewritten as interrupted and its task cancelled.
+    """
+
+    def __init__(
+        self,
+        inflight_users: Collection[int],
+        *,
+        timeout_sec: float = 20.0,
+        cancel_grace_sec: float = 5.0,
+        poll_interval_sec: float = 0.05,
+    ) -> None:
+        self.inflight_users = inflight_users
+        self.timeout_sec = timeout_sec
+        self.cancel_grace_sec = cancel_grace_sec
+        self.poll_interval_sec = poll_interval_sec
+        self._active: dict[asyncio.Task[Any], int] = {}
+
+    @property
+    def active(self) -> int:
+        return sum(self._active.values())
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        task = asyncio.current_task()
+        if task is None:
+            return await handler(event, data)
+        self._active[task] = self._active.get(task, 0) + 1
+        try:
+            return await handler(event, data)
+        finally:
+            remaining = self._active.pop(task, 1) - 1
+            if remaining > 0:
+                self._active[task] = remaining
+
+    async def drain(self, *, backlog: Callable[[], int] | None = None) -> DrainReport:
+        """``backlog`` は受信済みで未着手の更新数（webhook のキューなど）。それも待つ。"""
+        started = perf_counter()
+        queued = backlog() if backlog is not None else 0
+        pending = self.active + queued
+        report = DrainReport(inflight_users=len(self.inflight_users))
+        deadline = started + self.timeout_sec
+
+        def _busy() -> bool:
+            return bool(self._active or self.inflight_users or (backlog is not None and backlog() > 0))
+
+        while _busy() and perf_counter() < deadline:
+            await asyncio.sleep(self.poll_interval_sec)
+        abandoned = [task for task in self._active if not task.done()]
+        report.abandoned = sum(self._active.get(task, 0) for task in abandoned)
+        if backlog is not None:
+            report.abandoned += backlog()
+        report.drained = max(0, pending - report.abandoned)
+        # 中断する前に書き換える。ハンドラー側の削除はこれで no-op になる。
+        report.status_messages = await interrupt_status_messages()
+        for task in abandoned:
+            task.cancel()
+        if abandoned:
+            await asyncio.wait(abandoned, timeout=self.cancel_grace_sec)
+        report.elapsed_sec = perf_counter() - started
+        SHUTDOWN_UPDATES.inc(report.drained, outcome="drained")
+        SHUTDOWN_UPDATES.inc(report.abandoned, outcome="abandoned")
+        SHUTDOWN_STATUS_MESSAGES.inc(report.status_messages)
+        log = logger.warning if report.abandoned else logger.info
+        log(
+            "Shutdown drain finished",
+            extra={
+                "mode": "shutdown",
+                "drained": report.drained,
+                "abandoned": report.abandoned,
+                "inflight_users": report.inflight_users,
+                "status_messages": report.status_messages,
+                "elapsed_ms": round(report.elapsed_sec * 1000, 1),
+            },
+        )
+        return report
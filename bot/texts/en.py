@@ -219,6 +219,7 @@ TEXTS = {
     "BUSY_TAROT_MESSAGE": "A reading is already in progress—please wait a moment.",
     "BUSY_CHAT_MESSAGE": "I'm replying now—please wait a moment.",
     "READING_IN_PROGRESS_NOTICE": "🔮 Reading in progress… please wait.",
+    "READING_INTERRUPTED_NOTICE": "The reading was interrupted for maintenance. Please send your message again in a moment.",
     "APOLOGY_RETRY_NOTE": "Sorry for the trouble. Please try again after a short wait.",
     "USER_INFO_MISSING": "We couldn't confirm your user information.",
     "USER_INFO_DM_REQUIRED": "We couldn't confirm your user info. Please try from a direct chat.",
@@ -286,6 +286,7 @@ DEFAULT_TAROT_QUERY_FALLBACK = "今気になっていることについて占っ
 BUSY_TAROT_MESSAGE = "いま鑑定中です…少し待ってね。"
 BUSY_CHAT_MESSAGE = "いま返信中です…少し待ってね。"
 READING_IN_PROGRESS_NOTICE = "🔮鑑定中です…（しばらくお待ちください）"
+READING_INTERRUPTED_NOTICE = "メンテナンスのため鑑定を中断しました。お手数ですが、少し時間をおいてもう一度送ってください。"
 APOLOGY_RETRY_NOTE = "ご不便をおかけしてごめんなさい。時間をおいて再度お試しください。"
 USER_INFO_MISSING = "ユーザー情報を確認できませんでした。"
 USER_INFO_DM_REQUIRED = "ユーザー情報を確認できませんでした。個別チャットからお試しくださいませ。"
@@ -223,6 +223,7 @@ TEXTS = {
     "BUSY_TAROT_MESSAGE": "Uma leitura já está em andamento—aguarde um instante.",
     "BUSY_CHAT_MESSAGE": "Estou respondendo agora—aguarde um instante.",
     "READING_IN_PROGRESS_NOTICE": "🔮 Leitura em andamento… aguarde, por favor.",
+    "READING_INTERRUPTED_NOTICE": "A leitura foi interrompida para manutenção. Envie sua mensagem novamente daqui a pouco.",
     "APOLOGY_RETRY_NOTE": "Desculpe o transtorno. Tente novamente depois de esperar um pouco.",
     "USER_INFO_MISSING": "Não conseguimos confirmar suas informações de usuário.",
     "USER_INFO_DM_REQUIRED": "Não conseguimos confirmar suas informações. Tente a partir de um chat direto, por favor.",
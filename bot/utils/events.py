@@ -0,0 +1,79 @@
+import logging
+
+from core.db import log_app_event, log_audit, log_payment_event
+from core.logging import request_id_var
+
+logger = logging.getLogger(__name__)
+
+
+def safe_log_payment_event(
+    *, user_id: int | None, event_type: str, sku: str | None = None, payload: str | None = None
+) -> None:
+    if user_id is None:
+        return
+    try:
+        log_payment_event(user_id=user_id, event_type=event_type, sku=sku, payload=payload)
+    except Exception:
+        logger.exception(
+            "Failed to log payment event",
+            extra={"user_id": user_id, "event_type": event_type, "payload": payload},
+        )
+
+
+def safe_log_audit(
+    *,
+    action: str,
+    actor_user_id: int | None,
+    target_user_id: int | None,
+    payload: str | None,
+    status: str,
+) -> None:
+    if actor_user_id is None:
+        return
+    try:
+        log_audit(
+            action=action,
+            actor_user_id=actor_user_id,
+            target_user_id=target_user_id,
+            payload=payload,
+            status=status,
+        )
+    except Exception:
+        logger.exception(
+            "Failed to write audit log",
+            extra={
+                "action": action,
+                "actor_user_id": actor_user_id,
+                "target_user_id": target_user_id,
+            "status": status,
+        },
+    )
+
+
+def safe_log_app_event(
+    *, event_type: str, user_id: int | None, payload: str | None = None
+) -> None:
+    request_id = request_id_var.get("-")
+    try:
+        log_app_event(
+            event_type=event_type,
+            user_id=user_id,
+            request_id=request_id,
+            payload=payload,
+        )
+    except Exception:
+        logger.exception(
+            "Failed to log app event",
+            extra={
+                "event_type": event_type,
+                "user_id": user_id,
+                "payload": payload,
+                "request_id": request_id,
+            },
+        )
+
+
+def preview_text(text: str, limit: int = 80) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit] + "..."
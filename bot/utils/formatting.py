@@ -0,0 +1,341 @@
+import re
+from typing import Sequence
+
+from bot.texts.i18n import normalize_lang
+from core.prompts import get_tarot_rules_header
+from core.tarot import orientation_label_by_lang
+from core.tracing import traced
+
+
+CAUTION_NOTE = (
+    "※医療・法律・投資の判断は専門家にご相談ください（一般的な情報としてお伝えします）。"
+)
+CAUTION_NOTES = {
+    "ja": CAUTION_NOTE,
+    "en": "※ For medical, legal, or investment decisions, please consult professionals (general information only).",
+    "pt": "※ Para decisões médicas, jurídicas ou de investimento, consulte profissionais (informação geral).",
+}
+TIME_RANGE_TEXTS = {
+    "ja": "前後3か月",
+    "en": "3 months",
+    "pt": "3 meses",
+}
+CAUTION_KEYWORDS = {
+    "medical": ["病気", "症状", "診断", "薬", "治療", "病院"],
+    "legal": ["法律", "弁護士", "訴訟", "契約", "違法", "逮捕"],
+    "investment": ["投資", "株", "fx", "仮想通貨", "利回り", "資産運用"],
+}
+
+
+def _contains_caution_keyword(text: str) -> bool:
+    lowered = text.lower()
+    for keyword_list in CAUTION_KEYWORDS.values():
+        if any(keyword in lowered for keyword in keyword_list):
+            return True
+    return False
+
+
+def append_caution_note(user_text: str, response: str, *, lang: str | None = "ja") -> str:
+    if not user_text or not _contains_caution_keyword(user_text):
+        return response
+    caution_note = get_caution_note(lang)
+    separator = "\n\n" if not response.endswith("\n") else "\n"
+    return f"{response}{separator}{caution_note}"
+
+
+CARD_LINE_PREFIXES = {
+    "ja": "《カード》：",
+    "en": "《Card》: ",
+    "pt": "《Carta》: ",
+}
+CARD_LINE_PREFIX = CARD_LINE_PREFIXES["ja"]
+CARD_LINE_ERROR_TEXT = {
+    "ja": "カード情報を取得できませんでした。",
+    "en": "Could not retrieve card details.",
+    "pt": "Não foi possível obter informações das cartas.",
+}
+
+
+def get_card_line_prefix(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    return CARD_LINE_PREFIXES.get(lang_code, CARD_LINE_PREFIX)
+
+
+def get_rules_header(lang: str | None = "ja") -> str:
+    return get_tarot_rules_header(lang)
+
+
+def get_caution_note(lang: str | None = "ja") -> str:
+    return CAUTION_NOTES.get(normalize_lang(lang), CAUTION_NOTE)
+
+
+def get_time_range_text(lang: str | None = "ja") -> str:
+    return TIME_RANGE_TEXTS.get(normalize_lang(lang), TIME_RANGE_TEXTS["ja"])
+
+
+_META_HEADING_PATTERNS = (
+    r"^(まとめとして|結論として|総括として|総評として|まとめると|結論から言うと)[、,:：]?\s*",
+)
+
+
+def _strip_meta_prefix(text: str) -> str:
+    cleaned = text
+    for pattern in _META_HEADING_PATTERNS:
+        cleaned = re.sub(pattern, "", cleaned)
+    return cleaned.strip()
+
+
+def _inject_position_headings(
+    lines: list[str],
+    position_labels: Sequence[str] | None,
+    *,
+    card_line_prefix: str = CARD_LINE_PREFIX,
+) -> list[str]:
+    if not position_labels:
+        return lines
+
+    bracketed_labels = [f"【{label}】" for label in position_labels if label]
+    if not bracketed_labels:
+        return lines
+
+    formatted_text = "\n".join(lines)
+    missing_labels = [label for label in bracketed_labels if label not in formatted_text]
+    if not missing_labels:
+        return lines
+
+    card_line_index = None
+    for idx, line in enumerate(lines):
+        if card_line_prefix in line:
+            card_line_index = idx
+            break
+
+    insert_index = (card_line_index + 1) if card_line_index is not None else len(lines)
+    new_lines: list[str] = []
+    new_lines.extend(lines[:insert_index])
+
+    if new_lines and new_lines[-1] != "":
+        new_lines.append("")
+    new_lines.extend(missing_labels)
+    if insert_index < len(lines) and lines[insert_index] != "":
+        new_lines.append("")
+
+    new_lines.extend(lines[insert_index:])
+    return new_lines
+
+
+def _compress_trailing_text(trailing_text: str) -> str:
+    normalized = _strip_meta_prefix(trailing_text)
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    if not normalized:
+        return ""
+
+    sentences = re.split(r"(?<=[。．！？!？])\s*", normalized)
+    sentences = [s for s in sentences if s]
+    if not sentences:
+        return normalized
+
+    compressed = "".join(sentences[:2]).strip()
+    return compressed
+
+
+def _finalize_tarot_lines(lines: list[str]) -> list[str]:
+    bullet_indexes = [idx for idx, line in enumerate(lines) if line.lstrip().startswith("・")]
+    if bullet_indexes:
+        limited_lines: list[str] = []
+        bullet_seen = 0
+        for idx, line in enumerate(lines):
+            if idx in bullet_indexes:
+                bullet_seen += 1
+                if bullet_seen > 4:
+                    continue
+            limited_lines.append(line)
+        lines = limited_lines
+
+        bullet_indexes = [idx for idx, line in enumerate(lines) if line.lstrip().startswith("・")]
+        last_bullet_idx = bullet_indexes[-1]
+        trailing = lines[last_bullet_idx + 1 :]
+        while trailing and trailing[0] == "":
+            trailing.pop(0)
+        trailing_text = " ".join([t for t in trailing if t]).strip()
+        closing_line = _compress_trailing_text(trailing_text) if trailing_text else ""
+        lines = lines[: last_bullet_idx + 1]
+        if closing_line:
+            lines.append(closing_line)
+
+    return lines
+
+
+def format_tarot_answer(
+    text: str,
+    card_line: str | None = None,
+    *,
+    position_labels: Sequence[str] | None = None,
+    lang: str | None = "ja",
+    card_line_prefix: str | None = None,
+) -> str:
+    lang_code = normalize_lang(lang)
+    effective_prefix = card_line_prefix or get_card_line_prefix(lang_code)
+    content = (text or "").strip()
+    if not content:
+        fallback = {
+            "ja": "占い結果をうまく作成できませんでした。もう一度占わせてください。",
+            "en": "I couldn't generate the reading properly. May I draw again?",
+            "pt": "Não consegui gerar a leitura corretamente. Posso tirar novamente?",
+        }
+        return fallback.get(lang_code, fallback["ja"])
+
+    content = content.replace("🃏", "")
+    content = re.sub(r"(\n\s*){3,}", "\n\n", content)
+    lines = [line.rstrip() for line in content.splitlines()]
+
+    normalized_lines: list[str] = []
+    card_line_found = False
+    for line in lines:
+        cleaned = re.sub(r"^結論：\s*", "", line).strip()
+        cleaned = re.sub(r"^[0-9]+[\.．]\s*", "", cleaned)
+        cleaned = re.sub(r"^[①②③④⑤⑥⑦⑧⑨⑩]\s*", "", cleaned)
+        if re.fullmatch(r"[-・\s]*メインメッセージ[:：]?\s*", cleaned):
+            continue
+        cleaned = cleaned.replace("【メインメッセージ】", "")
+        cleaned = _strip_meta_prefix(cleaned)
+        cleaned = re.sub(r"^カード：", "引いたカード：", cleaned)
+        cleaned = re.sub(r"^引いたカード[：:]", effective_prefix, cleaned)
+        cleaned = re.sub(r"^《?(?:カード|Card|Carta)》?[：:]", effective_prefix, cleaned)
+        if effective_prefix in cleaned:
+            if card_line:
+                cleaned = card_line
+            if card_line_found:
+                continue
+            card_line_found = True
+        normalized_lines.append(cleaned)
+
+    if not card_line_found and card_line:
+        intro = [ln for ln in normalized_lines[:2] if ln]
+        rest = normalized_lines[2:]
+        normalized_lines = intro
+        if intro:
+            normalized_lines.append("")
+        normalized_lines.append(card_line)
+        if rest:
+            normalized_lines.append("")
+            normalized_lines.extend(rest)
+
+    compacted: list[str] = []
+    for line in normalized_lines:
+        if line == "" and compacted and compacted[-1] == "":
+            continue
+        compacted.append(line)
+
+    while compacted and compacted[0] == "":
+        compacted.pop(0)
+    while compacted and compacted[-1] == "":
+        compacted.pop()
+
+    compacted = _finalize_tarot_lines(compacted)
+    compacted = _inject_position_headings(
+        compacted,
+        position_labels if lang_code == "ja" else None,
+        card_line_prefix=effective_prefix,
+    )
+    formatted = "\n".join(compacted)
+    if len(formatted) > 1400:
+        formatted = formatted[:1380].rstrip() + "…"
+    return formatted
+
+
+@traced("format.long_answer")
+def format_long_answer(
+    text: str,
+    mode: str,
+    card_line: str | None = None,
+    *,
+    position_labels: Sequence[str] | None = None,
+    lang: str | None = "ja",
+    card_line_prefix: str | None = None,
+) -> str:
+    if mode == "tarot":
+        return format_tarot_answer(
+            text,
+            card_line,
+            position_labels=position_labels,
+            lang=lang,
+            card_line_prefix=card_line_prefix,
+        )
+
+    content = (text or "").strip()
+    if not content:
+        fallback = {
+            "ja": "少し情報が足りないようです。もう一度教えてくださいね。",
+            "en": "I might need a bit more detail. Could you share that again?",
+            "pt": "Preciso de um pouco mais de detalhe. Pode me contar de novo?",
+        }
+        return fallback.get(normalize_lang(lang), fallback["ja"])
+
+    lines = [
+        re.sub(r"^結論：?\s*", "", line)
+        for line in content.splitlines()
+    ]
+    cleaned_lines: list[str] = []
+    for line in lines:
+        stripped = re.sub(r"^[0-9]+[\.．]\s*", "", line)
+        stripped = re.sub(r"^[①②③④⑤⑥⑦⑧⑨⑩]\s*", "", stripped)
+        stripped = re.sub(r"^✅\s*", "", stripped)
+        stripped = stripped.replace("次の一手", "").strip()
+        if stripped or (cleaned_lines and cleaned_lines[-1] != ""):
+            cleaned_lines.append(stripped)
+
+    while cleaned_lines and cleaned_lines[0] == "":
+        cleaned_lines.pop(0)
+    while cleaned_lines and cleaned_lines[-1] == "":
+        cleaned_lines.pop()
+
+    content = "\n".join(cleaned_lines) if cleaned_lines else ""
+    if not content:
+        return "少し情報が足りないようです。もう一度教えてくださいね。"
+
+    content = re.sub(r"(\n\s*){3,}", "\n\n", content)
+    if len(content) > 1400:
+        content = content[:1380].rstrip() + "…"
+    return content
+
+
+def format_drawn_cards(drawn_cards: list[dict[str, str]], *, lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    prefix = get_card_line_prefix(lang_code)
+    if not drawn_cards:
+        message = CARD_LINE_ERROR_TEXT.get(lang_code, CARD_LINE_ERROR_TEXT["ja"])
+        return f"{prefix}{message}"
+
+    card_labels = []
+    for item in drawn_cards:
+        card = item.get("card", {})
+        card_name = (
+            card.get(f"name_{lang_code}")
+            or card.get("name_en")
+            or card.get("name_ja")
+            or "不明なカード"
+        )
+        orientation_label = card.get(f"orientation_label_{lang_code}")
+        if not orientation_label:
+            orientation = (card.get("orientation") or "").lower()
+            orientation_label = orientation_label_by_lang(orientation == "reversed", lang_code)
+        if lang_code == "ja":
+            card_label = f"{card_name}（{orientation_label}）" if orientation_label else card_name
+        else:
+            card_label = f"{card_name} ({orientation_label})" if orientation_label else card_name
+        position_label = item.get(f"label_{lang_code}") if lang_code != "ja" else item.get("label_ja")
+        if position_label and position_label.strip() != "メインメッセージ":
+            card_labels.append(f"{card_label} - {position_label}")
+        else:
+            card_labels.append(card_label)
+    separator = "、" if lang_code == "ja" else ", "
+    return prefix + separator.join(card_labels)
+
+
+def ensure_tarot_response_prefixed(
+    answer: str, heading: str, *, card_line_prefix: str | None = None
+) -> str:
+    prefix = card_line_prefix or CARD_LINE_PREFIX
+    if answer.lstrip().startswith(prefix):
+        return answer
+    return f"{heading}\n{answer}" if heading else answer
@@ -0,0 +1,245 @@
+import asyncio
+import itertools
+import logging
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+from aiogram.types import Message
+
+from bot.texts.i18n import normalize_lang, t
+from core.config import SUPERSEDE_MODES, USER_LOCK_TTL_SEC, USER_MAP_MAX_SIZE
+from core.expiring_map import ExpiringMap, lock_is_idle
+from core.metrics import REGISTRY
+from core.user_scope import scoped_user
+
+logger = logging.getLogger(__name__)
+
+
+# キーは (ボットのスコープ, user_id)。同じユーザーでも別のボットの処理は待たない。
+IN_FLIGHT_USERS: set[tuple[str, int]] = set()
+# 待ち手のいないロックだけが期限切れ・上限超過で捨てられる。
+USER_REQUEST_LOCKS: ExpiringMap[tuple[str, int], asyncio.Lock] = ExpiringMap(
+    ttl_sec=USER_LOCK_TTL_SEC, max_size=USER_MAP_MAX_SIZE, can_evict=lock_is_idle
+)
+RECENT_HANDLED: set[tuple[int, int]] = set()
+RECENT_HANDLED_ORDER: deque[tuple[int, int]] = deque(maxlen=500)
+
+T = TypeVar("T")
+
+# stage="queued": LLM を呼ぶ前に取り消した（呼び出し 1 回分が浮く）。
+# stage="in_flight": 応答待ちの途中で取り消した（送信済みの試行分は課金される）。
+SUPERSEDED_REQUESTS = REGISTRY.counter(
+    "bot_superseded_requests_total", "Requests replaced by a newer message from the same user", ("mode", "stage")
+)
+SUPERSEDED_REFUNDS = REGISTRY.counter(
+    "bot_superseded_refunds_total", "Charges given back for superseded requests", ("mode", "kind")
+)
+
+
+class Superseded(Exception):
+    """A newer message from the same user replaced this request before it was answered."""
+
+
+@dataclass
+class _PendingCall:
+    task: asyncio.Future
+    superseded: bool = False
+
+
+def _call_is_done(pending: _PendingCall) -> bool:
+    return pending.task.done()
+
+
+# SUPERSEDE_MODES の (スコープ, ユーザー, モード) ごとの最新リクエスト番号と、応答待ちの LLM 呼び出し。
+# 取り消すのは同じモードの新しいメッセージだけ。別モードのメッセージは従来どおり順番を待つ。
+# 番号は全体で単調増加なので、期限切れで消えた後は「より新しいものは来ていない」とみなせる。
+LATEST_REQUESTS: ExpiringMap[tuple[str, int, str], int] = ExpiringMap(
+    ttl_sec=USER_LOCK_TTL_SEC, max_size=USER_MAP_MAX_SIZE
+)
+PENDING_CALLS: ExpiringMap[tuple[str, int, str], _PendingCall] = ExpiringMap(
+    ttl_sec=USER_LOCK_TTL_SEC, max_size=USER_MAP_MAX_SIZE, can_evict=_call_is_done
+)
+_request_counter = itertools.count(1)
+_request_seq: ContextVar[int | None] = ContextVar("request_seq", default=None)
+
+
+async def acquire_inflight(
+    user_id: int | None,
+    message: Message | None = None,
+    *,
+    busy_message: str | None = None,
+    lang: str | None = "ja",
+    mode: str | None = None,
+) -> Callable[[], None]:
+    """ユーザーごとのロックを取る。
+
+    ``mode`` が SUPERSEDE_MODES に入っていれば、同じモードで待っている古いリクエストと
+    応答待ちの LLM 呼び出しを取り消して、このリクエストだけを処理する。取り消された側には
+    ``Superseded`` が送られる（ここで待っていた場合はこの関数が送出する）。
+    """
+
+    def _noop() -> None:
+        return None
+
+    if user_id is None:
+        return _noop
+
+    supersede = mode is not None and mode in SUPERSEDE_MODES
+    user_key = scoped_user(user_id)
+    key = (*user_key, mode or "")
+    seq: int | None = None
+    if supersede:
+        seq = next(_request_counter)
+        LATEST_REQUESTS[key] = seq
+        _request_seq.set(seq)
+        pending = PENDING_CALLS.get(key)
+        if pending is not None and not pending.task.done():
+            pending.superseded = True
+            pending.task.cancel()
+
+    lock = USER_REQUEST_LOCKS.setdefault(user_key, asyncio.Lock())
+    already_locked = lock.locked()
+    if already_locked and message and not supersede:
+        lang_code = normalize_lang(lang)
+        reply_text = busy_message if busy_message is not None else t(lang_code, "BUSY_TAROT_MESSAGE")
+        if reply_text:
+            # message.answer() returns an awaitable SendMessage, not a coroutine.
+            asyncio.ensure_future(message.answer(reply_text))
+    await lock.acquire()
+    if supersede and LATEST_REQUESTS.get(key, seq) != seq:
+        # 待っている間にもっと新しいメッセージが来た。
+        lock.release()
+        SUPERSEDED_REQUESTS.inc(mode=mode, stage="queued")
+        raise Superseded
+    IN_FLIGHT_USERS.add(user_key)
+    logger.info(
+        "Acquired user request lock",
+        extra={
+            "user_id": user_id,
+            "queued": already_locked,
+        },
+    )
+
+    def _release() -> None:
+        if lock.locked():
+            lock.release()
+        IN_FLIGHT_USERS.discard(user_key)
+        if seq is not None and LATEST_REQUESTS.get(key) == seq:
+            LATEST_REQUESTS.pop(key, None)
+        logger.info(
+            "Released user request lock",
+            extra={
+                "user_id": user_id,
+            },
+        )
+
+    return _release
+
+
+async def run_supersedable(user_id: int | None, mode: str, call: Awaitable[T]) -> T:
+    """LLM 呼び出しを、同じユーザーの新しいメッセージで取り消せる形で待つ。
+
+    ``acquire_inflight(..., mode=mode)`` の後に呼ぶ。取り消されたら ``Superseded``。
+    OpenAI の同期クライアントはスレッドで動くので、送信済みの HTTP リクエスト自体は止まらない。
+    """
+    seq = _request_seq.get()
+    if user_id is None or mode not in SUPERSEDE_MODES or seq is None:
+        return await call
+    key = (*scoped_user(user_id), mode)
+    if LATEST_REQUESTS.get(key, seq) != seq:
+        if asyncio.iscoroutine(call):
+            call.close()
+        SUPERSEDED_REQUESTS.inc(mode=mode, stage="queued")
+        raise Superseded
+    pending = _PendingCall(asyncio.ensure_future(call))
+    PENDING_CALLS[key] = pending
+    try:
+        return await pending.task
+    except asyncio.CancelledError:
+        if not pending.superseded:
+            raise
+        SUPERSEDED_REQUESTS.inc(mode=mode, stage="in_flight")
+        raise Superseded from None
+    finally:
+        if PENDING_CALLS.get(key) is pending:
+            PENDING_CALLS.pop(key, None)
+
+
+def record_superseded_refund(mode: str, kind: str, amount: float = 1.0) -> None:
+    SUPERSEDED_REFUNDS.inc(amount, mode=mode, kind=kind)
+    logger.info("Refunded superseded request", extra={"mode": mode, "kind": kind, "amount": amount})
+
+
+def _mark_recent_handled(message: Message) -> bool:
+    message_id = getattr(message, "message_id", None)
+    if message_id is None:
+        return True
+    key = (message.chat.id, message_id)
+    if key in RECENT_HANDLED:
+        return False
+    if len(RECENT_HANDLED_ORDER) >= RECENT_HANDLED_ORDER.maxlen:
+        oldest = RECENT_HANDLED_ORDER.popleft()
+        RECENT_HANDLED.discard(oldest)
+    RECENT_HANDLED.add(key)
+    RECENT_HANDLED_ORDER.append(key)
+    return True
+
+
+def should_process_message(
+    message: Message,
+    *,
+    handler: str | None = None,
+    allow_language_duplicate: bool = False,
+    language_button_hint: str | None = None,
+) -> bool:
+    # Telegram can resend identical language button taps; keep /lang reachable by letting those duplicates through.
+    dedup_key = None
+    message_id = getattr(message, "message_id", None)
+    chat_id = getattr(getattr(message, "chat", None), "id", None)
+    if message_id is not None and chat_id is not None:
+        dedup_key = f"{chat_id}:{message_id}"
+
+    if _mark_recent_handled(message):
+        if allow_language_duplicate or language_button_hint:
+            logger.info(
+                "Language dedup check passed",
+                extra={
+                    "mode": "language",
+                    "route": "dedup",
+                    "dedup_key": dedup_key,
+                    "handler": handler or "unknown",
+                    "status": "accepted_new",
+                    "language_button_hint": language_button_hint,
+                },
+            )
+        return True
+
+    if allow_language_duplicate:
+        logger.info(
+            "Bypassing duplicate message for language button",
+            extra={
+                "mode": "language",
+                "route": "dedup",
+                "dedup_key": dedup_key,
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "handler": handler or "unknown",
+                "language_button_hint": language_button_hint,
+                "status": "bypassed_duplicate",
+            },
+        )
+        return True
+
+    logger.info(
+        "Skipping duplicate message",
+        extra={
+            "mode": "router",
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "dedup_key": dedup_key,
+            "handler": handler or "unknown",
+        },
+    )
+    return False
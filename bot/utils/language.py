@@ -0,0 +1,119 @@
+import logging
+import re
+import unicodedata
+
+from bot.texts.i18n import t
+from bot.utils.events import preview_text
+from bot.utils.state import SUPPORTED_LANGS
+
+logger = logging.getLogger(__name__)
+
+
+LANGUAGE_BUTTON_LABELS = {
+    lang: t(lang, "MENU_LANGUAGE_LABEL") for lang in SUPPORTED_LANGS
+}
+GLOBE_EMOJI_PREFIXES = ("🌐", "🌍", "🌎", "🌏")
+VARIATION_SELECTOR_RE = re.compile(r"[\ufe00-\ufe0f\U000e0100-\U000e01ef]")
+
+
+def _strip_invisible(text: str) -> str:
+    if not text:
+        return ""
+    stripped_chars: list[str] = []
+    for ch in text:
+        if VARIATION_SELECTOR_RE.match(ch):
+            continue
+        category = unicodedata.category(ch)
+        if category in {"Cf", "Cc"}:
+            continue
+        stripped_chars.append(ch)
+    return "".join(stripped_chars)
+
+
+def normalize_language_button_base(text: str) -> str:
+    normalized = unicodedata.normalize("NFKC", text)
+    normalized = normalized.replace("\ufe0e", "").replace("\ufe0f", "")
+    # Telegram clients sometimes prepend invisible control characters on button taps; strip them to avoid false negatives.
+    return _strip_invisible(normalized)
+
+
+def _normalize_language_button_text(text: str) -> str:
+    if not text:
+        return ""
+    normalized = normalize_language_button_base(text)
+    normalized = normalized.strip()
+    for prefix in GLOBE_EMOJI_PREFIXES:
+        if normalized.startswith(prefix):
+            normalized = normalized[len(prefix) :]
+            normalized = normalized.lstrip()
+            break
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    return normalized
+
+
+def _normalize_menu_text(text: str) -> str:
+    if not text:
+        return ""
+    normalized = normalize_language_button_base(text)
+    return normalized.strip()
+
+
+def _has_language_button_prefix(text: str) -> bool:
+    if not text:
+        return False
+    normalized = normalize_language_button_base(text)
+    return normalized.lstrip().startswith(GLOBE_EMOJI_PREFIXES)
+
+
+def _log_language_button_check(
+    *, raw: str, normalized: str, matched: bool, reason: str, hint: str | None
+) -> None:
+    logger.info(
+        "Language button check executed",
+        extra={
+            "mode": "language",
+            "route": "button_check",
+            "matched": matched,
+            "reason": reason,
+            "raw_preview": preview_text(raw),
+            "normalized": normalized or None,
+            "hint": hint,
+        },
+    )
+
+
+def is_language_reply_button(text: str) -> tuple[bool, str | None]:
+    raw = (text or "").strip()
+    normalized = _normalize_language_button_text(raw)
+    if not normalized:
+        if _has_language_button_prefix(raw):
+            _log_language_button_check(raw=raw, normalized=normalized, matched=False, reason="empty", hint=None)
+        return False, None
+
+    normalized_candidates = {_normalize_language_button_text(label) for label in LANGUAGE_BUTTON_LABELS.values()}
+    raw_candidates = {label.strip() for label in LANGUAGE_BUTTON_LABELS.values()}
+    if raw in raw_candidates or normalized in normalized_candidates:
+        hint = normalized or raw
+        _log_language_button_check(raw=raw, normalized=normalized, matched=True, reason="label_match", hint=hint)
+        return True, hint
+
+    if not _has_language_button_prefix(raw):
+        return False, None
+
+    casefold_candidates = {candidate.casefold() for candidate in normalized_candidates}
+    casefold_candidates.update(label.casefold() for label in raw_candidates)
+    matched = normalized.casefold() in casefold_candidates
+    hint = normalized if matched else None
+    _log_language_button_check(
+        raw=raw,
+        normalized=normalized,
+        matched=matched,
+        reason="emoji_prefix" if matched else "emoji_prefix_miss",
+        hint=hint,
+    )
+    return matched, hint
+
+
+def _is_language_button_text(text: str) -> bool:
+    matched, _ = is_language_reply_button(text)
+    return matched
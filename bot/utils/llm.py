@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import random
+from time import perf_counter
+from typing import Any, Iterable
+
+from openai import (
+    APIConnectionError,
+    APIError,
+    APITimeoutError,
+    AuthenticationError,
+    BadRequestError,
+    OpenAI,
+    PermissionDeniedError,
+    RateLimitError,
+)
+
+from bot.texts.i18n import normalize_lang, t
+from bot.utils.postprocess import postprocess_llm_text
+from core.config import (
+    LLM_COALESCE_KEY,
+    MAX_USER_INPUT_TOKENS,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_TIMEOUT_SEC,
+)
+from core.metrics import REGISTRY
+from core.singleflight import SingleFlight, prompt_key
+from core.tokens import estimate_messages_tokens, trim_to_token_budget
+from core.tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+# Bot と同じく、最初の get_openai_client() まで作らない。
+client: OpenAI | None = None
+
+
+def get_openai_client() -> OpenAI:
+    """OpenAI クライアント（生成に数百 ms かかるので初回だけ作る。テストは ``client`` を差し替える）。"""
+    global client
+    if client is None:
+        client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, timeout=OPENAI_TIMEOUT_SEC)
+    return client
+
+
+OPENAI_REQUEST_SECONDS = REGISTRY.histogram(
+    "bot_openai_request_duration_seconds",
+    "OpenAI chat completion latency per attempt",
+    (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0),
+    labelnames=("model", "outcome"),
+)
+OPENAI_TOKENS = REGISTRY.counter(
+    "bot_openai_tokens_total", "Tokens reported by OpenAI usage", ("model", "kind")
+)
+# 同じプロンプトで同時に届いたリクエストは、再試行も含めて 1 回の呼び出しを共有する。
+LLM_FLIGHTS: SingleFlight[tuple[str, bool]] = SingleFlight("bot")
+
+
+def fit_user_input(
+    user_query: str, *, lang: str | None = "ja", mode: str, user_id: int | None = None
+) -> str:
+    """MAX_USER_INPUT_TOKENS を超える入力を末尾で切り詰める。"""
+    fitted, trimmed = trim_to_token_budget(user_query, MAX_USER_INPUT_TOKENS, lang)
+    if trimmed:
+        logger.info(
+            "User input trimmed to token budget",
+            extra={
+                "mode": mode,
+                "user_id": user_id,
+                "original_chars": len(user_query),
+                "trimmed_chars": len(fitted),
+                "max_input_tokens": MAX_USER_INPUT_TOKENS,
+            },
+        )
+    return fitted
+
+
+def _completion_kwargs(
+    prepared_messages: list[dict[str, str]], max_tokens: int | None
+) -> dict[str, Any]:
+    kwargs: dict[str, Any] = {"model": "gpt-4o-mini", "messages": prepared_messages}
+    if max_tokens is not None and max_tokens > 0:
+        kwargs["max_tokens"] = max_tokens
+    return kwargs
+
+
+def _log_token_usage(
+    prepared_messages: list[dict[str, str]],
+    completion: Any,
+    *,
+    lang: str,
+    max_tokens: int | None,
+) -> None:
+    usage = getattr(completion, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", None) if usage else None
+    if prompt_tokens is None:
+        return
+    estimated = estimate_messages_tokens(prepared_messages, lang)
+    logger.info(
+        "OpenAI token usage",
+        extra={
+            "lang": lang,
+            "estimated_prompt_tokens": estimated,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "prompt_token_delta": prompt_tokens - estimated,
+            "max_tokens": max_tokens,
+        },
+    )
+
+
+async def _create_completion(request_kwargs: dict[str, Any]) -> Any:
+    model = request_kwargs.get("model", "unknown")
+    started = perf_counter()
+    outcome = "error"
+    with TRACER.span("llm.chat_completion", model=model) as span:
+        try:
+            openai_client = get_openai_client()
+            completion = await asyncio.get_running_loop().run_in_executor(
+                None,
+                lambda: openai_client.chat.completions.create(**request_kwargs),
+            )
+            outcome = "ok"
+        finally:
+            OPENAI_REQUEST_SECONDS.observe(perf_counter() - started, model=model, outcome=outcome)
+        usage = getattr(completion, "usage", None)
+        for kind in ("prompt_tokens", "completion_tokens"):
+            tokens = getattr(usage, kind, None) if usage else None
+            if isinstance(tokens, int):
+                OPENAI_TOKENS.inc(tokens, model=model, kind=kind.removesuffix("_tokens"))
+                if span is not None:
+                    span.set(kind, tokens)
+    return completion
+
+
+async def call_openai_with_retry(
+    messages: Iterable[dict[str, str]],
+    *,
+    lang: str | None = "ja",
+    max_tokens: int | None = None,
+    coalesce: bool = False,
+) -> tuple[str, bool]:
+    """``coalesce=True`` は、ユーザー固有の情報（履歴・記憶・プロフィール）を含まないプロンプトだけに付ける。"""
+    prepared_messages = list(messages)
+    lang_code = normalize_lang(lang)
+    request_kwargs = _completion_kwargs(prepared_messages, max_tokens)
+    key = None
+    if coalesce:
+        key = prompt_key(
+            prepared_messages,
+            mode=LLM_COALESCE_KEY,
+            model=request_kwargs["model"],
+            max_tokens=request_kwargs.get("max_tokens"),
+            lang=lang_code,
+        )
+    if key is None:
+        return await _call_openai_with_retry(prepared_messages, request_kwargs, lang_code, max_tokens)
+    return await LLM_FLIGHTS.do(
+        key, lambda: _call_openai_with_retry(prepared_messages, request_kwargs, lang_code, max_tokens)
+    )
+
+
+async def _call_openai_with_retry(
+    prepared_messages: list[dict[str, str]],
+    request_kwargs: dict[str, Any],
+    lang_code: str,
+    max_tokens: int | None,
+) -> tuple[str, bool]:
+    max_attempts = 3
+    base_delay = 1.5
+
+    for attempt in range(1, max_attempts + 1):
+        try:
+            completion = await _create_completion(request_kwargs)
+            _log_token_usage(
+                prepared_messages, completion, lang=lang_code, max_tokens=max_tokens
+            )
+            answer = completion.choices[0].message.content
+            return postprocess_llm_text(answer, lang=lang_code), False
+        except (AuthenticationError, PermissionDeniedError, BadRequestError) as exc:
+            logger.exception("Fatal OpenAI error: %s", exc)
+            return (
+                t(lang_code, "OPENAI_FATAL_ERROR"),
+                True,
+            )
+        except (APITimeoutError, APIConnectionError, RateLimitError) as exc:
+            logger.warning(
+                "Transient OpenAI error on attempt %s/%s: %s",
+                attempt,
+                max_attempts,
+                exc,
+                exc_info=True,
+            )
+            if attempt == max_attempts:
+                break
+        except APIError as exc:
+            logger.warning(
+                "APIError on attempt %s/%s (status=%s): %s",
+                attempt,
+                max_attempts,
+                getattr(exc, "status", None),
+                exc,
+                exc_info=True,
+            )
+            if getattr(exc, "status", 500) >= 500 and attempt < max_attempts:
+                pass
+            else:
+                return (
+                    t(lang_code, "OPENAI_PROCESSING_ERROR"),
+                    True,
+                )
+
+        delay = base_delay * (2 ** (attempt - 1))
+        delay += random.uniform(0, 0.5)
+        await asyncio.sleep(delay)
+
+    return t(lang_code, "OPENAI_COMMUNICATION_ERROR"), False
+
+
+async def call_openai_with_retry_and_usage(
+    messages: Iterable[dict[str, str]],
+    *,
+    lang: str | None = "ja",
+    max_tokens: int | None = None,
+) -> tuple[str, bool, int | None]:
+    prepared_messages = list(messages)
+    max_attempts = 3
+    base_delay = 1.5
+    lang_code = normalize_lang(lang)
+    request_kwargs = _completion_kwargs(prepared_messages, max_tokens)
+
+    for attempt in range(1, max_attempts + 1):
+        try:
+            completion = await _create_completion(request_kwargs)
+            _log_token_usage(
+                prepared_messages, completion, lang=lang_code, max_tokens=max_tokens
+            )
+            answer = completion.choices[0].message.content
+            usage = getattr(completion, "usage", None)
+            total_tokens = getattr(usage, "total_tokens", None) if usage else None
+            return postprocess_llm_text(answer, lang=lang_code), False, total_tokens
+        except (AuthenticationError, PermissionDeniedError, BadRequestError) as exc:
+            logger.exception("Fatal OpenAI error: %s", exc)
+            return (
+                t(lang_code, "OPENAI_FATAL_ERROR"),
+                True,
+                None,
+            )
+        except (APITimeoutError, APIConnectionError, RateLimitError) as exc:
+            logger.warning(
+                "Transient OpenAI error on attempt %s/%s: %s",
+                attempt,
+                max_attempts,
+                exc,
+                exc_info=True,
+            )
+            if attempt == max_attempts:
+                break
+        except APIError as exc:
+            logger.warning(
+                "APIError on attempt %s/%s (status=%s): %s",
+                attempt,
+                max_attempts,
+                getattr(exc, "status", None),
+                exc,
+                exc_info=True,
+            )
+            if getattr(exc, "status", 500) >= 500 and attempt < max_attempts:
+                pass
+            else:
+                return (
+                    t(lang_code, "OPENAI_PROCESSING_ERROR"),
+                    True,
+                    None,
+                )
+
+        delay = base_delay * (2 ** (attempt - 1))
+        delay += random.uniform(0, 0.5)
+        await asyncio.sleep(delay)
+
+    return t(lang_code, "OPENAI_COMMUNICATION_ERROR"), False, None
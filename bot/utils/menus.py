@@ -0,0 +1,48 @@
+from aiogram.types import InlineKeyboardMarkup, Message, ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+from bot.keyboards.common import arisa_menu_kb, base_menu_kb
+from bot.texts.i18n import normalize_lang
+from bot.utils.replies import ensure_quick_menu
+from bot.utils.state import get_user_lang_or_default
+
+
+def build_base_menu(user_id: int | None):
+    return base_menu_kb(lang=get_user_lang_or_default(user_id))
+
+
+def build_arisa_menu(user_id: int | None):
+    return arisa_menu_kb(lang=get_user_lang_or_default(user_id))
+
+
+def build_quick_menu(
+    user_id: int | None,
+    *,
+    reply_markup: ReplyKeyboardMarkup | InlineKeyboardMarkup | ReplyKeyboardRemove | None = None,
+):
+    return ensure_quick_menu(reply_markup=reply_markup, lang=get_user_lang_or_default(user_id))
+
+
+def get_menu_prompt_text(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    prompts = {
+        "ja": "下のボタンから次を選べます👇",
+        "en": "Choose from the buttons below 👇",
+        "pt": "Escolha pelos botões abaixo 👇",
+    }
+    return prompts.get(lang_code, prompts["ja"])
+
+
+async def restore_base_menu(message: Message, user_id: int | None, lang: str) -> None:
+    lang_code = normalize_lang(lang or "ja")
+    prompts = {
+        "ja": "ボタンから選択してね👇",
+        "en": "Choose from the buttons below 👇",
+        "pt": "Escolha pelos botões abaixo 👇",
+    }
+    restore_text = prompts.get(lang_code, prompts["ja"])
+    if not restore_text.strip():
+        restore_text = prompts["ja"]
+    await message.answer(
+        restore_text,
+        reply_markup=build_base_menu(user_id),
+    )
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+from time import monotonic
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message, PreCheckoutQuery
+
+from bot.texts.i18n import normalize_lang, t
+from bot.utils.state import get_user_lang_or_default
+from bot.utils.telegram import current_mode, get_bot, handle_stale_interaction, is_stale_query_error
+from core.metrics import REGISTRY
+from core.store.catalog import Product, iter_products
+
+logger = logging.getLogger(__name__)
+
+
+PENDING_PURCHASES: dict[tuple[int, str], float] = {}
+PAYWALL_BLOCKS = REGISTRY.counter(
+    "bot_paywall_blocks_total", "Requests stopped by the paywall or credit checks", ("mode", "reason")
+)
+IMAGE_ADDON_ENABLED = os.getenv("IMAGE_ADDON_ENABLED", "false").strip().lower() in {
+    "1",
+    "true",
+    "yes",
+    "on",
+}
+PURCHASE_DEDUP_TTL_SECONDS = 30.0
+
+
+def parse_invoice_payload(payload: str) -> tuple[str | None, int | None]:
+    try:
+        payload_data = json.loads(payload)
+    except json.JSONDecodeError:
+        return None, None
+
+    if not isinstance(payload_data, dict):
+        return None, None
+
+    sku = payload_data.get("sku")
+    user_id_raw = payload_data.get("user_id")
+    try:
+        user_id = int(user_id_raw) if user_id_raw is not None else None
+    except (TypeError, ValueError):
+        user_id = None
+
+    return (str(sku) if sku is not None else None, user_id)
+
+
+def _cleanup_pending_purchases(now_monotonic: float) -> None:
+    expired_keys = [
+        key for key, ts in PENDING_PURCHASES.items() if now_monotonic - ts > PURCHASE_DEDUP_TTL_SECONDS
+    ]
+    for key in expired_keys:
+        PENDING_PURCHASES.pop(key, None)
+
+
+def check_purchase_dedup(user_id: int, product_sku: str) -> bool:
+    now_ts = monotonic()
+    _cleanup_pending_purchases(now_ts)
+    key = (user_id, product_sku)
+    last_request = PENDING_PURCHASES.get(key)
+    if last_request and now_ts - last_request < PURCHASE_DEDUP_TTL_SECONDS:
+        return True
+    PENDING_PURCHASES[key] = now_ts
+    return False
+
+
+async def safe_answer_pre_checkout(
+    pre_checkout_query: PreCheckoutQuery, *, ok: bool, error_message: str | None = None
+) -> None:
+    try:
+        await get_bot().answer_pre_checkout_query(
+            pre_checkout_query.id,
+            ok=ok,
+            error_message=error_message,
+        )
+    except TelegramBadRequest as exc:
+        if is_stale_query_error(exc):
+            await handle_stale_interaction(
+                pre_checkout_query,
+                user_id=pre_checkout_query.from_user.id if pre_checkout_query.from_user else None,
+                sku=None,
+                payload=pre_checkout_query.invoice_payload,
+                event_type="stale_pre_checkout",
+            )
+            return
+        logger.exception(
+            "TelegramBadRequest while answering pre_checkout_query",
+            extra={"payload": pre_checkout_query.invoice_payload, "error": str(exc)},
+        )
+    except Exception:
+        logger.exception(
+            "Failed to answer pre_checkout_query",
+            extra={"payload": pre_checkout_query.invoice_payload},
+        )
+
+
+def get_store_intro_text(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    if current_mode() == "arisa":
+        arisa_text = t(lang_code, "ARISA_STORE_INTRO_TEXT")
+        if arisa_text != "ARISA_STORE_INTRO_TEXT":
+            return arisa_text
+    return t(lang_code, "STORE_INTRO_TEXT")
+
+
+def get_product_title(product: Product, lang: str) -> str:
+    if current_mode() == "arisa":
+        arisa_key = f"ARISA_PRODUCT_{product.sku}_TITLE"
+        arisa_title = t(lang, arisa_key)
+        if arisa_title != arisa_key:
+            return arisa_title
+    return t(lang, f"PRODUCT_{product.sku}_TITLE")
+
+
+def get_product_description(product: Product, lang: str) -> str:
+    if current_mode() == "arisa":
+        arisa_key = f"ARISA_PRODUCT_{product.sku}_DESCRIPTION"
+        arisa_description = t(lang, arisa_key)
+        if arisa_description != arisa_key:
+            return arisa_description
+    return t(lang, f"PRODUCT_{product.sku}_DESCRIPTION")
+
+
+def is_arisa_product(product: Product) -> bool:
+    return product.sku.startswith("ARISA_")
+
+
+def build_store_keyboard(lang: str | None = "ja") -> InlineKeyboardMarkup:
+    lang_code = normalize_lang(lang)
+    rows: list[list[InlineKeyboardButton]] = []
+    for product in iter_products():
+        if current_mode() == "arisa":
+            if not is_arisa_product(product):
+                continue
+        elif is_arisa_product(product):
+            continue
+        if product.sku == "ADDON_IMAGES" and not IMAGE_ADDON_ENABLED:
+            rows.append(
+                [
+                    InlineKeyboardButton(
+                        text=t(lang_code, "ADDON_PENDING_LABEL"),
+                        callback_data="addon:pending",
+                    )
+                ]
+            )
+            continue
+        rows.append(
+            [
+                InlineKeyboardButton(
+                    text=f"{get_product_title(product, lang_code)} - {product.price_stars}⭐️",
+                    callback_data=f"buy:{product.sku}"
+                )
+            ]
+        )
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def send_store_menu(message: Message) -> None:
+    user_id = message.from_user.id if message.from_user else None
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(
+        get_store_intro_text(lang=lang), reply_markup=build_store_keyboard(lang=lang)
+    )
@@ -0,0 +1,114 @@
+from aiogram.types import Message
+
+from bot.texts.i18n import normalize_lang, t
+from bot.utils.menus import build_quick_menu
+from bot.utils.state import get_user_lang_or_default, mark_user_active, reset_conversation_state
+
+
+SENSITIVE_TOPICS: dict[str, list[str]] = {
+    "medical": [
+        "病気",
+        "症状",
+        "診断",
+        "薬",
+        "治療",
+        "受診",
+        "病院",
+        "メンタル",
+        "鬱",
+        "うつ",
+        "パニック",
+    ],
+    "legal": [
+        "法律",
+        "弁護士",
+        "訴訟",
+        "裁判",
+        "契約",
+        "違法",
+        "逮捕",
+        "示談",
+        "告訴",
+    ],
+    "investment": [
+        "投資",
+        "株",
+        "fx",
+        "先物",
+        "仮想通貨",
+        "利回り",
+        "資産運用",
+        "配当",
+        "儲かる",
+    ],
+    "self_harm": [
+        "自殺",
+        "死にたい",
+        "消えたい",
+        "希死念慮",
+        "リストカット",
+        "傷つけたい",
+        "助けて",
+    ],
+    "violence": [
+        "暴力",
+        "傷害",
+        "危害",
+        "脅迫",
+        "復讐",
+        "殺",
+        "殴る",
+        "危険",
+    ],
+}
+
+
+def classify_sensitive_topics(text: str) -> set[str]:
+    if not text:
+        return set()
+
+    lowered = text.lower()
+    hits: set[str] = set()
+    for topic, keywords in SENSITIVE_TOPICS.items():
+        if any(keyword in lowered for keyword in keywords):
+            hits.add(topic)
+    return hits
+
+
+def build_sensitive_topic_notice(topics: set[str], *, lang: str | None = "ja") -> str:
+    if not topics:
+        return ""
+
+    lang_code = normalize_lang(lang)
+    topic_labels = [
+        t(lang_code, f"SENSITIVE_TOPIC_LABEL_{topic.upper()}") for topic in sorted(topics)
+    ]
+    joined_labels = " / ".join(topic_labels)
+    lines = [
+        t(lang_code, "SENSITIVE_TOPIC_NOTICE_HEADER", topics=joined_labels),
+        t(lang_code, "SENSITIVE_TOPIC_NOTICE_PRO_HELP"),
+    ]
+    for topic in sorted(topics):
+        guidance_key = f"SENSITIVE_TOPIC_GUIDANCE_{topic.upper()}"
+        guidance = t(lang_code, guidance_key)
+        if guidance != guidance_key:
+            lines.append(f"・{guidance}")
+
+    lines.append(t(lang_code, "SENSITIVE_TOPIC_NOTICE_FOCUS"))
+    lines.append(t(lang_code, "SENSITIVE_TOPIC_NOTICE_LIST_REMINDER"))
+    return "\n".join(lines)
+
+
+async def respond_with_safety_notice(message: Message, user_query: str) -> bool:
+    topics = classify_sensitive_topics(user_query)
+    if not topics:
+        return False
+
+    user_id = message.from_user.id if message.from_user else None
+    reset_conversation_state(user_id)
+    mark_user_active(user_id)
+    lang = get_user_lang_or_default(user_id)
+    await message.answer(
+        build_sensitive_topic_notice(topics, lang=lang), reply_markup=build_quick_menu(user_id)
+    )
+    return True
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta, timezone
+
+from aiogram.types import Message
+
+from bot.texts.i18n import normalize_lang
+from bot.utils.themes import DEFAULT_THEME
+from core.config import ADMIN_USER_IDS, STATE_CACHE_SIZE, STATE_DB_PATH, USER_MAP_MAX_SIZE
+from core.db import DB_PATH, USAGE_TIMEZONE, get_user_lang, set_user_lang
+from core.expiring_map import ExpiringMap
+from core.state_store import StateField, StateStore
+from core.user_scope import current_user_scope
+
+
+STATE_TIMEOUT = timedelta(minutes=20)
+# 占いの進行などはリセット（STATE_TIMEOUT）後に使われないので、少し余裕を見て消す。
+STATE_TTL = STATE_TIMEOUT + timedelta(minutes=10)
+# 無操作リセットはハンドラーが案内付きで行う。モードと最終操作時刻が先に消えると
+# モードが黙って相談に戻り案内も出ないので、この 2 つだけ別レコードで長く残す。
+# 言語は users テーブルに保存しているのでここには含まない。
+SESSION_TTL = timedelta(days=30)
+state_store = StateStore(STATE_DB_PATH or DB_PATH, ttl=STATE_TTL, max_entries=STATE_CACHE_SIZE)
+# 言語はここにキャッシュし、スロットル応答などのホットパスでは DB を読まない。
+USER_LANG_CACHE: ExpiringMap[int, str] = ExpiringMap(ttl_sec=3600, max_size=USER_MAP_MAX_SIZE)
+# 会話状態はボット（プロファイル）ごと。別のボットでの操作がモードを書き換えないようにする。
+USER_MODE: StateField[str] = StateField(
+    state_store, "mode", prefix="session", scope=current_user_scope, ttl=SESSION_TTL
+)
+TAROT_FLOW: StateField[str | None] = StateField(state_store, "tarot_flow", scope=current_user_scope)
+TAROT_THEME: StateField[str] = StateField(state_store, "tarot_theme", scope=current_user_scope)
+USER_STATE_LAST_ACTIVE: StateField[datetime] = StateField(
+    state_store,
+    "last_active",
+    prefix="session",
+    scope=current_user_scope,
+    ttl=SESSION_TTL,
+    encode=datetime.isoformat,
+    decode=datetime.fromisoformat,
+)
+SUPPORTED_LANGS = {"ja", "en", "pt"}
+
+
+def usage_today(now: datetime) -> datetime.date:
+    return now.astimezone(USAGE_TIMEZONE).date()
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _extract_start_payload(message: Message) -> str | None:
+    text = message.text or ""
+    parts = text.split(maxsplit=1)
+    if len(parts) < 2:
+        return None
+    payload = parts[1].strip()
+    if not payload:
+        return None
+    token = payload.split()[0]
+    candidate = token.strip().lower().replace("_", "-")
+    if candidate in SUPPORTED_LANGS:
+        return candidate
+    return None
+
+
+def resolve_user_lang(message: Message) -> tuple[str, bool]:
+    user_id = message.from_user.id if message.from_user else None
+    payload_lang = _extract_start_payload(message)
+    if payload_lang:
+        if user_id is not None:
+            store_user_lang(user_id, payload_lang)
+        return payload_lang, True
+
+    saved_lang = load_user_lang(user_id)
+    if saved_lang:
+        return saved_lang, True
+
+    telegram_lang = None
+    if message.from_user and getattr(message.from_user, "language_code", None):
+        telegram_lang = normalize_lang(message.from_user.language_code)
+
+    return telegram_lang or "ja", False
+
+
+def load_user_lang(user_id: int | None) -> str | None:
+    if user_id is None:
+        return None
+    cached = USER_LANG_CACHE.get(user_id)
+    if cached:
+        return cached
+    saved = get_user_lang(user_id)
+    if saved:
+        USER_LANG_CACHE[user_id] = saved
+    return saved
+
+
+def store_user_lang(user_id: int, lang: str) -> str:
+    normalized = set_user_lang(user_id, lang)
+    USER_LANG_CACHE[user_id] = normalized
+    return normalized
+
+
+def get_user_lang_or_default(user_id: int | None) -> str:
+    return load_user_lang(user_id) or "ja"
+
+
+def get_user_mode(user_id: int | None) -> str:
+    if user_id is None:
+        return "consult"
+    return USER_MODE.get(user_id, "consult")
+
+
+def set_user_mode(user_id: int | None, mode: str) -> None:
+    if user_id is None:
+        return
+    USER_MODE[user_id] = mode
+    if mode != "tarot":
+        TAROT_FLOW.pop(user_id, None)
+
+
+def set_tarot_flow(user_id: int | None, state: str | None) -> None:
+    if user_id is None:
+        return
+    TAROT_FLOW[user_id] = state
+    if state is None:
+        TAROT_FLOW.pop(user_id, None)
+
+
+def set_tarot_theme(user_id: int | None, theme: str) -> None:
+    if user_id is None:
+        return
+    TAROT_THEME[user_id] = theme
+
+
+def get_tarot_theme(user_id: int | None) -> str:
+    if user_id is None:
+        return DEFAULT_THEME
+    return TAROT_THEME.get(user_id, DEFAULT_THEME)
+
+
+def reset_tarot_state(user_id: int | None) -> None:
+    if user_id is None:
+        return
+    TAROT_FLOW.pop(user_id, None)
+    TAROT_THEME.pop(user_id, None)
+
+
+def reset_conversation_state(user_id: int | None) -> None:
+    if user_id is None:
+        return
+    USER_MODE.pop(user_id, None)
+    reset_tarot_state(user_id)
+    USER_STATE_LAST_ACTIVE.pop(user_id, None)
+
+
+def mark_user_active(user_id: int | None, *, now: datetime | None = None) -> None:
+    if user_id is None:
+        return
+    USER_STATE_LAST_ACTIVE[user_id] = now or utcnow()
+    # 操作が続いている間は占いの進行・テーマも期限を延ばす。
+    TAROT_FLOW.touch(user_id)
+
+
+def reset_state_for_explicit_command(user_id: int | None) -> None:
+    if user_id is None:
+        return
+    reset_conversation_state(user_id)
+
+
+def is_admin_user(user_id: int | None) -> bool:
+    return user_id is not None and user_id in ADMIN_USER_IDS
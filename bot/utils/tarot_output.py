@@ -2,6 +2,7 @@ import re
 from typing import Iterable, Sequence
 
 from core.tarot.draws import orientation_label_by_lang
+from core.tracing import traced
 
 
 META_PHRASES = [
@@ -107,6 +108,7 @@ def _build_time_axis_card_line(
     return f"{card_line_prefix}{name}{orientation_suffix}"
 
 
+@traced("format.finalize_tarot_answer")
 def finalize_tarot_answer(
     text: str,
     *,
@@ -0,0 +1,374 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import (
+    CallbackQuery,
+    InlineKeyboardMarkup,
+    Message,
+    PreCheckoutQuery,
+    ReplyKeyboardMarkup,
+    ReplyKeyboardRemove,
+)
+
+from bot.keyboards.common import build_charge_retry_keyboard
+from bot.middlewares.send_scheduler import SendScheduler, SendSchedulerMiddleware
+from bot.texts.i18n import t
+from bot.utils.events import safe_log_payment_event
+from bot.utils.state import get_user_lang_or_default
+from core.characters import use_character
+from core.config import (
+    CHARACTER,
+    EXTRA_BOTS,
+    SEND_CHAT_BURST,
+    SEND_CHAT_RATE_PER_SEC,
+    SEND_GLOBAL_RATE_PER_SEC,
+    TELEGRAM_API_BASE_URL,
+    TELEGRAM_BOT_TOKEN,
+    USER_MAP_MAX_SIZE,
+)
+from core.tracing import traced
+from core.user_scope import use_user_scope
+
+logger = logging.getLogger(__name__)
+
+
+def build_bot_session(base_url: str = TELEGRAM_API_BASE_URL) -> AiohttpSession:
+    """aiohttp session for the Bot API; ``base_url`` swaps api.telegram.org for another server."""
+    if base_url:
+        return AiohttpSession(api=TelegramAPIServer.from_base(base_url))
+    return AiohttpSession()
+
+
+@dataclass(frozen=True)
+class BotProfile:
+    """1 つのボット（トークン）と、そのボットが使うキャラクター。"""
+
+    character: str
+    token: str = field(repr=False)
+
+    @property
+    def mode(self) -> str:
+        return "arisa" if self.character == "arisa" else "default"
+
+    @property
+    def name(self) -> str:
+        return self.character or "tarot"
+
+    @property
+    def scope(self) -> str:
+        """ユーザー単位の状態のスコープ。プライマリは空（単独運用時と同じキー）。"""
+        return "" if self is PRIMARY_PROFILE else self.name
+
+
+# 先頭がプライマリ（TELEGRAM_BOT_TOKEN / CHARACTER）、続いて EXTRA_BOTS の順。
+PRIMARY_PROFILE = BotProfile(CHARACTER, TELEGRAM_BOT_TOKEN)
+BOT_PROFILES: tuple[BotProfile, ...] = (
+    PRIMARY_PROFILE,
+    *(BotProfile(character, token) for character, token in EXTRA_BOTS),
+)
+
+# Bot は import では作らず、最初の get_bot()（起動時は create_runtime()）で用意する。
+bot: Bot | None = None
+extra_bots: list[Bot] | None = None
+send_scheduler = SendScheduler(
+    global_rate_per_sec=SEND_GLOBAL_RATE_PER_SEC,
+    global_burst=SEND_GLOBAL_RATE_PER_SEC,
+    chat_rate_per_sec=SEND_CHAT_RATE_PER_SEC,
+    chat_burst=SEND_CHAT_BURST,
+    max_tracked_chats=USER_MAP_MAX_SIZE,
+)
+# 複数ボットの同居時に、処理中の更新がどのボットに届いたかを持つ。
+_current_bot: ContextVar[Bot | None] = ContextVar("current_bot", default=None)
+_current_profile: ContextVar[BotProfile | None] = ContextVar("current_profile", default=None)
+
+
+def _create_bot(token: str) -> Bot:
+    # 送信スケジューラーは全ボットで共有する（グローバルの送信レートは 1 つ）。
+    created = Bot(token=token, session=build_bot_session())
+    created.session.middleware(SendSchedulerMiddleware(send_scheduler))
+    return created
+
+
+def _primary_bot() -> Bot:
+    global bot
+    if bot is None:
+        bot = _create_bot(TELEGRAM_BOT_TOKEN)
+    return bot
+
+
+def get_bot() -> Bot:
+    """処理中の更新を受けたボット。更新の外ではプライマリのボット。"""
+    current = _current_bot.get()
+    if current is not None:
+        return current
+    return _primary_bot()
+
+
+def get_bots() -> list[Bot]:
+    """``BOT_PROFILES`` と同じ順の全ボット。"""
+    global extra_bots
+    if extra_bots is None:
+        extra_bots = [_create_bot(profile.token) for profile in BOT_PROFILES[1:]]
+    return [_primary_bot(), *extra_bots]
+
+
+def profile_for(target: Bot) -> BotProfile:
+    for profile, candidate in zip(BOT_PROFILES, get_bots()):
+        if candidate.id == target.id:
+            return profile
+    return PRIMARY_PROFILE
+
+
+def current_profile() -> BotProfile:
+    return _current_profile.get() or PRIMARY_PROFILE
+
+
+def current_mode() -> str:
+    return current_profile().mode
+
+
+@contextmanager
+def use_bot(target: Bot) -> Iterator[BotProfile]:
+    """ブロック内の get_bot() / current_mode() / キャラクターを ``target`` のものにする。"""
+    profile = profile_for(target)
+    bot_token = _current_bot.set(target)
+    profile_token = _current_profile.set(profile)
+    try:
+        with use_character(profile.character), use_user_scope(profile.scope):
+            yield profile
+    finally:
+        _current_profile.reset(profile_token)
+        _current_bot.reset(bot_token)
+
+
+def is_stale_query_error(error: Exception | str) -> bool:
+    message = str(error).lower()
+    stale_fragments = [
+        "query is too old",
+        "query id is invalid",
+        "query is too old and response time expired",
+    ]
+    return any(fragment in message for fragment in stale_fragments)
+
+
+async def safe_answer_callback(query: CallbackQuery, *args, **kwargs) -> None:
+    try:
+        if not args and "text" not in kwargs:
+            kwargs["text"] = None
+        await query.answer(*args, **kwargs)
+    except TelegramBadRequest as exc:
+        if is_stale_query_error(exc):
+            await handle_stale_interaction(
+                query,
+                user_id=query.from_user.id if query.from_user else None,
+                sku=None,
+                payload=query.data,
+            )
+            return
+        logger.exception(
+            "TelegramBadRequest while answering callback query",
+            extra={"callback_data": query.data, "error": str(exc)},
+        )
+    except Exception:
+        logger.exception("Failed to answer callback query", extra={"callback_data": query.data})
+
+
+def split_text_for_sending(text: str, *, limit: int = 3800) -> list[str]:
+    if len(text) <= limit:
+        return [text]
+    paragraphs = text.split("\n\n")
+    chunks: list[str] = []
+    current = ""
+    for para in paragraphs:
+        candidate = f"{current}\n\n{para}" if current else para
+        if len(candidate) <= limit:
+            current = candidate
+        else:
+            if current:
+                chunks.append(current)
+            if len(para) > limit:
+                while len(para) > limit:
+                    chunks.append(para[:limit])
+                    para = para[limit:]
+                if para:
+                    current = para
+                else:
+                    current = ""
+            else:
+                current = para
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@traced("telegram.send_long_text")
+async def send_long_text(
+    chat_id: int,
+    text: str,
+    *,
+    reply_to: int | None = None,
+    edit_target: Message | None = None,
+    reply_markup_first: ReplyKeyboardMarkup | InlineKeyboardMarkup | ReplyKeyboardRemove | None = None,
+    reply_markup_last: ReplyKeyboardMarkup | InlineKeyboardMarkup | ReplyKeyboardRemove | None = None,
+) -> None:
+    chunks = split_text_for_sending(text)
+    first_chunk, *rest = chunks
+    first_markup = reply_markup_last if not rest else reply_markup_first
+    if edit_target:
+        try:
+            await edit_target.edit_text(first_chunk, reply_markup=first_markup)
+        except Exception:
+            await get_bot().send_message(
+                chat_id,
+                first_chunk,
+                reply_to_message_id=reply_to,
+                reply_markup=first_markup,
+            )
+    else:
+        await get_bot().send_message(
+            chat_id,
+            first_chunk,
+            reply_to_message_id=reply_to,
+            reply_markup=first_markup,
+        )
+
+    for index, chunk in enumerate(rest):
+        is_last = index == len(rest) - 1
+        markup = reply_markup_last if is_last else None
+        await get_bot().send_message(
+            chat_id,
+            chunk,
+            reply_to_message_id=reply_to,
+            reply_markup=markup,
+        )
+
+
+async def safe_delete_message(message: Message | None) -> None:
+    if not message:
+        return
+
+    chat_id = getattr(getattr(message, "chat", None), "id", None)
+    message_id = getattr(message, "message_id", None)
+
+    if chat_id is None or message_id is None:
+        return
+
+    try:
+        await get_bot().delete_message(chat_id=chat_id, message_id=message_id)
+    except TelegramBadRequest as exc:
+        logger.warning(
+            "Failed to delete status message",
+            extra={
+                "mode": "cleanup",
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "reason": str(exc),
+            },
+        )
+        try:
+            await get_bot().edit_message_text(
+                text="\u200b", chat_id=chat_id, message_id=message_id, reply_markup=None
+            )
+            logger.info(
+                "Replaced status message after deletion failure",
+                extra={"mode": "cleanup", "chat_id": chat_id, "message_id": message_id},
+            )
+        except TelegramBadRequest as edit_exc:
+            logger.warning(
+                "Fallback edit failed while cleaning up status message",
+                extra={
+                    "mode": "cleanup",
+                    "chat_id": chat_id,
+                    "message_id": message_id,
+                    "reason": str(edit_exc),
+                },
+            )
+        except Exception:
+            logger.exception(
+                "Unexpected error while editing status message during cleanup",
+                extra={"mode": "cleanup", "chat_id": chat_id, "message_id": message_id},
+            )
+    except Exception:
+        logger.exception(
+            "Unexpected error while deleting status message",
+            extra={"mode": "cleanup", "chat_id": chat_id, "message_id": message_id},
+        )
+
+
+# 送信済みで、まだ消していない「鑑定中…」などのステータスメッセージ。
+STATUS_MESSAGES: dict[tuple[int, int], Message] = {}
+
+
+def _status_key(message: Message | None) -> tuple[int, int] | None:
+    chat_id = getattr(getattr(message, "chat", None), "id", None)
+    message_id = getattr(message, "message_id", None)
+    if chat_id is None or message_id is None:
+        return None
+    return chat_id, message_id
+
+
+async def send_status_message(message: Message, text: str, **kwargs) -> Message:
+    status = await message.answer(text, **kwargs)
+    key = _status_key(status)
+    if key is not None:
+        STATUS_MESSAGES[key] = status
+    return status
+
+
+async def delete_status_message(status: Message | None) -> None:
+    """Delete a status message unless shutdown has already rewritten it."""
+    key = _status_key(status)
+    if key is not None and STATUS_MESSAGES.pop(key, None) is None:
+        return
+    await safe_delete_message(status)
+
+
+async def interrupt_status_messages() -> int:
+    """残っているステータスメッセージを「中断しました」に書き換える。書き換えた件数を返す。"""
+    pending = list(STATUS_MESSAGES.values())
+    STATUS_MESSAGES.clear()
+    rewritten = 0
+    for status in pending:
+        chat_id = status.chat.id
+        try:
+            await status.edit_text(t(get_user_lang_or_default(chat_id), "READING_INTERRUPTED_NOTICE"))
+            rewritten += 1
+        except Exception:
+            logger.warning(
+                "Failed to mark status message as interrupted",
+                extra={"mode": "shutdown", "chat_id": chat_id, "message_id": status.message_id},
+                exc_info=True,
+            )
+    return rewritten
+
+
+async def handle_stale_interaction(
+    event: CallbackQuery | PreCheckoutQuery,
+    *,
+    user_id: int | None,
+    sku: str | None,
+    payload: str | None,
+    event_type: str = "stale_callback",
+) -> None:
+    chat_id: int | None = None
+    if isinstance(event, CallbackQuery) and event.message and event.message.chat:
+        chat_id = event.message.chat.id
+    safe_log_payment_event(user_id=user_id, event_type=event_type, sku=sku, payload=payload)
+    if user_id is None and chat_id is None:
+        logger.warning("Stale interaction detected but no user/chat to notify", extra={"payload": payload})
+        return
+    try:
+        lang = get_user_lang_or_default(user_id)
+        target = chat_id if chat_id is not None else user_id
+        await get_bot().send_message(
+            target, t(lang, "STALE_CALLBACK_MESSAGE"), reply_markup=build_charge_retry_keyboard(lang)
+        )
+    except Exception:
+        logger.exception("Failed to notify user about stale interaction", extra={"payload": payload, "user_id": user_id})
@@ -0,0 +1,154 @@
+from bot.texts.i18n import normalize_lang, t
+from bot.texts.ja import HELP_TEXT_TEMPLATE
+
+
+DEFAULT_THEME = "life"
+
+TAROT_THEME_LABELS: dict[str, str] = {
+    "love": "恋愛",
+    "marriage": "結婚",
+    "work": "仕事",
+    "life": "人生",
+}
+
+TAROT_THEME_EXAMPLES: dict[str, tuple[str, ...]] = {
+    "love": (
+        "片思いの相手の気持ちは？",
+        "連絡はいつ来る？",
+        "距離を縮めるには？",
+        "復縁の可能性は？",
+    ),
+    "marriage": (
+        "結婚のタイミングは？",
+        "この人と結婚できる？",
+        "プロポーズはうまくいく？",
+        "家族へ伝えるベストな時期は？",
+    ),
+    "work": (
+        "今の職場で評価を上げるには？",
+        "転職すべき？",
+        "来月の仕事運は？",
+        "職場の人間関係は良くなる？",
+    ),
+    "life": (
+        "今年の流れは？",
+        "今いちばん大事にすべきことは？",
+        "迷っている選択、どっちが良い？",
+        "金銭面は安定する？",
+    ),
+}
+TAROT_THEME_LABELS_EN: dict[str, str] = {
+    "love": "Love",
+    "marriage": "Marriage",
+    "work": "Work",
+    "life": "Life",
+}
+TAROT_THEME_LABELS_PT: dict[str, str] = {
+    "love": "Amor",
+    "marriage": "Casamento",
+    "work": "Trabalho",
+    "life": "Vida",
+}
+TAROT_THEME_EXAMPLES_EN: dict[str, tuple[str, ...]] = {
+    "love": (
+        "How does my crush feel?",
+        "When will they reach out?",
+        "How can we get closer?",
+        "Is reconciliation possible?",
+    ),
+    "marriage": (
+        "When is the right time to marry?",
+        "Can I marry this person?",
+        "Will the proposal go well?",
+        "When should I tell my family?",
+    ),
+    "work": (
+        "How can I be recognized at work?",
+        "Should I change jobs?",
+        "How will my work go this month?",
+        "Will workplace relationships improve?",
+    ),
+    "life": (
+        "How will this year flow?",
+        "What should I focus on most now?",
+        "Which option is better for my choice?",
+        "Will my finances stabilize?",
+    ),
+}
+TAROT_THEME_EXAMPLES_PT: dict[str, tuple[str, ...]] = {
+    "love": (
+        "O que a pessoa amada sente?",
+        "Quando vou receber uma mensagem?",
+        "Como posso nos aproximar?",
+        "Há chance de reconciliação?",
+    ),
+    "marriage": (
+        "Qual o momento certo para casar?",
+        "Vou me casar com essa pessoa?",
+        "O pedido vai dar certo?",
+        "Quando contar para a família?",
+    ),
+    "work": (
+        "Como posso ser reconhecido no trabalho?",
+        "Devo trocar de emprego?",
+        "Como vai ser meu trabalho neste mês?",
+        "Os relacionamentos no trabalho vão melhorar?",
+    ),
+    "life": (
+        "Como será o fluxo deste ano?",
+        "No que devo focar mais agora?",
+        "Qual opção é melhor para minha escolha?",
+        "Minhas finanças vão estabilizar?",
+    ),
+}
+
+
+def get_theme_labels(lang: str) -> dict[str, str]:
+    if lang == "en":
+        return TAROT_THEME_LABELS_EN
+    if lang == "pt":
+        return TAROT_THEME_LABELS_PT
+    return TAROT_THEME_LABELS
+
+
+def get_theme_examples(lang: str) -> dict[str, tuple[str, ...]]:
+    if lang == "en":
+        return TAROT_THEME_EXAMPLES_EN
+    if lang == "pt":
+        return TAROT_THEME_EXAMPLES_PT
+    return TAROT_THEME_EXAMPLES
+
+
+def format_theme_examples_for_help(lang: str = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    theme_labels = get_theme_labels(lang_code)
+    theme_examples = get_theme_examples(lang_code)
+    bullet = "・" if lang_code == "ja" else "•"
+    bullet_prefix = bullet if lang_code == "ja" else f"{bullet} "
+    lines: list[str] = []
+    for theme in TAROT_THEME_LABELS:
+        examples = theme_examples.get(theme)
+        if not examples:
+            continue
+
+        lines.append(theme_labels.get(theme, TAROT_THEME_LABELS[theme]))
+        for example in examples:
+            lines.append(f"{bullet_prefix}{example}")
+        lines.append("")
+
+    if lines and lines[-1] == "":
+        lines.pop()
+
+    return "\n".join(lines)
+
+
+def build_help_text(lang: str | None = "ja") -> str:
+    lang_code = normalize_lang(lang)
+    if lang_code == "ja":
+        return HELP_TEXT_TEMPLATE.format(theme_examples=format_theme_examples_for_help(lang_code))
+    template = t(lang_code, "HELP_TEXT_TEMPLATE")
+    return template.format(theme_examples=format_theme_examples_for_help(lang_code))
+
+
+def get_tarot_theme_label(theme: str) -> str:
+    return TAROT_THEME_LABELS.get(theme, TAROT_THEME_LABELS[DEFAULT_THEME])
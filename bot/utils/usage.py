@@ -0,0 +1,40 @@
+from datetime import datetime, time, timedelta
+
+from bot.utils.state import usage_today
+from core.config import USER_MAP_MAX_SIZE
+from core.db import USAGE_TIMEZONE, UserRecord
+from core.expiring_map import ExpiringMap
+
+
+FREE_ONE_ORACLE_TRIAL_PER_DAY = 2
+FREE_ONE_ORACLE_POST_TRIAL_PER_DAY = 1
+FREE_GENERAL_CHAT_PER_DAY = 2
+FREE_GENERAL_CHAT_DAYS = 5
+# キーに日付を含むので、2 日を過ぎた分は参照されない。
+ONE_ORACLE_MEMORY: ExpiringMap[tuple[int, str], int] = ExpiringMap(
+    ttl_sec=2 * 24 * 3600, max_size=USER_MAP_MAX_SIZE, touch_on_get=False
+)
+
+
+def format_next_reset(now: datetime) -> str:
+    next_reset = datetime.combine(
+        usage_today(now) + timedelta(days=1), time(0, 0), tzinfo=USAGE_TIMEZONE
+    )
+    return next_reset.strftime("%m/%d %H:%M JST")
+
+
+def _days_since_first_seen(user: UserRecord, now: datetime) -> int:
+    return (usage_today(now) - usage_today(user.first_seen)).days
+
+
+def trial_day_number(user: UserRecord, now: datetime) -> int:
+    return _days_since_first_seen(user, now) + 1
+
+
+def general_chat_trial_days_left(user: UserRecord, now: datetime) -> int:
+    used_days = _days_since_first_seen(user, now)
+    return max(0, FREE_GENERAL_CHAT_DAYS - (used_days + 1))
+
+
+def is_in_general_chat_trial(user: UserRecord, now: datetime) -> bool:
+    return _days_since_first_seen(user, now) < FREE_GENERAL_CHAT_DAYS
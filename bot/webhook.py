@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Union
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+if TYPE_CHECKING:
+    from bot.workers import ShardedUpdatePool
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/webhooks/telegram/bot"
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+@dataclass
+class UpdatePoolStats:
+    accepted: int = 0
+    rejected: int = 0
+    processed: int = 0
+    failed: int = 0
+
+
+class UpdateWorkerPool:
+    """Bounded queue of incoming updates drained by a fixed set of workers.
+
+    The webhook endpoint only enqueues and returns, so Telegram gets its 200
+    immediately while ``dp.feed_update`` runs in the background. When the
+    queue is full ``submit`` refuses the update and the endpoint answers with
+    an error, which makes Telegram redeliver it later.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        *,
+        workers: int = 8,
+        max_queue: int = 1000,
+    ) -> None:
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.workers = max(1, workers)
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=max(1, max_queue))
+        self._tasks: list[asyncio.Task[None]] = []
+        self.stats = UpdatePoolStats()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(index), name=f"tg-update-worker-{index}")
+            for index in range(self.workers)
+        ]
+        logger.info(
+            "Update worker pool started",
+            extra={"mode": "webhook", "workers": self.workers, "max_queue": self._queue.maxsize},
+        )
+
+    async def stop(self, *, drain_timeout: float = 10.0) -> None:
+        if not self._tasks:
+            return
+        # drain_timeout <= 0: 呼び出し側で待ち終えているので、すぐにワーカーを止める。
+        if drain_timeout > 0:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Update queue not drained before shutdown",
+                    extra={"mode": "webhook", "pending": self._queue.qsize()},
+                )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, update: Update) -> bool:
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.stats.rejected += 1
+            logger.warning(
+                "Update queue full; asking Telegram to retry",
+                extra={"mode": "webhook", "update_id": update.update_id},
+            )
+            return False
+        self.stats.accepted += 1
+        return True
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+                self.stats.processed += 1
+            except Exception:
+                self.stats.failed += 1
+                logger.exception(
+                    "Failed to process webhook update",
+                    extra={"mode": "webhook", "update_id": update.update_id, "worker": index},
+                )
+            finally:
+                self._queue.task_done()
+
+    def parse_update(self, payload: dict[str, Any]) -> Update:
+        return Update.model_validate(payload, context={"bot": self.bot})
+
+
+ActivePool = Union[UpdateWorkerPool, "ShardedUpdatePool"]
+
+_active_pool: ActivePool | None = None
+
+
+def get_update_pool() -> ActivePool | None:
+    return _active_pool
+
+
+def set_update_pool(pool: ActivePool | None) -> None:
+    global _active_pool
+    _active_pool = pool
+
+
+__all__ = [
+    "ActivePool",
+    "SECRET_TOKEN_HEADER",
+    "UpdateWorkerPool",
+    "WEBHOOK_PATH",
+    "get_update_pool",
+    "set_update_pool",
+]
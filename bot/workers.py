@@ -0,0 +1,366 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import queue
+import sys
+import time
+from dataclasses import dataclass, field
+from multiprocessing.context import BaseContext
+from typing import Any, Awaitable, Callable, Sequence
+
+logger = logging.getLogger(__name__)
+
+RawUpdate = dict[str, Any]
+
+# Update fields whose payload carries the acting Telegram user in ``from``.
+_USER_UPDATE_FIELDS = (
+    "message",
+    "edited_message",
+    "callback_query",
+    "pre_checkout_query",
+    "shipping_query",
+    "inline_query",
+    "chosen_inline_result",
+    "my_chat_member",
+    "chat_member",
+)
+
+RESTART_BACKOFF_MIN_SEC = 1.0
+RESTART_BACKOFF_MAX_SEC = 30.0
+STABLE_UPTIME_SEC = 30.0
+
+
+def extract_user_id(raw: RawUpdate) -> int | None:
+    for key in _USER_UPDATE_FIELDS:
+        payload = raw.get(key)
+        if not isinstance(payload, dict):
+            continue
+        sender = payload.get("from") or payload.get("from_user")
+        if isinstance(sender, dict) and isinstance(sender.get("id"), int):
+            return sender["id"]
+        chat = payload.get("chat")
+        if isinstance(chat, dict) and isinstance(chat.get("id"), int):
+            return chat["id"]
+    return None
+
+
+def _score(key: int, worker_id: int) -> int:
+    digest = hashlib.blake2b(f"{key}:{worker_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def rendezvous_worker(key: int, worker_ids: Sequence[int]) -> int:
+    """Highest-random-weight hashing: only ~1/N keys move when a worker is added."""
+    if not worker_ids:
+        raise ValueError("No workers to route to")
+    return max(worker_ids, key=lambda worker_id: _score(key, worker_id))
+
+
+def shard_key(raw: RawUpdate) -> int:
+    user_id = extract_user_id(raw)
+    if user_id is not None:
+        return user_id
+    return int(raw.get("update_id") or 0)
+
+
+@dataclass
+class _WorkerSlot:
+    worker_id: int
+    inbox: Any
+    process: Any = None
+    started_at: float = 0.0
+    restarts: int = 0
+    next_start_at: float = 0.0
+    retiring: bool = False
+    backoff_sec: float = field(default=RESTART_BACKOFF_MIN_SEC)
+    # Updates of users this worker still owns while it retires; handed to
+    # their new worker once this one has finished everything it had queued.
+    held: list[Any] = field(default_factory=list)
+
+
+class WorkerSupervisor:
+    """Runs N bot worker processes and routes raw updates to them by user.
+
+    Each worker owns one inbox queue that lives in the supervisor, so a
+    crashed worker is restarted with the same id and picks up where it
+    stopped; users keep landing on the same process.
+
+    When ``resize`` shrinks the pool, the users of a retiring worker are held
+    here until that worker has drained its inbox and exited, so a user never
+    runs on two processes at once. Growing the pool does not wait: users that
+    move to a new worker may briefly overlap with updates still queued at
+    their old worker.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        *,
+        target: Callable[..., None],
+        queue_size: int = 1000,
+        context: BaseContext | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.target = target
+        self.queue_size = max(1, queue_size)
+        self._context = context or multiprocessing.get_context("spawn")
+        self._clock = clock
+        self._slots: dict[int, _WorkerSlot] = {}
+        self._count = max(1, count)
+        self.dropped = 0
+
+    @property
+    def worker_ids(self) -> list[int]:
+        return sorted(worker_id for worker_id, slot in self._slots.items() if not slot.retiring)
+
+    def start(self) -> None:
+        for worker_id in range(self._count):
+            self._ensure_slot(worker_id)
+        self.check()
+
+    def _ensure_slot(self, worker_id: int) -> _WorkerSlot:
+        slot = self._slots.get(worker_id)
+        if slot is None:
+            slot = _WorkerSlot(worker_id=worker_id, inbox=self._context.Queue(self.queue_size))
+            self._slots[worker_id] = slot
+        slot.retiring = False
+        return slot
+
+    def _spawn(self, slot: _WorkerSlot) -> None:
+        process = self._context.Process(
+            target=self.target,
+            args=(slot.worker_id, self._count, slot.inbox),
+            name=f"bot-worker-{slot.worker_id}",
+            daemon=True,
+        )
+        process.start()
+        slot.process = process
+        slot.started_at = self._clock()
+        logger.info(
+            "Bot worker started",
+            extra={"worker_id": slot.worker_id, "pid": process.pid, "restarts": slot.restarts},
+        )
+
+    def check(self) -> None:
+        """Start missing workers and restart crashed ones with backoff."""
+        now = self._clock()
+        for worker_id, slot in list(self._slots.items()):
+            process = slot.process
+            if process is not None and process.is_alive():
+                continue
+            if slot.retiring:
+                if process is not None:
+                    process.join(timeout=0)
+                    slot.process = None
+                continue
+            if process is not None:
+                uptime = now - slot.started_at
+                slot.backoff_sec = (
+                    RESTART_BACKOFF_MIN_SEC
+                    if uptime >= STABLE_UPTIME_SEC
+                    else min(slot.backoff_sec * 2, RESTART_BACKOFF_MAX_SEC)
+                )
+                slot.restarts += 1
+                slot.next_start_at = now + slot.backoff_sec
+                slot.process = None
+                logger.warning(
+                    "Bot worker exited; scheduling restart",
+                    extra={
+                        "worker_id": worker_id,
+                        "exitcode": process.exitcode,
+                        "restart_in_sec": slot.backoff_sec,
+                    },
+                )
+            if now >= slot.next_start_at:
+                self._spawn(slot)
+        self._release_held()
+
+    def _release_held(self) -> None:
+        for worker_id, slot in list(self._slots.items()):
+            if slot.retiring and slot.process is not None:
+                continue  # still draining what it had queued
+            while slot.held:
+                # 縮小後にまた増やした場合は自分の inbox に戻す（終了後の再起動で処理される）
+                target = self._slots[rendezvous_worker(shard_key(slot.held[0]), self.worker_ids)]
+                try:
+                    target.inbox.put_nowait(slot.held[0])
+                except queue.Full:
+                    break  # keep the order; retry on the next check
+                slot.held.pop(0)
+            if slot.retiring and not slot.held:
+                self._slots.pop(worker_id, None)
+
+    def resize(self, count: int) -> None:
+        """Change the worker count; rendezvous hashing moves only the affected users."""
+        count = max(1, count)
+        previous = self._count
+        self._count = count
+        for worker_id in range(count):
+            self._ensure_slot(worker_id)
+        for worker_id in range(count, previous):
+            slot = self._slots.get(worker_id)
+            if slot is not None and not slot.retiring:
+                slot.retiring = True
+                # Already queued updates are drained before the worker exits.
+                slot.inbox.put(None)
+        logger.info("Bot workers resized", extra={"previous": previous, "workers": count})
+        self.check()
+
+    def submit(self, raw: RawUpdate) -> bool:
+        # Retiring workers still take part in routing, so their users stay put
+        # (held) until the hand-over in check().
+        slot = self._slots[rendezvous_worker(shard_key(raw), sorted(self._slots))]
+        if slot.retiring or slot.held:
+            if len(slot.held) >= self.queue_size:
+                self.dropped += 1
+                return False
+            slot.held.append(raw)
+            return True
+        try:
+            slot.inbox.put_nowait(raw)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    async def submit_waiting(self, raw: RawUpdate, *, poll_interval_sec: float = 0.1) -> None:
+        """Submit ``raw``, waiting while the target inbox is full.
+
+        A worker that died with a full inbox never frees a slot, so the wait
+        keeps calling ``check()`` to restart it; the new process drains the
+        same inbox.
+        """
+        while not self.submit(raw):
+            self.check()
+            await asyncio.sleep(poll_interval_sec)
+
+    def queue_depth(self) -> int:
+        depth = 0
+        for slot in self._slots.values():
+            depth += len(slot.held)
+            try:
+                depth += slot.inbox.qsize()
+            except NotImplementedError:  # macOS has no sem_getvalue
+                return -1
+        return depth
+
+    def stop(self, *, timeout: float = 10.0) -> None:
+        for slot in self._slots.values():
+            try:
+                slot.inbox.put(None, timeout=1.0)
+            except queue.Full:
+                pass
+        deadline = self._clock() + timeout
+        for slot in self._slots.values():
+            if slot.process is None:
+                continue
+            slot.process.join(timeout=max(0.0, deadline - self._clock()))
+            if slot.process.is_alive():
+                slot.process.terminate()
+                slot.process.join(timeout=1.0)
+        self._slots.clear()
+
+
+class ShardedUpdatePool:
+    """Webhook-side adapter with the same surface as ``UpdateWorkerPool``."""
+
+    def __init__(self, supervisor: WorkerSupervisor, *, check_interval_sec: float = 1.0) -> None:
+        self.supervisor = supervisor
+        self.check_interval_sec = check_interval_sec
+        self._monitor: asyncio.Task[None] | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._monitor is not None
+
+    def parse_update(self, payload: Any) -> RawUpdate:
+        if not isinstance(payload, dict) or not isinstance(payload.get("update_id"), int):
+            raise ValueError("update_id is required")
+        return payload
+
+    def submit(self, update: RawUpdate) -> bool:
+        return self.supervisor.submit(update)
+
+    def queue_depth(self) -> int:
+        return self.supervisor.queue_depth()
+
+    async def start(self) -> None:
+        if self._monitor is not None:
+            return
+        self.supervisor.start()
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval_sec)
+            try:
+                self.supervisor.check()
+            except Exception:
+                logger.exception("Bot worker check failed")
+
+    async def stop(self) -> None:
+        if self._monitor is None:
+            return
+        self._monitor.cancel()
+        await asyncio.gather(self._monitor, return_exceptions=True)
+        self._monitor = None
+        await asyncio.get_running_loop().run_in_executor(None, self.supervisor.stop)
+
+
+async def feed_raw_updates(inbox: Any, handle: Callable[[RawUpdate], Awaitable[Any]]) -> None:
+    """Worker loop: read raw updates from ``inbox`` until ``None`` and handle them.
+
+    Updates of different users run concurrently; updates of the same user are
+    chained so each starts only after the previous one finished.
+    """
+    loop = asyncio.get_running_loop()
+    tails: dict[int, asyncio.Task[None]] = {}
+
+    async def _run(raw: RawUpdate, previous: asyncio.Task[None] | None) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            await handle(raw)
+        except Exception:
+            logger.exception(
+                "Worker failed to handle update", extra={"update_id": raw.get("update_id")}
+            )
+
+    def _forget(key: int, task: asyncio.Task[None]) -> None:
+        if tails.get(key) is task:
+            tails.pop(key, None)
+
+    while True:
+        raw = await loop.run_in_executor(None, inbox.get)
+        if raw is None:
+            break
+        key = shard_key(raw)
+        task = asyncio.create_task(_run(raw, tails.get(key)))
+        tails[key] = task
+        task.add_done_callback(lambda done, key=key: _forget(key, done))
+    if tails:
+        await asyncio.gather(*tails.values(), return_exceptions=True)
+
+
+def run_bot_worker(worker_id: int, worker_count: int, inbox: Any) -> None:
+    """Process entry point for one sharded bot worker."""
+    main_module = sys.modules.get("__mp_main__")
+    if getattr(getattr(main_module, "__spec__", None), "name", None) == "bot.main":
+        # spawn で python -m bot.main が __mp_main__ として読み込み済みなら、それを使い回す。
+        sys.modules.setdefault("bot.main", main_module)
+
+    from bot import main as bot_main
+
+    asyncio.run(bot_main.run_worker(inbox, worker_id=worker_id, worker_count=worker_count))
+
+
+__all__ = [
+    "ShardedUpdatePool",
+    "WorkerSupervisor",
+    "extract_user_id",
+    "feed_raw_updates",
+    "rendezvous_worker",
+    "run_bot_worker",
+    "shard_key",
+]
@@ -0,0 +1,186 @@
+"""In-memory character packs loaded from ``characters/<name>/``.
+
+Each pack keeps every ``*.txt`` file of a character resident in memory so the
+chat hot path never touches the disk. Packs are revalidated with a cheap
+``stat`` of the directory at most once per ``reload_interval_sec`` and are
+re-read only when a file's mtime or size changed. Several characters can be
+resident at once; when one process hosts several bots, ``use_character`` picks
+the pack for the update being handled.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from core.env import parse_float_env
+
+logger = logging.getLogger(__name__)
+
+CHARACTERS_ROOT = Path(__file__).resolve().parents[1] / "characters"
+PACK_FILE_SUFFIX = ".txt"
+
+FileSignature = tuple[int, int]
+
+
+CHARACTER_RELOAD_INTERVAL_SEC = parse_float_env("CHARACTER_RELOAD_INTERVAL_SEC", 5.0)
+
+
+def is_valid_character_name(name: str | None) -> bool:
+    if not name:
+        return False
+    return not ("/" in name or "\\" in name or name.startswith("."))
+
+
+@dataclass(frozen=True)
+class CharacterPack:
+    name: str
+    files: dict[str, str]
+    signatures: dict[str, FileSignature] = field(repr=False)
+    loaded_at: float = 0.0
+
+    def get(self, filename: str) -> str | None:
+        return self.files.get(filename)
+
+    @property
+    def system_prompt(self) -> str | None:
+        return self.get("system_prompt.txt")
+
+    @property
+    def boundary_lines(self) -> str | None:
+        return self.get("boundary_lines.txt")
+
+
+def _scan_signatures(directory: Path) -> dict[str, FileSignature] | None:
+    try:
+        entries = list(os.scandir(directory))
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    signatures: dict[str, FileSignature] = {}
+    for entry in entries:
+        if not entry.name.endswith(PACK_FILE_SUFFIX) or not entry.is_file():
+            continue
+        stat = entry.stat()
+        signatures[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return signatures
+
+
+class CharacterPackLoader:
+    def __init__(
+        self,
+        root: Path = CHARACTERS_ROOT,
+        *,
+        reload_interval_sec: float = CHARACTER_RELOAD_INTERVAL_SEC,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.root = Path(root)
+        self.reload_interval_sec = reload_interval_sec
+        self._clock = clock
+        self._packs: dict[str, CharacterPack | None] = {}
+        self._last_checked: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str | None) -> CharacterPack | None:
+        if not is_valid_character_name(name):
+            return None
+        assert name is not None
+        now = self._clock()
+        if name in self._packs and now - self._last_checked[name] < self.reload_interval_sec:
+            return self._packs[name]
+        with self._lock:
+            return self._refresh(name, now)
+
+    def preload(self, names: Iterable[str]) -> None:
+        for name in names:
+            self.get(name)
+
+    def loaded(self) -> list[str]:
+        return sorted(name for name, pack in self._packs.items() if pack is not None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._packs.clear()
+            self._last_checked.clear()
+
+    def _refresh(self, name: str, now: float) -> CharacterPack | None:
+        self._last_checked[name] = now
+        signatures = _scan_signatures(self.root / name)
+        current = self._packs.get(name)
+        if signatures is None or not signatures:
+            if current is not None:
+                logger.info("Character pack removed", extra={"character": name})
+            self._packs[name] = None
+            return None
+        if current is not None and current.signatures == signatures:
+            return current
+        pack = self._load(name, signatures, now)
+        if current is not None:
+            logger.info(
+                "Character pack reloaded",
+                extra={"character": name, "files": sorted(pack.files)},
+            )
+        self._packs[name] = pack
+        return pack
+
+    def _load(
+        self, name: str, signatures: dict[str, FileSignature], now: float
+    ) -> CharacterPack:
+        directory = self.root / name
+        files: dict[str, str] = {}
+        for filename in sorted(signatures):
+            try:
+                files[filename] = (directory / filename).read_text(encoding="utf-8")
+            except OSError:
+                logger.exception(
+                    "Failed to read character file",
+                    extra={"character": name, "file": filename},
+                )
+        return CharacterPack(name=name, files=files, signatures=signatures, loaded_at=now)
+
+
+_default_loader = CharacterPackLoader()
+_active_character: ContextVar[str | None] = ContextVar("active_character", default=None)
+
+
+def get_character_loader() -> CharacterPackLoader:
+    return _default_loader
+
+
+@contextmanager
+def use_character(name: str | None) -> Iterator[None]:
+    """Make ``name`` the default character inside the block (``""`` means none)."""
+    token = _active_character.set(name)
+    try:
+        yield
+    finally:
+        _active_character.reset(token)
+
+
+def get_character_pack(name: str | None = None) -> CharacterPack | None:
+    """Return the pack for ``name``.
+
+    When omitted: the character set by ``use_character``, else the ``CHARACTER`` env.
+    """
+    if name is None:
+        name = _active_character.get()
+    if name is None:
+        name = os.getenv("CHARACTER", "").strip()
+    return _default_loader.get(name)
+
+
+__all__ = [
+    "CHARACTERS_ROOT",
+    "CharacterPack",
+    "CharacterPackLoader",
+    "get_character_loader",
+    "get_character_pack",
+    "is_valid_character_name",
+    "use_character",
+]
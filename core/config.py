@@ -1,11 +1,10 @@
 import os
-from pathlib import Path
 from typing import Set
 
-from dotenv import load_dotenv
+from core.env import load_env, parse_float_env
+from core.singleflight import coalesce_key_from_env
 
-dotenv_path = Path(os.getenv("DOTENV_FILE", Path(__file__).resolve().parents[1] / ".env"))
-load_dotenv(dotenv_path, override=False)
+dotenv_path = load_env()
 
 
 def _parse_admin_ids(raw: str) -> Set[int]:
@@ -21,29 +20,103 @@ def _parse_admin_ids(raw: str) -> Set[int]:
     return values
 
 
-def _parse_float_env(name: str, default: float) -> float:
+def _parse_extra_bots(raw: str) -> tuple[tuple[str, str], ...]:
+    """``arisa=<token>,tarot=<token>`` を ``((character, token), ...)`` にする。
+
+    ``tarot`` / ``default`` は既定（キャラクターなし）の占いボット。
+    """
+    bots: list[tuple[str, str]] = []
+    for item in (raw or "").split(","):
+        if not item.strip():
+            continue
+        character, separator, token = item.partition("=")
+        character, token = character.strip().lower(), token.strip()
+        if not separator or not token:
+            raise RuntimeError(f"EXTRA_BOTS entries must look like 'character=token', got {item.strip()!r}")
+        bots.append(("" if character in {"tarot", "default"} else character, token))
+    return tuple(bots)
+
+
+def _parse_bool_env(name: str, default: bool) -> bool:
     raw = os.getenv(name)
     if raw is None:
         return default
-    try:
-        return float(raw)
-    except ValueError:
-        return default
+    return raw.strip().lower() in {"1", "true", "yes", "on"}
 
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Empty means api.telegram.org; point at tools.fake_telegram (or a local Bot API server) for offline runs.
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "").strip()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Empty means the official endpoint; point at tools.fake_openai for offline benchmarks.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip() or None
+OPENAI_TIMEOUT_SEC = parse_float_env("OPENAI_TIMEOUT_SEC", 600.0)
+CHARACTER = os.getenv("CHARACTER", "").strip().lower()
+# CHARACTER=arisa で Arisa 用のルーターだけを登録する。それ以外は占い（tarot）モード。
+BOT_MODE = "arisa" if CHARACTER == "arisa" else "default"
+# 同じプロセスで追加で動かすボット（キャラクター=トークン）。DB・LLM クライアント・キャッシュは共有する。
+EXTRA_BOTS = _parse_extra_bots(os.getenv("EXTRA_BOTS", ""))
 SUPPORT_EMAIL = os.getenv("SUPPORT_EMAIL", "hasegawaarisa1@gmail.com")
 ADMIN_USER_IDS = _parse_admin_ids(os.getenv("ADMIN_USER_IDS", ""))
-THROTTLE_MESSAGE_INTERVAL_SEC = _parse_float_env("THROTTLE_MESSAGE_INTERVAL_SEC", 1.2)
-THROTTLE_CALLBACK_INTERVAL_SEC = _parse_float_env("THROTTLE_CALLBACK_INTERVAL_SEC", 0.8)
+THROTTLE_MESSAGE_INTERVAL_SEC = parse_float_env("THROTTLE_MESSAGE_INTERVAL_SEC", 1.2)
+THROTTLE_CALLBACK_INTERVAL_SEC = parse_float_env("THROTTLE_CALLBACK_INTERVAL_SEC", 0.8)
+THROTTLE_MESSAGE_BURST = parse_float_env("THROTTLE_MESSAGE_BURST", 1.0)
+THROTTLE_CALLBACK_BURST = parse_float_env("THROTTLE_CALLBACK_BURST", 3.0)
+LOAD_SHED_LLM_INFLIGHT = parse_float_env("LOAD_SHED_LLM_INFLIGHT", 50.0)
+LOAD_SHED_LOOP_LAG_MS = parse_float_env("LOAD_SHED_LOOP_LAG_MS", 250.0)
+LOAD_SHED_FACTOR = parse_float_env("LOAD_SHED_FACTOR", 0.25)
+LOOP_MONITOR_ENABLED = _parse_bool_env("LOOP_MONITOR_ENABLED", True)
+LOOP_MONITOR_DEBUG = _parse_bool_env("LOOP_MONITOR_DEBUG", False)
+LOOP_SLOW_CALLBACK_MS = parse_float_env("LOOP_SLOW_CALLBACK_MS", 100.0)
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+SEND_GLOBAL_RATE_PER_SEC = parse_float_env("SEND_GLOBAL_RATE_PER_SEC", 30.0)
+SEND_CHAT_RATE_PER_SEC = parse_float_env("SEND_CHAT_RATE_PER_SEC", 1.0)
+SEND_CHAT_BURST = parse_float_env("SEND_CHAT_BURST", 3.0)
+BOT_RUNTIME = os.getenv("BOT_RUNTIME", "polling").strip().lower()
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "").strip()
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "").strip()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+BOT_WORKERS = max(1, int(os.getenv("BOT_WORKERS", "1")))
+# 停止時に処理中の更新（LLM 待ちを含む）を待つ上限秒数。超えた分は中断する。
+SHUTDOWN_DRAIN_TIMEOUT_SEC = parse_float_env("SHUTDOWN_DRAIN_TIMEOUT_SEC", 20.0)
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "").strip()
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", "10000"))
+USER_MAP_MAX_SIZE = int(os.getenv("USER_MAP_MAX_SIZE", "100000"))
+USER_LOCK_TTL_SEC = parse_float_env("USER_LOCK_TTL_SEC", 1800.0)
+# 同じユーザーの新しいメッセージで、まだ返答していない古い LLM リクエストを取り消すモード（既定はなし）。
+SUPERSEDE_MODES = frozenset(
+    mode.strip().lower() for mode in os.getenv("SUPERSEDE_MODES", "").split(",") if mode.strip()
+)
+# 同じプロンプトの同時呼び出しをまとめるときのキーの作り方（off / exact / normalized）。
+LLM_COALESCE_KEY = coalesce_key_from_env()
 ONE_MESSAGE_TOKENS = int(os.getenv("ONE_MESSAGE_TOKENS", "600"))
 TRIAL_FREE_CREDITS = int(os.getenv("TRIAL_FREE_CREDITS", "10"))
 PASS_7D_DAILY_LIMIT = int(os.getenv("PASS_7D_DAILY_LIMIT", "30"))
 PASS_30D_DAILY_LIMIT = int(os.getenv("PASS_30D_DAILY_LIMIT", "50"))
+TAROT_MAX_TOKENS = int(os.getenv("TAROT_MAX_TOKENS", "2000"))
+CONSULT_MAX_TOKENS = int(os.getenv("CONSULT_MAX_TOKENS", "1000"))
+# 0 なら max_tokens を付けない。
+ARISA_MAX_TOKENS = int(os.getenv("ARISA_MAX_TOKENS", "600"))
+MAX_USER_INPUT_TOKENS = int(os.getenv("MAX_USER_INPUT_TOKENS", "1000"))
 
 if not TELEGRAM_BOT_TOKEN:
     raise RuntimeError("TELEGRAM_BOT_TOKEN is not set in environment or .env")
 
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY is not set in environment or .env")
+
+if BOT_RUNTIME not in {"polling", "webhook"}:
+    raise RuntimeError(f"BOT_RUNTIME must be 'polling' or 'webhook', got {BOT_RUNTIME!r}")
+
+if not SUPERSEDE_MODES <= {"tarot", "consult", "arisa"}:
+    raise RuntimeError(f"SUPERSEDE_MODES accepts tarot, consult and arisa, got {sorted(SUPERSEDE_MODES)}")
+
+if EXTRA_BOTS and (BOT_RUNTIME != "polling" or BOT_WORKERS > 1):
+    raise RuntimeError("EXTRA_BOTS requires BOT_RUNTIME=polling and BOT_WORKERS=1")
+# 会話状態・ロック・スロットルはキャラクター名でボットごとに分けるので、追加ボットの名前は重複させない。
+if len({character for character, _ in EXTRA_BOTS}) < len(EXTRA_BOTS):
+    raise RuntimeError("EXTRA_BOTS lists the same character more than once")
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
+import functools
 import logging
 import os
 import sqlite3
+import time
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Literal
+from typing import Callable, Literal, ParamSpec, TypeVar
 
 from bot.texts.i18n import normalize_lang
+from core.metrics import REGISTRY
+from core.tracing import TRACER
 from core.store.catalog import get_product
 
 DB_PATH = os.getenv("SQLITE_DB_PATH", "db/telegram_tarot.db")
@@ -16,6 +20,34 @@ USAGE_TIMEZONE = timezone(timedelta(hours=9))
 logger = logging.getLogger(__name__)
 
 
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "db_query_duration_seconds",
+    "Time spent in core.db functions",
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+    labelnames=("function",),
+)
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def _timed(func: Callable[P, R]) -> Callable[P, R]:
+    """DB 関数の実行時間をヒストグラムとトレースに記録する。クエリを発行する公開関数にだけ付ける。"""
+    span_name = f"db.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        started = time.perf_counter()
+        try:
+            with TRACER.span(span_name):
+                return func(*args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, function=func.__name__)
+
+    return wrapper
+
+
 def _usage_date(now: datetime) -> date:
     return now.astimezone(USAGE_TIMEZONE).date()
 
@@ -100,7 +132,27 @@ class AppEventRecord:
     created_at: datetime
 
 
+@dataclass
+class ArisaLedgerEntry:
+    id: int
+    user_id: int
+    kind: str
+    status: str
+    pass_credits: int
+    ticket_credits: int
+    trial_credits: int
+    reserved_credits: int
+    used_credits: int
+    shortfall: int
+    usage_date: date | None
+    request_id: str | None
+    created_at: datetime
+    closed_at: datetime | None
+
+
 TicketColumn = Literal["tickets_3", "tickets_7", "tickets_10"]
+ArisaCreditSource = Literal["pass", "ticket", "trial"]
+ARISA_CREDIT_SOURCES: tuple[ArisaCreditSource, ...] = ("pass", "ticket", "trial")
 
 
 def _ensure_parent_dir(path: str | os.PathLike[str]) -> None:
@@ -109,13 +161,24 @@ def _ensure_parent_dir(path: str | os.PathLike[str]) -> None:
         directory.mkdir(parents=True, exist_ok=True)
 
 
-def _connect() -> sqlite3.Connection:
+# スキーマ作成・ALTER チェックは import では走らせず、起動処理が init_db() を明示的に呼ぶ。
+# 呼ばれないまま使われた場合（テストやツール）は最初の接続で一度だけ行う。
+_initialized_path: str | None = None
+
+
+def _open() -> sqlite3.Connection:
     _ensure_parent_dir(DB_PATH)
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def _connect() -> sqlite3.Connection:
+    if _initialized_path != DB_PATH:
+        init_db()
+    return _open()
+
+
 def _column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
     rows = conn.execute(f"PRAGMA table_info({table})").fetchall()
     return any(row[1] == column for row in rows)
@@ -127,7 +190,8 @@ def _normalize_lang(code: str | None) -> str:
 
 
 def init_db() -> None:
-    with _connect() as conn:
+    global _initialized_path
+    with _open() as conn:
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
@@ -303,9 +367,45 @@ def init_db() -> None:
             """
         )
 
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS arisa_credit_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INT,
+                kind TEXT,
+                status TEXT,
+                pass_credits INT DEFAULT 0,
+                ticket_credits INT DEFAULT 0,
+                trial_credits INT DEFAULT 0,
+                reserved_credits INT DEFAULT 0,
+                used_credits INT DEFAULT 0,
+                shortfall INT DEFAULT 0,
+                usage_date TEXT,
+                request_id TEXT,
+                created_at TEXT,
+                closed_at TEXT
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_arisa_credit_ledger_user
+            ON arisa_credit_ledger(user_id, id)
+            """
+        )
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_arisa_credit_ledger_open
+            ON arisa_credit_ledger(status, created_at)
+            WHERE status = 'reserved'
+            """
+        )
+
         _backfill_user_columns(conn)
+    _initialized_path = DB_PATH
 
 
+@_timed
 def ensure_user(user_id: int, *, now: datetime | None = None) -> UserRecord:
     now = now or datetime.now(timezone.utc)
     usage_today = _usage_date(now)
@@ -369,6 +469,7 @@ def ensure_user(user_id: int, *, now: datetime | None = None) -> UserRecord:
         )
 
 
+@_timed
 def get_user(user_id: int, *, now: datetime | None = None) -> UserRecord | None:
     now = now or datetime.now(timezone.utc)
     with _connect() as conn:
@@ -380,6 +481,7 @@ def get_user(user_id: int, *, now: datetime | None = None) -> UserRecord | None:
     return _row_to_user(row)
 
 
+@_timed
 def get_user_lang(user_id: int) -> str | None:
     with _connect() as conn:
         row = conn.execute(
@@ -391,6 +493,7 @@ def get_user_lang(user_id: int) -> str | None:
     return _normalize_lang(lang_raw) if lang_raw else None
 
 
+@_timed
 def set_user_lang(user_id: int, lang: str, *, now: datetime | None = None) -> str:
     now = now or datetime.now(timezone.utc)
     normalized = _normalize_lang(lang)
@@ -403,6 +506,7 @@ def set_user_lang(user_id: int, lang: str, *, now: datetime | None = None) -> st
     return normalized
 
 
+@_timed
 def log_payment(
     *,
     user_id: int,
@@ -444,6 +548,7 @@ def log_payment(
         return _row_to_payment(new_row), True
 
 
+@_timed
 def get_payment_by_charge_id(telegram_payment_charge_id: str) -> PaymentRecord | None:
     with _connect() as conn:
         row = conn.execute(
@@ -455,6 +560,7 @@ def get_payment_by_charge_id(telegram_payment_charge_id: str) -> PaymentRecord |
     return _row_to_payment(row)
 
 
+@_timed
 def mark_payment_refunded(
     telegram_payment_charge_id: str, *, refund_id: str | None = None, now: datetime | None = None
 ) -> PaymentRecord | None:
@@ -477,6 +583,7 @@ def mark_payment_refunded(
     return _row_to_payment(row)
 
 
+@_timed
 def log_payment_event(
     *, user_id: int, event_type: str, sku: str | None = None, payload: str | None = None, now: datetime | None = None
 ) -> PaymentEvent:
@@ -498,6 +605,7 @@ def log_payment_event(
     return _row_to_payment_event(row)
 
 
+@_timed
 def log_audit(
     *,
     action: str,
@@ -525,6 +633,7 @@ def log_audit(
     return _row_to_audit(row)
 
 
+@_timed
 def get_latest_audit(action: str | None = None) -> AuditRecord | None:
     query = "SELECT * FROM audits"
     params: tuple[object, ...] = ()
@@ -539,6 +648,7 @@ def get_latest_audit(action: str | None = None) -> AuditRecord | None:
     return _row_to_audit(row)
 
 
+@_timed
 def get_latest_payment(user_id: int) -> PaymentRecord | None:
     with _connect() as conn:
         row = conn.execute(
@@ -555,6 +665,7 @@ def get_latest_payment(user_id: int) -> PaymentRecord | None:
     return _row_to_payment(row)
 
 
+@_timed
 def check_db_health() -> tuple[bool, list[str]]:
     messages: list[str] = []
     db_file = Path(DB_PATH)
@@ -564,7 +675,7 @@ def check_db_health() -> tuple[bool, list[str]]:
         return False, [message]
 
     try:
-        with _connect() as conn:
+        with _open() as conn:
             integrity = conn.execute("PRAGMA quick_check").fetchone()
             if not integrity or integrity[0] != "ok":
                 message = f"PRAGMA quick_check failed: {integrity[0] if integrity else 'unknown'}"
@@ -635,6 +746,21 @@ def check_db_health() -> tuple[bool, list[str]]:
                     "payload",
                     "created_at",
                 },
+                "arisa_credit_ledger": {
+                    "user_id",
+                    "kind",
+                    "status",
+                    "pass_credits",
+                    "ticket_credits",
+                    "trial_credits",
+                    "reserved_credits",
+                    "used_credits",
+                    "shortfall",
+                    "usage_date",
+                    "request_id",
+                    "created_at",
+                    "closed_at",
+                },
             }
 
             for table, required_columns in requirements.items():
@@ -774,6 +900,27 @@ def _row_to_app_event(row: sqlite3.Row) -> AppEventRecord:
     )
 
 
+def _row_to_ledger_entry(row: sqlite3.Row) -> ArisaLedgerEntry:
+    usage_raw = row["usage_date"]
+    closed_raw = row["closed_at"]
+    return ArisaLedgerEntry(
+        id=row["id"],
+        user_id=row["user_id"],
+        kind=row["kind"],
+        status=row["status"],
+        pass_credits=row["pass_credits"] or 0,
+        ticket_credits=row["ticket_credits"] or 0,
+        trial_credits=row["trial_credits"] or 0,
+        reserved_credits=row["reserved_credits"] or 0,
+        used_credits=row["used_credits"] or 0,
+        shortfall=row["shortfall"] or 0,
+        usage_date=date.fromisoformat(usage_raw) if usage_raw else None,
+        request_id=row["request_id"],
+        created_at=datetime.fromisoformat(row["created_at"]),
+        closed_at=datetime.fromisoformat(closed_raw) if closed_raw else None,
+    )
+
+
 def _ticket_column_for_sku(sku: str) -> TicketColumn:
     if sku == "TICKET_3":
         return "tickets_3"
@@ -789,6 +936,7 @@ def _add_days_to_premium(current: datetime | None, days: int, *, now: datetime)
     return base + timedelta(days=days)
 
 
+@_timed
 def grant_purchase(user_id: int, sku: str, *, now: datetime | None = None) -> UserRecord:
     now = now or datetime.now(timezone.utc)
     product = get_product(sku)
@@ -829,6 +977,7 @@ def grant_purchase(user_id: int, sku: str, *, now: datetime | None = None) -> Us
     return get_user(user_id)  # type: ignore[return-value]
 
 
+@_timed
 def revoke_purchase(user_id: int, sku: str, *, now: datetime | None = None) -> UserRecord:
     now = now or datetime.now(timezone.utc)
     ensure_user(user_id, now=now)
@@ -854,6 +1003,7 @@ def revoke_purchase(user_id: int, sku: str, *, now: datetime | None = None) -> U
     return get_user(user_id)  # type: ignore[return-value]
 
 
+@_timed
 def consume_ticket(user_id: int, *, ticket: TicketColumn) -> bool:
     ensure_user(user_id)
     with _connect() as conn:
@@ -869,11 +1019,22 @@ def consume_ticket(user_id: int, *, ticket: TicketColumn) -> bool:
     return True
 
 
+@_timed
+def refund_ticket(user_id: int, *, ticket: TicketColumn) -> None:
+    """Give back a ticket taken by ``consume_ticket`` for a request that was never answered."""
+    with _connect() as conn:
+        conn.execute(
+            f"UPDATE users SET {ticket} = {ticket} + 1 WHERE user_id = ?",
+            (user_id,),
+        )
+
+
 def has_accepted_terms(user_id: int) -> bool:
     user = get_user(user_id)
     return bool(user and user.terms_accepted_at)
 
 
+@_timed
 def set_terms_accepted(user_id: int, *, now: datetime | None = None) -> UserRecord:
     now = now or datetime.now(timezone.utc)
     ensure_user(user_id, now=now)
@@ -885,6 +1046,7 @@ def set_terms_accepted(user_id: int, *, now: datetime | None = None) -> UserReco
     return get_user(user_id)  # type: ignore[return-value]
 
 
+@_timed
 def set_last_general_chat_block_notice(
     user_id: int, *, now: datetime | None = None
 ) -> UserRecord:
@@ -910,18 +1072,44 @@ def has_active_pass(user_id: int, *, now: datetime | None = None) -> bool:
     return False
 
 
+@_timed
 def increment_general_chat_count(user_id: int, *, now: datetime | None = None) -> UserRecord:
     return _increment_daily_count(
         user_id, column="general_chat_count_today", now=now
     )
 
 
+@_timed
 def increment_one_oracle_count(user_id: int, *, now: datetime | None = None) -> UserRecord:
     return _increment_daily_count(
         user_id, column="one_oracle_count_today", now=now
     )
 
 
+@_timed
+def decrement_general_chat_count(user_id: int, *, now: datetime | None = None) -> None:
+    _decrement_daily_count(user_id, column="general_chat_count_today", now=now)
+
+
+@_timed
+def decrement_one_oracle_count(user_id: int, *, now: datetime | None = None) -> None:
+    _decrement_daily_count(user_id, column="one_oracle_count_today", now=now)
+
+
+def _decrement_daily_count(user_id: int, *, column: str, now: datetime | None = None) -> None:
+    # 日付が変わっていたら、もう数え直されているので何もしない。
+    today = _usage_date(now or datetime.now(timezone.utc))
+    with _connect() as conn:
+        conn.execute(
+            f"""
+            UPDATE users
+            SET {column} = MAX({column} - 1, 0)
+            WHERE user_id = ? AND usage_date = ?
+            """,
+            (user_id, today.isoformat()),
+        )
+
+
 def _increment_daily_count(
     user_id: int, *, column: str, now: datetime | None = None
 ) -> UserRecord:
@@ -979,6 +1167,7 @@ def _refresh_daily_counts(
     return refreshed if refreshed else row
 
 
+@_timed
 def log_feedback(
     *,
     user_id: int,
@@ -1004,6 +1193,7 @@ def log_feedback(
     return _row_to_feedback(row)
 
 
+@_timed
 def get_recent_feedback(limit: int = 10) -> list[FeedbackRecord]:
     with _connect() as conn:
         rows = conn.execute(
@@ -1013,6 +1203,7 @@ def get_recent_feedback(limit: int = 10) -> list[FeedbackRecord]:
     return [_row_to_feedback(row) for row in rows]
 
 
+@_timed
 def log_app_event(
     *,
     event_type: str,
@@ -1038,6 +1229,7 @@ def log_app_event(
     return _row_to_app_event(row)
 
 
+@_timed
 def has_app_event(*, user_id: int, event_type: str) -> bool:
     with _connect() as conn:
         row = conn.execute(
@@ -1052,6 +1244,7 @@ def has_app_event(*, user_id: int, event_type: str) -> bool:
     return row is not None
 
 
+@_timed
 def has_payment_event(
     *, user_id: int, event_type: str, sku_prefix: str | None = None
 ) -> bool:
@@ -1069,6 +1262,7 @@ def has_payment_event(
     return row is not None
 
 
+@_timed
 def update_arisa_credits(
     user_id: int, *, delta: int, now: datetime | None = None
 ) -> UserRecord:
@@ -1089,6 +1283,7 @@ def update_arisa_credits(
     return get_user(user_id, now=now)  # type: ignore[return-value]
 
 
+@_timed
 def set_arisa_trial_remaining(
     user_id: int, *, remaining: int, now: datetime | None = None
 ) -> UserRecord:
@@ -1102,6 +1297,7 @@ def set_arisa_trial_remaining(
     return get_user(user_id, now=now)  # type: ignore[return-value]
 
 
+@_timed
 def update_arisa_pass(
     user_id: int,
     *,
@@ -1132,6 +1328,7 @@ def update_arisa_pass(
     return get_user(user_id, now=now)  # type: ignore[return-value]
 
 
+@_timed
 def increment_arisa_pass_usage(
     user_id: int, *, amount: int, now: datetime | None = None
 ) -> UserRecord:
@@ -1164,6 +1361,403 @@ def increment_arisa_pass_usage(
     return get_user(user_id, now=now)  # type: ignore[return-value]
 
 
+def _arisa_balances(user: UserRecord, now: datetime) -> dict[str, int]:
+    pass_remaining = 0
+    if user.arisa_pass_until and user.arisa_pass_until > now:
+        used_today = user.arisa_pass_used_today
+        if user.arisa_pass_usage_date != _usage_date(now):
+            used_today = 0
+        pass_remaining = max((user.arisa_pass_daily_limit or 0) - used_today, 0)
+    return {
+        "pass": pass_remaining,
+        "ticket": max(user.arisa_credits, 0),
+        "trial": max(user.arisa_trial_remaining, 0),
+    }
+
+
+def _take_arisa_credits(balances: dict[str, int], credits: int) -> dict[str, int]:
+    taken: dict[str, int] = {}
+    remaining = credits
+    for source in ARISA_CREDIT_SOURCES:
+        use = min(balances.get(source, 0), remaining)
+        taken[source] = use
+        remaining -= use
+    return taken
+
+
+def _load_user_for_update(conn: sqlite3.Connection, user_id: int, now: datetime) -> UserRecord:
+    row = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if row is None:
+        raise ValueError("User must exist to change Arisa credits")
+    return _row_to_user(_refresh_daily_counts(conn, row, now))
+
+
+def _apply_arisa_credit_delta(
+    conn: sqlite3.Connection,
+    user: UserRecord,
+    delta: dict[str, int],
+    now: datetime,
+) -> None:
+    """Apply signed per-source balance changes (negative = spend) in one UPDATE."""
+    usage_today = _usage_date(now)
+    used_today = user.arisa_pass_used_today if user.arisa_pass_usage_date == usage_today else 0
+    conn.execute(
+        """
+        UPDATE users
+        SET arisa_pass_used_today = ?,
+            arisa_pass_usage_date = ?,
+            arisa_credits = MAX(arisa_credits + ?, 0),
+            arisa_trial_remaining = MAX(arisa_trial_remaining + ?, 0)
+        WHERE user_id = ?
+        """,
+        (
+            max(used_today - delta.get("pass", 0), 0),
+            usage_today.isoformat(),
+            delta.get("ticket", 0),
+            delta.get("trial", 0),
+            user.user_id,
+        ),
+    )
+
+
+def _get_ledger_entry(conn: sqlite3.Connection, entry_id: int) -> sqlite3.Row | None:
+    return conn.execute(
+        "SELECT * FROM arisa_credit_ledger WHERE id = ?", (entry_id,)
+    ).fetchone()
+
+
+def _seed_arisa_opening_balance(conn: sqlite3.Connection, user: UserRecord, now: datetime) -> None:
+    """Record the balances held before the user's first ledger entry.
+
+    Balances granted before the ledger existed (or outside it) would otherwise
+    be missing from the replay, so the first ledger write for a user opens
+    with this migration entry.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM arisa_credit_ledger WHERE user_id = ? LIMIT 1", (user.user_id,)
+    ).fetchone()
+    if exists is not None:
+        return
+    used_today = user.arisa_pass_used_today if user.arisa_pass_usage_date == _usage_date(now) else 0
+    conn.execute(
+        """
+        INSERT INTO arisa_credit_ledger (
+            user_id, kind, status, pass_credits, ticket_credits, trial_credits,
+            reserved_credits, used_credits, shortfall, usage_date, request_id, created_at, closed_at
+        ) VALUES (?, 'opening', 'granted', ?, ?, ?, 0, 0, 0, ?, NULL, ?, ?)
+        """,
+        (
+            user.user_id,
+            used_today,
+            user.arisa_credits,
+            user.arisa_trial_remaining,
+            _usage_date(now).isoformat(),
+            now.isoformat(),
+            now.isoformat(),
+        ),
+    )
+
+
+@_timed
+def reserve_arisa_credits(
+    user_id: int,
+    *,
+    credits: int,
+    partial: bool = False,
+    now: datetime | None = None,
+    request_id: str | None = None,
+) -> ArisaLedgerEntry | None:
+    """Hold ``credits`` (pass → ticket → trial) before calling the LLM.
+
+    The hold is taken from the balances immediately so concurrent messages
+    cannot spend the same credits. Returns None when the balance is short;
+    with ``partial`` it holds whatever is left instead and returns None only
+    when nothing is.
+    """
+    now = now or datetime.now(timezone.utc)
+    credits = max(credits, 1)
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        user = _load_user_for_update(conn, user_id, now)
+        taken = _take_arisa_credits(_arisa_balances(user, now), credits)
+        held = sum(taken.values())
+        if held == 0 or (held < credits and not partial):
+            return None
+        _seed_arisa_opening_balance(conn, user, now)
+        _apply_arisa_credit_delta(
+            conn, user, {source: -amount for source, amount in taken.items()}, now
+        )
+        cursor = conn.execute(
+            """
+            INSERT INTO arisa_credit_ledger (
+                user_id, kind, status, pass_credits, ticket_credits, trial_credits,
+                reserved_credits, used_credits, shortfall, usage_date, request_id, created_at, closed_at
+            ) VALUES (?, 'usage', 'reserved', ?, ?, ?, ?, 0, 0, ?, ?, ?, NULL)
+            """,
+            (
+                user_id,
+                taken["pass"],
+                taken["ticket"],
+                taken["trial"],
+                held,
+                _usage_date(now).isoformat(),
+                request_id,
+                now.isoformat(),
+            ),
+        )
+        row = _get_ledger_entry(conn, cursor.lastrowid)
+    if row is None:
+        raise ValueError("Failed to insert Arisa credit reservation")
+    return _row_to_ledger_entry(row)
+
+
+def _close_arisa_reservation(
+    entry_id: int, *, used_credits: int, status: str, now: datetime
+) -> ArisaLedgerEntry:
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = _get_ledger_entry(conn, entry_id)
+        if row is None:
+            raise ValueError("Unknown Arisa credit reservation")
+        if row["status"] != "reserved":
+            return _row_to_ledger_entry(row)
+        user = _load_user_for_update(conn, row["user_id"], now)
+        held = {
+            "pass": row["pass_credits"] or 0,
+            "ticket": row["ticket_credits"] or 0,
+            "trial": row["trial_credits"] or 0,
+        }
+        if row["usage_date"] != _usage_date(now).isoformat():
+            # The daily pass counter was reset since the hold; nothing to give back.
+            held_pass_refundable = 0
+        else:
+            held_pass_refundable = held["pass"]
+        from_hold = _take_arisa_credits(held, used_credits)
+        refund = {source: held[source] - from_hold[source] for source in ARISA_CREDIT_SOURCES}
+        refund["pass"] = min(refund["pass"], held_pass_refundable)
+        balances = _arisa_balances(user, now)
+        available = {source: balances[source] + refund[source] for source in ARISA_CREDIT_SOURCES}
+        extra = _take_arisa_credits(available, used_credits - sum(from_hold.values()))
+        consumed = {source: from_hold[source] + extra[source] for source in ARISA_CREDIT_SOURCES}
+        shortfall = used_credits - sum(consumed.values())
+        _apply_arisa_credit_delta(
+            conn,
+            user,
+            {source: refund[source] - extra[source] for source in ARISA_CREDIT_SOURCES},
+            now,
+        )
+        conn.execute(
+            """
+            UPDATE arisa_credit_ledger
+            SET status = ?,
+                pass_credits = ?,
+                ticket_credits = ?,
+                trial_credits = ?,
+                used_credits = ?,
+                shortfall = ?,
+                closed_at = ?
+            WHERE id = ?
+            """,
+            (
+                status,
+                consumed["pass"],
+                consumed["ticket"],
+                consumed["trial"],
+                used_credits,
+                shortfall,
+                now.isoformat(),
+                entry_id,
+            ),
+        )
+        updated = _get_ledger_entry(conn, entry_id)
+    if updated is None:
+        raise ValueError("Failed to reload Arisa credit reservation")
+    return _row_to_ledger_entry(updated)
+
+
+@_timed
+def settle_arisa_reservation(
+    entry_id: int, *, used_credits: int, now: datetime | None = None
+) -> ArisaLedgerEntry:
+    """Charge the actual usage against a hold and refund the rest in one transaction."""
+    now = now or datetime.now(timezone.utc)
+    return _close_arisa_reservation(
+        entry_id, used_credits=max(used_credits, 0), status="settled", now=now
+    )
+
+
+@_timed
+def release_arisa_reservation(
+    entry_id: int, *, now: datetime | None = None
+) -> ArisaLedgerEntry:
+    """Return every held credit (LLM call failed or was abandoned)."""
+    now = now or datetime.now(timezone.utc)
+    return _close_arisa_reservation(entry_id, used_credits=0, status="released", now=now)
+
+
+@_timed
+def release_stale_arisa_reservations(
+    *, older_than: timedelta, now: datetime | None = None
+) -> int:
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - older_than).isoformat()
+    with _connect() as conn:
+        rows = conn.execute(
+            """
+            SELECT id FROM arisa_credit_ledger
+            WHERE status = 'reserved' AND created_at < ?
+            """,
+            (cutoff,),
+        ).fetchall()
+    for row in rows:
+        release_arisa_reservation(row["id"], now=now)
+    return len(rows)
+
+
+@_timed
+def grant_arisa_credits(
+    user_id: int,
+    *,
+    source: ArisaCreditSource,
+    credits: int,
+    now: datetime | None = None,
+    request_id: str | None = None,
+) -> UserRecord:
+    """Add ticket or trial credits and record the grant in the ledger."""
+    if source not in {"ticket", "trial"}:
+        raise ValueError(f"Credits cannot be granted to source: {source}")
+    now = now or datetime.now(timezone.utc)
+    ensure_user(user_id, now=now)
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        user = _load_user_for_update(conn, user_id, now)
+        _seed_arisa_opening_balance(conn, user, now)
+        _apply_arisa_credit_delta(conn, user, {source: credits}, now)
+        conn.execute(
+            """
+            INSERT INTO arisa_credit_ledger (
+                user_id, kind, status, pass_credits, ticket_credits, trial_credits,
+                reserved_credits, used_credits, shortfall, usage_date, request_id, created_at, closed_at
+            ) VALUES (?, 'grant', 'granted', 0, ?, ?, 0, 0, 0, ?, ?, ?, ?)
+            """,
+            (
+                user_id,
+                credits if source == "ticket" else 0,
+                credits if source == "trial" else 0,
+                _usage_date(now).isoformat(),
+                request_id,
+                now.isoformat(),
+                now.isoformat(),
+            ),
+        )
+        row = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if row is None:
+        raise ValueError("Failed to reload user after credit grant")
+    return _row_to_user(row)
+
+
+@_timed
+def get_arisa_credit_ledger(user_id: int, *, limit: int = 50) -> list[ArisaLedgerEntry]:
+    with _connect() as conn:
+        rows = conn.execute(
+            """
+            SELECT * FROM arisa_credit_ledger
+            WHERE user_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            (user_id, limit),
+        ).fetchall()
+    return [_row_to_ledger_entry(row) for row in rows]
+
+
+def _ledger_balances(conn: sqlite3.Connection, user_id: int, now: datetime) -> dict[str, int]:
+    row = conn.execute(
+        """
+        SELECT
+            COALESCE(SUM(CASE WHEN kind IN ('grant', 'opening') THEN ticket_credits ELSE -ticket_credits END), 0)
+                AS ticket,
+            COALESCE(SUM(CASE WHEN kind IN ('grant', 'opening') THEN trial_credits ELSE -trial_credits END), 0)
+                AS trial,
+            COALESCE(SUM(CASE WHEN kind IN ('usage', 'opening') AND usage_date = ? THEN pass_credits ELSE 0 END), 0)
+                AS pass_used_today
+        FROM arisa_credit_ledger
+        WHERE user_id = ? AND status != 'released'
+        """,
+        (_usage_date(now).isoformat(), user_id),
+    ).fetchone()
+    return {
+        "ticket": row["ticket"],
+        "trial": row["trial"],
+        "pass_used_today": row["pass_used_today"],
+    }
+
+
+@_timed
+def audit_arisa_credits(
+    user_id: int, *, now: datetime | None = None
+) -> dict[str, dict[str, int]]:
+    """Compare stored balances with the balances replayed from the ledger.
+
+    The replay starts from the ``opening`` entry written before the user's
+    first ledger row. Users whose ledger started before opening entries were
+    recorded show their older balance as a mismatch.
+    """
+    now = now or datetime.now(timezone.utc)
+    with _connect() as conn:
+        user = _load_user_for_update(conn, user_id, now)
+        ledger = _ledger_balances(conn, user_id, now)
+    used_today = (
+        user.arisa_pass_used_today if user.arisa_pass_usage_date == _usage_date(now) else 0
+    )
+    return {
+        "ticket": {"stored": user.arisa_credits, "ledger": ledger["ticket"]},
+        "trial": {"stored": user.arisa_trial_remaining, "ledger": ledger["trial"]},
+        "pass_used_today": {"stored": used_today, "ledger": ledger["pass_used_today"]},
+    }
+
+
+@_timed
+def rebuild_arisa_credits(user_id: int, *, now: datetime | None = None) -> UserRecord:
+    """Overwrite stored balances with the ledger replay (see ``audit_arisa_credits``).
+
+    Raises ValueError for users whose ledger has no opening entry: their
+    balance predates the ledger, and the replay would wipe it.
+    """
+    now = now or datetime.now(timezone.utc)
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        user = _load_user_for_update(conn, user_id, now)
+        _seed_arisa_opening_balance(conn, user, now)
+        opening = conn.execute(
+            "SELECT 1 FROM arisa_credit_ledger WHERE user_id = ? AND kind = 'opening' LIMIT 1",
+            (user_id,),
+        ).fetchone()
+        if opening is None:
+            raise ValueError("Arisa credit ledger predates opening balances; refusing to rebuild")
+        ledger = _ledger_balances(conn, user_id, now)
+        conn.execute(
+            """
+            UPDATE users
+            SET arisa_credits = ?,
+                arisa_trial_remaining = ?,
+                arisa_pass_used_today = ?,
+                arisa_pass_usage_date = ?
+            WHERE user_id = ?
+            """,
+            (
+                max(ledger["ticket"], 0),
+                max(ledger["trial"], 0),
+                max(ledger["pass_used_today"], 0),
+                _usage_date(now).isoformat(),
+                user_id,
+            ),
+        )
+        row = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    return _row_to_user(row)
+
+
+@_timed
 def get_daily_stats(*, days: int = 7, now: datetime | None = None) -> list[dict[str, object]]:
     now = now or datetime.now(timezone.utc)
     days = max(1, min(14, days))
@@ -1281,10 +1875,11 @@ def _backfill_user_columns(conn: sqlite3.Connection) -> None:
     )
 
 
-init_db()
-
 __all__ = [
     "DB_PATH",
+    "ARISA_CREDIT_SOURCES",
+    "ArisaCreditSource",
+    "ArisaLedgerEntry",
     "AuditRecord",
     "PaymentEvent",
     "PaymentRecord",
@@ -1292,9 +1887,13 @@ __all__ = [
     "AppEventRecord",
     "FeedbackRecord",
     "TicketColumn",
+    "audit_arisa_credits",
+    "get_arisa_credit_ledger",
     "get_daily_stats",
     "check_db_health",
     "consume_ticket",
+    "decrement_general_chat_count",
+    "decrement_one_oracle_count",
     "ensure_user",
     "get_user",
     "get_user_lang",
@@ -1302,6 +1901,7 @@ __all__ = [
     "get_latest_audit",
     "get_latest_payment",
     "get_payment_by_charge_id",
+    "grant_arisa_credits",
     "grant_purchase",
     "has_app_event",
     "has_active_pass",
@@ -1317,11 +1917,17 @@ __all__ = [
     "log_payment_event",
     "log_audit",
     "mark_payment_refunded",
+    "rebuild_arisa_credits",
+    "refund_ticket",
+    "release_arisa_reservation",
+    "release_stale_arisa_reservations",
+    "reserve_arisa_credits",
     "revoke_purchase",
     "set_arisa_trial_remaining",
     "set_user_lang",
     "set_last_general_chat_block_notice",
     "set_terms_accepted",
+    "settle_arisa_reservation",
     "update_arisa_credits",
     "update_arisa_pass",
 ]
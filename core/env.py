@@ -0,0 +1,41 @@
+"""``.env`` の読み込み。プロセス内で 1 回だけ読み、以降の呼び出しは何もしない。
+
+設定を読むモジュール（core.config / core.monetization / api.main / bot.main）は
+``os.getenv`` の前にここを通す。既に設定済みの環境変数は上書きしない。
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+_loaded_path: Path | None = None
+
+
+def dotenv_file() -> Path:
+    return Path(os.getenv("DOTENV_FILE", Path(__file__).resolve().parents[1] / ".env"))
+
+
+def parse_float_env(name: str, default: float) -> float:
+    """数値でない値は設定なしとして ``default`` を返す。"""
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        return default
+
+
+def load_env() -> Path:
+    """Load ``DOTENV_FILE`` (default: repo ``.env``) once and return its path."""
+    global _loaded_path
+    if _loaded_path is None:
+        _loaded_path = dotenv_file()
+        load_dotenv(_loaded_path, override=False)
+    return _loaded_path
+
+
+__all__ = ["dotenv_file", "load_env", "parse_float_env"]
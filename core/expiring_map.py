@@ -0,0 +1,170 @@
+"""TTL と上限件数つきの dict。ユーザーごとのロックやスロットル記録が際限なく増えないようにする。"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Iterable, Iterator, MutableMapping, TypeVar
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class ExpiringMap(MutableMapping[K, V], Generic[K, V]):
+    """Mapping whose entries expire ``ttl_sec`` after their last access.
+
+    Entries are kept in access order, so expired ones sit at the front and a
+    sweep only walks what it removes. ``can_evict`` lets callers pin entries
+    that are still in use (e.g. a held lock): pinned entries are skipped by
+    both expiry and the size limit, so the map can briefly exceed
+    ``max_size`` rather than drop something live.
+    """
+
+    def __init__(
+        self,
+        ttl_sec: float,
+        max_size: int,
+        *,
+        can_evict: Callable[[V], bool] | None = None,
+        touch_on_get: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl_sec = ttl_sec
+        self.max_size = max(1, max_size)
+        self.touch_on_get = touch_on_get
+        self._can_evict = can_evict or (lambda value: True)
+        self._clock = clock
+        self._data: OrderedDict[K, tuple[V, float]] = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    def __getitem__(self, key: K) -> V:
+        value, expires_at = self._data[key]
+        now = self._clock()
+        if expires_at <= now and self._can_evict(value):
+            del self._data[key]
+            self.expired += 1
+            raise KeyError(key)
+        if self.touch_on_get:
+            self._data[key] = (value, now + self.ttl_sec)
+            self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._data[key] = (value, self._clock() + self.ttl_sec)
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._shrink()
+
+    def __delitem__(self, key: K) -> None:
+        del self._data[key]
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]  # type: ignore[index]
+        except KeyError:
+            return False
+        return True
+
+    def setdefault(self, key: K, default: V) -> V:  # type: ignore[override]
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def _shrink(self) -> None:
+        excess = len(self._data) - self.max_size
+        pinned: list[K] = []
+        while excess > 0 and len(pinned) < len(self._data):
+            key, (value, _) = next(iter(self._data.items()))
+            if self._can_evict(value):
+                del self._data[key]
+                self.evicted += 1
+                excess -= 1
+            else:
+                # Rotate pinned entries to the back so the scan keeps moving.
+                self._data.move_to_end(key)
+                pinned.append(key)
+
+    def sweep(self) -> int:
+        """Drop expired entries that may be evicted; returns how many were removed."""
+        now = self._clock()
+        removed = 0
+        pinned: list[K] = []
+        for key, (value, expires_at) in list(self._data.items()):
+            if expires_at > now:
+                break
+            if self._can_evict(value):
+                del self._data[key]
+                removed += 1
+            else:
+                pinned.append(key)
+        for key in pinned:
+            value, _ = self._data[key]
+            # Still in use: give it another TTL instead of rescanning it every sweep.
+            self._data[key] = (value, now + self.ttl_sec)
+            self._data.move_to_end(key)
+        self.expired += removed
+        return removed
+
+
+class MapSweeper:
+    """Background task that periodically sweeps a set of ``ExpiringMap``s."""
+
+    def __init__(self, maps: Iterable[ExpiringMap], *, interval_sec: float = 60.0) -> None:
+        self.maps = list(maps)
+        self.interval_sec = interval_sec
+        self._task: asyncio.Task[None] | None = None
+
+    def add(self, mapping: ExpiringMap) -> None:
+        self.maps.append(mapping)
+
+    def sweep(self) -> int:
+        return sum(mapping.sweep() for mapping in self.maps)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="expiring-map-sweeper")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_sec)
+            try:
+                removed = self.sweep()
+            except Exception:
+                logger.exception("Expiring map sweep failed")
+                continue
+            if removed:
+                logger.debug("Swept expired entries", extra={"removed": removed})
+
+
+def lock_is_idle(lock: asyncio.Lock) -> bool:
+    """True when nobody holds or waits for ``lock``, so dropping it is safe."""
+    # Right after release() the next waiter is woken but has not re-acquired
+    # yet, so locked() alone would report an in-use lock as free.
+    return not lock.locked() and not getattr(lock, "_waiters", None)
+
+
+__all__ = ["ExpiringMap", "MapSweeper", "lock_is_idle"]
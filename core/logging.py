@@ -1,11 +1,30 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import re
+import threading
+import time
 from contextvars import ContextVar
-from logging.handlers import RotatingFileHandler
-from typing import Iterable
+from datetime import datetime, timezone
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Callable, Iterable
+
+from core.metrics import REGISTRY
 
 request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
 _SENSITIVE_ENV_VARS = ("TELEGRAM_BOT_TOKEN", "OPENAI_API_KEY")
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s [rid=%(request_id)s]: %(message)s"
+# Attributes every LogRecord has; anything else on a record came from ``extra={...}``.
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+_listener: QueueListener | None = None
+_sampler: "LogSampler | None" = None
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full"
+)
 
 
 def _gather_env_values(keys: Iterable[str]) -> list[str]:
@@ -20,52 +39,331 @@ def _gather_env_values(keys: Iterable[str]) -> list[str]:
 def collect_sensitive_values(additional: Iterable[str] | None = None) -> list[str]:
     """Return a list of sensitive strings that should be masked in logs."""
     secrets = _gather_env_values(_SENSITIVE_ENV_VARS)
+    # EXTRA_BOTS は "character=token,..." なので、トークン部分だけを伏せる。
+    for item in os.getenv("EXTRA_BOTS", "").split(","):
+        token = item.partition("=")[2].strip()
+        if token:
+            secrets.append(token)
     if additional:
         secrets.extend([value for value in additional if value])
     return secrets
 
 
+@lru_cache(maxsize=16)
+def _compile_secrets(secrets: tuple[str, ...]) -> re.Pattern[str] | None:
+    values = sorted({value for value in secrets if value}, key=len, reverse=True)
+    if not values:
+        return None
+    # Longest first so a secret that contains another is masked as a whole.
+    return re.compile("|".join(re.escape(value) for value in values))
+
+
+def build_secret_pattern(secrets: Iterable[str]) -> re.Pattern[str] | None:
+    """One precompiled alternation of all secrets (``None`` when there are none)."""
+    return _compile_secrets(tuple(secrets))
+
+
 def mask_secrets(message: str, secrets: Iterable[str]) -> str:
     """Replace sensitive substrings in the given message with asterisks."""
-    masked = message
-    for secret in secrets:
-        masked = masked.replace(secret, "***")
-    return masked
+    pattern = build_secret_pattern(secrets)
+    return pattern.sub("***", message) if pattern is not None else message
 
 
 class SafeLogFilter(logging.Filter):
     def __init__(self, secrets: list[str]) -> None:
         super().__init__()
         self.secrets = [value for value in secrets if value]
+        self.pattern = build_secret_pattern(self.secrets)
 
     def filter(self, record: logging.LogRecord) -> bool:
-        record.request_id = request_id_var.get("-")
-        record.msg = mask_secrets(record.getMessage(), self.secrets)
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get("-")
+        message = record.getMessage()
+        if self.pattern is not None:
+            message = self.pattern.sub("***", message)
+        record.msg = message
         record.args = ()
         return True
 
 
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, request id and extras."""
+
+    def __init__(self, secret_pattern: re.Pattern[str] | None = None) -> None:
+        super().__init__()
+        self.secret_pattern = secret_pattern
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: dict[str, object] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in payload:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        if record.stack_info:
+            payload["stack"] = self.formatStack(record.stack_info)
+        line = json.dumps(payload, ensure_ascii=False, default=str)
+        # Masking the rendered line also covers secrets passed via extra={...}.
+        return self.secret_pattern.sub("***", line) if self.secret_pattern is not None else line
+
+
+class _MaskingTextFormatter(logging.Formatter):
+    def __init__(self, fmt: str, secret_pattern: re.Pattern[str] | None) -> None:
+        super().__init__(fmt)
+        self.secret_pattern = secret_pattern
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        return self.secret_pattern.sub("***", line) if self.secret_pattern is not None else line
+
+
+class LogQueueHandler(QueueHandler):
+    """Hands records to the listener thread with as little work as possible.
+
+    Only what cannot wait is done on the caller's thread: the request id is
+    read from the contextvar and the message is rendered, since ``args`` may
+    be mutated after the call returns. Formatting, masking and file I/O run
+    in the listener. When the queue is full the record is dropped and counted
+    instead of blocking the event loop.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id_var.get("-")
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+
+def parse_sample_rules(raw: str) -> dict[str, float]:
+    """``"key=rate,key=rate"`` -> ``{key: rate}``; key is a message template or logger prefix."""
+    rules: dict[str, float] = {}
+    for item in raw.split(","):
+        key, sep, rate = item.rpartition("=")
+        if not sep or not key.strip():
+            continue
+        try:
+            rules[key.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rules
+
+
+class _KeyState:
+    __slots__ = ("seen", "window_started", "window_count", "suppressed")
+
+    def __init__(self, now: float) -> None:
+        self.seen = 0
+        self.window_started = now
+        self.window_count = 0
+        self.suppressed = 0
+
+
+class LogSampler(logging.Filter):
+    """Samples and rate-limits INFO/DEBUG records per (logger, message template).
+
+    ``rules`` maps a message template (exact) or a logger name prefix to the
+    fraction of records to keep; sampling is deterministic (every Nth record).
+    On top of that, at most ``rate_limit`` records per key are kept in each
+    ``window_sec``. Warnings and errors always pass. Every ``window_sec`` a
+    "Suppressed N log records" summary is logged for each key that lost
+    records, through the same logger so it lands next to what it summarises.
+    """
+
+    summary_attr = "log_sampler_summary"
+
+    def __init__(
+        self,
+        rules: dict[str, float] | None = None,
+        *,
+        default_rate: float = 1.0,
+        rate_limit: int = 0,
+        window_sec: float = 60.0,
+        max_keys: int = 1000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__()
+        self.rules = dict(rules or {})
+        self._logger_rules = sorted(self.rules.items(), key=lambda item: len(item[0]), reverse=True)
+        self.default_rate = default_rate
+        self.rate_limit = max(0, rate_limit)
+        self.window_sec = window_sec
+        self.max_keys = max_keys
+        self._clock = clock
+        self._keys: dict[tuple[str, str], _KeyState] = {}
+        self._lock = threading.Lock()
+        self._last_report = clock()
+        self.suppressed_total = 0
+
+    def _rate_for(self, name: str, template: str) -> float:
+        rate = self.rules.get(template)
+        if rate is not None:
+            return rate
+        for prefix, prefix_rate in self._logger_rules:
+            if name == prefix or name.startswith(prefix + "."):
+                return prefix_rate
+        return self.default_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or getattr(record, self.summary_attr, False):
+            return True
+        rate = self._rate_for(record.name, str(record.msg))
+        if rate >= 1.0 and not self.rate_limit:
+            self._maybe_report()
+            return True
+        now = self._clock()
+        key = (record.name, str(record.msg))
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                if len(self._keys) >= self.max_keys:
+                    # Unbounded templates (f-strings): fall back to one key per logger.
+                    key = (record.name, "*")
+                    state = self._keys.get(key)
+                if state is None:
+                    state = self._keys[key] = _KeyState(now)
+            if now - state.window_started >= self.window_sec:
+                state.window_started = now
+                state.window_count = 0
+            state.seen += 1
+            if rate >= 1.0:
+                keep = True
+            elif rate <= 0.0:
+                keep = False
+            else:
+                keep = (state.seen - 1) % max(1, round(1 / rate)) == 0
+            if keep and self.rate_limit and state.window_count >= self.rate_limit:
+                keep = False
+            if keep:
+                state.window_count += 1
+            else:
+                state.suppressed += 1
+                self.suppressed_total += 1
+        self._maybe_report(now)
+        return keep
+
+    def _maybe_report(self, now: float | None = None) -> None:
+        now = self._clock() if now is None else now
+        if now - self._last_report < self.window_sec:
+            return
+        self.flush_summaries(now)
+
+    def flush_summaries(self, now: float | None = None) -> None:
+        now = self._clock() if now is None else now
+        with self._lock:
+            elapsed = now - self._last_report
+            self._last_report = now
+            pending = [(key, state.suppressed) for key, state in self._keys.items() if state.suppressed]
+            for key, _ in pending:
+                self._keys[key].suppressed = 0
+        # Logged outside the lock: the summary passes through this filter again.
+        for (name, template), count in pending:
+            logging.getLogger(name).info(
+                "Suppressed %d log records like %r in the last %ds",
+                count,
+                template,
+                round(elapsed),
+                extra={self.summary_attr: True, "suppressed": count, "template": template},
+            )
+
+
+def build_sampler_from_env() -> LogSampler | None:
+    # 既定では間引かない。運用側が LOG_SAMPLE_RULES などで明示したときだけ有効にする。
+    rules = parse_sample_rules(os.getenv("LOG_SAMPLE_RULES", ""))
+    default_rate = float(os.getenv("LOG_SAMPLE_DEFAULT", "1"))
+    rate_limit = int(os.getenv("LOG_RATE_LIMIT", "0"))
+    window_sec = float(os.getenv("LOG_SAMPLE_WINDOW_SEC", "60"))
+    if not rules and default_rate >= 1.0 and not rate_limit:
+        return None
+    return LogSampler(rules, default_rate=default_rate, rate_limit=rate_limit, window_sec=window_sec)
+
+
+def build_formatter(log_format: str, secret_pattern: re.Pattern[str] | None) -> logging.Formatter:
+    if log_format == "text":
+        return _MaskingTextFormatter(TEXT_FORMAT, secret_pattern)
+    return JsonLogFormatter(secret_pattern)
+
+
 def setup_logging() -> None:
-    """Configure console and rotating file logging for the bot."""
-    log_level = logging.INFO
-    log_format = "%(asctime)s [%(levelname)s] %(name)s [rid=%(request_id)s]: %(message)s"
+    """Route all logging through a queue to console and rotating file handlers.
 
-    handlers = [logging.StreamHandler()]
+    ``LOG_FORMAT=text`` (default) keeps the human-readable one-line format;
+    ``LOG_FORMAT=json`` writes one JSON object per line including extras.
+    """
+    global _listener, _sampler
+    root = logging.getLogger()
+    # Like basicConfig: leave an already configured root logger alone.
+    if _listener is not None or root.handlers:
+        return
+    log_format = os.getenv("LOG_FORMAT", "text").strip().lower()
+    queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
     logs_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs")
     os.makedirs(logs_dir, exist_ok=True)
     file_path = os.path.join(logs_dir, "bot.log")
 
-    file_handler = RotatingFileHandler(
-        file_path, maxBytes=1_000_000, backupCount=5, encoding="utf-8"
-    )
-    handlers.append(file_handler)
-
-    filter_instance = SafeLogFilter(collect_sensitive_values())
+    handlers: list[logging.Handler] = [
+        logging.StreamHandler(),
+        RotatingFileHandler(file_path, maxBytes=1_000_000, backupCount=5, encoding="utf-8"),
+    ]
+    formatter = build_formatter(log_format, build_secret_pattern(collect_sensitive_values()))
     for handler in handlers:
-        handler.addFilter(filter_instance)
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=max(0, queue_size))
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    queue_handler = LogQueueHandler(log_queue)
+    # Sampling runs before the record is queued, so dropped lines cost almost nothing.
+    _sampler = build_sampler_from_env()
+    if _sampler is not None:
+        queue_handler.addFilter(_sampler)
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
 
-    logging.basicConfig(level=log_level, format=log_format, handlers=handlers)
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is None:
+        return
+    if _sampler is not None:
+        _sampler.flush_summaries()
+    _listener.stop()
+    _listener = None
 
 
-__all__ = ["collect_sensitive_values", "mask_secrets", "request_id_var", "setup_logging"]
+__all__ = [
+    "JsonLogFormatter",
+    "LogQueueHandler",
+    "LogSampler",
+    "SafeLogFilter",
+    "build_formatter",
+    "build_sampler_from_env",
+    "build_secret_pattern",
+    "collect_sensitive_values",
+    "mask_secrets",
+    "parse_sample_rules",
+    "request_id_var",
+    "setup_logging",
+    "shutdown_logging",
+]
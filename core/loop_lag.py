@@ -0,0 +1,166 @@
+"""イベントループの遅延（予定より何秒遅れてタイマーが発火したか）を測る。
+
+デバッグ時はループを止めた処理のスタックも記録する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+
+from core.metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_BUCKETS: tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+@dataclass
+class BlockedLoopSample:
+    detected_at: float
+    blocked_for_sec: float
+    stack: str
+
+
+class LoopLagProbe:
+    """Sleeps ``interval_sec`` in a loop and records how late each wake-up was.
+
+    A blocked event loop (sync DB call, CPU-heavy parsing) shows up as lag;
+    ``lag_sec`` is the most recent sample and ``max_lag_sec`` the worst one
+    since start. With ``debug=True`` it also turns on asyncio's slow-callback
+    logging and runs a watchdog thread that, when the loop has not ticked for
+    ``slow_callback_sec``, grabs the loop thread's current stack, i.e. the
+    code that is blocking it.
+    """
+
+    def __init__(
+        self,
+        interval_sec: float = 0.5,
+        *,
+        slow_callback_sec: float = 0.1,
+        debug: bool = False,
+        registry: MetricsRegistry = REGISTRY,
+        max_samples: int = 20,
+    ) -> None:
+        self.interval_sec = interval_sec
+        self.slow_callback_sec = slow_callback_sec
+        self.debug = debug
+        self.lag_sec = 0.0
+        self.max_lag_sec = 0.0
+        self.blocked: deque[BlockedLoopSample] = deque(maxlen=max_samples)
+        self.lag_histogram = registry.histogram(
+            "bot_event_loop_lag_seconds", "Event loop timer lateness", LOOP_LAG_BUCKETS
+        )
+        self.blocked_histogram = registry.histogram(
+            "bot_event_loop_blocked_seconds", "Stalls longer than the slow-callback threshold", LOOP_LAG_BUCKETS
+        )
+        self._task: asyncio.Task[None] | None = None
+        self._beat_handle: asyncio.TimerHandle | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._heartbeat = time.monotonic()
+        self._reported = False
+        self._loop_thread_id: int | None = None
+
+    @property
+    def lag_ms(self) -> float:
+        return self.lag_sec * 1000
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    @property
+    def _tick_sec(self) -> float:
+        return max(0.005, self.slow_callback_sec / 2)
+
+    def record(self, lag_sec: float) -> None:
+        self.lag_sec = max(0.0, lag_sec)
+        self.max_lag_sec = max(self.max_lag_sec, self.lag_sec)
+        self.lag_histogram.observe(self.lag_sec)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run(), name="loop-lag-probe")
+        if not self.debug:
+            return
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.slow_callback_sec
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._beat_handle = loop.call_later(self._tick_sec, self._beat)
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(
+            "Event loop debug monitor started",
+            extra={"mode": "startup", "slow_callback_ms": round(self.slow_callback_sec * 1000)},
+        )
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._beat_handle is not None:
+            self._beat_handle.cancel()
+            self._beat_handle = None
+        if self._watchdog is not None:
+            self._stop.set()
+            self._watchdog.join(timeout=1.0)
+            self._watchdog = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval_sec)
+            self.record(loop.time() - started - self.interval_sec)
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        stalled = now - self._heartbeat - self._tick_sec
+        if stalled >= self.slow_callback_sec:
+            self.blocked_histogram.observe(stalled)
+        self._heartbeat = now
+        self._reported = False
+        self._beat_handle = asyncio.get_running_loop().call_later(self._tick_sec, self._beat)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self._tick_sec):
+            stalled = time.monotonic() - self._heartbeat - self._tick_sec
+            if stalled < self.slow_callback_sec or self._reported:
+                continue
+            self._reported = True
+            frame = sys._current_frames().get(self._loop_thread_id or -1)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            self.blocked.append(BlockedLoopSample(time.time(), stalled, stack))
+            # The stack goes into the message itself: the plain log format drops extras.
+            logger.warning(
+                "Event loop blocked for %dms at:\n%s",
+                round(stalled * 1000),
+                stack,
+                extra={"mode": "loop", "blocked_ms": round(stalled * 1000)},
+            )
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "lag_ms": round(self.lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_sec * 1000, 2),
+            "lag_p99_ms": round(self.lag_histogram.quantile(0.99) * 1000, 2),
+            "blocked_events": self.blocked_histogram.count,
+        }
+
+
+__all__ = ["BlockedLoopSample", "LOOP_LAG_BUCKETS", "LoopLagProbe"]
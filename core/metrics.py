@@ -0,0 +1,350 @@
+"""プロセス内のメトリクス。計測側は inc / set / observe するだけで、集計と出力はここで持つ。
+
+出力は Prometheus のテキスト形式（``render_text``）。本番で常時有効にできるよう、
+1 回の記録はロック 1 回と dict 参照程度に抑えている。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import threading
+from typing import Callable, Iterable, Mapping, Sequence
+
+DEFAULT_LATENCY_BUCKETS: tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+logger = logging.getLogger(__name__)
+
+LabelKey = tuple[str, ...]
+Sample = tuple[str, LabelKey, float]
+GaugeCallback = Callable[[], "float | Mapping[LabelKey, float]"]
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Mapping[str, object]) -> LabelKey:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        try:
+            return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError as exc:
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}") from exc
+
+    def samples(self) -> list[Sample]:  # pragma: no cover - overridden
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[Sample]:
+        with self._lock:
+            return [("", key, value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Settable gauge; ``set_function`` makes it read a live value at collection time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[LabelKey, float] = {}
+        self._function: GaugeCallback | None = None
+
+    def set(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: GaugeCallback | None) -> None:
+        """``function`` returns a number, or ``{label_values: number}`` for labelled gauges."""
+        self._function = function
+
+    def value(self, **labels: object) -> float:
+        key = self._key(labels)
+        for sample_key, value in self._read():
+            if sample_key == key:
+                return value
+        return 0.0
+
+    def _read(self) -> list[tuple[LabelKey, float]]:
+        if self._function is not None:
+            result = self._function()
+            if isinstance(result, Mapping):
+                return [(tuple(str(part) for part in key), float(value)) for key, value in result.items()]
+            return [((), float(result))]
+        with self._lock:
+            return list(self._values.items())
+
+    def samples(self) -> list[Sample]:
+        return [("", key, value) for key, value in self._read()]
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self, size: int) -> None:
+        # Per-bucket counts (not cumulative); the last slot is +Inf.
+        self.counts = [0] * size
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram (Prometheus semantics) with a running sum."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[LabelKey, _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets) + 1)
+            series.counts[index] += 1
+            series.count += 1
+            series.sum += value
+
+    @property
+    def count(self) -> int:
+        with self._lock:
+            return sum(series.count for series in self._series.values())
+
+    @property
+    def sum(self) -> float:
+        with self._lock:
+            return sum(series.sum for series in self._series.values())
+
+    def cumulative_counts(self, **labels: object) -> list[tuple[float, int]]:
+        """``(upper_bound, count <= upper_bound)`` pairs ending with +Inf.
+
+        Without labels the counts are summed over every label set.
+        """
+        with self._lock:
+            if labels:
+                series = self._series.get(self._key(labels))
+                selected = [series] if series is not None else []
+            else:
+                selected = list(self._series.values())
+            counts = [sum(values) for values in zip(*(series.counts for series in selected))]
+        counts = counts or [0] * (len(self.buckets) + 1)
+        total = 0
+        result = []
+        for bound, count in zip((*self.buckets, float("inf")), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, fraction: float, **labels: object) -> float:
+        """Upper bound of the bucket holding the given quantile (0 when empty)."""
+        cumulative = self.cumulative_counts(**labels)
+        observed = cumulative[-1][1]
+        if observed == 0:
+            return 0.0
+        target = fraction * observed
+        for bound, count in cumulative:
+            if count >= target:
+                return bound if bound != float("inf") else self.buckets[-1]
+        return self.buckets[-1]
+
+    def samples(self) -> list[Sample]:
+        with self._lock:
+            snapshot = [
+                (key, list(series.counts), series.count, series.sum)
+                for key, series in self._series.items()
+            ]
+        result: list[Sample] = []
+        for key, counts, count, total in snapshot:
+            running = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                running += bucket_count
+                result.append(("_bucket", (*key, _format_value(bound)), float(running)))
+            result.append(("_sum", key, total))
+            result.append(("_count", key, float(count)))
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls: type, name: str, factory: Callable[[], _Metric]) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, lambda: Counter(name, help_text, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, lambda: Gauge(name, help_text, labelnames))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+        labelnames: Sequence[str] = (),
+    ) -> Histogram:
+        return self._get_or_create(  # type: ignore[return-value]
+            Histogram, name, lambda: Histogram(name, help_text, buckets, labelnames)
+        )
+
+    def get(self, name: str) -> _Metric | None:
+        return self._metrics.get(name)
+
+    def collect(self) -> list[_Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: LabelKey) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render_text(registry: MetricsRegistry) -> str:
+    """Prometheus text exposition format 0.0.4."""
+    lines: list[str] = []
+    for metric in sorted(registry.collect(), key=lambda item: item.name):
+        lines.append(f"# HELP {metric.name} {_escape(metric.help_text)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, key, value in metric.samples():
+            names = (*metric.labelnames, "le") if suffix == "_bucket" else metric.labelnames
+            lines.append(f"{metric.name}{suffix}{_format_labels(names, key)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsServer:
+    """Minimal HTTP listener serving ``GET /metrics`` for processes without FastAPI."""
+
+    def __init__(self, host: str, port: int, registry: MetricsRegistry = REGISTRY) -> None:
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server: asyncio.base_events.Server | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._server is not None
+
+    async def start(self) -> None:
+        if self._server is not None:
+            return
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Metrics endpoint listening", extra={"mode": "startup", "host": self.host, "port": self.port})
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+            while (await asyncio.wait_for(reader.readline(), timeout=5.0)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", CONTENT_TYPE, render_text(self.registry).encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+__all__ = [
+    "CONTENT_TYPE",
+    "Counter",
+    "DEFAULT_LATENCY_BUCKETS",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "MetricsServer",
+    "REGISTRY",
+    "render_text",
+]
@@ -4,11 +4,10 @@ import os
 from datetime import datetime, timedelta, timezone
 from typing import Set
 
-from dotenv import load_dotenv
-
 from core.db import UserRecord, get_user, has_active_pass
+from core.env import load_env
 
-load_dotenv()
+load_env()
 
 
 def _get_bool(name: str, default: bool = False) -> bool:
@@ -1,5 +1,4 @@
-import os
-from pathlib import Path
+from core.characters import get_character_pack
 
 
 def _normalize_lang(lang: str | None) -> str:
@@ -13,21 +12,15 @@ def _normalize_lang(lang: str | None) -> str:
     return "ja"
 
 
-def _read_character_file(filename: str) -> str | None:
-    character = os.getenv("CHARACTER", "").strip()
-    if not character:
+def _read_character_file(filename: str, character: str | None = None) -> str | None:
+    pack = get_character_pack(character)
+    if pack is None:
         return None
-    if "/" in character or "\\" in character or character.startswith("."):
-        return None
-    repo_root = Path(__file__).resolve().parents[1]
-    candidate = repo_root / "characters" / character / filename
-    if not candidate.is_file():
-        return None
-    return candidate.read_text(encoding="utf-8")
+    return pack.get(filename)
 
 
-def get_character_boundary_lines() -> str | None:
-    return _read_character_file("boundary_lines.txt")
+def get_character_boundary_lines(character: str | None = None) -> str | None:
+    return _read_character_file("boundary_lines.txt", character)
 
 
 CONSULT_SYSTEM_PROMPTS: dict[str, str] = {
@@ -313,9 +306,11 @@ TAROT_THEME_FOCUS_MAP: dict[str, dict[str, str]] = {
 }
 
 
-def get_consult_system_prompt(lang: str | None = "ja") -> str:
+def get_consult_system_prompt(
+    lang: str | None = "ja", *, character: str | None = None
+) -> str:
     lang_code = _normalize_lang(lang)
-    character_prompt = _read_character_file("system_prompt.txt")
+    character_prompt = _read_character_file("system_prompt.txt", character)
     if character_prompt is not None:
         return character_prompt
     return CONSULT_SYSTEM_PROMPTS.get(lang_code, CONSULT_SYSTEM_PROMPTS["ja"])
@@ -365,3 +360,224 @@ def theme_instructions(theme: str | None, lang: str | None = "ja") -> str:
     lang_code = _normalize_lang(lang)
     focus_map = TAROT_THEME_FOCUS_MAP.get(lang_code) or TAROT_THEME_FOCUS_MAP["ja"]
     return focus_map.get(theme or "", focus_map["life"])
+
+
+TAROT_RULES_HEADERS: dict[str, str] = {
+    "ja": "出力ルール:",
+    "en": "Output rules:",
+    "pt": "Regras de saída:",
+}
+
+TAROT_PROMPT_THEMES: tuple[str, ...] = ("", "love", "marriage", "work", "life")
+# None = no explicit count, -1 = any count outside the supported 2〜4 range.
+TAROT_PROMPT_ACTION_COUNTS: tuple[int | None, ...] = (None, 2, 3, 4, -1)
+
+
+def get_tarot_rules_header(lang: str | None = "ja") -> str:
+    lang_code = _normalize_lang(lang)
+    return TAROT_RULES_HEADERS.get(lang_code, TAROT_RULES_HEADERS["ja"])
+
+
+def _action_count_text(action_count: int | None, lang_code: str) -> str:
+    if action_count is None:
+        if lang_code == "ja":
+            return "- 次の一手は2〜3個を基本に、必要なときだけ4個まで。"
+        if lang_code == "pt":
+            return "- Use 2–3 próximos passos como padrão e só chegue a 4 se for necessário."
+        return "- Default to 2–3 next steps; use up to 4 only when needed."
+    if action_count == 4:
+        if lang_code == "ja":
+            return "- 次の一手は必ず4個。内容が薄い場合は各項目を短くしないで具体化する。"
+        if lang_code == "pt":
+            return "- Traga exatamente 4 próximos passos. Se estiverem rasos, deixe cada item mais concreto."
+        return "- Provide exactly 4 next steps. If they feel thin, make each item concrete."
+    if action_count in {2, 3}:
+        if lang_code == "ja":
+            return f"- 次の一手は必ず{action_count}個。4個は禁止。必要な要素は各項目に統合して良い。"
+        if lang_code == "pt":
+            return (
+                f"- Entregue exatamente {action_count} próximos passos. Não adicione um 4º; combine ideias se precisar."
+            )
+        return f"- Provide exactly {action_count} next steps. Do not add a 4th; merge ideas when needed."
+    if lang_code == "ja":
+        return "- 次の一手はシステムの指示個数を守り、必要でも4個までに抑える。"
+    if lang_code == "pt":
+        return "- Use o número pedido de próximos passos; no máximo 4 mesmo se precisar mais."
+    return "- Follow the requested number of next steps; cap them at 4 even if you need more."
+
+
+TAROT_THEME_HINT_PREFIXES: dict[str, str] = {
+    "ja": "- テーマ: ",
+    "en": "- Theme: ",
+    "pt": "- Theme: ",
+}
+
+TAROT_THEME_FOCUS_PREFIXES: dict[str, str] = {
+    "ja": "- テーマ別フォーカス: ",
+    "en": "- Theme focus: ",
+    "pt": "- Foco do tema: ",
+}
+
+
+def _tarot_format_guide(*, time_axis: bool, lang_code: str) -> str:
+    format_template = get_tarot_fixed_output_format(lang_code, time_axis=time_axis)
+    if time_axis:
+        if lang_code == "ja":
+            return (
+                "過去・現在・未来の時間軸リーディングです。見出しや章ラベルを使わず、次の並びと改行を必ず守ってください:\n"
+                f"{format_template}\n"
+                "- 箇条書きは未来パートにのみ最大3点まで。過去と現在では使わない。\n"
+                "- 時間の目安が無い場合は前後3か月の流れとして触れる。\n"
+                "- カード名は各ブロックの《カード》行で必ず書く。🃏などの絵文字は禁止。"
+            )
+        if lang_code == "pt":
+            return (
+                "Leitura em linha do tempo (passado/presente/futuro). Não use títulos; siga a ordem e quebras abaixo:\n"
+                f"{format_template}\n"
+                "- Use tópicos apenas no bloco do futuro, no máximo 3. Não use no passado/presente.\n"
+                "- Se não houver prazo, considere cerca de 3 meses de fluxo.\n"
+                "- Cada bloco precisa da linha “《Carta》” com nome e orientação; evite emojis como 🃏."
+            )
+        return (
+            "This is a past–present–future reading. No headings; keep this order and line breaks:\n"
+            f"{format_template}\n"
+            "- Bullets only in the future block, maximum 3. Do not use them for past/present.\n"
+            "- If no time scale is given, read it as about 3 months of flow.\n"
+            "- Each block must include the card name on the “《Card》” line; avoid emojis like 🃏."
+        )
+    if lang_code == "ja":
+        return (
+            "必ず次の順序と改行で、見出しや絵文字を使わずに書いてください:\n"
+            f"{format_template}\n"
+            "- 1枚引きは350〜650字、3枚以上は550〜900字を目安に、1400文字以内に収める。\n"
+            "- カード名は「《カード》：」行で1回だけ伝える。🃏などの絵文字は禁止。"
+        )
+    if lang_code == "en":
+        return (
+            "Follow this order and line breaks without headings or emojis:\n"
+            f"{format_template}\n"
+            "- Aim for 350–650 characters for 1 card; 550–900 for 3+; keep under 1400.\n"
+            '- Give the card name only once on the "《Card》" line; no 🃏 emojis.'
+        )
+    return (
+        "Siga esta ordem e quebras de linha, sem títulos nem emojis:\n"
+        f"{format_template}\n"
+        "- Mire em 350–650 caracteres para 1 carta; 550–900 para 3+; mantenha abaixo de 1400.\n"
+        '- Informe o nome da carta só uma vez na linha "《Carta》"; sem emoji 🃏.'
+    )
+
+
+def build_tarot_static_prompt(
+    *, time_axis: bool = False, short: bool = False, lang: str | None = "ja"
+) -> str:
+    """Return the request-independent tarot prompt.
+
+    The text depends only on language, spread family and short mode, so it is
+    byte-identical across readings and forms the shared prompt prefix. It is
+    shorter than the 1024 tokens upstream caching needs, so it is not cached.
+    """
+    lang_code = _normalize_lang(lang)
+    base_template = (
+        TIME_AXIS_TAROT_SYSTEM_PROMPT_TEMPLATES
+        if time_axis
+        else TAROT_SYSTEM_PROMPT_TEMPLATES
+    )
+    template = base_template.get(lang_code, base_template["ja"])
+    output_format = get_tarot_fixed_output_format(lang_code, time_axis=time_axis)
+    rules = get_tarot_output_rules(time_axis=time_axis, short=short, lang=lang_code)
+    rules_text = "\n".join(f"- {rule}" for rule in rules)
+    return (
+        f"{template.format(output_format=output_format)}\n"
+        f"{get_tarot_rules_header(lang_code)}\n{rules_text}\n\n"
+        f"{_tarot_format_guide(time_axis=time_axis, lang_code=lang_code)}"
+    )
+
+
+def build_tarot_request_directives(
+    theme: str | None,
+    *,
+    time_axis: bool = False,
+    action_count: int | None = None,
+    lang: str | None = "ja",
+) -> str:
+    """Return the per-reading instructions (theme and next-step count)."""
+    lang_code = _normalize_lang(lang)
+    lines: list[str] = []
+    hint_mapping = TAROT_THEME_HINTS_MAP.get(lang_code) or TAROT_THEME_HINTS_MAP["ja"]
+    hint = hint_mapping.get(theme or "", "")
+    if hint:
+        lines.append(f"{TAROT_THEME_HINT_PREFIXES[lang_code]}{hint}")
+    if not time_axis:
+        lines.append(_action_count_text(action_count, lang_code))
+    lines.append(
+        f"{TAROT_THEME_FOCUS_PREFIXES[lang_code]}{theme_instructions(theme, lang=lang_code)}"
+    )
+    return "\n".join(lines)
+
+
+TarotPromptKey = tuple[str, bool, bool, str, int | None]
+
+
+def _tarot_prompt_key(
+    theme: str | None,
+    *,
+    time_axis: bool,
+    short: bool,
+    action_count: int | None,
+    lang: str | None,
+) -> TarotPromptKey:
+    theme_key = theme if theme in TAROT_PROMPT_THEMES else ""
+    if action_count is not None and action_count not in {2, 3, 4}:
+        action_count = -1
+    return (_normalize_lang(lang), bool(time_axis), bool(short), theme_key, action_count)
+
+
+def compile_tarot_prompt_table() -> dict[TarotPromptKey, tuple[str, str]]:
+    """Precompute every (static prompt, request directives) pair used by tarot readings.
+
+    Entries sharing a language, spread family and short mode reuse the same
+    static prompt object.
+    """
+    table: dict[TarotPromptKey, tuple[str, str]] = {}
+    for lang_code in TAROT_RULES_HEADERS:
+        for time_axis in (False, True):
+            for short in (False, True):
+                static_prompt = build_tarot_static_prompt(
+                    time_axis=time_axis, short=short, lang=lang_code
+                )
+                for theme in TAROT_PROMPT_THEMES:
+                    for action_count in TAROT_PROMPT_ACTION_COUNTS:
+                        directives = build_tarot_request_directives(
+                            theme or None,
+                            time_axis=time_axis,
+                            action_count=action_count,
+                            lang=lang_code,
+                        )
+                        key = (lang_code, time_axis, short, theme, action_count)
+                        table[key] = (static_prompt, directives)
+    return table
+
+
+TAROT_PROMPT_TABLE: dict[TarotPromptKey, tuple[str, str]] = compile_tarot_prompt_table()
+
+
+def get_tarot_prompt_pair(
+    theme: str | None,
+    *,
+    time_axis: bool = False,
+    short: bool = False,
+    action_count: int | None = None,
+    lang: str | None = "ja",
+) -> tuple[str, str]:
+    key = _tarot_prompt_key(
+        theme, time_axis=time_axis, short=short, action_count=action_count, lang=lang
+    )
+    cached = TAROT_PROMPT_TABLE.get(key)
+    if cached is not None:
+        return cached
+    return (
+        build_tarot_static_prompt(time_axis=time_axis, short=short, lang=lang),
+        build_tarot_request_directives(
+            theme, time_axis=time_axis, action_count=action_count, lang=lang
+        ),
+    )
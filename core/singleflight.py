@@ -0,0 +1,93 @@
+"""同じプロンプトの同時 LLM 呼び出しを 1 回にまとめる（single-flight）。"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from typing import Any, Awaitable, Callable, Generic, Hashable, Iterable, TypeVar
+
+from core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# off: まとめない / exact: 完全一致 / normalized: 空白・全角半角・大文字小文字の違いを無視する。
+COALESCE_KEY_MODES = ("off", "exact", "normalized")
+
+# role="upstream" が実際の呼び出し、role="shared" が相乗りして浮いた呼び出し。
+COALESCED_REQUESTS = REGISTRY.counter(
+    "llm_coalesced_requests_total", "LLM requests by whether they made the upstream call", ("flight", "role")
+)
+
+_SPACES = re.compile(r"\s+")
+
+
+def coalesce_key_from_env() -> str:
+    """``LLM_COALESCE_KEY`` を読んで検証する（既定 off）。Bot と API で同じ値を使う。"""
+    mode = os.getenv("LLM_COALESCE_KEY", "off").strip().lower() or "off"
+    if mode not in COALESCE_KEY_MODES:
+        raise RuntimeError(f"LLM_COALESCE_KEY must be 'off', 'exact' or 'normalized', got {mode!r}")
+    return mode
+
+
+def _normalize_content(content: str) -> str:
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", content)).strip().casefold()
+
+
+def prompt_key(messages: Iterable[dict[str, Any]], *, mode: str, **params: Any) -> str | None:
+    """メッセージ列と呼び出しパラメーター（model, max_tokens など）からキーを作る。``off`` なら None。"""
+    if mode not in COALESCE_KEY_MODES:
+        raise ValueError(f"Coalesce key mode must be one of {', '.join(COALESCE_KEY_MODES)}, got {mode!r}")
+    if mode == "off":
+        return None
+    normalize = _normalize_content if mode == "normalized" else str
+    payload = {
+        "messages": [[message.get("role"), normalize(message.get("content") or "")] for message in messages],
+        "params": params,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight(Generic[T]):
+    """Shares one in-progress call among concurrent callers with the same key.
+
+    The first caller starts ``factory()`` as its own task; callers arriving
+    before it finishes await the same task and get the same result (or
+    exception). Each caller waits through ``asyncio.shield``, so cancelling one
+    of them (a superseded request, an abandoned update) leaves the call running
+    for the others. Nothing is cached: the key is forgotten once the call ends.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Future[T]] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(factory())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+            COALESCED_REQUESTS.inc(flight=self.name, role="upstream")
+        else:
+            COALESCED_REQUESTS.inc(flight=self.name, role="shared")
+            logger.debug("Joined in-flight LLM call", extra={"flight": self.name})
+        return await asyncio.shield(call)
+
+    def _forget(self, key: Hashable, done: asyncio.Future[T]) -> None:
+        if self._calls.get(key) is done:
+            del self._calls[key]
+        # 待ち手が全員取り消されていても、例外を未回収のまま捨てない。
+        if not done.cancelled():
+            done.exception()
@@ -0,0 +1,451 @@
+"""会話状態の保存先。メモリ上の LRU を前段に、SQLite へ write-behind で書き出す。
+
+再起動しても状態が残り、TTL を過ぎたキーはまとめて削除される。
+aiogram の FSM 用には ``StateStoreStorage`` を使う。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable, Generic, Mapping, TypeVar
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+@dataclass
+class StateStoreStats:
+    hits: int = 0
+    misses: int = 0
+    loads: int = 0
+    evictions: int = 0
+    flushed_rows: int = 0
+    purged_rows: int = 0
+
+
+class StateStore:
+    """Key/value store: reads hit the LRU, writes are batched into SQLite.
+
+    Values must be JSON serialisable. Every write refreshes the key's TTL.
+    Cached absences are remembered too, so unknown users do not hit SQLite on
+    every message. Pending writes are consulted before the database, so an
+    evicted key never resurrects a stale row.
+
+    The background task writes batches and purges in an executor thread so
+    the event loop never waits on SQLite; the connection is guarded by a lock
+    and the batch being written stays visible to ``get`` until it lands.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike[str],
+        *,
+        ttl: timedelta,
+        max_entries: int = 10_000,
+        max_pending: int = 500,
+        flush_interval_sec: float = 1.0,
+        purge_interval_sec: float = 300.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = str(path)
+        self.ttl_sec = ttl.total_seconds()
+        self.max_entries = max(1, max_entries)
+        self.max_pending = max(1, max_pending)
+        self.flush_interval_sec = flush_interval_sec
+        self.purge_interval_sec = purge_interval_sec
+        self._clock = clock
+        # key -> (value, expires_at); value is _MISSING for a cached absence.
+        self._cache: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        # key -> (json or None for delete, expires_at)
+        self._pending: dict[str, tuple[str | None, float]] = {}
+        # The batch currently being written by flush(); same shape as _pending.
+        self._flushing: dict[str, tuple[str | None, float]] = {}
+        self._db_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: asyncio.Task[None] | None = None
+        self._conn: sqlite3.Connection | None = None
+        self.stats = StateStoreStats()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One long-lived connection: cold reads happen on the message path, and
+        # opening a connection costs more than the lookup itself. It is opened on
+        # first use, so constructing the store at import time touches no files.
+        if self._conn is None:
+            directory = Path(self.path).parent
+            if directory and not directory.exists():
+                directory.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._init_table(self._conn)
+        return self._conn
+
+    def close(self) -> None:
+        self.flush()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _init_table(self, conn: sqlite3.Connection) -> None:
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS state_store (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_state_store_expires_at ON state_store(expires_at)"
+            )
+
+    def _remember(self, key: str, value: Any, expires_at: float) -> None:
+        self._cache[key] = (value, expires_at)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+            self.stats.evictions += 1
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = self._clock()
+        cached = self._cache.get(key)
+        if cached is not None:
+            value, expires_at = cached
+            if expires_at > now:
+                self._cache.move_to_end(key)
+                self.stats.hits += 1
+                return default if value is _MISSING else value
+            del self._cache[key]
+        self.stats.misses += 1
+        pending = self._pending.get(key) or self._flushing.get(key)
+        if pending is not None:
+            raw, expires_at = pending
+        else:
+            raw, expires_at = self._load(key)
+        if raw is None or expires_at <= now:
+            self._remember(key, _MISSING, now + self.ttl_sec)
+            return default
+        value = json.loads(raw)
+        self._remember(key, value, expires_at)
+        return value
+
+    def _load(self, key: str) -> tuple[str | None, float]:
+        self.stats.loads += 1
+        with self._db_lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM state_store WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None, 0.0
+        return row[0], float(row[1])
+
+    def set(self, key: str, value: Any, *, ttl: timedelta | None = None) -> None:
+        expires_at = self._clock() + (ttl.total_seconds() if ttl is not None else self.ttl_sec)
+        self._pending[key] = (json.dumps(value, ensure_ascii=False), expires_at)
+        self._remember(key, value, expires_at)
+        self._flush_if_full()
+
+    def delete(self, key: str) -> None:
+        now = self._clock()
+        self._pending[key] = (None, now)
+        self._remember(key, _MISSING, now + self.ttl_sec)
+        self._flush_if_full()
+
+    def pending_writes(self) -> int:
+        return len(self._pending)
+
+    def _flush_if_full(self) -> None:
+        if len(self._pending) >= self.max_pending:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write pending changes in one transaction and return the row count."""
+        with self._flush_lock:
+            pending = self._take_pending()
+            if pending:
+                self._write_batch(pending)
+        return len(pending)
+
+    async def flush_async(self) -> int:
+        """``flush`` with the SQLite write done in an executor thread.
+
+        Returns 0 without waiting when another flush is still writing; the
+        next call picks up whatever is pending by then.
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        pending = self._take_pending()
+        if not pending:
+            self._flush_lock.release()
+            return 0
+        try:
+            future = asyncio.get_running_loop().run_in_executor(None, self._write_batch_and_release, pending)
+        except BaseException:
+            self._flushing = {}
+            self._restore_pending(pending)
+            self._flush_lock.release()
+            raise
+        await future
+        return len(pending)
+
+    def _take_pending(self) -> dict[str, tuple[str | None, float]]:
+        # Called with _flush_lock held, so batches reach SQLite in the order they were taken.
+        pending, self._pending = self._pending, {}
+        self._flushing = pending
+        return pending
+
+    def _restore_pending(self, pending: dict[str, tuple[str | None, float]]) -> None:
+        # Put the batch back unless a newer write for the same key arrived meanwhile.
+        for key, item in pending.items():
+            self._pending.setdefault(key, item)
+
+    def _write_batch_and_release(self, pending: dict[str, tuple[str | None, float]]) -> None:
+        # Releases in the worker thread: a sync flush() waiting on the loop must not deadlock.
+        try:
+            self._write_batch(pending)
+        finally:
+            self._flush_lock.release()
+
+    def _write_batch(self, pending: dict[str, tuple[str | None, float]]) -> None:
+        upserts = [(key, raw, expires_at) for key, (raw, expires_at) in pending.items() if raw is not None]
+        deletes = [(key,) for key, (raw, _) in pending.items() if raw is None]
+        try:
+            with self._db_lock, self._connect() as conn:
+                if upserts:
+                    conn.executemany(
+                        """
+                        INSERT INTO state_store (key, value, expires_at) VALUES (?, ?, ?)
+                        ON CONFLICT(key) DO UPDATE SET
+                            value = excluded.value, expires_at = excluded.expires_at
+                        """,
+                        upserts,
+                    )
+                if deletes:
+                    conn.executemany("DELETE FROM state_store WHERE key = ?", deletes)
+        except sqlite3.Error:
+            self._restore_pending(pending)
+            raise
+        finally:
+            self._flushing = {}
+        self.stats.flushed_rows += len(pending)
+
+    def purge_expired(self) -> int:
+        """Delete every expired row in bulk and drop expired cache entries."""
+        now = self._clock()
+        self.flush()
+        return self._purged(now, self._delete_expired(now))
+
+    async def purge_expired_async(self) -> int:
+        """``purge_expired`` with the SQLite work done in an executor thread."""
+        now = self._clock()
+        await self.flush_async()
+        purged = await asyncio.get_running_loop().run_in_executor(None, self._delete_expired, now)
+        return self._purged(now, purged)
+
+    def _delete_expired(self, now: float) -> int:
+        with self._db_lock, self._connect() as conn:
+            return conn.execute("DELETE FROM state_store WHERE expires_at <= ?", (now,)).rowcount
+
+    def _purged(self, now: float, purged: int) -> int:
+        for key in [key for key, (_, expires_at) in self._cache.items() if expires_at <= now]:
+            del self._cache[key]
+        self.stats.purged_rows += purged
+        return purged
+
+    def keys(self, prefix: str = "") -> list[str]:
+        """Unexpired keys starting with ``prefix`` (flushes first; meant for admin use)."""
+        self.flush()
+        with self._db_lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key FROM state_store WHERE key LIKE ? ESCAPE '\\' AND expires_at > ?",
+                (prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%", self._clock()),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="state-store-flusher")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush()
+
+    async def _run(self) -> None:
+        last_purge = self._clock()
+        while True:
+            await asyncio.sleep(self.flush_interval_sec)
+            try:
+                await self.flush_async()
+                if self._clock() - last_purge >= self.purge_interval_sec:
+                    last_purge = self._clock()
+                    purged = await self.purge_expired_async()
+                    if purged:
+                        logger.info("Purged expired state", extra={"mode": "state", "rows": purged})
+            except sqlite3.Error:
+                logger.exception("State store flush failed", extra={"mode": "state"})
+
+
+class StateField(Generic[V]):
+    """Dict-like view of one field of each user's conversation record.
+
+    Fields sharing a ``prefix`` live in one record per user, so writing any of
+    them (or ``touch``) keeps the whole record alive for ``ttl`` (the store's
+    TTL by default); fields that must live longer use their own prefix. When
+    ``scope`` returns a non-empty name (the bot profile), it is added to the
+    prefix, so each bot keeps its own record for the same user.
+
+    Only per-user lookups are offered: iterating or counting would scan the
+    whole table, so that lives in ``scan_user_ids`` for admin use.
+    """
+
+    def __init__(
+        self,
+        store: StateStore,
+        name: str,
+        *,
+        prefix: str = "conv",
+        scope: Callable[[], str] | None = None,
+        ttl: timedelta | None = None,
+        encode: Callable[[V], Any] | None = None,
+        decode: Callable[[Any], V] | None = None,
+    ) -> None:
+        self.store = store
+        self.name = name
+        self.prefix = prefix
+        self.ttl = ttl
+        self._scope = scope
+        self._encode = encode or (lambda value: value)
+        self._decode = decode or (lambda value: value)
+
+    def _head(self) -> str:
+        scope = self._scope() if self._scope is not None else ""
+        return f"{self.prefix}:{scope}:" if scope else f"{self.prefix}:"
+
+    def _key(self, user_id: int) -> str:
+        return f"{self._head()}{user_id}"
+
+    def __getitem__(self, user_id: int) -> V:
+        record = self.store.get(self._key(user_id))
+        if not record or self.name not in record:
+            raise KeyError(user_id)
+        return self._decode(record[self.name])
+
+    def __setitem__(self, user_id: int, value: V) -> None:
+        key = self._key(user_id)
+        record = dict(self.store.get(key) or {})
+        record[self.name] = self._encode(value)
+        self.store.set(key, record, ttl=self.ttl)
+
+    def __delitem__(self, user_id: int) -> None:
+        key = self._key(user_id)
+        record = dict(self.store.get(key) or {})
+        if self.name not in record:
+            raise KeyError(user_id)
+        del record[self.name]
+        if record:
+            self.store.set(key, record, ttl=self.ttl)
+        else:
+            self.store.delete(key)
+
+    def __contains__(self, user_id: object) -> bool:
+        if not isinstance(user_id, int):
+            return False
+        record = self.store.get(self._key(user_id))
+        return bool(record) and self.name in record
+
+    def get(self, user_id: int, default: Any = None) -> Any:
+        try:
+            return self[user_id]
+        except KeyError:
+            return default
+
+    def pop(self, user_id: int, default: Any = _MISSING) -> Any:
+        try:
+            value = self[user_id]
+        except KeyError:
+            if default is _MISSING:
+                raise
+            return default
+        del self[user_id]
+        return value
+
+    def touch(self, user_id: int) -> None:
+        """Refresh the TTL of the user's record, if there is one."""
+        key = self._key(user_id)
+        record = self.store.get(key)
+        if record:
+            self.store.set(key, record, ttl=self.ttl)
+
+    def scan_user_ids(self) -> list[int]:
+        """Users that have this field set. Flushes and scans the table: admin use only."""
+        head = self._head()
+        return [
+            int(key[len(head):])
+            for key in self.store.keys(head)
+            # 無スコープの "conv:" は他のボットの "conv:<scope>:" も拾うので除く。
+            if key[len(head):].isdigit() and self.name in (self.store.get(key) or {})
+        ]
+
+
+class StateStoreStorage(BaseStorage):
+    """aiogram FSM storage on top of ``StateStore``."""
+
+    def __init__(self, store: StateStore, key_builder: KeyBuilder | None = None) -> None:
+        self.store = store
+        self.key_builder = key_builder or DefaultKeyBuilder(prefix="fsm", with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key, "state")
+        value = state.state if isinstance(state, State) else state
+        if value is None:
+            self.store.delete(storage_key)
+        else:
+            self.store.set(storage_key, value)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return self.store.get(self.key_builder.build(key, "state"))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key, "data")
+        if data:
+            self.store.set(storage_key, dict(data))
+        else:
+            self.store.delete(storage_key)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict(self.store.get(self.key_builder.build(key, "data")) or {})
+
+    async def close(self) -> None:
+        self.store.flush()
+
+
+__all__ = [
+    "StateField",
+    "StateStore",
+    "StateStoreStats",
+    "StateStoreStorage",
+]
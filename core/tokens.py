@@ -0,0 +1,112 @@
+"""Offline token estimation for chat prompts.
+
+No BPE vocabulary is vendored, so counts come from a heuristic calibrated
+against the ``o200k_base`` encoding used by ``gpt-4o-mini`` on the bot's own
+ja/en/pt prompts: kanji are roughly one token each, kana merge slightly,
+Latin words split by an average chars-per-token ratio that differs between
+English and Portuguese, and every chat message carries a small fixed overhead.
+The estimate is meant for budgeting (credit pre-checks, ``max_tokens``,
+trimming) and is logged next to the real ``usage`` so drift stays visible.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from functools import lru_cache
+from typing import Iterable, Mapping
+
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+TRIM_SUFFIX = "…"
+
+# Average characters per token for Latin-script words, per language.
+_LATIN_CHARS_PER_TOKEN = {"ja": 4.0, "en": 4.2, "pt": 3.4}
+_DEFAULT_LATIN_CHARS_PER_TOKEN = 3.8
+_KANA_TOKENS_PER_CHAR = 0.8
+_CJK_TOKENS_PER_CHAR = 1.0
+_DIGITS_PER_TOKEN = 3
+
+_TOKEN_RE = re.compile(
+    r"(?P<cjk>[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)"
+    r"|(?P<kana>[\u3040-\u30ff\u31f0-\u31ff\uff66-\uff9f]+)"
+    r"|(?P<latin>[A-Za-z\u00c0-\u024f]+)"
+    r"|(?P<digits>[0-9]+)"
+    r"|(?P<space>\s+)"
+    r"|(?P<other>.)",
+    re.DOTALL,
+)
+
+
+def _latin_ratio(lang: str | None) -> float:
+    return _LATIN_CHARS_PER_TOKEN.get((lang or "").lower(), _DEFAULT_LATIN_CHARS_PER_TOKEN)
+
+
+def _estimate(text: str, ratio: float) -> int:
+    total = 0.0
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        size = match.end() - match.start()
+        if kind == "cjk":
+            total += size * _CJK_TOKENS_PER_CHAR
+        elif kind == "kana":
+            total += size * _KANA_TOKENS_PER_CHAR
+        elif kind == "latin":
+            total += math.ceil(size / ratio)
+        elif kind == "digits":
+            total += math.ceil(size / _DIGITS_PER_TOKEN)
+        elif kind == "other":
+            # Emoji and other astral symbols usually cost two byte-level tokens.
+            total += 2 if ord(match.group()) > 0xFFFF else 1
+    return math.ceil(total)
+
+
+# Static system prompts are shared string objects, so repeated estimates are free.
+_estimate_cached = lru_cache(maxsize=512)(_estimate)
+
+
+def estimate_text_tokens(text: str | None, lang: str | None = None) -> int:
+    """Estimate the number of tokens ``text`` encodes to."""
+    if not text:
+        return 0
+    return _estimate_cached(text, _latin_ratio(lang))
+
+
+def estimate_messages_tokens(
+    messages: Iterable[Mapping[str, str]], lang: str | None = None
+) -> int:
+    """Estimate the prompt tokens billed for a chat completion request."""
+    total = REPLY_PRIMING_TOKENS
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + estimate_text_tokens(message.get("content"), lang)
+    return total
+
+
+def trim_to_token_budget(
+    text: str, max_tokens: int, lang: str | None = None
+) -> tuple[str, bool]:
+    """Cut ``text`` so that it fits in ``max_tokens``.
+
+    Returns the (possibly trimmed) text and whether anything was removed.
+    """
+    if max_tokens <= 0 or estimate_text_tokens(text, lang) <= max_tokens:
+        return text, False
+    ratio = _latin_ratio(lang)
+    budget = max_tokens - _estimate(TRIM_SUFFIX, ratio)
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if _estimate(text[:middle], ratio) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + TRIM_SUFFIX, True
+
+
+__all__ = [
+    "MESSAGE_OVERHEAD_TOKENS",
+    "REPLY_PRIMING_TOKENS",
+    "estimate_messages_tokens",
+    "estimate_text_tokens",
+    "trim_to_token_budget",
+]
@@ -0,0 +1,337 @@
+"""リクエスト単位のトレース。contextvar で親子関係をたどり、どこで時間を使ったかを残す。
+
+ルートスパンはハンドラーの入口（RequestIdMiddleware）で開き、DB・LLM・整形・送信は
+その子スパンになる。トレースが無い場所（起動処理など）では子スパンは作られず、ほぼ無料。
+終わったトレースは直近分をメモリに保持し（``/admin traces``）、設定があれば JSONL ファイルか
+OTLP/HTTP 互換のコレクターへ別スレッドで書き出す。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterator, Sequence, TypeVar
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    start_time: float
+    attributes: dict[str, Any] = field(default_factory=dict)
+    duration_ms: float = 0.0
+    status: str = "ok"
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": round(self.start_time, 6),
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+@dataclass
+class Trace:
+    root: Span
+    spans: list[Span]
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def breakdown(self) -> list[tuple[str, int, float]]:
+        """``(span name, count, total ms)`` for child spans, slowest first."""
+        totals: dict[str, list[float]] = {}
+        for span in self.spans:
+            if span is self.root:
+                continue
+            entry = totals.setdefault(span.name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += span.duration_ms
+        return sorted(
+            ((name, int(count), total) for name, (count, total) in totals.items()),
+            key=lambda item: item[2],
+            reverse=True,
+        )
+
+
+_FLUSH = object()
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Attach an attribute to the active span, if there is one."""
+    span = _current_span.get()
+    if span is not None:
+        span.set(key, value)
+
+
+class SpanExporter:
+    """Writes finished spans from a background thread so the event loop never does I/O."""
+
+    def __init__(self, *, batch_size: int = 100, max_queue: int = 10_000, flush_interval_sec: float = 1.0) -> None:
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_sec
+        self.dropped = 0
+        self._queue: queue.Queue[Any] = queue.Queue(maxsize=max_queue)
+        self._thread: threading.Thread | None = None
+
+    def export(self, spans: Sequence[Span]) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"{type(self).__name__}", daemon=True)
+            self._thread.start()
+        for span in spans:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        batch: list[Span] = []
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval_sec)
+            except queue.Empty:
+                item = _FLUSH
+            if isinstance(item, Span):
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            if batch:
+                try:
+                    self.write(batch)
+                except Exception:
+                    logger.exception("Span export failed", extra={"spans": len(batch)})
+                batch = []
+            if item is None:
+                return
+
+    def write(self, spans: list[Span]) -> None:  # pragma: no cover - overridden
+        raise NotImplementedError
+
+
+class JsonlSpanExporter(SpanExporter):
+    """One span per line, appended to ``path``."""
+
+    def __init__(self, path: str | os.PathLike[str], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.path = Path(path)
+
+    def write(self, spans: list[Span]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as handle:
+            for span in spans:
+                handle.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_json(spans: Sequence[Span], service_name: str) -> dict[str, Any]:
+    """Spans in the OTLP/HTTP JSON shape accepted by OpenTelemetry collectors."""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "core.tracing"},
+                        "spans": [
+                            {
+                                "traceId": span.trace_id,
+                                "spanId": span.span_id,
+                                **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                                "name": span.name,
+                                "kind": 1,
+                                "startTimeUnixNano": str(int(span.start_time * 1e9)),
+                                "endTimeUnixNano": str(int((span.start_time + span.duration_ms / 1000) * 1e9)),
+                                "attributes": [
+                                    {"key": key, "value": _otlp_value(value)}
+                                    for key, value in span.attributes.items()
+                                ],
+                                "status": {"code": 2 if span.status == "error" else 1},
+                            }
+                            for span in spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class OtlpHttpSpanExporter(SpanExporter):
+    """POSTs batches as OTLP/HTTP JSON (e.g. ``http://127.0.0.1:4318/v1/traces``)."""
+
+    def __init__(self, url: str, *, service_name: str = "akolasia-tarot-bot", timeout: float = 5.0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.url = url
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def write(self, spans: list[Span]) -> None:
+        import httpx
+
+        response = httpx.post(self.url, json=to_otlp_json(spans, self.service_name), timeout=self.timeout)
+        response.raise_for_status()
+
+
+class Tracer:
+    def __init__(self, exporter: SpanExporter | None = None, *, keep_recent: int = 200, enabled: bool = True) -> None:
+        self.exporter = exporter
+        self.enabled = enabled
+        self.recent: deque[Trace] = deque(maxlen=keep_recent)
+        self._open: dict[str, list[Span]] = {}
+
+    @contextmanager
+    def span(self, name: str, *, root: bool = False, **attributes: Any) -> Iterator[Span | None]:
+        """Open a span under the active one.
+
+        Without an active span nothing is recorded unless ``root=True``, so
+        instrumented helpers stay free when called outside a request.
+        """
+        parent = _current_span.get()
+        if not self.enabled or (parent is None and not root):
+            yield None
+            return
+        if parent is None:
+            span = Span(name, secrets.token_hex(16), secrets.token_hex(8), None, time.time(), dict(attributes))
+            self._open[span.trace_id] = [span]
+        else:
+            span = Span(name, parent.trace_id, secrets.token_hex(8), parent.span_id, time.time(), dict(attributes))
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.status = "error"
+            span.set("error", type(exc).__name__)
+            raise
+        finally:
+            span.duration_ms = (time.perf_counter() - span._started) * 1000
+            _current_span.reset(token)
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        spans = self._open.get(span.trace_id)
+        if span.parent_id is not None:
+            if spans is not None:
+                spans.append(span)
+            elif self.exporter is not None:
+                # Finished after its root (a background task): export on its own.
+                self.exporter.export([span])
+            return
+        spans = self._open.pop(span.trace_id, [span])
+        self.recent.append(Trace(span, spans))
+        if self.exporter is not None:
+            self.exporter.export(spans)
+
+    def traced(self, name: str | None = None) -> Callable[[F], F]:
+        """Decorator: run the function inside a child span named ``name``."""
+
+        def decorator(func: F) -> F:
+            span_name = name or func.__qualname__
+            if asyncio.iscoroutinefunction(func):
+
+                @functools.wraps(func)
+                async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                    with self.span(span_name):
+                        return await func(*args, **kwargs)
+
+                return async_wrapper  # type: ignore[return-value]
+
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+
+            return wrapper  # type: ignore[return-value]
+
+        return decorator
+
+    def slowest(self, limit: int = 5) -> list[Trace]:
+        return sorted(self.recent, key=lambda trace: trace.duration_ms, reverse=True)[:limit]
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def build_exporter_from_env() -> SpanExporter | None:
+    target = os.getenv("TRACE_EXPORT", "").strip().lower()
+    if target == "file":
+        default_path = Path(__file__).resolve().parents[1] / "logs" / "traces.jsonl"
+        return JsonlSpanExporter(os.getenv("TRACE_FILE", str(default_path)))
+    if target == "otlp":
+        return OtlpHttpSpanExporter(os.getenv("TRACE_OTLP_URL", "http://127.0.0.1:4318/v1/traces"))
+    return None
+
+
+def _tracing_enabled() -> bool:
+    return os.getenv("TRACING_ENABLED", "true").strip().lower() not in {"0", "false", "no", "off"}
+
+
+TRACER = Tracer(build_exporter_from_env(), enabled=_tracing_enabled())
+traced = TRACER.traced
+
+
+__all__ = [
+    "JsonlSpanExporter",
+    "OtlpHttpSpanExporter",
+    "Span",
+    "SpanExporter",
+    "TRACER",
+    "Trace",
+    "Tracer",
+    "build_exporter_from_env",
+    "current_span",
+    "set_attribute",
+    "to_otlp_json",
+    "traced",
+]
@@ -0,0 +1,35 @@
+"""ユーザー単位の状態（会話状態・ロック・スロットル）をボットごとに分けるスコープ。
+
+複数のボットを 1 プロセスで動かすと、同じユーザーが両方のボットと話せる。更新を受けた
+ボットのプロファイル名をここに入れ、ユーザー単位のキーに含める。プライマリのボットは
+空文字なので、1 ボットだけの運用ではキーは従来と同じ。
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+_user_scope: ContextVar[str] = ContextVar("user_scope", default="")
+
+
+def current_user_scope() -> str:
+    return _user_scope.get()
+
+
+@contextmanager
+def use_user_scope(scope: str) -> Iterator[None]:
+    token = _user_scope.set(scope)
+    try:
+        yield
+    finally:
+        _user_scope.reset(token)
+
+
+def scoped_user(user_id: int) -> tuple[str, int]:
+    """ユーザー単位のマップのキー（スコープ, user_id）。"""
+    return _user_scope.get(), user_id
+
+
+__all__ = ["current_user_scope", "scoped_user", "use_user_scope"]
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    db_path = tmp_path / "test.db"
+    monkeypatch.setenv("SQLITE_DB_PATH", str(db_path))
+    import core.db as db_module
+
+    db = importlib.reload(db_module)
+    yield db
+
+
+BASE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _setup_user(db, user_id: int, *, tickets: int = 0, trial: int = 0) -> None:
+    db.ensure_user(user_id, now=BASE)
+    if tickets:
+        db.grant_arisa_credits(user_id, source="ticket", credits=tickets, now=BASE)
+    if trial:
+        db.grant_arisa_credits(user_id, source="trial", credits=trial, now=BASE)
+
+
+def test_reserve_holds_credits_and_rejects_overspend(db):
+    _setup_user(db, 1, tickets=3, trial=2)
+
+    first = db.reserve_arisa_credits(1, credits=4, now=BASE)
+    second = db.reserve_arisa_credits(1, credits=2, now=BASE)
+
+    assert first is not None
+    assert (first.ticket_credits, first.trial_credits) == (3, 1)
+    assert second is None
+    user = db.get_user(1, now=BASE)
+    assert (user.arisa_credits, user.arisa_trial_remaining) == (0, 1)
+
+
+def test_partial_reserve_holds_what_is_left(db):
+    _setup_user(db, 9, tickets=1, trial=1)
+
+    entry = db.reserve_arisa_credits(9, credits=5, partial=True, now=BASE)
+
+    assert (entry.ticket_credits, entry.trial_credits, entry.reserved_credits) == (1, 1, 2)
+    assert db.reserve_arisa_credits(9, credits=5, partial=True, now=BASE) is None
+
+
+def test_settle_refunds_unused_hold(db):
+    _setup_user(db, 2, tickets=2, trial=5)
+    entry = db.reserve_arisa_credits(2, credits=4, now=BASE)
+
+    settled = db.settle_arisa_reservation(entry.id, used_credits=3, now=BASE)
+
+    assert settled.status == "settled"
+    assert (settled.ticket_credits, settled.trial_credits, settled.shortfall) == (2, 1, 0)
+    user = db.get_user(2, now=BASE)
+    assert (user.arisa_credits, user.arisa_trial_remaining) == (0, 4)
+    # Settling twice is a no-op.
+    again = db.settle_arisa_reservation(entry.id, used_credits=10, now=BASE)
+    assert again.used_credits == 3
+
+
+def test_settle_charges_overrun_and_records_shortfall(db):
+    _setup_user(db, 3, tickets=1, trial=1)
+    entry = db.reserve_arisa_credits(3, credits=1, now=BASE)
+
+    settled = db.settle_arisa_reservation(entry.id, used_credits=4, now=BASE)
+
+    assert (settled.ticket_credits, settled.trial_credits) == (1, 1)
+    assert settled.shortfall == 2
+    user = db.get_user(3, now=BASE)
+    assert (user.arisa_credits, user.arisa_trial_remaining) == (0, 0)
+
+
+def test_release_returns_pass_and_ticket_credits(db):
+    _setup_user(db, 4, tickets=2)
+    db.update_arisa_pass(4, pass_until=BASE + timedelta(days=7), daily_limit=3, now=BASE)
+    entry = db.reserve_arisa_credits(4, credits=4, now=BASE)
+    assert (entry.pass_credits, entry.ticket_credits) == (3, 1)
+
+    released = db.release_arisa_reservation(entry.id, now=BASE)
+
+    assert released.status == "released"
+    user = db.get_user(4, now=BASE)
+    assert (user.arisa_pass_used_today, user.arisa_credits) == (0, 2)
+
+
+def test_stale_reservations_are_released(db):
+    _setup_user(db, 5, tickets=2)
+    db.reserve_arisa_credits(5, credits=2, now=BASE)
+
+    released = db.release_stale_arisa_reservations(
+        older_than=timedelta(minutes=10), now=BASE + timedelta(minutes=30)
+    )
+
+    assert released == 1
+    assert db.get_user(5, now=BASE).arisa_credits == 2
+
+
+def test_ledger_audit_and_rebuild(db):
+    _setup_user(db, 6, tickets=5, trial=3)
+    entry = db.reserve_arisa_credits(6, credits=6, now=BASE)
+    db.settle_arisa_reservation(entry.id, used_credits=6, now=BASE)
+    kept = db.reserve_arisa_credits(6, credits=1, now=BASE)
+    assert kept is not None
+
+    report = db.audit_arisa_credits(6, now=BASE)
+    assert report["ticket"] == {"stored": 0, "ledger": 0}
+    assert report["trial"] == {"stored": 1, "ledger": 1}
+
+    db.update_arisa_credits(6, delta=10, now=BASE)
+    assert db.audit_arisa_credits(6, now=BASE)["ticket"] == {"stored": 10, "ledger": 0}
+    rebuilt = db.rebuild_arisa_credits(6, now=BASE)
+    assert (rebuilt.arisa_credits, rebuilt.arisa_trial_remaining) == (0, 1)
+    kinds = [item.kind for item in db.get_arisa_credit_ledger(6)]
+    assert kinds == ["usage", "usage", "grant", "grant", "opening"]
+
+
+def test_rebuild_keeps_balance_that_predates_the_ledger(db):
+    db.ensure_user(7, now=BASE)
+    db.update_arisa_credits(7, delta=4, now=BASE)  # 台帳導入前に付与された残高
+    db.grant_arisa_credits(7, source="ticket", credits=2, now=BASE)
+    entry = db.reserve_arisa_credits(7, credits=1, now=BASE)
+    db.settle_arisa_reservation(entry.id, used_credits=1, now=BASE)
+
+    assert db.audit_arisa_credits(7, now=BASE)["ticket"] == {"stored": 5, "ledger": 5}
+    assert db.rebuild_arisa_credits(7, now=BASE).arisa_credits == 5
+
+
+def test_rebuild_refuses_ledger_without_opening_entry(db):
+    _setup_user(db, 8, tickets=2)
+    db.update_arisa_credits(8, delta=3, now=BASE)
+    with db._connect() as conn:
+        # 開始残高を記録する前の台帳を再現する。
+        conn.execute("DELETE FROM arisa_credit_ledger WHERE user_id = 8 AND kind = 'opening'")
+
+    with pytest.raises(ValueError, match="opening"):
+        db.rebuild_arisa_credits(8, now=BASE)
+    assert db.get_user(8, now=BASE).arisa_credits == 5
+
+
+class DummyFromUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class DummyMessage:
+    def __init__(self, text: str, user_id: int):
+        self.text = text
+        self.from_user = DummyFromUser(user_id)
+        self.answers: list[str] = []
+
+    async def answer(self, text: str, **kwargs):
+        self.answers.append(text)
+
+
+def _import_arisa(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "arisa.db"))
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    for module in [name for name in sys.modules if name.startswith(("bot.handlers", "bot.utils"))]:
+        sys.modules.pop(module, None)
+    for module in ["core.config", "core.monetization", "core.db", "bot.main"]:
+        sys.modules.pop(module, None)
+    arisa = importlib.import_module("bot.handlers.arisa")
+    db = sys.modules["core.db"]
+    for module in (arisa, sys.modules["bot.utils.state"]):
+        monkeypatch.setattr(module, "utcnow", lambda: BASE)
+    return arisa, db
+
+
+def test_arisa_chat_settles_actual_usage_and_releases_on_failure(monkeypatch, tmp_path):
+    arisa, db = _import_arisa(monkeypatch, tmp_path)
+    results = [("ok", False, arisa.ONE_MESSAGE_TOKENS * 2), ("error", True, None)]
+
+    async def fake_call(messages, *, lang="ja", max_tokens=None):
+        return results.pop(0)
+
+    monkeypatch.setattr(arisa, "call_openai_with_retry_and_usage", fake_call)
+    user_id = 8080
+
+    asyncio.run(arisa.handle_arisa_chat(DummyMessage("こんにちは", user_id), "こんにちは"))
+    after_success = db.get_user(user_id, now=BASE).arisa_trial_remaining
+    asyncio.run(arisa.handle_arisa_chat(DummyMessage("もう一回", user_id), "もう一回"))
+    after_failure = db.get_user(user_id, now=BASE).arisa_trial_remaining
+
+    assert after_success == arisa.TRIAL_FREE_CREDITS - 2
+    assert after_failure == after_success
+    statuses = [entry.status for entry in db.get_arisa_credit_ledger(user_id)]
+    assert statuses == ["released", "settled", "granted", "granted"]
+
+
+@pytest.mark.parametrize("balance", [0, 1, 3])
+def test_arisa_chat_at_low_balance_answers_and_records_shortfall(monkeypatch, tmp_path, balance):
+    arisa, db = _import_arisa(monkeypatch, tmp_path)
+    calls: list[int | None] = []
+
+    async def fake_call(messages, *, lang="ja", max_tokens=None):
+        calls.append(max_tokens)
+        # 長いシステムプロンプト込みで 1 ターン 5 クレジット分。
+        return "ok", False, arisa.ONE_MESSAGE_TOKENS * 5
+
+    monkeypatch.setattr(arisa, "call_openai_with_retry_and_usage", fake_call)
+    user_id = 9090
+    db.ensure_user(user_id, now=BASE)
+    arisa.ensure_arisa_trial(user_id, now=BASE)
+    db.set_arisa_trial_remaining(user_id, remaining=balance, now=BASE)
+    message = DummyMessage("こんにちは", user_id)
+
+    asyncio.run(arisa.handle_arisa_chat(message, "こんにちは"))
+
+    user = db.get_user(user_id, now=BASE)
+    assert user.arisa_trial_remaining == 0
+    if balance == 0:
+        assert calls == []
+        assert message.answers == [arisa.t("ja", "ARISA_OUT_OF_CREDITS")]
+        return
+    # 残高が 1 でもプロンプトを理由に断らず、残高分だけ確保して実際の usage で精算する。
+    assert calls == [arisa.ARISA_MAX_TOKENS]
+    assert message.answers == ["ok"]
+    settled = db.get_arisa_credit_ledger(user_id)[0]
+    assert settled.status == "settled" and 1 <= settled.reserved_credits <= balance
+    assert (settled.used_credits, settled.shortfall) == (5, 5 - balance)
+
+
+def test_arisa_chat_reserves_from_the_balance_read_under_the_lock(monkeypatch, tmp_path):
+    arisa, db = _import_arisa(monkeypatch, tmp_path)
+    monkeypatch.setattr(arisa, "ARISA_MAX_TOKENS", arisa.ONE_MESSAGE_TOKENS * 3)
+    user_id = 9191
+    db.ensure_user(user_id, now=BASE)
+    arisa.ensure_arisa_trial(user_id, now=BASE)
+    db.set_arisa_trial_remaining(user_id, remaining=3, now=BASE)
+    acquire_inflight = arisa.acquire_inflight
+
+    async def acquire_after_other_message(*args, **kwargs):
+        # ロックを待つ間に別のメッセージが 2 クレジット使った。
+        db.set_arisa_trial_remaining(user_id, remaining=1, now=BASE)
+        return await acquire_inflight(*args, **kwargs)
+
+    async def fake_call(messages, *, lang="ja", max_tokens=None):
+        return "ok", False, arisa.ONE_MESSAGE_TOKENS
+
+    monkeypatch.setattr(arisa, "acquire_inflight", acquire_after_other_message)
+    monkeypatch.setattr(arisa, "call_openai_with_retry_and_usage", fake_call)
+    message = DummyMessage("こんにちは", user_id)
+
+    asyncio.run(arisa.handle_arisa_chat(message, "こんにちは"))
+
+    assert message.answers == ["ok"]
+    settled = db.get_arisa_credit_ledger(user_id)[0]
+    assert (settled.status, settled.reserved_credits, settled.shortfall) == ("settled", 1, 0)
+    assert db.get_user(user_id, now=BASE).arisa_trial_remaining == 0
@@ -7,7 +7,14 @@ from datetime import datetime, timedelta, timezone
 from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup
 import pytest
 
-from core.tarot import contains_tarot_like, is_tarot_request
+from core.tarot import (
+    CELTIC_CROSS,
+    HEXAGRAM,
+    ONE_CARD,
+    THREE_CARD_SITUATION,
+    contains_tarot_like,
+    is_tarot_request,
+)
 from bot.texts.i18n import t
 
 
@@ -16,6 +23,8 @@ def import_bot_main(monkeypatch, tmp_path=None):
     monkeypatch.setenv("OPENAI_API_KEY", "dummy")
     if tmp_path is not None:
         monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    for module in [name for name in sys.modules if name.startswith(("bot.handlers", "bot.utils"))]:
+        sys.modules.pop(module, None)
     if "core.config" in sys.modules:
         del sys.modules["core.config"]
     if "core.monetization" in sys.modules:
@@ -27,6 +36,13 @@ def import_bot_main(monkeypatch, tmp_path=None):
     return importlib.import_module("bot.main")
 
 
+def patch_bot_attr(monkeypatch, name, value):
+    """Patch ``name`` in every loaded bot module: handlers import shared helpers by name."""
+    for module_name, module in list(sys.modules.items()):
+        if module_name.startswith("bot.") and hasattr(module, name):
+            monkeypatch.setattr(module, name, value)
+
+
 def test_is_tarot_request_basic():
     assert is_tarot_request("今の恋愛について占って")
     assert is_tarot_request("/tarot 恋愛運")
@@ -35,33 +51,35 @@ def test_is_tarot_request_basic():
 
 
 def test_choose_spread(monkeypatch):
-    bot_main = import_bot_main(monkeypatch)
-    assert bot_main.choose_spread("恋愛について占って") == bot_main.ONE_CARD
-    assert bot_main.choose_spread("3枚で恋愛について占って") == bot_main.ONE_CARD
+    import_bot_main(monkeypatch)
+    tarot = importlib.import_module("bot.handlers.tarot")
+    assert tarot.choose_spread("恋愛について占って") == ONE_CARD
+    assert tarot.choose_spread("3枚で恋愛について占って") == ONE_CARD
 
 
 def test_parse_spread_command(monkeypatch):
-    bot_main = import_bot_main(monkeypatch)
+    import_bot_main(monkeypatch)
+    tarot = importlib.import_module("bot.handlers.tarot")
 
-    spread, question = bot_main.parse_spread_command("/love1 片思いの相手の気持ち")
-    assert spread == bot_main.ONE_CARD
+    spread, question = tarot.parse_spread_command("/love1 片思いの相手の気持ち")
+    assert spread == ONE_CARD
     assert question == "片思いの相手の気持ち"
 
-    spread_read, _ = bot_main.parse_spread_command("/read1 気持ち")
-    assert spread_read == bot_main.ONE_CARD
+    spread_read, _ = tarot.parse_spread_command("/read1 気持ち")
+    assert spread_read == ONE_CARD
 
-    spread_three, question_three = bot_main.parse_spread_command("/love3 結果を知りたい")
-    assert spread_three == bot_main.THREE_CARD_SITUATION
+    spread_three, question_three = tarot.parse_spread_command("/love3 結果を知りたい")
+    assert spread_three == THREE_CARD_SITUATION
     assert question_three == "結果を知りたい"
 
-    spread_three_read, _ = bot_main.parse_spread_command("/read3")
-    assert spread_three_read == bot_main.THREE_CARD_SITUATION
+    spread_three_read, _ = tarot.parse_spread_command("/read3")
+    assert spread_three_read == THREE_CARD_SITUATION
 
-    spread_hexa, _ = bot_main.parse_spread_command("/hexa 今後")
-    assert spread_hexa == bot_main.HEXAGRAM
+    spread_hexa, _ = tarot.parse_spread_command("/hexa 今後")
+    assert spread_hexa == HEXAGRAM
 
-    spread_celtic, _ = bot_main.parse_spread_command("/celtic")
-    assert spread_celtic == bot_main.CELTIC_CROSS
+    spread_celtic, _ = tarot.parse_spread_command("/celtic")
+    assert spread_celtic == CELTIC_CROSS
 
 
 def test_contains_tarot_like_detection():
@@ -71,19 +89,21 @@ def test_contains_tarot_like_detection():
 
 
 def test_help_text_includes_theme_examples(monkeypatch):
-    bot_main = import_bot_main(monkeypatch)
+    import_bot_main(monkeypatch)
+    themes = importlib.import_module("bot.utils.themes")
 
-    help_text = bot_main.build_help_text()
+    help_text = themes.build_help_text()
 
     assert "テーマ別の質問例" in help_text
-    for theme, label in bot_main.TAROT_THEME_LABELS.items():
+    for theme, label in themes.TAROT_THEME_LABELS.items():
         assert label in help_text
-        for example in bot_main.TAROT_THEME_EXAMPLES[theme]:
+        for example in themes.TAROT_THEME_EXAMPLES[theme]:
             assert example in help_text
 
 
 def test_general_chat_response_triggers_rewrite(monkeypatch):
-    bot_main = import_bot_main(monkeypatch)
+    import_bot_main(monkeypatch)
+    consult = importlib.import_module("bot.handlers.consult")
 
     called = {"value": False}
 
@@ -92,7 +112,7 @@ def test_general_chat_response_triggers_rewrite(monkeypatch):
         return "リライト済みです。", False
 
     result = asyncio.run(
-        bot_main.ensure_general_chat_safety(
+        consult.ensure_general_chat_safety(
             "引いたカードは恋人でした。今日は寒いですね。", rewrite_func=fake_rewrite
         )
     )
@@ -102,9 +122,10 @@ def test_general_chat_response_triggers_rewrite(monkeypatch):
 
 
 def test_tarot_response_prefixed(monkeypatch):
-    bot_main = import_bot_main(monkeypatch)
+    import_bot_main(monkeypatch)
+    formatting = importlib.import_module("bot.utils.formatting")
     heading = "《カード》：恋人（正位置）"
-    response = bot_main.ensure_tarot_response_prefixed("解釈が続きます。", heading)
+    response = formatting.ensure_tarot_response_prefixed("解釈が続きます。", heading)
     assert response.startswith(heading)
 
 
@@ -155,10 +176,11 @@ class DummyCallback:
 
 
 def test_start_message_shorter(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
     message = DummyMessage("/start", user_id=1)
 
-    asyncio.run(bot_main.cmd_start(message))
+    asyncio.run(tarot.cmd_start(message))
 
     assert message.answers
     assert "1日2回まで無料" in message.answers[0]
@@ -168,7 +190,8 @@ def test_start_message_shorter(monkeypatch, tmp_path):
 
 
 def test_love1_command_is_alias(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
 
     calls: list[tuple[str, object]] = []
 
@@ -179,42 +202,45 @@ def test_love1_command_is_alias(monkeypatch, tmp_path):
         guidance_note=None,
         short_response=False,
         theme=None,
+        charge=None,
     ):
         calls.append((user_query, spread))
 
-    monkeypatch.setattr(bot_main, "handle_tarot_reading", fake_handle_tarot)
+    monkeypatch.setattr(tarot, "handle_tarot_reading", fake_handle_tarot)
 
     message_love = DummyMessage("/love1", user_id=10)
-    asyncio.run(bot_main.handle_message(message_love))
+    asyncio.run(tarot.handle_message(message_love))
 
     message_read = DummyMessage("/read1", user_id=11)
-    asyncio.run(bot_main.handle_message(message_read))
+    asyncio.run(tarot.handle_message(message_read))
 
     assert len(calls) == 2
     assert calls[0][0] == calls[1][0]
-    assert calls[0][1] is bot_main.ONE_CARD
-    assert calls[1][1] is bot_main.ONE_CARD
+    assert calls[0][1] is ONE_CARD
+    assert calls[1][1] is ONE_CARD
 
 
 def test_multiple_card_hint_without_command(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
 
     async def fake_call(messages):
         return "テスト回答", False
 
-    monkeypatch.setattr(bot_main, "call_openai_with_retry", fake_call)
+    patch_bot_attr(monkeypatch, "call_openai_with_retry", fake_call)
     message = DummyMessage("占って、3枚でお願いします", user_id=5)
 
-    asyncio.run(bot_main.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
 
     assert any("複数枚はコマンド指定" in ans for ans in message.answers)
 
 
 def test_start_payload_sets_lang(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
     message = DummyMessage("/start en", user_id=100)
 
-    asyncio.run(bot_main.cmd_start(message))
+    asyncio.run(tarot.cmd_start(message))
 
     from core import db as core_db
 
@@ -226,28 +252,30 @@ def test_start_payload_sets_lang(monkeypatch, tmp_path):
 
 
 def test_start_prefers_saved_lang(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
     from core import db as core_db
 
     core_db.set_user_lang(200, "pt")
     message = DummyMessage("/start unknown", user_id=200)
 
-    asyncio.run(bot_main.cmd_start(message))
+    asyncio.run(tarot.cmd_start(message))
 
     assert core_db.get_user_lang(200) == "pt"
 
 
 def test_lang_command_and_callback(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
     message = DummyMessage("/lang", user_id=300)
 
-    asyncio.run(bot_main.cmd_lang(message))
+    asyncio.run(tarot.cmd_lang(message))
 
     assert message.reply_markups
     assert isinstance(message.reply_markups[0], InlineKeyboardMarkup)
 
     callback = DummyCallback("lang:set:pt", user_id=300, message=message)
-    asyncio.run(bot_main.handle_lang_set(callback))
+    asyncio.run(tarot.handle_lang_set(callback))
 
     from core import db as core_db
 
@@ -257,66 +285,73 @@ def test_lang_command_and_callback(monkeypatch, tmp_path):
 
 
 def test_menu_routing_by_emoji(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
     called = {"tarot": False}
 
     async def fake_prompt_tarot_mode(message):
         called["tarot"] = True
 
-    monkeypatch.setattr(bot_main, "prompt_tarot_mode", fake_prompt_tarot_mode)
+    monkeypatch.setattr(tarot, "prompt_tarot_mode", fake_prompt_tarot_mode)
 
     message = DummyMessage("🎩 Tarot", user_id=400)
-    asyncio.run(bot_main.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
 
     assert called["tarot"] is True
 
 
 def test_paywall_blocks_paid_spread(monkeypatch, tmp_path):
     monkeypatch.setenv("PAYWALL_ENABLED", "true")
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
     message = DummyMessage("/read3", user_id=42)
 
-    asyncio.run(bot_main.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
 
     assert message.answers
     assert "/buy" in message.answers[0]
 
 
 def test_explicit_command_resets_tarot_flow(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    state = importlib.import_module("bot.utils.state")
+    tarot = importlib.import_module("bot.handlers.tarot")
     user_id = 21
-    bot_main.set_user_mode(user_id, "tarot")
-    bot_main.set_tarot_flow(user_id, "awaiting_question")
+    state.set_user_mode(user_id, "tarot")
+    state.set_tarot_flow(user_id, "awaiting_question")
     message = DummyMessage("/help", user_id=user_id)
 
-    asyncio.run(bot_main.cmd_help(message))
+    asyncio.run(tarot.cmd_help(message))
 
-    assert bot_main.TAROT_FLOW.get(user_id) is None
-    assert bot_main.get_user_mode(user_id) == "consult"
+    assert state.TAROT_FLOW.get(user_id) is None
+    assert state.get_user_mode(user_id) == "consult"
 
 
 def test_timeout_resets_state(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    state = importlib.import_module("bot.utils.state")
+    tarot = importlib.import_module("bot.handlers.tarot")
     user_id = 22
     now = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    bot_main.set_user_mode(user_id, "tarot")
-    bot_main.set_tarot_flow(user_id, "awaiting_question")
-    bot_main.USER_STATE_LAST_ACTIVE[user_id] = now - bot_main.STATE_TIMEOUT - timedelta(minutes=1)
+    state.set_user_mode(user_id, "tarot")
+    state.set_tarot_flow(user_id, "awaiting_question")
+    state.USER_STATE_LAST_ACTIVE[user_id] = now - state.STATE_TIMEOUT - timedelta(minutes=1)
     message = DummyMessage("続きを送ります", user_id=user_id)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: now)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: now)
 
-    asyncio.run(bot_main.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
 
     assert any("リセット" in ans for ans in message.answers)
-    assert bot_main.TAROT_FLOW.get(user_id) is None
-    assert bot_main.USER_MODE.get(user_id) is None
+    assert state.TAROT_FLOW.get(user_id) is None
+    assert state.USER_MODE.get(user_id) is None
 
 
 def test_terms_required_before_buy(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    store = importlib.import_module("bot.handlers.store")
     message = DummyMessage("/buy", user_id=99)
 
-    asyncio.run(bot_main.cmd_buy(message))
+    asyncio.run(store.cmd_buy(message))
 
     assert any("/terms" in ans or "同意" in ans for ans in message.answers)
 
@@ -324,28 +359,30 @@ def test_terms_required_before_buy(monkeypatch, tmp_path):
 def test_terms_support_and_pay_support_use_configured_email(monkeypatch, tmp_path):
     support_email = "support@tarot.test"
     monkeypatch.setenv("SUPPORT_EMAIL", support_email)
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    store = importlib.import_module("bot.handlers.store")
 
     terms_message = DummyMessage("/terms", user_id=500)
-    asyncio.run(bot_main.cmd_terms(terms_message))
+    asyncio.run(store.cmd_terms(terms_message))
 
     support_message = DummyMessage("/support", user_id=500)
-    asyncio.run(bot_main.cmd_support(support_message))
+    asyncio.run(store.cmd_support(support_message))
 
     pay_support_message = DummyMessage("/paysupport", user_id=500)
-    asyncio.run(bot_main.cmd_pay_support(pay_support_message))
+    asyncio.run(store.cmd_pay_support(pay_support_message))
 
-    assert support_email in bot_main.get_terms_text()
+    assert support_email in store.get_terms_text()
     assert any(support_email in ans for ans in terms_message.answers)
     assert any(support_email in ans for ans in support_message.answers)
     assert any(support_email in ans for ans in pay_support_message.answers)
 
 
 def test_buy_shows_terms_prompt_keyboard(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    store = importlib.import_module("bot.handlers.store")
     message = DummyMessage("/buy", user_id=123)
 
-    asyncio.run(bot_main.cmd_buy(message))
+    asyncio.run(store.cmd_buy(message))
 
     assert message.reply_markups
     buttons = [btn.text for row in message.reply_markups[0].inline_keyboard for btn in row]
@@ -354,25 +391,29 @@ def test_buy_shows_terms_prompt_keyboard(monkeypatch, tmp_path):
 
 
 def test_agree_and_buy_callback_opens_store(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    store = importlib.import_module("bot.handlers.store")
+    db = importlib.import_module("core.db")
     user_id = 321
     message = DummyMessage("/buy", user_id=user_id)
 
-    asyncio.run(bot_main.cmd_buy(message))
+    asyncio.run(store.cmd_buy(message))
 
     callback = DummyCallback(
-        bot_main.TERMS_CALLBACK_AGREE_AND_BUY, user_id=user_id, message=message
+        store.TERMS_CALLBACK_AGREE_AND_BUY, user_id=user_id, message=message
     )
-    asyncio.run(bot_main.handle_terms_agree_and_buy(callback))
+    asyncio.run(store.handle_terms_agree_and_buy(callback))
 
-    user = bot_main.get_user(user_id)
-    assert bot_main.has_accepted_terms(user_id)
+    user = db.get_user(user_id)
+    assert db.has_accepted_terms(user_id)
     assert user is not None
     assert any("必要に合う" in ans or "Stars" in ans for ans in message.answers)
 
 
 def test_successful_payment_not_double_granted(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    store = importlib.import_module("bot.handlers.store")
+    db = importlib.import_module("core.db")
     user_id = 77
     payload = json.dumps({"sku": "TICKET_3", "user_id": user_id})
 
@@ -384,21 +425,22 @@ def test_successful_payment_not_double_granted(monkeypatch, tmp_path):
             self.provider_payment_charge_id = "provider"
 
     first_message = DummyMessage("", user_id=user_id, successful_payment=DummyPayment("ch1"))
-    asyncio.run(bot_main.process_successful_payment(first_message))
+    asyncio.run(store.process_successful_payment(first_message))
 
     dup_message = DummyMessage("", user_id=user_id, successful_payment=DummyPayment("ch1"))
-    asyncio.run(bot_main.process_successful_payment(dup_message))
+    asyncio.run(store.process_successful_payment(dup_message))
 
-    user = bot_main.get_user(user_id)
+    user = db.get_user(user_id)
     assert user.tickets_3 == 1
     assert any("処理済み" in ans for ans in dup_message.answers)
 
 
 def test_admin_cannot_refund(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    admin = importlib.import_module("bot.handlers.admin")
     message = DummyMessage("/refund chx", user_id=1234)
 
-    asyncio.run(bot_main.cmd_refund(message))
+    asyncio.run(admin.cmd_refund(message))
 
     assert any("管理者専用" in ans for ans in message.answers)
 
@@ -407,14 +449,16 @@ def test_admin_grant_creates_pass(monkeypatch, tmp_path):
     admin_id = 9001
     monkeypatch.setenv("ADMIN_USER_IDS", str(admin_id))
 
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    admin = importlib.import_module("bot.handlers.admin")
+    db = importlib.import_module("core.db")
     fixed_now = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: fixed_now)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: fixed_now)
 
     message = DummyMessage("/admin grant 4242 PASS_7D", user_id=admin_id)
-    asyncio.run(bot_main.cmd_admin(message))
+    asyncio.run(admin.cmd_admin(message))
 
-    user = bot_main.get_user(4242)
+    user = db.get_user(4242)
     assert user is not None
     assert user.pass_until is not None
     expected_expiry = fixed_now + timedelta(days=7)
@@ -427,22 +471,25 @@ def test_admin_grant_rejects_unknown_sku(monkeypatch, tmp_path):
     admin_id = 9002
     monkeypatch.setenv("ADMIN_USER_IDS", str(admin_id))
 
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    admin = importlib.import_module("bot.handlers.admin")
+    db = importlib.import_module("core.db")
     message = DummyMessage("/admin grant 9999 UNKNOWN", user_id=admin_id)
-    asyncio.run(bot_main.cmd_admin(message))
+    asyncio.run(admin.cmd_admin(message))
 
     assert any("SKU" in ans for ans in message.answers)
-    assert bot_main.get_user(9999) is None
+    assert db.get_user(9999) is None
 
 
 def test_admin_grant_writes_audit(monkeypatch, tmp_path):
     admin_id = 9100
     monkeypatch.setenv("ADMIN_USER_IDS", str(admin_id))
 
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    admin = importlib.import_module("bot.handlers.admin")
 
     message = DummyMessage("/admin grant 4242 PASS_7D", user_id=admin_id)
-    asyncio.run(bot_main.cmd_admin(message))
+    asyncio.run(admin.cmd_admin(message))
 
     db_module = sys.modules["core.db"]
     audit = db_module.get_latest_audit("admin_grant")
@@ -456,18 +503,20 @@ def test_admin_revoke_clears_pass_and_logs(monkeypatch, tmp_path):
     admin_id = 9101
     monkeypatch.setenv("ADMIN_USER_IDS", str(admin_id))
 
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    admin = importlib.import_module("bot.handlers.admin")
+    db = importlib.import_module("core.db")
     fixed_now = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: fixed_now)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: fixed_now)
 
     grant_message = DummyMessage("/admin grant 4242 PASS_7D", user_id=admin_id)
-    asyncio.run(bot_main.cmd_admin(grant_message))
-    assert bot_main.get_user(4242).pass_until is not None
+    asyncio.run(admin.cmd_admin(grant_message))
+    assert db.get_user(4242).pass_until is not None
 
     revoke_message = DummyMessage("/admin revoke 4242 PASS_7D", user_id=admin_id)
-    asyncio.run(bot_main.cmd_admin(revoke_message))
+    asyncio.run(admin.cmd_admin(revoke_message))
 
-    user = bot_main.get_user(4242)
+    user = db.get_user(4242)
     assert user is not None
     assert user.pass_until is None
 
@@ -483,20 +532,39 @@ def test_admin_status_shows_virtual_pass(monkeypatch, tmp_path):
     admin_id = 9001
     monkeypatch.setenv("ADMIN_USER_IDS", str(admin_id))
 
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
+    db = importlib.import_module("core.db")
     fixed_now = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: fixed_now)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: fixed_now)
 
     status_message = DummyMessage("/status", user_id=admin_id)
-    asyncio.run(bot_main.cmd_status(status_message))
+    asyncio.run(tarot.cmd_status(status_message))
 
     assert status_message.answers
     status_text = status_message.answers[0]
     expected_expiry = (
         fixed_now + timedelta(days=30)
-    ).astimezone(bot_main.USAGE_TIMEZONE).strftime("%Y-%m-%d %H:%M JST")
+    ).astimezone(db.USAGE_TIMEZONE).strftime("%Y-%m-%d %H:%M JST")
 
     assert "管理者モード" in status_text
     assert "パス有効期限: なし" not in status_text
     assert expected_expiry in status_text
     assert "管理者" in status_text
+
+
+def test_arisa_messages_keep_character_prompt_as_stable_prefix(monkeypatch):
+    monkeypatch.setenv("CHARACTER", "arisa")
+    import_bot_main(monkeypatch)
+    arisa = importlib.import_module("bot.handlers.arisa")
+
+    free = arisa.build_arisa_messages("こんばんは", lang="ja", paid=False)
+    paid = arisa.build_arisa_messages(
+        "hello", lang="en", paid=True, first_paid_turn=True
+    )
+
+    assert [msg["role"] for msg in free] == ["system", "system", "user"]
+    assert free[0]["content"] == paid[0]["content"]
+    assert free[1]["content"] == 'MODE: "FREE"\nFIRST_PAID_TURN: "false"\nLANG: "ja"'
+    assert paid[1]["content"] == 'MODE: "PAID"\nFIRST_PAID_TURN: "true"\nLANG: "en"'
+    assert paid[-1]["content"] == "hello"
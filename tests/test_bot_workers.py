@@ -0,0 +1,188 @@
+import asyncio
+import multiprocessing
+import queue
+from collections import Counter
+
+from bot.workers import (
+    WorkerSupervisor,
+    extract_user_id,
+    feed_raw_updates,
+    rendezvous_worker,
+    shard_key,
+)
+
+
+def _message_update(update_id: int, user_id: int, text: str = "hi") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+def test_extract_user_id_covers_messages_callbacks_and_payments():
+    callback = {"update_id": 2, "callback_query": {"id": "c", "from": {"id": 7}, "chat_instance": "x"}}
+    checkout = {"update_id": 3, "pre_checkout_query": {"id": "p", "from": {"id": 8}}}
+
+    assert extract_user_id(_message_update(1, 42)) == 42
+    assert extract_user_id(callback) == 7
+    assert extract_user_id(checkout) == 8
+    assert extract_user_id({"update_id": 9}) is None
+    assert shard_key({"update_id": 9}) == 9
+
+
+def test_rendezvous_spreads_users_and_moves_few_on_scale_up():
+    users = range(10_000, 14_000)
+    before = {user: rendezvous_worker(user, [0, 1, 2, 3]) for user in users}
+    after = {user: rendezvous_worker(user, [0, 1, 2, 3, 4]) for user in users}
+
+    counts = Counter(before.values())
+    assert min(counts.values()) > 800
+    moved = [user for user in users if before[user] != after[user]]
+    # Only users that now belong to the new worker move (~1/5 of them).
+    assert all(after[user] == 4 for user in moved)
+    assert 600 < len(moved) < 1000
+    assert all(rendezvous_worker(user, [0, 1, 2, 3]) == before[user] for user in users)
+
+
+def test_feed_raw_updates_keeps_per_user_order():
+    inbox: queue.Queue = queue.Queue()
+    for update_id, user_id in enumerate([1, 2, 1, 1, 2, 3], start=1):
+        inbox.put(_message_update(update_id, user_id))
+    inbox.put(None)
+    seen: list[tuple[int, int]] = []
+
+    async def handle(raw):
+        user_id = raw["message"]["from"]["id"]
+        # Earlier updates sleep longer, so unordered handling would reverse them.
+        await asyncio.sleep(0.01 * (10 - raw["update_id"]))
+        seen.append((user_id, raw["update_id"]))
+
+    asyncio.run(feed_raw_updates(inbox, handle))
+
+    assert [update_id for user_id, update_id in seen if user_id == 1] == [1, 3, 4]
+    assert [update_id for user_id, update_id in seen if user_id == 2] == [2, 5]
+    assert len(seen) == 6
+
+
+def _echo_worker(worker_id, worker_count, inbox, results):
+    while True:
+        raw = inbox.get()
+        if raw is None:
+            return
+        if raw.get("crash"):
+            raise SystemExit(3)
+        results.put((worker_id, extract_user_id(raw)))
+
+
+class _EchoSupervisor(WorkerSupervisor):
+    def __init__(self, count, results, clock, queue_size=1000):
+        context = multiprocessing.get_context("fork")
+        super().__init__(count, target=_echo_worker, queue_size=queue_size, context=context, clock=clock)
+        self._results = results
+
+    def _spawn(self, slot):
+        original = self.target
+        self.target = lambda *args: original(*args, self._results)
+        try:
+            super()._spawn(slot)
+        finally:
+            self.target = original
+
+
+def _drain(results, expected):
+    return [results.get(timeout=5) for _ in range(expected)]
+
+
+def test_supervisor_routes_by_user_and_restarts_crashed_worker():
+    now = [0.0]
+    results = multiprocessing.get_context("fork").Queue()
+    supervisor = _EchoSupervisor(3, results, clock=lambda: now[0])
+    supervisor.start()
+    try:
+        for update_id, user_id in enumerate([101, 202, 303, 101], start=1):
+            assert supervisor.submit(_message_update(update_id, user_id))
+        routed = _drain(results, 4)
+        assert {user: worker for worker, user in routed} == {
+            user: rendezvous_worker(user, [0, 1, 2]) for user in (101, 202, 303)
+        }
+
+        owner = rendezvous_worker(101, [0, 1, 2])
+        crash = _message_update(5, 101)
+        crash["crash"] = True
+        supervisor.submit(crash)
+        supervisor._slots[owner].process.join(timeout=5)
+        supervisor.submit(_message_update(6, 101))
+
+        supervisor.check()  # notices the exit and schedules a restart
+        now[0] += 60
+        supervisor.check()
+        assert supervisor._slots[owner].restarts == 1
+        assert _drain(results, 1) == [(owner, 101)]
+
+        supervisor.resize(4)
+        assert supervisor.worker_ids == [0, 1, 2, 3]
+        supervisor.resize(2)
+        assert supervisor.worker_ids == [0, 1]
+        assert supervisor.submit(_message_update(7, 303))
+        for slot in list(supervisor._slots.values()):
+            if slot.retiring:
+                slot.process.join(timeout=5)
+        supervisor.check()
+        assert _drain(results, 1) == [(rendezvous_worker(303, [0, 1]), 303)]
+    finally:
+        supervisor.stop(timeout=5)
+
+
+def test_resize_holds_moved_users_until_retiring_worker_exits():
+    results = multiprocessing.get_context("fork").Queue()
+    supervisor = _EchoSupervisor(2, results, clock=lambda: 0.0)
+    supervisor.start()
+    try:
+        user = next(user for user in range(1, 1000) if rendezvous_worker(user, [0, 1]) == 1)
+        stay = next(user for user in range(1, 1000) if rendezvous_worker(user, [0, 1]) == 0)
+        retiring = supervisor._slots[1]
+        supervisor.resize(1)
+
+        # 退役中のワーカーが残りを処理し終えるまで、移るユーザーの更新は渡さない。
+        assert supervisor.submit(_message_update(1, user))
+        assert supervisor.submit(_message_update(2, stay))
+        assert [raw["update_id"] for raw in retiring.held] == [1]
+        assert supervisor.queue_depth() >= 1
+        assert _drain(results, 1) == [(0, stay)]
+
+        retiring.process.join(timeout=5)
+        supervisor.check()
+        assert 1 not in supervisor._slots
+        assert _drain(results, 1) == [(0, user)]
+        assert supervisor.submit(_message_update(3, user))
+        assert _drain(results, 1) == [(0, user)]
+    finally:
+        supervisor.stop(timeout=5)
+
+
+def test_submit_waiting_restarts_worker_that_died_with_full_inbox():
+    ticks = iter(range(0, 10_000, 10))
+    results = multiprocessing.get_context("fork").Queue()
+    supervisor = _EchoSupervisor(1, results, clock=lambda: float(next(ticks)), queue_size=1)
+    supervisor.start()
+    try:
+        crash = _message_update(1, 101)
+        crash["crash"] = True
+        assert supervisor.submit(crash)
+        supervisor._slots[0].process.join(timeout=5)
+        assert supervisor.submit(_message_update(2, 101))
+        assert not supervisor.submit(_message_update(3, 202))
+
+        # 死んだワーカーの inbox は誰も読まないので、待つ側が再起動しないと進まない。
+        asyncio.run(asyncio.wait_for(supervisor.submit_waiting(_message_update(3, 202), poll_interval_sec=0.01), 10))
+
+        assert supervisor._slots[0].restarts == 1
+        assert sorted(_drain(results, 2)) == [(0, 101), (0, 202)]
+    finally:
+        supervisor.stop(timeout=5)
@@ -0,0 +1,108 @@
+from pathlib import Path
+
+from core.characters import CharacterPackLoader
+from core.prompts import get_consult_system_prompt
+
+
+class _FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _write_pack(root: Path, name: str, prompt: str, boundary: str | None = None) -> Path:
+    directory = root / name
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / "system_prompt.txt").write_text(prompt, encoding="utf-8")
+    if boundary is not None:
+        (directory / "boundary_lines.txt").write_text(boundary, encoding="utf-8")
+    (directory / "README.md").write_text("docs only", encoding="utf-8")
+    return directory
+
+
+def test_multiple_characters_stay_resident(tmp_path) -> None:
+    _write_pack(tmp_path, "alpha", "alpha prompt", "alpha boundary")
+    _write_pack(tmp_path, "beta", "beta prompt")
+    loader = CharacterPackLoader(tmp_path, reload_interval_sec=60)
+
+    loader.preload(["alpha", "beta"])
+
+    assert loader.loaded() == ["alpha", "beta"]
+    alpha = loader.get("alpha")
+    assert alpha is not None
+    assert alpha.system_prompt == "alpha prompt"
+    assert alpha.boundary_lines == "alpha boundary"
+    assert "README.md" not in alpha.files
+    beta = loader.get("beta")
+    assert beta is not None and beta.boundary_lines is None
+
+
+def test_pack_is_served_from_memory_until_interval(tmp_path, monkeypatch) -> None:
+    directory = _write_pack(tmp_path, "alpha", "v1")
+    clock = _FakeClock()
+    loader = CharacterPackLoader(tmp_path, reload_interval_sec=5, clock=clock)
+    first = loader.get("alpha")
+
+    scans: list[Path] = []
+    import core.characters as characters
+
+    original_scan = characters._scan_signatures
+
+    def counting_scan(path):
+        scans.append(path)
+        return original_scan(path)
+
+    monkeypatch.setattr(characters, "_scan_signatures", counting_scan)
+    (directory / "system_prompt.txt").write_text("version two", encoding="utf-8")
+
+    clock.now = 4.0
+    assert loader.get("alpha") is first
+    assert scans == []
+
+    clock.now = 5.0
+    reloaded = loader.get("alpha")
+    assert len(scans) == 1
+    assert reloaded is not None and reloaded.system_prompt == "version two"
+
+
+def test_unchanged_files_are_not_reread(tmp_path, monkeypatch) -> None:
+    _write_pack(tmp_path, "alpha", "v1")
+    clock = _FakeClock()
+    loader = CharacterPackLoader(tmp_path, reload_interval_sec=1, clock=clock)
+    first = loader.get("alpha")
+
+    reads: list[Path] = []
+    original_read_text = Path.read_text
+
+    def counting_read_text(self, *args, **kwargs):
+        reads.append(self)
+        return original_read_text(self, *args, **kwargs)
+
+    monkeypatch.setattr(Path, "read_text", counting_read_text)
+    clock.now = 10.0
+
+    assert loader.get("alpha") is first
+    assert reads == []
+
+
+def test_removed_and_invalid_packs_return_none(tmp_path) -> None:
+    directory = _write_pack(tmp_path, "alpha", "v1")
+    clock = _FakeClock()
+    loader = CharacterPackLoader(tmp_path, reload_interval_sec=1, clock=clock)
+    assert loader.get("alpha") is not None
+
+    (directory / "system_prompt.txt").unlink()
+    clock.now = 2.0
+
+    assert loader.get("alpha") is None
+    assert loader.get("../alpha") is None
+    assert loader.get("") is None
+
+
+def test_consult_prompt_accepts_explicit_character(monkeypatch) -> None:
+    monkeypatch.delenv("CHARACTER", raising=False)
+
+    assert "アリサ" in get_consult_system_prompt("ja", character="arisa")
+    assert "アリサ" not in get_consult_system_prompt("ja")
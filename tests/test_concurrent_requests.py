@@ -4,7 +4,8 @@ import os
 os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
 os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
 
-from bot.main import IN_FLIGHT_USERS, _acquire_inflight
+from bot.utils.inflight import IN_FLIGHT_USERS, acquire_inflight
+from core.user_scope import scoped_user
 
 
 class _DummyMessage:
@@ -19,24 +20,57 @@ class _DummyMessage:
 def test_requests_from_same_user_are_queued_with_notice() -> None:
     async def _run() -> None:
         first = _DummyMessage(user_id=42)
-        release_first = await _acquire_inflight(42, first, busy_message="wait")
+        release_first = await acquire_inflight(42, first, busy_message="wait")
 
         second = _DummyMessage(user_id=42)
         second_task = asyncio.create_task(
-            _acquire_inflight(42, second, busy_message="wait")
+            acquire_inflight(42, second, busy_message="wait")
         )
 
         await asyncio.sleep(0.01)
         assert second.answers == ["wait"]
         assert not second_task.done()
-        assert 42 in IN_FLIGHT_USERS
+        assert scoped_user(42) in IN_FLIGHT_USERS
 
         release_first()
         release_second = await second_task
-        assert 42 in IN_FLIGHT_USERS
+        assert scoped_user(42) in IN_FLIGHT_USERS
 
         release_second()
-        assert 42 not in IN_FLIGHT_USERS
+        assert scoped_user(42) not in IN_FLIGHT_USERS
         assert first.answers == []
 
     asyncio.run(_run())
+
+
+class _AwaitableAnswer:
+    """Mimics aiogram's ``message.answer()``: awaitable, but not a coroutine."""
+
+    def __init__(self, sink: list[str], text: str) -> None:
+        self.sink = sink
+        self.text = text
+
+    def __await__(self):
+        async def _send() -> None:
+            self.sink.append(self.text)
+
+        return _send().__await__()
+
+
+def test_busy_notice_accepts_awaitable_send_method() -> None:
+    class _AiogramLikeMessage(_DummyMessage):
+        def answer(self, text: str, show_alert: bool | None = None) -> _AwaitableAnswer:  # noqa: ARG002
+            return _AwaitableAnswer(self.answers, text)
+
+    async def _run() -> None:
+        release_first = await acquire_inflight(43, _DummyMessage(user_id=43))
+        second = _AiogramLikeMessage(user_id=43)
+        second_task = asyncio.create_task(acquire_inflight(43, second, busy_message="wait"))
+
+        await asyncio.sleep(0.01)
+        assert second.answers == ["wait"]
+
+        release_first()
+        (await second_task)()
+
+    asyncio.run(_run())
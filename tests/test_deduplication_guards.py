@@ -1,4 +1,5 @@
 import asyncio
+import importlib
 
 import pytest
 
@@ -29,48 +30,50 @@ class DummyMessage:
 
 
 @pytest.fixture
-def bot_main(monkeypatch, tmp_path):
-    module = import_bot_main(monkeypatch, tmp_path)
-    module.RECENT_HANDLED.clear()
-    module.RECENT_HANDLED_ORDER.clear()
+def tarot(monkeypatch, tmp_path):
+    import_bot_main(monkeypatch, tmp_path)
+    module = importlib.import_module("bot.handlers.tarot")
+    inflight = importlib.import_module("bot.utils.inflight")
+    inflight.RECENT_HANDLED.clear()
+    inflight.RECENT_HANDLED_ORDER.clear()
     yield module
-    module.RECENT_HANDLED.clear()
-    module.RECENT_HANDLED_ORDER.clear()
+    inflight.RECENT_HANDLED.clear()
+    inflight.RECENT_HANDLED_ORDER.clear()
 
 
-def test_duplicate_tarot_question_is_ignored(bot_main, monkeypatch):
+def test_duplicate_tarot_question_is_ignored(tarot, monkeypatch):
     user_id = 999
-    bot_main.set_user_mode(user_id, "tarot")
+    tarot.set_user_mode(user_id, "tarot")
 
     calls: list[str] = []
 
     async def fake_execute_tarot(message, user_query: str, spread, theme=None):
         calls.append(user_query)
 
-    monkeypatch.setattr(bot_main, "execute_tarot_request", fake_execute_tarot)
+    monkeypatch.setattr(tarot, "execute_tarot_request", fake_execute_tarot)
 
     message = DummyMessage("占ってください", user_id=user_id, message_id=1)
 
-    asyncio.run(bot_main.handle_message(message))
-    asyncio.run(bot_main.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
 
     assert calls == ["占ってください"]
 
 
-def test_duplicate_chat_message_is_ignored(bot_main, monkeypatch):
+def test_duplicate_chat_message_is_ignored(tarot, monkeypatch):
     user_id = 1000
-    bot_main.set_user_mode(user_id, "consult")
+    tarot.set_user_mode(user_id, "consult")
 
     calls: list[str] = []
 
     async def fake_general_chat(message, user_query: str):
         calls.append(user_query)
 
-    monkeypatch.setattr(bot_main, "handle_general_chat", fake_general_chat)
+    monkeypatch.setattr(tarot, "handle_general_chat", fake_general_chat)
 
     message = DummyMessage("お話を聞いてほしいです", user_id=user_id, message_id=2)
 
-    asyncio.run(bot_main.handle_message(message))
-    asyncio.run(bot_main.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
 
     assert calls == ["お話を聞いてほしいです"]
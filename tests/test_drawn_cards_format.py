@@ -3,7 +3,7 @@ import os
 os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
 os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
 
-from bot.main import format_drawn_cards, format_tarot_answer
+from bot.utils.formatting import format_drawn_cards, format_tarot_answer
 from core.tarot import ONE_CARD, THREE_CARD_SITUATION, orientation_label
 
 
@@ -0,0 +1,96 @@
+import asyncio
+
+from core.expiring_map import ExpiringMap, MapSweeper, lock_is_idle
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_last_access():
+    clock = FakeClock()
+    mapping: ExpiringMap[int, str] = ExpiringMap(ttl_sec=10, max_size=100, clock=clock)
+    mapping[1] = "a"
+    mapping[2] = "b"
+
+    clock.now += 8
+    assert mapping[1] == "a"  # touching refreshes the TTL
+    clock.now += 5
+
+    assert mapping.get(1) == "a"
+    assert 2 not in mapping
+    assert len(mapping) == 1
+
+
+def test_size_limit_evicts_least_recently_used():
+    mapping: ExpiringMap[int, int] = ExpiringMap(ttl_sec=60, max_size=3, clock=FakeClock())
+    for key in range(3):
+        mapping[key] = key
+    mapping.get(0)
+    mapping[3] = 3
+
+    assert sorted(mapping) == [0, 2, 3]
+    assert mapping.evicted == 1
+
+
+def test_held_locks_are_never_evicted():
+    async def run():
+        clock = FakeClock()
+        locks: ExpiringMap[int, asyncio.Lock] = ExpiringMap(
+            ttl_sec=10, max_size=2, can_evict=lock_is_idle, clock=clock
+        )
+        held = locks.setdefault(1, asyncio.Lock())
+        await held.acquire()
+        locks.setdefault(2, asyncio.Lock())
+        locks.setdefault(3, asyncio.Lock())  # over the limit: drops 2, keeps held 1
+
+        assert sorted(locks) == [1, 3]
+        clock.now += 11
+        assert locks.sweep() == 1
+        assert locks.setdefault(1, asyncio.Lock()) is held
+
+        held.release()
+        clock.now += 11
+        assert locks.sweep() == 1
+        return len(locks)
+
+    assert asyncio.run(run()) == 0
+
+
+def test_lock_with_pending_waiter_counts_as_busy():
+    async def run():
+        lock = asyncio.Lock()
+        await lock.acquire()
+        waiter = asyncio.create_task(lock.acquire())
+        await asyncio.sleep(0)
+        lock.release()
+        # The waiter has been woken but has not re-acquired yet.
+        busy = not lock_is_idle(lock)
+        await waiter
+        lock.release()
+        return busy, lock_is_idle(lock)
+
+    assert asyncio.run(run()) == (True, True)
+
+
+def test_sweeper_keeps_many_users_bounded():
+    clock = FakeClock()
+    first: ExpiringMap[int, float] = ExpiringMap(ttl_sec=5, max_size=1000, clock=clock)
+    second: ExpiringMap[int, float] = ExpiringMap(ttl_sec=60, max_size=500, clock=clock)
+    sweeper = MapSweeper([first, second])
+
+    for user_id in range(50_000):
+        clock.now += 0.01
+        first[user_id] = clock.now
+        second[user_id] = clock.now
+        if user_id % 1000 == 0:
+            sweeper.sweep()
+        assert len(first) <= 1000
+    sweeper.sweep()
+
+    assert 499 <= len(first) <= 501  # about five seconds of arrivals
+    assert len(second) == 500
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from openai import APITimeoutError, InternalServerError, OpenAI, RateLimitError
+
+from api.services.line_prince import PrinceChatService
+from tools.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+
+MESSAGES = [{"role": "system", "content": "占い師です"}, {"role": "user", "content": "仕事運を見て"}]
+
+
+def _client(server: FakeOpenAIServer, **kwargs) -> OpenAI:
+    return OpenAI(api_key="test", base_url=server.base_url, max_retries=0, **kwargs)
+
+
+def test_completion_and_stream_report_usage() -> None:
+    with FakeOpenAIServer(FakeOpenAIConfig(latency="0", reply="星のカードです。焦らずに。")) as server:
+        client = _client(server)
+        completion = client.chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+        usage = completion.usage
+        assert completion.choices[0].message.content == "星のカードです。焦らずに。"
+        assert usage.prompt_tokens > 0 and usage.completion_tokens > 0
+        assert usage.total_tokens == usage.prompt_tokens + usage.completion_tokens
+
+        chunks = list(
+            client.chat.completions.create(
+                model="gpt-4o-mini", messages=MESSAGES, stream=True, stream_options={"include_usage": True}
+            )
+        )
+        text = "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices)
+        assert text == "星のカードです。焦らずに。"
+        assert chunks[-1].usage.total_tokens == usage.total_tokens
+        assert server.stats["ok"] == 2
+
+
+def test_injected_failures_surface_as_openai_errors() -> None:
+    with FakeOpenAIServer(FakeOpenAIConfig(latency="0", rate_429=1.0)) as server:
+        with pytest.raises(RateLimitError):
+            _client(server).chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+    with FakeOpenAIServer(FakeOpenAIConfig(latency="0", rate_5xx=1.0)) as server:
+        with pytest.raises(InternalServerError):
+            _client(server).chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+    with FakeOpenAIServer(FakeOpenAIConfig(latency="0", rate_timeout=1.0, hang_sec=5)) as server:
+        with pytest.raises(APITimeoutError):
+            _client(server, timeout=0.2).chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+        assert server.stats["timeout"] == 1
+
+
+def test_prince_service_uses_openai_base_url(monkeypatch: pytest.MonkeyPatch) -> None:
+    with FakeOpenAIServer(FakeOpenAIConfig(latency="0", reply="  バラを大切に。  ")) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        reply = asyncio.run(PrinceChatService().generate_reply("こんにちは"))
+    assert reply == "バラを大切に。"
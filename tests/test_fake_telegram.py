@@ -0,0 +1,96 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import LabeledPrice
+
+from bot.utils.telegram import build_bot_session
+from tools.fake_telegram import FakeTelegramConfig, FakeTelegramServer
+
+UNLIMITED = FakeTelegramConfig(global_rate_per_sec=0, chat_rate_per_sec=0)
+
+
+def _run(server: FakeTelegramServer, scenario) -> None:
+    async def _main() -> None:
+        bot = Bot(token="123456:FAKE", session=build_bot_session(server.base_url))
+        try:
+            await scenario(bot)
+        finally:
+            await bot.session.close()
+
+    asyncio.run(_main())
+
+
+def test_edit_and_delete_follow_telegram_semantics() -> None:
+    async def scenario(bot: Bot) -> None:
+        sent = await bot.send_message(42, "こんにちは")
+        with pytest.raises(TelegramBadRequest, match="message is not modified"):
+            await bot.edit_message_text("こんにちは", chat_id=42, message_id=sent.message_id)
+        edited = await bot.edit_message_text("こんばんは", chat_id=42, message_id=sent.message_id)
+        assert edited.text == "こんばんは"
+        assert await bot.delete_message(42, sent.message_id) is True
+        with pytest.raises(TelegramBadRequest, match="message to delete not found"):
+            await bot.delete_message(42, sent.message_id)
+        with pytest.raises(TelegramBadRequest, match="message to edit not found"):
+            await bot.edit_message_text("?", chat_id=42, message_id=sent.message_id)
+
+        assert await bot.answer_callback_query("cb-1") is True
+        with pytest.raises(TelegramBadRequest, match="query is too old"):
+            await bot.answer_callback_query("cb-1")
+        invoice = await bot.send_invoice(
+            42, "PASS_7D", "7日パス", payload="{}", currency="XTR", prices=[LabeledPrice(label="PASS", amount=100)]
+        )
+        assert invoice.chat.id == 42
+        assert await bot.answer_pre_checkout_query("pcq-1", ok=True) is True
+
+    with FakeTelegramServer(UNLIMITED) as server:
+        _run(server, scenario)
+        assert server.api.counts["sendMessage"] == 1
+        assert server.api.statuses[400] == 4
+
+
+def test_flood_limit_answers_429_with_retry_after() -> None:
+    async def scenario(bot: Bot) -> None:
+        await bot.send_message(7, "1")
+        await bot.send_message(7, "2")
+        with pytest.raises(TelegramRetryAfter) as exc_info:
+            await bot.send_message(7, "3")
+        assert exc_info.value.retry_after >= 1
+        await bot.send_message(8, "other chat")
+
+    config = FakeTelegramConfig(global_rate_per_sec=0, chat_rate_per_sec=0.5, chat_burst=2)
+    with FakeTelegramServer(config) as server:
+        _run(server, scenario)
+        assert server.api.statuses[429] == 1
+
+
+def test_pushed_updates_are_served_by_get_updates() -> None:
+    async def scenario(bot: Bot) -> None:
+        updates = await bot.get_updates(timeout=1)
+        assert [update.message.text for update in updates] == ["占って"]
+        # The user's own message can be deleted like on Telegram.
+        assert await bot.delete_message(99, 5) is True
+        assert await bot.get_updates(offset=updates[-1].update_id + 1, timeout=0) == []
+
+    with FakeTelegramServer(UNLIMITED) as server:
+        server.api.add_updates(
+            [
+                {
+                    "update_id": 1,
+                    "message": {
+                        "message_id": 5,
+                        "date": 0,
+                        "chat": {"id": 99, "type": "private"},
+                        "from": {"id": 99, "is_bot": False, "first_name": "U"},
+                        "text": "占って",
+                    },
+                }
+            ]
+        )
+        _run(server, scenario)
@@ -0,0 +1,31 @@
+from tools.import_time_report import OWN_PACKAGES, measure, parse_importtime
+
+# bot.main 配下の自前モジュールの import にかけてよい時間。現状は 50〜70ms 程度。
+OWN_IMPORT_BUDGET_MS = 150
+
+
+def test_parse_importtime_reads_depth_and_times() -> None:
+    entries = parse_importtime(
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     core.env\n"
+        "import time:      3000 |       3120 |   core.config\n"
+        "import time:       500 |       3620 | bot.main\n"
+    )
+    assert [(entry.name, entry.depth) for entry in entries] == [("core.env", 2), ("core.config", 1), ("bot.main", 0)]
+    assert entries[1].self_us == 3000 and entries[1].cumulative_us == 3120
+
+
+def test_bot_main_import_is_cheap_and_side_effect_free() -> None:
+    report = measure(
+        "bot.main",
+        extra_code=(
+            "import sys\n"
+            "import bot.main as m\n"
+            "from bot.utils import llm, telegram\n"
+            "assert telegram.bot is None and m.dp is None and llm.client is None, 'runtime built at import'\n"
+            "assert not [name for name in sys.modules if name.startswith('bot.handlers.')], 'handlers imported eagerly'"
+        ),
+    )
+    assert report.created_files == [], "importing bot.main must not create the DB"
+    assert report.imported("bot") and {"bot", "core"} <= set(OWN_PACKAGES)
+    assert report.own_us / 1000 < OWN_IMPORT_BUDGET_MS, f"own import time {report.own_us / 1000:.1f}ms"
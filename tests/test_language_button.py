@@ -1,4 +1,5 @@
 import asyncio
+import importlib
 
 import pytest
 from aiogram.types import InlineKeyboardMarkup
@@ -32,14 +33,15 @@ def _collect_button_texts(markup: InlineKeyboardMarkup) -> list[str]:
     ],
 )
 def test_language_reply_button_shows_picker(monkeypatch, tmp_path, button_text, user_lang):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
 
     from core import db as core_db
 
     core_db.set_user_lang(999, user_lang)
     message = DummyMessage(button_text, user_id=999, chat_id=999, message_id=1)
 
-    asyncio.run(bot_main.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
 
     assert any(isinstance(markup, InlineKeyboardMarkup) for markup in message.reply_markups)
     prompt = t(user_lang, "LANGUAGE_SELECT_PROMPT")
@@ -67,28 +69,31 @@ def test_language_reply_button_shows_picker(monkeypatch, tmp_path, button_text,
     ],
 )
 def test_language_reply_button_does_not_misfire(monkeypatch, tmp_path, free_text):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    language = importlib.import_module("bot.utils.language")
 
-    is_button, hint = bot_main.is_language_reply_button(free_text)
+    is_button, hint = language.is_language_reply_button(free_text)
 
     assert is_button is False
     assert hint is None
 
 
 def test_language_button_bypasses_dedup(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    inflight = importlib.import_module("bot.utils.inflight")
+    tarot = importlib.import_module("bot.handlers.tarot")
 
     from core import db as core_db
 
     core_db.set_user_lang(555, "en")
-    bot_main.RECENT_HANDLED.clear()
-    bot_main.RECENT_HANDLED_ORDER.clear()
+    inflight.RECENT_HANDLED.clear()
+    inflight.RECENT_HANDLED_ORDER.clear()
 
     first = DummyMessage("🌐 Language", user_id=555, chat_id=555, message_id=5)
     second = DummyMessage("🌐 Language", user_id=555, chat_id=555, message_id=5)
 
-    asyncio.run(bot_main.handle_message(first))
-    asyncio.run(bot_main.handle_message(second))
+    asyncio.run(tarot.handle_message(first))
+    asyncio.run(tarot.handle_message(second))
 
     assert any(isinstance(markup, InlineKeyboardMarkup) for markup in first.reply_markups)
     assert any(isinstance(markup, InlineKeyboardMarkup) for markup in second.reply_markups)
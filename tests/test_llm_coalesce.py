@@ -0,0 +1,117 @@
+import asyncio
+import importlib
+import sys
+
+import pytest
+
+from api.services import line_prince
+from api.services.line_prince import PrinceChatService
+from core.singleflight import COALESCED_REQUESTS, SingleFlight, coalesce_key_from_env, prompt_key
+from tools.fake_openai import FakeOpenAIClient
+
+
+def import_llm(monkeypatch, tmp_path, key_mode="exact"):
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setenv("LLM_COALESCE_KEY", key_mode)
+    for module in [name for name in sys.modules if name.startswith("bot.utils")]:
+        sys.modules.pop(module, None)
+    sys.modules.pop("core.config", None)
+    return importlib.import_module("bot.utils.llm")
+
+
+def _messages(text: str) -> list[dict[str, str]]:
+    return [{"role": "system", "content": "相談相手です"}, {"role": "user", "content": text}]
+
+
+def test_prompt_key_modes():
+    assert prompt_key(_messages("a"), mode="off") is None
+    assert prompt_key(_messages("今日の運勢？"), mode="exact") != prompt_key(_messages(" 今日の運勢? "), mode="exact")
+    assert prompt_key(_messages("今日の運勢？"), mode="normalized") == prompt_key(
+        _messages(" 今日の運勢? "), mode="normalized"
+    )
+    assert prompt_key(_messages("a"), mode="exact", max_tokens=10) != prompt_key(
+        _messages("a"), mode="exact", max_tokens=20
+    )
+    with pytest.raises(ValueError):
+        prompt_key(_messages("a"), mode="fuzzy")
+
+
+def test_cancelled_caller_leaves_shared_call_running():
+    flight: SingleFlight[str] = SingleFlight("test")
+    started: list[int] = []
+
+    async def upstream() -> str:
+        started.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def _run():
+        first = asyncio.create_task(flight.do("k", upstream))
+        second = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, flight.in_flight
+
+    answer, remaining = asyncio.run(_run())
+
+    assert answer == "answer"
+    assert started == [1]
+    assert remaining == 0
+
+
+def test_identical_concurrent_prompts_share_one_call(monkeypatch, tmp_path):
+    llm = import_llm(monkeypatch, tmp_path)
+    fake = FakeOpenAIClient("const:50", reply="同じ答え")
+    monkeypatch.setattr(llm, "client", fake)
+    shared_before = COALESCED_REQUESTS.value(flight="bot", role="shared")
+
+    async def _run():
+        same = [llm.call_openai_with_retry(_messages("今日の運勢"), coalesce=True) for _ in range(5)]
+        other = llm.call_openai_with_retry(_messages("別の相談"), coalesce=True)
+        personal = llm.call_openai_with_retry(_messages("今日の運勢"))
+        return await asyncio.gather(*same, other, personal)
+
+    results = asyncio.run(_run())
+
+    assert all(result == ("同じ答え", False) for result in results)
+    # 同じ 5 件で 1 回、別の相談で 1 回、coalesce なし（個人向け）で 1 回。
+    assert fake.calls == 3
+    assert COALESCED_REQUESTS.value(flight="bot", role="shared") - shared_before == 4
+
+
+def test_coalescing_can_be_turned_off(monkeypatch, tmp_path):
+    llm = import_llm(monkeypatch, tmp_path, key_mode="off")
+    fake = FakeOpenAIClient("const:20")
+    monkeypatch.setattr(llm, "client", fake)
+
+    async def _run():
+        await asyncio.gather(*(llm.call_openai_with_retry(_messages("同じ"), coalesce=True) for _ in range(3)))
+
+    asyncio.run(_run())
+
+    assert fake.calls == 3
+
+
+def test_coalescing_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("LLM_COALESCE_KEY", raising=False)
+    assert coalesce_key_from_env() == "off"
+    monkeypatch.setenv("LLM_COALESCE_KEY", "fuzzy")
+    with pytest.raises(RuntimeError, match="LLM_COALESCE_KEY"):
+        coalesce_key_from_env()
+
+
+def test_prince_greetings_share_one_call(monkeypatch):
+    monkeypatch.setattr(line_prince, "LLM_COALESCE_KEY", "normalized")
+    fake = FakeOpenAIClient("const:50", reply="  やあ、きみに会えてうれしい。  ")
+
+    async def _run():
+        return await asyncio.gather(
+            *(PrinceChatService(client=fake).generate_reply(text) for text in ("こんにちは", "こんにちは ", "こんにちは"))
+        )
+
+    replies = asyncio.run(_run())
+
+    assert replies == ["やあ、きみに会えてうれしい。"] * 3
+    assert fake.calls == 1
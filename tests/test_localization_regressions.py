@@ -1,8 +1,8 @@
 import re
 from types import SimpleNamespace
 
-from bot import main
 from bot.texts import en, ja, pt
+from bot.utils import state
 from core.db import get_user_lang
 
 
@@ -33,7 +33,7 @@ def test_no_japanese_in_translated_texts() -> None:
 def test_resolve_user_lang_respects_unsaved_users() -> None:
     user = SimpleNamespace(id=987654321, language_code="en")
     message = SimpleNamespace(text="/start", from_user=user)
-    lang, persisted = main.resolve_user_lang(message)
+    lang, persisted = state.resolve_user_lang(message)
 
     assert lang == "en"
     assert persisted is False
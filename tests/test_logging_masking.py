@@ -1,8 +1,22 @@
+import json
 import logging
 import os
+import queue
 from io import StringIO
+from logging.handlers import QueueListener
 
-from core.logging import SafeLogFilter, collect_sensitive_values
+from core.logging import (
+    JsonLogFormatter,
+    LogQueueHandler,
+    LogSampler,
+    SafeLogFilter,
+    build_sampler_from_env,
+    build_secret_pattern,
+    collect_sensitive_values,
+    mask_secrets,
+    parse_sample_rules,
+    request_id_var,
+)
 
 
 def test_safe_log_filter_masks_env_secrets(monkeypatch) -> None:
@@ -27,3 +41,104 @@ def test_safe_log_filter_masks_env_secrets(monkeypatch) -> None:
     assert "telegram-secret-token" not in output
     assert "sk-test-secret" not in output
     assert "***" in output
+
+
+def test_mask_secrets_prefers_the_longest_overlapping_secret() -> None:
+    assert mask_secrets("key=abc-123 short=abc", ["abc", "abc-123"]) == "key=*** short=***"
+    assert mask_secrets("nothing here", []) == "nothing here"
+
+
+def test_queue_handler_writes_json_with_extras_and_masks_them() -> None:
+    stream = StringIO()
+    sink = logging.StreamHandler(stream)
+    sink.setFormatter(JsonLogFormatter(build_secret_pattern(["sk-live-secret"])))
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue()
+    listener = QueueListener(log_queue, sink)
+
+    logger = logging.getLogger("json-queue-test")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(LogQueueHandler(log_queue))
+    logger.propagate = False
+
+    listener.start()
+    token = request_id_var.set("u1-m2-3")
+    payload = {"count": 1}
+    try:
+        logger.info("Payload %s", payload, extra={"user_id": 42, "note": "key sk-live-secret"})
+        payload["count"] = 2  # later mutation must not leak into the queued record
+    finally:
+        request_id_var.reset(token)
+        listener.stop()
+        logger.handlers.clear()
+
+    record = json.loads(stream.getvalue())
+    assert record["message"] == "Payload {'count': 1}"
+    assert record["request_id"] == "u1-m2-3"
+    assert record["user_id"] == 42
+    assert record["note"] == "key ***"
+    assert record["level"] == "INFO"
+
+
+def test_full_log_queue_drops_instead_of_blocking() -> None:
+    handler = LogQueueHandler(queue.Queue(maxsize=1))
+    logger = logging.getLogger("full-queue-test")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        for index in range(3):
+            logger.info("message %s", index)
+    finally:
+        logger.removeHandler(handler)
+
+    assert handler.dropped == 2
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_sampler_keeps_warnings_and_summarises_suppressed_records() -> None:
+    clock = _Clock()
+    sampler = LogSampler({"Acquired user request lock": 0.1}, rate_limit=5, window_sec=60, clock=clock)
+    stream = StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.addFilter(sampler)
+    logger = logging.getLogger("sampling-test")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        for _ in range(100):
+            logger.info("Acquired user request lock")
+        for index in range(10):
+            logger.info("Handling message %s", index)
+        logger.warning("Acquired user request lock")
+        clock.now += 61
+        logger.info("Handling message %s", "after window")
+    finally:
+        logger.removeHandler(handler)
+
+    lines = stream.getvalue().splitlines()
+    assert lines.count("Acquired user request lock") == 6  # 5 sampled (rate-limited) + the warning
+    assert sum(line.startswith("Handling message") for line in lines) == 6
+    assert "Suppressed 95 log records like 'Acquired user request lock' in the last 61s" in lines
+    assert "Suppressed 5 log records like 'Handling message %s' in the last 61s" in lines
+
+
+def test_parse_sample_rules_skips_invalid_items() -> None:
+    assert parse_sample_rules("a=0.5, bot.main=0 ,broken, c=x, d=3") == {"a": 0.5, "bot.main": 0.0, "d": 1.0}
+
+
+def test_sampling_is_off_unless_configured(monkeypatch) -> None:
+    for name in ("LOG_SAMPLE_RULES", "LOG_SAMPLE_DEFAULT", "LOG_RATE_LIMIT"):
+        monkeypatch.delenv(name, raising=False)
+    assert build_sampler_from_env() is None
+
+    monkeypatch.setenv("LOG_SAMPLE_RULES", "Acquired user request lock=0.01")
+    sampler = build_sampler_from_env()
+    assert sampler is not None and sampler.rules == {"Acquired user request lock": 0.01}
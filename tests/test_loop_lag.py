@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from core.loop_lag import LoopLagProbe
+from core.metrics import MetricsRegistry
+
+
+def test_probe_records_lag_into_histogram():
+    registry = MetricsRegistry()
+
+    async def run():
+        probe = LoopLagProbe(interval_sec=0.01, registry=registry)
+        await probe.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.12)  # block the loop
+        await asyncio.sleep(0.03)
+        await probe.stop()
+        return probe
+
+    probe = asyncio.run(run())
+
+    histogram = registry.get("bot_event_loop_lag_seconds")
+    assert histogram is not None and histogram.count >= 2
+    assert probe.max_lag_sec >= 0.08
+    assert not probe.running
+
+
+def test_debug_watchdog_captures_blocking_stack():
+    registry = MetricsRegistry()
+
+    def blocking_sqlite_call():
+        time.sleep(0.25)
+
+    async def run():
+        probe = LoopLagProbe(interval_sec=0.05, slow_callback_sec=0.05, debug=True, registry=registry)
+        await probe.start()
+        await asyncio.sleep(0.05)
+        blocking_sqlite_call()
+        await asyncio.sleep(0.1)
+        await probe.stop()
+        return probe
+
+    probe = asyncio.run(run())
+
+    assert probe.blocked, "watchdog did not report the stall"
+    assert "blocking_sqlite_call" in probe.blocked[0].stack
+    assert registry.get("bot_event_loop_blocked_seconds").count >= 1
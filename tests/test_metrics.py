@@ -0,0 +1,108 @@
+import asyncio
+import importlib
+import inspect
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from core.metrics import MetricsRegistry, MetricsServer, render_text
+
+
+def test_render_text_uses_prometheus_exposition_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("demo_requests_total", "Requests", ("route",))
+    requests.inc(route="/a")
+    requests.inc(2, route='say "hi"\n')
+    registry.gauge("demo_depth", "Queue depth").set_function(lambda: 7)
+    latency = registry.histogram("demo_seconds", "Latency", (0.1, 1.0), labelnames=("route",))
+    latency.observe(0.05, route="/a")
+    latency.observe(0.5, route="/a")
+    latency.observe(3.0, route="/a")
+
+    text = render_text(registry)
+
+    assert "# TYPE demo_requests_total counter" in text
+    assert 'demo_requests_total{route="/a"} 1' in text
+    assert 'route="say \\"hi\\"\\n"' in text
+    assert "demo_depth 7" in text
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{route="/a"} 3' in text
+    assert latency.quantile(0.5, route="/a") == 1.0
+
+
+def test_registry_rejects_wrong_labels_and_kind_clashes():
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "Demo", ("mode",))
+
+    assert registry.counter("demo_total", "Demo", ("mode",)) is counter
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
+    with pytest.raises(ValueError):
+        registry.gauge("demo_total", "Demo")
+
+
+def test_api_exposes_metrics_with_route_templates(monkeypatch):
+    monkeypatch.setenv("METRICS_TOKEN", "scrape-secret")
+    client = TestClient(app)
+    client.get("/api/health")
+
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'api_request_duration_seconds_count{method="GET",route="/api/health",status="200"}' in response.text
+
+
+def test_api_metrics_require_configured_token(monkeypatch):
+    client = TestClient(app)
+
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setenv("METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Basic scrape-secret"}).status_code == 401
+
+
+def test_metrics_server_serves_registry_over_http():
+    registry = MetricsRegistry()
+    registry.counter("demo_total", "Demo").inc(3)
+
+    async def run():
+        server = MetricsServer("127.0.0.1", 0, registry)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            await writer.drain()
+            payload = await reader.read()
+            writer.close()
+        finally:
+            await server.stop()
+        return payload.decode()
+
+    payload = asyncio.run(run())
+
+    assert payload.startswith("HTTP/1.1 200 OK")
+    assert "demo_total 3" in payload
+
+
+def test_db_query_functions_are_timed_explicitly(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "metrics.db"))
+    sys.modules.pop("core.db", None)
+    db = importlib.import_module("core.db")
+    db.init_db()
+    before = db.DB_QUERY_SECONDS.cumulative_counts(function="get_user")[-1][1]
+
+    db.ensure_user(1)
+    db.get_user(1)
+
+    assert db.DB_QUERY_SECONDS.cumulative_counts(function="get_user")[-1][1] == before + 1
+    assert "now" in inspect.signature(db.get_user).parameters
+    # get_user を呼ぶだけの薄い関数は二重に計測しない。
+    assert not hasattr(db.has_active_pass, "__wrapped__")
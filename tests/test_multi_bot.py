@@ -0,0 +1,186 @@
+import asyncio
+import importlib
+import sys
+import time
+
+import pytest
+from aiogram.types import Update
+
+from tools.fake_telegram import FakeTelegramSession
+
+PRIMARY_TOKEN = "123456:TESTTOKEN"
+ARISA_TOKEN = "654321:ARISATOKEN"
+
+
+def import_bot_main(monkeypatch, tmp_path, extra_bots=""):
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", PRIMARY_TOKEN)
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setenv("STATE_DB_PATH", str(tmp_path / "state.db"))
+    monkeypatch.setenv("EXTRA_BOTS", extra_bots)
+    monkeypatch.delenv("CHARACTER", raising=False)
+    for module in [name for name in sys.modules if name.startswith(("bot.handlers", "bot.utils"))]:
+        sys.modules.pop(module, None)
+    for module in ("core.config", "core.monetization", "core.db", "bot.main"):
+        sys.modules.pop(module, None)
+    return importlib.import_module("bot.main")
+
+
+class RecordingSession(FakeTelegramSession):
+    def __init__(self) -> None:
+        super().__init__()
+        self.texts: list[str] = []
+
+    async def make_request(self, bot, method, timeout=None):
+        text = getattr(method, "text", None)
+        if isinstance(text, str):
+            self.texts.append(text)
+        return await super().make_request(bot, method, timeout)
+
+
+def _start_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test", "language_code": "ja"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+def test_extra_bots_parsing(monkeypatch, tmp_path):
+    import_bot_main(monkeypatch, tmp_path, extra_bots=f" Arisa={ARISA_TOKEN} , tarot=1:abc,")
+    config = importlib.import_module("core.config")
+    telegram = importlib.import_module("bot.utils.telegram")
+
+    assert config.EXTRA_BOTS == (("arisa", ARISA_TOKEN), ("", "1:abc"))
+    assert [profile.mode for profile in telegram.BOT_PROFILES] == ["default", "arisa", "default"]
+    assert ARISA_TOKEN not in repr(telegram.BOT_PROFILES)
+
+    with pytest.raises(RuntimeError):
+        config._parse_extra_bots("arisa")
+
+
+def test_extra_bots_requires_single_polling_process(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_WORKERS", "2")
+    with pytest.raises(RuntimeError, match="EXTRA_BOTS"):
+        import_bot_main(monkeypatch, tmp_path, extra_bots=f"arisa={ARISA_TOKEN}")
+
+
+def test_single_bot_dispatcher_has_no_profile_middleware(monkeypatch, tmp_path):
+    bot_main = import_bot_main(monkeypatch, tmp_path)
+
+    dispatcher = bot_main.create_dispatcher()
+
+    assert not any(isinstance(m, bot_main.BotProfileMiddleware) for m in dispatcher.update.outer_middleware)
+    assert "bot.handlers.arisa" not in sys.modules
+
+
+def test_updates_are_routed_by_receiving_bot(monkeypatch, tmp_path):
+    bot_main = import_bot_main(monkeypatch, tmp_path, extra_bots=f"arisa={ARISA_TOKEN}")
+    telegram = importlib.import_module("bot.utils.telegram")
+    sessions = []
+    for runtime_bot in telegram.get_bots():
+        session = RecordingSession()
+        runtime_bot.session = session
+        sessions.append(session)
+    tarot_bot, arisa_bot = telegram.get_bots()
+    dispatcher = bot_main.create_dispatcher()
+
+    async def _run() -> None:
+        for runtime_bot, update_id, user_id in ((tarot_bot, 1, 7001), (arisa_bot, 2, 7002)):
+            update = Update.model_validate(_start_update(update_id, user_id), context={"bot": runtime_bot})
+            await dispatcher.feed_update(runtime_bot, update)
+
+    asyncio.run(_run())
+
+    tarot = importlib.import_module("bot.handlers.tarot")
+    arisa = importlib.import_module("bot.handlers.arisa")
+    tarot_texts, arisa_texts = sessions[0].texts, sessions[1].texts
+    assert len(tarot_texts) == 1 and len(arisa_texts) == 1
+    assert tarot.get_start_text(lang="ja") in tarot_texts[0]
+    assert arisa.get_arisa_start_text(lang="ja") in arisa_texts[0]
+    # 更新の外ではプライマリに戻る。
+    assert telegram.get_bot() is tarot_bot
+    assert telegram.current_mode() == "default"
+
+
+def test_store_texts_follow_current_bot(monkeypatch, tmp_path):
+    import_bot_main(monkeypatch, tmp_path, extra_bots=f"arisa={ARISA_TOKEN}")
+    telegram = importlib.import_module("bot.utils.telegram")
+    payments = importlib.import_module("bot.utils.payments")
+    _, arisa_bot = telegram.get_bots()
+
+    default_skus = {
+        button.callback_data for row in payments.build_store_keyboard("ja").inline_keyboard for button in row
+    }
+    with telegram.use_bot(arisa_bot) as profile:
+        assert profile.character == "arisa"
+        arisa_skus = {
+            button.callback_data for row in payments.build_store_keyboard("ja").inline_keyboard for button in row
+        }
+
+    assert any("ARISA_" in (data or "") for data in arisa_skus)
+    assert not any("ARISA_" in (data or "") for data in default_skus)
+
+
+def test_per_user_state_is_kept_per_bot(monkeypatch, tmp_path):
+    import_bot_main(monkeypatch, tmp_path, extra_bots=f"arisa={ARISA_TOKEN}")
+    telegram = importlib.import_module("bot.utils.telegram")
+    state = importlib.import_module("bot.utils.state")
+    inflight = importlib.import_module("bot.utils.inflight")
+    tarot_bot, arisa_bot = telegram.get_bots()
+    user_id = 7100
+
+    with telegram.use_bot(tarot_bot):
+        state.set_user_mode(user_id, "tarot")
+    with telegram.use_bot(arisa_bot):
+        state.set_user_mode(user_id, "charge")
+    with telegram.use_bot(tarot_bot):
+        assert state.get_user_mode(user_id) == "tarot"
+    with telegram.use_bot(arisa_bot):
+        assert state.get_user_mode(user_id) == "charge"
+
+    async def _run() -> list[str]:
+        # 占いボットで処理中でも、Arisa ボット側は「処理中」の案内なしでロックが取れる。
+        notices: list[str] = []
+
+        class _Message:
+            async def answer(self, text: str) -> None:
+                notices.append(text)
+
+        with telegram.use_bot(tarot_bot):
+            release_tarot = await inflight.acquire_inflight(user_id, _Message(), busy_message="busy")
+        with telegram.use_bot(arisa_bot):
+            release_arisa = await asyncio.wait_for(
+                inflight.acquire_inflight(user_id, _Message(), busy_message="busy"), 1
+            )
+        assert len(inflight.IN_FLIGHT_USERS) == 2
+        release_arisa()
+        release_tarot()
+        return notices
+
+    assert asyncio.run(_run()) == []
+    assert inflight.IN_FLIGHT_USERS == set()
+
+
+def test_throttle_buckets_are_kept_per_bot(monkeypatch, tmp_path):
+    bot_main = import_bot_main(monkeypatch, tmp_path, extra_bots=f"arisa={ARISA_TOKEN}")
+    telegram = importlib.import_module("bot.utils.telegram")
+    tarot_bot, arisa_bot = telegram.get_bots()
+    throttle = bot_main.message_throttle
+
+    with telegram.use_bot(tarot_bot):
+        assert throttle._take(7200)
+        assert not throttle._take(7200)
+    with telegram.use_bot(arisa_bot):
+        assert throttle._take(7200)
+
+
+def test_extra_bots_reject_duplicate_characters(monkeypatch, tmp_path):
+    with pytest.raises(RuntimeError, match="same character"):
+        import_bot_main(monkeypatch, tmp_path, extra_bots=f"arisa={ARISA_TOKEN},arisa=1:abc")
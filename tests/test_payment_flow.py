@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import importlib
 from datetime import datetime, timedelta, timezone
 
 import pytest
@@ -8,33 +9,35 @@ from tests.test_bot_modes import import_bot_main
 
 
 def test_parse_invoice_payload_variants(monkeypatch):
-    bot_main = import_bot_main(monkeypatch)
+    import_bot_main(monkeypatch)
+    payments = importlib.import_module("bot.utils.payments")
 
-    sku, user_id = bot_main._parse_invoice_payload('{"sku": "TICKET_3", "user_id": "77"}')
+    sku, user_id = payments.parse_invoice_payload('{"sku": "TICKET_3", "user_id": "77"}')
     assert sku == "TICKET_3"
     assert user_id == 77
 
-    bad_json = bot_main._parse_invoice_payload("not-json")
+    bad_json = payments.parse_invoice_payload("not-json")
     assert bad_json == (None, None)
 
-    missing_fields = bot_main._parse_invoice_payload('{"sku": null, "user_id": "abc"}')
+    missing_fields = payments.parse_invoice_payload('{"sku": null, "user_id": "abc"}')
     assert missing_fields == (None, None)
 
-    list_payload = bot_main._parse_invoice_payload('["not", "dict"]')
+    list_payload = payments.parse_invoice_payload('["not", "dict"]')
     assert list_payload == (None, None)
 
 
 def test_purchase_dedup_respects_ttl(monkeypatch):
-    bot_main = import_bot_main(monkeypatch)
-    bot_main.PENDING_PURCHASES = {}
-    monkeypatch.setattr(bot_main, "PURCHASE_DEDUP_TTL_SECONDS", 0.1)
+    import_bot_main(monkeypatch)
+    payments = importlib.import_module("bot.utils.payments")
+    payments.PENDING_PURCHASES.clear()
+    monkeypatch.setattr(payments, "PURCHASE_DEDUP_TTL_SECONDS", 0.1)
 
     clock = iter([10.0, 10.05, 10.2])
-    monkeypatch.setattr(bot_main, "monotonic", lambda: next(clock))
+    monkeypatch.setattr(payments, "monotonic", lambda: next(clock))
 
-    first = bot_main._check_purchase_dedup(1, "PASS_7D")
-    dup_hit = bot_main._check_purchase_dedup(1, "PASS_7D")
-    after_ttl = bot_main._check_purchase_dedup(1, "PASS_7D")
+    first = payments.check_purchase_dedup(1, "PASS_7D")
+    dup_hit = payments.check_purchase_dedup(1, "PASS_7D")
+    after_ttl = payments.check_purchase_dedup(1, "PASS_7D")
 
     assert first is False
     assert dup_hit is True
@@ -42,17 +45,20 @@ def test_purchase_dedup_respects_ttl(monkeypatch):
 
 
 def test_status_reflects_purchase_and_pass(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
+    db = importlib.import_module("core.db")
+    monetization = importlib.import_module("core.monetization")
 
     now = datetime(2024, 1, 1, tzinfo=timezone.utc)
     user_id = 24601
-    bot_main.ensure_user(user_id, now=now)
+    db.ensure_user(user_id, now=now)
 
-    granted = bot_main.grant_purchase(user_id, "PASS_7D", now=now)
-    assert bot_main.effective_has_pass(user_id, granted, now=now + timedelta(seconds=1))
+    granted = db.grant_purchase(user_id, "PASS_7D", now=now)
+    assert monetization.effective_has_pass(user_id, granted, now=now + timedelta(seconds=1))
 
     payment_time = now + timedelta(minutes=5)
-    bot_main.log_payment(
+    db.log_payment(
         user_id=user_id,
         sku="PASS_7D",
         stars=1000,
@@ -61,9 +67,9 @@ def test_status_reflects_purchase_and_pass(monkeypatch, tmp_path):
         now=payment_time,
     )
 
-    status = bot_main.format_status(granted, now=payment_time)
-    expected_until = (now + timedelta(days=7)).astimezone(bot_main.USAGE_TIMEZONE).strftime("%Y-%m-%d %H:%M JST")
-    purchase_stamp = payment_time.astimezone(bot_main.USAGE_TIMEZONE).strftime("%Y-%m-%d %H:%M JST")
+    status = tarot.format_status(granted, now=payment_time)
+    expected_until = (now + timedelta(days=7)).astimezone(db.USAGE_TIMEZONE).strftime("%Y-%m-%d %H:%M JST")
+    purchase_stamp = payment_time.astimezone(db.USAGE_TIMEZONE).strftime("%Y-%m-%d %H:%M JST")
 
     assert expected_until in status
     assert "直近の購入" in status and "PASS_7D" in status
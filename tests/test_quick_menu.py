@@ -1,4 +1,5 @@
 import asyncio
+import importlib
 
 from aiogram.types import ReplyKeyboardMarkup
 
@@ -49,30 +50,34 @@ def test_base_menu_layout_pt():
 
 
 def test_help_and_terms_attach_quick_menu(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
+    store = importlib.import_module("bot.handlers.store")
 
     help_message = DummyMessage("/help", user_id=1)
-    asyncio.run(bot_main.cmd_help(help_message))
+    asyncio.run(tarot.cmd_help(help_message))
 
     assert any(isinstance(markup, ReplyKeyboardMarkup) for markup in help_message.reply_markups)
 
     terms_message = DummyMessage("/terms", user_id=2)
-    asyncio.run(bot_main.cmd_terms(terms_message))
+    asyncio.run(store.cmd_terms(terms_message))
 
     assert any(isinstance(markup, ReplyKeyboardMarkup) for markup in terms_message.reply_markups)
 
 
 def test_safety_notice_resets_state(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    state = importlib.import_module("bot.utils.state")
+    safety = importlib.import_module("bot.utils.safety")
     user_id = 3
-    bot_main.set_user_mode(user_id, "tarot")
-    bot_main.set_tarot_flow(user_id, "awaiting_question")
+    state.set_user_mode(user_id, "tarot")
+    state.set_tarot_flow(user_id, "awaiting_question")
 
     message = DummyMessage("病気について", user_id=user_id)
 
-    handled = asyncio.run(bot_main.respond_with_safety_notice(message, "病気について"))
+    handled = asyncio.run(safety.respond_with_safety_notice(message, "病気について"))
 
     assert handled is True
-    assert bot_main.USER_MODE.get(user_id) is None
-    assert bot_main.TAROT_FLOW.get(user_id) is None
+    assert state.USER_MODE.get(user_id) is None
+    assert state.TAROT_FLOW.get(user_id) is None
     assert any(isinstance(markup, ReplyKeyboardMarkup) for markup in message.reply_markups)
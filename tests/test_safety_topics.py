@@ -1,4 +1,5 @@
 import asyncio
+import importlib
 
 import pytest
 
@@ -6,27 +7,30 @@ from tests.test_bot_modes import DummyMessage, import_bot_main
 
 
 @pytest.fixture()
-def bot_main(monkeypatch, tmp_path):
-    return import_bot_main(monkeypatch, tmp_path)
+def tarot(monkeypatch, tmp_path):
+    import_bot_main(monkeypatch, tmp_path)
+    return importlib.import_module("bot.handlers.tarot")
 
 
-def test_sensitive_topic_classification(bot_main):
-    topics = bot_main.classify_sensitive_topics("頭痛が続いて診断が必要です。")
+def test_sensitive_topic_classification(tarot):
+    safety = importlib.import_module("bot.utils.safety")
+    topics = safety.classify_sensitive_topics("頭痛が続いて診断が必要です。")
     assert "medical" in topics
     assert "investment" not in topics
 
 
-def test_sensitive_topic_short_circuits_llm(monkeypatch, bot_main):
+def test_sensitive_topic_short_circuits_llm(monkeypatch, tarot):
     calls = {"llm": False}
 
     async def fake_call(messages):
         calls["llm"] = True
         return "LLM should not be called", False
 
-    monkeypatch.setattr(bot_main, "call_openai_with_retry", fake_call)
+    for module in (tarot, importlib.import_module("bot.handlers.consult")):
+        monkeypatch.setattr(module, "call_openai_with_retry", fake_call)
     message = DummyMessage("裁判や診断について教えてほしい", user_id=77)
 
-    asyncio.run(bot_main.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
 
     assert message.answers
     assert any("占いとしては" in ans for ans in message.answers)
@@ -0,0 +1,217 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+
+from bot.middlewares.send_scheduler import SendScheduler, SendSchedulerMiddleware
+
+
+class FakeClock:
+    """Virtual time: the earliest pending sleeper advances the clock."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self._pending: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        target = self.now + seconds
+        self._pending.append(target)
+        try:
+            while self.now < target:
+                await asyncio.sleep(0)
+                if target <= min(self._pending):
+                    self.now = target
+        finally:
+            self._pending.remove(target)
+
+
+def _scheduler(clock: FakeClock, **kwargs) -> SendScheduler:
+    options = {
+        "global_rate_per_sec": 30.0,
+        "global_burst": 30.0,
+        "chat_rate_per_sec": 1.0,
+        "chat_burst": 2.0,
+    }
+    options.update(kwargs)
+    return SendScheduler(clock=clock, sleep=clock.sleep, **options)
+
+
+def test_per_chat_sends_are_paced_and_ordered():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+    sent: list[tuple[int, float]] = []
+
+    def make_send(index: int):
+        async def _send():
+            sent.append((index, clock.now))
+            await asyncio.sleep(0)
+            return index
+
+        return _send
+
+    async def run():
+        return await asyncio.gather(*(scheduler.submit(1, make_send(i)) for i in range(4)))
+
+    results = asyncio.run(run())
+
+    assert results == [0, 1, 2, 3]
+    assert [index for index, _ in sent] == [0, 1, 2, 3]
+    # Two sends fit the burst, the rest wait one second each.
+    assert [at for _, at in sent] == [0.0, 0.0, 1.0, 2.0]
+    assert scheduler.queue_depth() == 0
+    assert scheduler.stats.max_queue_depth == 4
+    assert scheduler.stats.sent == 4
+
+
+def test_global_limit_spans_chats():
+    clock = FakeClock()
+    scheduler = _scheduler(clock, global_rate_per_sec=2.0, global_burst=2.0)
+    sent_at: list[float] = []
+
+    async def _send():
+        sent_at.append(clock.now)
+
+    async def run():
+        await asyncio.gather(*(scheduler.submit(chat_id, _send) for chat_id in range(4)))
+
+    asyncio.run(run())
+
+    assert sent_at == [0.0, 0.0, 0.5, 1.0]
+
+
+def test_retry_after_pauses_chat_and_retries():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+    attempts: list[float] = []
+
+    async def _send():
+        attempts.append(clock.now)
+        if len(attempts) == 1:
+            raise TelegramRetryAfter(
+                method=SendMessage(chat_id=7, text="hi"),
+                message="Too Many Requests",
+                retry_after=3,
+            )
+        return "ok"
+
+    assert asyncio.run(scheduler.submit(7, _send)) == "ok"
+    assert attempts[1] - attempts[0] >= 3
+    assert scheduler.stats.retry_after_hits == 1
+    assert scheduler.stats.failed == 0
+
+
+def test_retry_after_gives_up_after_max_retries():
+    clock = FakeClock()
+    scheduler = _scheduler(clock, max_retries=1)
+
+    async def _send():
+        raise TelegramRetryAfter(
+            method=SendMessage(chat_id=7, text="hi"), message="Too Many Requests", retry_after=1
+        )
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(scheduler.submit(7, _send))
+    assert scheduler.stats.failed == 1
+    assert scheduler.queue_depth() == 0
+
+
+def test_middleware_only_schedules_chat_messages():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+    middleware = SendSchedulerMiddleware(scheduler)
+    seen: list[str] = []
+
+    async def make_request(bot, method):
+        seen.append(type(method).__name__)
+        return True
+
+    async def run():
+        await middleware(make_request, None, SendMessage(chat_id=1, text="a"))
+        await middleware(make_request, None, AnswerCallbackQuery(callback_query_id="q"))
+
+    asyncio.run(run())
+
+    assert seen == ["SendMessage", "AnswerCallbackQuery"]
+    assert scheduler.stats.sent == 1
+
+
+def test_chat_buckets_expire_once_refilled():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+
+    async def _send():
+        return None
+
+    async def run():
+        await asyncio.gather(*(scheduler.submit(chat_id, _send) for chat_id in range(1000)))
+
+    asyncio.run(run())
+    assert len(scheduler.chat_buckets) == 1000
+
+    clock.now += 2.0  # chat_burst / chat_rate_per_sec
+    assert scheduler.chat_buckets.sweep() == 1000
+    assert len(scheduler.chat_buckets) == 0
+
+
+def test_retry_after_pauses_other_chats_too():
+    clock = FakeClock()
+    waits: list[tuple[int, float]] = []
+    attempts: list[int] = []
+    current: list[int] = []
+
+    async def sleep(seconds: float) -> None:
+        waits.append((current[-1], seconds))
+        if len(waits) == 1:
+            # チャット 7 が flood wait 中に、別のチャットから送ろうとする。
+            current.append(8)
+            await scheduler.submit(8, make_send(8))
+            current.pop()
+        clock.now += seconds
+
+    scheduler = SendScheduler(clock=clock, sleep=sleep, chat_rate_per_sec=1.0, chat_burst=2.0)
+
+    def make_send(chat_id: int):
+        async def _send():
+            attempts.append(chat_id)
+            if attempts == [7]:
+                raise TelegramRetryAfter(
+                    method=SendMessage(chat_id=7, text="hi"), message="Too Many Requests", retry_after=5
+                )
+
+        return _send
+
+    current.append(7)
+    asyncio.run(scheduler.submit(7, make_send(7)))
+
+    assert attempts == [7, 8, 7]
+    assert waits[0][0] == 7 and waits[0][1] >= 5.0
+    # チャット 8 も全体のバケットで約 5 秒待たされた。
+    assert waits[1][0] == 8 and waits[1][1] >= 4.9
+
+
+def test_send_latency_is_exported_as_histograms():
+    from bot.middlewares.send_scheduler import SEND_LATENCY_SECONDS, SEND_WAIT_SECONDS
+
+    clock = FakeClock()
+    scheduler = _scheduler(clock, chat_burst=1.0)
+    ok_before = SEND_LATENCY_SECONDS.cumulative_counts(outcome="ok")[-1][1]
+    waits_before = SEND_WAIT_SECONDS.cumulative_counts()
+
+    async def _send():
+        return None
+
+    async def run():
+        await asyncio.gather(scheduler.submit(3, _send), scheduler.submit(3, _send))
+
+    asyncio.run(run())
+
+    assert SEND_LATENCY_SECONDS.cumulative_counts(outcome="ok")[-1][1] - ok_before == 2
+    waits_after = SEND_WAIT_SECONDS.cumulative_counts()
+    # 2 通目は 1 秒待ったので、0.5 秒以下のバケットには 1 件しか増えない。
+    under_half = dict(waits_after)[0.5] - dict(waits_before)[0.5]
+    assert under_half == 1
+    assert waits_after[-1][1] - waits_before[-1][1] == 2
@@ -0,0 +1,194 @@
+import asyncio
+import importlib
+import sys
+from types import SimpleNamespace
+
+
+def import_shutdown(monkeypatch, tmp_path):
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    for module in [name for name in sys.modules if name.startswith(("bot.utils", "bot.shutdown"))]:
+        sys.modules.pop(module, None)
+    for module in ("core.config", "core.db"):
+        sys.modules.pop(module, None)
+    return importlib.import_module("bot.shutdown")
+
+
+class FakeStatus:
+    def __init__(self, chat_id: int, message_id: int) -> None:
+        self.chat = SimpleNamespace(id=chat_id)
+        self.message_id = message_id
+        self.edits: list[str] = []
+
+    async def edit_text(self, text: str, **kwargs) -> None:
+        self.edits.append(text)
+
+
+class FakeMessage:
+    def __init__(self, chat_id: int) -> None:
+        self.chat_id = chat_id
+        self.sent: list[FakeStatus] = []
+
+    async def answer(self, text: str, **kwargs) -> FakeStatus:
+        status = FakeStatus(self.chat_id, 100 + len(self.sent))
+        self.sent.append(status)
+        return status
+
+
+def test_drain_waits_for_running_updates(monkeypatch, tmp_path):
+    shutdown = import_shutdown(monkeypatch, tmp_path)
+    inflight: set[int] = set()
+    coordinator = shutdown.ShutdownCoordinator(inflight, timeout_sec=2.0, poll_interval_sec=0.01)
+    finished: list[int] = []
+
+    async def handler(event, data):
+        inflight.add(event)
+        await asyncio.sleep(0.05)
+        inflight.discard(event)
+        finished.append(event)
+
+    async def _run():
+        tasks = [asyncio.create_task(coordinator(handler, user_id, {})) for user_id in (1, 2, 3)]
+        await asyncio.sleep(0)
+        assert coordinator.active == 3
+        report = await coordinator.drain()
+        await asyncio.gather(*tasks)
+        return report
+
+    report = asyncio.run(_run())
+
+    assert sorted(finished) == [1, 2, 3]
+    assert (report.drained, report.abandoned, report.inflight_users) == (3, 0, 3)
+    assert report.elapsed_sec < 1.0
+
+
+def test_drain_abandons_after_deadline_and_rewrites_status(monkeypatch, tmp_path):
+    shutdown = import_shutdown(monkeypatch, tmp_path)
+    telegram = importlib.import_module("bot.utils.telegram")
+    coordinator = shutdown.ShutdownCoordinator(set(), timeout_sec=0.05, poll_interval_sec=0.01)
+    message = FakeMessage(chat_id=42)
+    deleted: list[object] = []
+
+    async def fake_safe_delete(status):
+        deleted.append(status)
+
+    monkeypatch.setattr(telegram, "safe_delete_message", fake_safe_delete)
+
+    async def fast(event, data):
+        status = await telegram.send_status_message(message, "working")
+        await telegram.delete_status_message(status)
+
+    async def slow(event, data):
+        status = await telegram.send_status_message(message, "working")
+        try:
+            await asyncio.sleep(10)
+        finally:
+            await telegram.delete_status_message(status)
+
+    async def _run():
+        await coordinator(fast, None, {})
+        task = asyncio.create_task(coordinator(slow, None, {}))
+        await asyncio.sleep(0.01)
+        report = await coordinator.drain()
+        return report, task
+
+    report, task = asyncio.run(_run())
+
+    assert task.cancelled()
+    assert (report.drained, report.abandoned, report.status_messages) == (0, 1, 1)
+    fast_status, slow_status = message.sent
+    assert deleted == [fast_status]
+    assert slow_status.edits == [telegram.t("ja", "READING_INTERRUPTED_NOTICE")]
+    assert telegram.STATUS_MESSAGES == {}
+    assert shutdown.SHUTDOWN_UPDATES.value(outcome="abandoned") >= 1
+
+
+def test_drain_counts_queued_backlog(monkeypatch, tmp_path):
+    shutdown = import_shutdown(monkeypatch, tmp_path)
+    coordinator = shutdown.ShutdownCoordinator(set(), timeout_sec=0.05, poll_interval_sec=0.01)
+    queue = [1, 2]
+
+    async def _run():
+        return await coordinator.drain(backlog=lambda: len(queue))
+
+    report = asyncio.run(_run())
+
+    assert (report.drained, report.abandoned) == (0, 2)
+
+
+def _import_bot_main(monkeypatch, tmp_path):
+    monkeypatch.setenv("STATE_DB_PATH", str(tmp_path / "state.db"))
+    import_shutdown(monkeypatch, tmp_path)
+    for module in ("core.monetization", "bot.main"):
+        sys.modules.pop(module, None)
+    for module in [name for name in sys.modules if name.startswith("bot.handlers")]:
+        sys.modules.pop(module, None)
+    return importlib.import_module("bot.main")
+
+
+def test_graceful_shutdown_flushes_logs_last(monkeypatch, tmp_path):
+    bot_main = _import_bot_main(monkeypatch, tmp_path)
+    calls: list[str] = []
+
+    class FakeSession:
+        async def close(self) -> None:
+            calls.append("close_session")
+
+    async def fake_stop_background_tasks() -> None:
+        calls.append("stop_background_tasks")
+
+    monkeypatch.setattr(bot_main, "stop_background_tasks", fake_stop_background_tasks)
+    monkeypatch.setattr(bot_main, "get_bots", lambda: [SimpleNamespace(session=FakeSession())])
+    monkeypatch.setattr(bot_main, "shutdown_logging", lambda: calls.append("shutdown_logging"))
+
+    asyncio.run(bot_main.graceful_shutdown())
+
+    # webhook やワーカーの停止もこの関数を通るので、キューのログが捨てられない。
+    assert calls == ["stop_background_tasks", "close_session", "shutdown_logging"]
+
+
+def test_sharded_polling_runs_the_shared_shutdown(monkeypatch, tmp_path):
+    bot_main = _import_bot_main(monkeypatch, tmp_path)
+    calls: list[str] = []
+
+    class FakeSupervisor:
+        def start(self) -> None:
+            calls.append("start")
+
+        def check(self) -> None:
+            pass
+
+        def stop(self) -> None:
+            calls.append("stop_workers")
+
+    class FakeBot:
+        async def delete_webhook(self, **kwargs) -> None:
+            pass
+
+        async def get_updates(self, **kwargs):
+            raise asyncio.CancelledError
+
+    async def noop() -> None:
+        pass
+
+    async def fake_graceful_shutdown(pool=None) -> None:
+        calls.append("graceful_shutdown")
+
+    monkeypatch.setattr(bot_main, "prepare_runtime", noop)
+    monkeypatch.setattr(bot_main, "_build_worker_supervisor", FakeSupervisor)
+    monkeypatch.setattr(bot_main, "get_bot", FakeBot)
+    monkeypatch.setattr(
+        bot_main, "get_dispatcher", lambda: SimpleNamespace(resolve_used_update_types=lambda: [])
+    )
+    monkeypatch.setattr(bot_main, "graceful_shutdown", fake_graceful_shutdown)
+
+    async def _run() -> None:
+        try:
+            await bot_main.run_sharded_polling()
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(_run())
+
+    assert calls == ["start", "stop_workers", "graceful_shutdown"]
@@ -0,0 +1,188 @@
+import asyncio
+import importlib
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+from core.state_store import StateField, StateStore, StateStoreStorage
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_state_survives_store_restart(tmp_path):
+    path = tmp_path / "state.db"
+    store = StateStore(path, ttl=timedelta(minutes=20))
+    store.set("conv:1", {"mode": "tarot"})
+    store.set("conv:2", {"mode": "consult"})
+    store.delete("conv:2")
+    assert store.get("conv:1") == {"mode": "tarot"}
+    assert store.flush() == 2
+
+    reopened = StateStore(path, ttl=timedelta(minutes=20))
+
+    assert reopened.get("conv:1") == {"mode": "tarot"}
+    assert reopened.get("conv:2") is None
+    assert reopened.stats.loads == 2
+
+
+def test_expired_keys_are_hidden_and_purged_in_bulk(tmp_path):
+    clock = FakeClock()
+    store = StateStore(tmp_path / "state.db", ttl=timedelta(minutes=20), clock=clock)
+    for user_id in range(5):
+        store.set(f"conv:{user_id}", {"mode": "tarot"})
+    store.set("conv:long", {"mode": "tarot"}, ttl=timedelta(hours=2))
+    store.flush()
+
+    clock.now += 21 * 60
+
+    assert store.get("conv:0") is None
+    assert store.purge_expired() == 5
+    assert store.keys("conv:") == ["conv:long"]
+
+
+def test_background_flush_writes_off_the_event_loop(tmp_path):
+    store = StateStore(tmp_path / "state.db", ttl=timedelta(minutes=20), max_entries=1)
+    writing = threading.Event()
+    release = threading.Event()
+    write_batch = store._write_batch
+    threads = []
+
+    def slow_write_batch(pending):
+        threads.append(threading.get_ident())
+        writing.set()
+        release.wait(5)
+        write_batch(pending)
+
+    store._write_batch = slow_write_batch
+
+    async def scenario():
+        store.set("a", 1)
+        store.set("b", 2)  # "a" は LRU から追い出される
+        flush = asyncio.create_task(store.flush_async())
+        await asyncio.get_running_loop().run_in_executor(None, writing.wait, 5)
+        # 書き込み中もループは動き、書き込み中のバッチが読める。
+        assert store.get("a") == 1
+        assert store.pending_writes() == 0
+        release.set()
+        assert await flush == 2
+
+    asyncio.run(scenario())
+
+    assert threads and threads[0] != threading.get_ident()
+    assert StateStore(tmp_path / "state.db", ttl=timedelta(minutes=20)).get("a") == 1
+
+
+def test_evicted_pending_write_is_not_lost(tmp_path):
+    store = StateStore(tmp_path / "state.db", ttl=timedelta(minutes=20), max_entries=2)
+    store.set("a", 1)
+    store.set("b", 2)
+    store.set("c", 3)
+
+    assert store.stats.evictions == 1
+    assert store.get("a") == 1
+    assert store.stats.loads == 0
+
+
+def test_state_field_shares_one_record_per_user(tmp_path):
+    store = StateStore(tmp_path / "state.db", ttl=timedelta(minutes=20))
+    modes: StateField[str] = StateField(store, "mode")
+    last_active: StateField[datetime] = StateField(
+        store, "last_active", encode=datetime.isoformat, decode=datetime.fromisoformat
+    )
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    modes[7] = "tarot"
+    last_active[7] = now
+
+    assert store.get("conv:7") == {"mode": "tarot", "last_active": now.isoformat()}
+    assert last_active.get(7) == now
+    assert 7 in modes and 8 not in modes
+    assert modes.scan_user_ids() == [7]
+    assert modes.pop(7) == "tarot"
+    del last_active[7]
+    assert store.get("conv:7") is None
+    assert modes.get(7, "consult") == "consult"
+
+
+class Flow(StatesGroup):
+    asking = State()
+
+
+def test_fsm_storage_roundtrip_across_restart(tmp_path):
+    path = tmp_path / "state.db"
+    key = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+    async def write():
+        storage = StateStoreStorage(StateStore(path, ttl=timedelta(minutes=20)))
+        await storage.set_state(key, Flow.asking)
+        await storage.update_data(key, {"theme": "love"})
+        await storage.close()
+
+    async def read():
+        storage = StateStoreStorage(StateStore(path, ttl=timedelta(minutes=20)))
+        return await storage.get_state(key), await storage.get_data(key)
+
+    asyncio.run(write())
+
+    assert asyncio.run(read()) == (Flow.asking.state, {"theme": "love"})
+
+
+def _import_bot_state(monkeypatch, tmp_path):
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123:ABC")
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "bot.db"))
+    for module in [name for name in sys.modules if name.startswith(("bot.handlers", "bot.utils"))]:
+        sys.modules.pop(module, None)
+    for module in ("core.config", "core.monetization", "core.db", "bot.main"):
+        sys.modules.pop(module, None)
+    importlib.import_module("bot.main")
+    return importlib.import_module("bot.utils.state")
+
+
+def test_bot_conversation_state_survives_restart(monkeypatch, tmp_path):
+    state = _import_bot_state(monkeypatch, tmp_path)
+    state.set_user_mode(5, "tarot")
+    state.set_tarot_flow(5, "awaiting_question")
+    state.set_tarot_theme(5, "work")
+    state.state_store.flush()
+
+    restarted = _import_bot_state(monkeypatch, tmp_path)
+
+    assert restarted.get_user_mode(5) == "tarot"
+    assert restarted.TAROT_FLOW.get(5) == "awaiting_question"
+    assert restarted.get_tarot_theme(5) == "work"
+
+
+def test_bot_mode_and_language_survive_long_idle(monkeypatch, tmp_path):
+    state = _import_bot_state(monkeypatch, tmp_path)
+    now = [1000.0]
+    monkeypatch.setattr(state.state_store, "_clock", lambda: now[0])
+    state.set_user_mode(5, "tarot")
+    state.set_tarot_flow(5, "awaiting_question")
+    state.mark_user_active(5)
+    state.store_user_lang(5, "en")
+
+    # 操作が続く間は占いの進行も残る。
+    now[0] += timedelta(minutes=25).total_seconds()
+    state.mark_user_active(5)
+    now[0] += timedelta(minutes=25).total_seconds()
+    assert state.TAROT_FLOW.get(5) == "awaiting_question"
+
+    # 2 時間放置すると進行は消えるが、モードと最終操作時刻は残る（リセットはハンドラーが案内付きで行う）。
+    now[0] += timedelta(hours=2).total_seconds()
+    state.state_store.purge_expired()
+    state.USER_LANG_CACHE.clear()
+
+    assert state.TAROT_FLOW.get(5) is None
+    assert state.get_user_mode(5) == "tarot"
+    assert state.USER_STATE_LAST_ACTIVE.get(5) is not None
+    assert state.get_user_lang_or_default(5) == "en"
@@ -0,0 +1,196 @@
+import asyncio
+import importlib
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+
+def import_inflight(monkeypatch, tmp_path, modes="tarot,consult"):
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setenv("SUPERSEDE_MODES", modes)
+    for module in [name for name in sys.modules if name.startswith("bot.utils")]:
+        sys.modules.pop(module, None)
+    for module in ("core.config", "core.db"):
+        sys.modules.pop(module, None)
+    return importlib.import_module("bot.utils.inflight")
+
+
+def test_unknown_supersede_mode_is_rejected(monkeypatch, tmp_path):
+    with pytest.raises(RuntimeError, match="SUPERSEDE_MODES"):
+        import_inflight(monkeypatch, tmp_path, modes="tarot,unknown")
+
+
+def test_newer_message_cancels_waiting_llm_call(monkeypatch, tmp_path):
+    inflight = import_inflight(monkeypatch, tmp_path)
+    calls: list[str] = []
+
+    async def fake_llm(text: str, delay: float) -> str:
+        calls.append(text)
+        await asyncio.sleep(delay)
+        return f"answer:{text}"
+
+    async def request(text: str, delay: float) -> str:
+        try:
+            release = await inflight.acquire_inflight(1, mode="tarot")
+        except inflight.Superseded:
+            return "superseded"
+        try:
+            return await inflight.run_supersedable(1, "tarot", fake_llm(text, delay))
+        except inflight.Superseded:
+            return "superseded"
+        finally:
+            release()
+
+    async def _run():
+        first = asyncio.create_task(request("first", 10))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(request("second", 0.01))
+        return await asyncio.gather(first, second)
+
+    results = asyncio.run(_run())
+
+    assert results == ["superseded", "answer:second"]
+    assert calls == ["first", "second"]
+    assert inflight.SUPERSEDED_REQUESTS.value(mode="tarot", stage="in_flight") == 1
+    assert inflight.LATEST_REQUESTS == {} and inflight.PENDING_CALLS == {}
+
+
+def test_burst_only_answers_last_message(monkeypatch, tmp_path):
+    inflight = import_inflight(monkeypatch, tmp_path)
+    calls: list[str] = []
+
+    async def fake_llm(text: str) -> str:
+        calls.append(text)
+        await asyncio.sleep(0.02)
+        return text
+
+    async def request(text: str) -> str:
+        try:
+            release = await inflight.acquire_inflight(1, mode="consult")
+        except inflight.Superseded:
+            return "superseded"
+        try:
+            return await inflight.run_supersedable(1, "consult", fake_llm(text))
+        except inflight.Superseded:
+            return "superseded"
+        finally:
+            release()
+
+    async def _run():
+        return await asyncio.gather(*(request(text) for text in ("a", "b", "c")))
+
+    results = asyncio.run(_run())
+
+    assert results == ["superseded", "superseded", "c"]
+    # a は応答待ちに入った直後に、b はロック待ちのまま置き換えられた。
+    assert calls == ["c"]
+    assert inflight.SUPERSEDED_REQUESTS.value(mode="consult", stage="queued") == 1
+    assert inflight.SUPERSEDED_REQUESTS.value(mode="consult", stage="in_flight") == 1
+
+
+def test_consult_does_not_cancel_tarot_in_either_stage(monkeypatch, tmp_path):
+    inflight = import_inflight(monkeypatch, tmp_path)
+
+    async def request(mode: str, text: str, *, pause: float = 0.0) -> str:
+        try:
+            release = await inflight.acquire_inflight(1, mode=mode)
+        except inflight.Superseded:
+            return "superseded"
+        try:
+            await asyncio.sleep(pause)
+            return await inflight.run_supersedable(1, mode, asyncio.sleep(0.03, result=text))
+        except inflight.Superseded:
+            return "superseded"
+        finally:
+            release()
+
+    async def _run():
+        # 1 件目: consult が届いた時点ではまだ LLM 前。2 件目: LLM 応答待ちの最中。
+        before_call = asyncio.create_task(request("tarot", "before", pause=0.02))
+        await asyncio.sleep(0.01)
+        first_consult = asyncio.create_task(request("consult", "consult-1"))
+        first = await asyncio.gather(before_call, first_consult)
+        during_call = asyncio.create_task(request("tarot", "during"))
+        await asyncio.sleep(0.01)
+        second_consult = asyncio.create_task(request("consult", "consult-2"))
+        second = await asyncio.gather(during_call, second_consult)
+        return first + second
+
+    results = asyncio.run(_run())
+
+    assert results == ["before", "consult-1", "during", "consult-2"]
+    assert inflight.LATEST_REQUESTS == {} and inflight.PENDING_CALLS == {}
+
+
+def test_supersede_maps_expire_without_cancelling_the_live_request(monkeypatch, tmp_path):
+    inflight = import_inflight(monkeypatch, tmp_path)
+    now = [0.0]
+    monkeypatch.setattr(inflight.LATEST_REQUESTS, "_clock", lambda: now[0])
+    monkeypatch.setattr(inflight.PENDING_CALLS, "_clock", lambda: now[0])
+
+    async def _run():
+        release = await inflight.acquire_inflight(1, mode="tarot")
+        started = asyncio.Event()
+
+        async def slow_llm() -> str:
+            started.set()
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        call = asyncio.create_task(inflight.run_supersedable(1, "tarot", slow_llm()))
+        await started.wait()
+        now[0] += inflight.USER_LOCK_TTL_SEC + 1
+        # 応答待ちの呼び出しは残り、番号だけが期限切れで消える。
+        inflight.LATEST_REQUESTS.sweep()
+        inflight.PENDING_CALLS.sweep()
+        assert len(inflight.LATEST_REQUESTS) == 0 and len(inflight.PENDING_CALLS) == 1
+        try:
+            return await call
+        finally:
+            release()
+
+    assert asyncio.run(_run()) == "answer"
+    assert inflight.PENDING_CALLS == {}
+
+
+def test_modes_outside_setting_keep_queueing(monkeypatch, tmp_path):
+    inflight = import_inflight(monkeypatch, tmp_path, modes="consult")
+    answered: list[str] = []
+
+    async def request(text: str) -> None:
+        release = await inflight.acquire_inflight(1, mode="tarot")
+        try:
+            await inflight.run_supersedable(1, "tarot", asyncio.sleep(0.01))
+            answered.append(text)
+        finally:
+            release()
+
+    async def _run():
+        await asyncio.gather(request("a"), request("b"))
+
+    asyncio.run(_run())
+
+    assert answered == ["a", "b"]
+    assert inflight.LATEST_REQUESTS == {}
+
+
+def test_refund_helpers_restore_charges(monkeypatch, tmp_path):
+    import_inflight(monkeypatch, tmp_path)
+    db = importlib.import_module("core.db")
+    db.init_db()
+    now = datetime(2026, 1, 5, 12, 0, tzinfo=timezone.utc)
+    db.ensure_user(1, now=now)
+    db.increment_general_chat_count(1, now=now)
+    db.grant_purchase(1, "TICKET_3", now=now)
+    assert db.consume_ticket(1, ticket="tickets_3")
+
+    db.decrement_general_chat_count(1, now=now)
+    db.decrement_general_chat_count(1, now=now)
+    db.refund_ticket(1, ticket="tickets_3")
+
+    user = db.get_user(1, now=now)
+    assert user.general_chat_count_today == 0
+    assert user.tickets_3 == 1
@@ -3,7 +3,7 @@ import os
 os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
 os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
 
-from bot.main import (
+from bot.handlers.tarot import (
     build_tarot_theme_keyboard,
     build_upgrade_keyboard,
     get_start_text,
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from aiogram.types import Update
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.routers import tg_webhook
+from bot.webhook import SECRET_TOKEN_HEADER, WEBHOOK_PATH, UpdateWorkerPool
+
+UPDATE_PAYLOAD = {
+    "update_id": 1001,
+    "message": {
+        "message_id": 1,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "hello",
+    },
+}
+
+
+class StubPool:
+    def __init__(self, *, running: bool = True, accept: bool = True) -> None:
+        self.running = running
+        self.accept = accept
+        self.updates: list[Update] = []
+
+    def parse_update(self, payload):
+        return Update.model_validate(payload)
+
+    def submit(self, update: Update) -> bool:
+        if self.accept:
+            self.updates.append(update)
+        return self.accept
+
+
+@pytest.fixture
+def webhook_client(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_WEBHOOK_SECRET", "s3cret")
+    pool = StubPool()
+    app.dependency_overrides[tg_webhook.get_worker_pool] = lambda: pool
+    try:
+        yield TestClient(app), pool
+    finally:
+        app.dependency_overrides.pop(tg_webhook.get_worker_pool, None)
+
+
+def test_webhook_accepts_update_with_valid_secret(webhook_client):
+    client, pool = webhook_client
+
+    response = client.post(WEBHOOK_PATH, json=UPDATE_PAYLOAD, headers={SECRET_TOKEN_HEADER: "s3cret"})
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert [update.update_id for update in pool.updates] == [1001]
+
+
+def test_webhook_rejects_wrong_or_missing_secret(webhook_client):
+    client, pool = webhook_client
+
+    missing = client.post(WEBHOOK_PATH, json=UPDATE_PAYLOAD)
+    wrong = client.post(WEBHOOK_PATH, json=UPDATE_PAYLOAD, headers={SECRET_TOKEN_HEADER: "nope"})
+
+    assert missing.status_code == 401
+    assert wrong.status_code == 401
+    assert pool.updates == []
+
+
+def test_webhook_asks_for_redelivery_when_queue_is_full(webhook_client):
+    client, pool = webhook_client
+    pool.accept = False
+
+    response = client.post(WEBHOOK_PATH, json=UPDATE_PAYLOAD, headers={SECRET_TOKEN_HEADER: "s3cret"})
+
+    assert response.status_code == 503
+
+
+def test_webhook_unavailable_without_runtime(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_WEBHOOK_SECRET", "s3cret")
+    app.dependency_overrides[tg_webhook.get_worker_pool] = lambda: None
+    try:
+        response = TestClient(app).post(
+            WEBHOOK_PATH, json=UPDATE_PAYLOAD, headers={SECRET_TOKEN_HEADER: "s3cret"}
+        )
+    finally:
+        app.dependency_overrides.pop(tg_webhook.get_worker_pool, None)
+
+    assert response.status_code == 503
+
+
+class RecordingDispatcher:
+    def __init__(self) -> None:
+        self.seen: list[int] = []
+
+    async def feed_update(self, bot, update):
+        await asyncio.sleep(0)
+        if update.update_id == 13:
+            raise RuntimeError("boom")
+        self.seen.append(update.update_id)
+
+
+def test_worker_pool_drains_queue_and_bounds_it():
+    dispatcher = RecordingDispatcher()
+
+    async def run():
+        pool = UpdateWorkerPool(dispatcher, bot=None, workers=2, max_queue=3)
+        accepted = [pool.submit(Update(update_id=i)) for i in (11, 12, 13, 14)]
+        await pool.start()
+        await pool.stop(drain_timeout=1.0)
+        return pool, accepted
+
+    pool, accepted = asyncio.run(run())
+
+    assert accepted == [True, True, True, False]
+    assert sorted(dispatcher.seen) == [11, 12]
+    assert (pool.stats.processed, pool.stats.failed, pool.stats.rejected) == (2, 1, 1)
+    assert not pool.running
@@ -1,10 +1,12 @@
+import json
 import os
 
 os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
 os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
 
-from bot.main import build_tarot_messages, format_tarot_answer, format_drawn_cards
-from core.tarot import ONE_CARD, THREE_CARD_SITUATION, orientation_label
+from bot.handlers.tarot import build_tarot_messages
+from bot.utils.formatting import format_drawn_cards, format_tarot_answer
+from core.tarot import CELTIC_CROSS, ONE_CARD, THREE_CARD_SITUATION, orientation_label
 
 
 def _build_drawn_cards(spread):
@@ -97,3 +99,81 @@ def test_tarot_prompts_are_localized_for_en():
     assert "Output rules:" in system_text
     assert "work/career" in system_text.lower()
     assert "出力ルール" not in system_text
+
+
+def test_tarot_prompt_table_matches_dynamic_builders():
+    from core.prompts import (
+        TAROT_PROMPT_TABLE,
+        build_tarot_request_directives,
+        build_tarot_static_prompt,
+        get_tarot_prompt_pair,
+    )
+
+    assert len(TAROT_PROMPT_TABLE) == 3 * 2 * 2 * 5 * 5
+    for (lang, time_axis, short, theme, action_count), pair in TAROT_PROMPT_TABLE.items():
+        assert pair == (
+            build_tarot_static_prompt(time_axis=time_axis, short=short, lang=lang),
+            build_tarot_request_directives(
+                theme or None, time_axis=time_axis, action_count=action_count, lang=lang
+            ),
+        )
+
+    first = get_tarot_prompt_pair("love", action_count=3, lang="pt-BR")
+    second = get_tarot_prompt_pair("love", action_count=3, lang="pt")
+    assert first is second
+    assert get_tarot_prompt_pair("unknown", action_count=9) is get_tarot_prompt_pair(
+        None, action_count=-1
+    )
+    assert get_tarot_prompt_pair("love")[0] is get_tarot_prompt_pair("work", action_count=4)[0]
+
+
+def test_tarot_messages_start_with_shared_static_prefix():
+    love = build_tarot_messages(
+        spread=ONE_CARD,
+        user_query="恋愛について",
+        drawn_cards=_build_drawn_cards(ONE_CARD),
+        theme="love",
+        action_count=2,
+    )
+    work = build_tarot_messages(
+        spread=CELTIC_CROSS,
+        user_query="仕事について",
+        drawn_cards=_build_drawn_cards(CELTIC_CROSS),
+        theme="work",
+        action_count=4,
+    )
+
+    assert [msg["role"] for msg in love] == ["system", "system", "assistant", "user"]
+    assert love[0]["content"] == work[0]["content"]
+    assert love[1]["content"] != work[1]["content"]
+    payload = love[2]["content"]
+    assert "\n" not in payload
+    assert json.loads(payload)["user_question"] == "恋愛について"
+    # 質問そのものは、変更前と同じく最後の user メッセージにそのまま入る。
+    assert love[-1] == {"role": "user", "content": "恋愛について"}
+
+
+def test_character_prompt_is_read_from_disk_once(monkeypatch):
+    from pathlib import Path
+
+    from core import characters, prompts
+
+    monkeypatch.setenv("CHARACTER", "arisa")
+    monkeypatch.setattr(characters, "_default_loader", characters.CharacterPackLoader())
+    reads: list[Path] = []
+    original_read_text = Path.read_text
+
+    def counting_read_text(self, *args, **kwargs):
+        reads.append(self)
+        return original_read_text(self, *args, **kwargs)
+
+    monkeypatch.setattr(Path, "read_text", counting_read_text)
+
+    first = prompts.get_consult_system_prompt("ja")
+    second = prompts.get_consult_system_prompt("en")
+    boundary = prompts.get_character_boundary_lines()
+
+    assert first == second
+    assert "アリサ" in first
+    assert boundary and "boundary" in boundary
+    assert sorted(path.name for path in reads) == ["boundary_lines.txt", "system_prompt.txt"]
@@ -1,6 +1,7 @@
 import asyncio
 
-from bot.middlewares.throttle import ThrottleMiddleware
+from bot.middlewares.throttle import LoadShedder, LoadSignal, ThrottleMiddleware
+from bot.texts.i18n import t
 from bot.texts.ja import THROTTLE_TEXT
 
 
@@ -34,3 +35,80 @@ def test_throttle_shows_notice_without_raising() -> None:
         assert second_event.answers == [THROTTLE_TEXT]
 
     asyncio.run(_run())
+
+
+class _FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def _count(event, data):  # type: ignore[no-untyped-def]
+    event.handled += 1
+
+
+def test_throttle_burst_allows_double_tap_then_refills() -> None:
+    clock = _FakeClock()
+    middleware = ThrottleMiddleware(min_interval_sec=1.0, burst=2, clock=clock)
+
+    async def _run() -> list[int]:
+        handled = []
+        for step in (0.0, 0.1, 0.1, 1.0, 0.2):
+            clock.now += step
+            event = _DummyMessage()
+            await middleware(_count, event, {})
+            handled.append(event.handled)
+        return handled
+
+    assert asyncio.run(_run()) == [1, 1, 0, 1, 0]
+    assert middleware.throttled == 2
+
+
+def test_throttle_tightens_while_overloaded() -> None:
+    clock = _FakeClock()
+    inflight = {"value": 0.0}
+    shedder = LoadShedder([LoadSignal("llm_inflight", lambda: inflight["value"], 10)], factor=0.25)
+    middleware = ThrottleMiddleware(min_interval_sec=1.0, burst=3, shedder=shedder, clock=clock)
+
+    async def _send() -> int:
+        event = _DummyMessage()
+        await middleware(_count, event, {})
+        return event.handled
+
+    async def _run() -> tuple[list[int], list[int]]:
+        calm = [await _send(), await _send(), await _send()]
+        inflight["value"] = 12
+        clock.now += 2.0  # would refill two tokens at the normal rate
+        busy = [await _send(), await _send()]
+        return calm, busy
+
+    calm, busy = asyncio.run(_run())
+
+    assert calm == [1, 1, 1]
+    assert busy == [0, 0]
+    assert shedder.overloaded_by() == "llm_inflight"
+    assert middleware.shed == 2
+
+
+def test_throttle_notice_uses_cached_language_only() -> None:
+    lookups: list[int] = []
+
+    def resolver(user_id: int) -> str | None:
+        lookups.append(user_id)
+        return "en" if user_id == 1 else None
+
+    middleware = ThrottleMiddleware(min_interval_sec=5.0, lang_resolver=resolver)
+
+    async def _run() -> tuple[list[str], list[str]]:
+        english, unknown = _DummyMessage(1), _DummyMessage(2)
+        for event in (english, english, unknown, unknown):
+            await middleware(_count, event, {})
+        return english.answers, unknown.answers
+
+    english, unknown = asyncio.run(_run())
+
+    assert english == [t("en", "THROTTLE_TEXT")]
+    assert unknown == [THROTTLE_TEXT]
+    assert lookups == [1, 2]
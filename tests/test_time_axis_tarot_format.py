@@ -3,7 +3,8 @@ import os
 os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
 os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
 
-from bot.main import CAUTION_NOTE, build_tarot_messages
+from bot.handlers.tarot import build_tarot_messages
+from bot.utils.formatting import CAUTION_NOTE
 from bot.utils.tarot_output import format_time_axis_tarot_answer
 from core.tarot import THREE_CARD_TIME_AXIS, orientation_label
 
@@ -0,0 +1,106 @@
+import asyncio
+import importlib
+import sys
+from types import SimpleNamespace
+
+from core.tokens import (
+    MESSAGE_OVERHEAD_TOKENS,
+    REPLY_PRIMING_TOKENS,
+    estimate_messages_tokens,
+    estimate_text_tokens,
+    trim_to_token_budget,
+)
+
+
+def import_bot_main(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "test_tokens.db"))
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    for module in [name for name in sys.modules if name.startswith(("bot.handlers", "bot.utils"))]:
+        sys.modules.pop(module, None)
+    for module in ["core.config", "core.monetization", "core.db", "bot.main"]:
+        if module in sys.modules:
+            del sys.modules[module]
+    return importlib.import_module("bot.main")
+
+
+def test_estimate_text_tokens_per_script():
+    assert estimate_text_tokens("") == 0
+    assert estimate_text_tokens(None) == 0
+    # Kanji count one token each, kana slightly less.
+    assert estimate_text_tokens("恋愛運", "ja") == 3
+    assert 8 <= estimate_text_tokens("彼の気持ちが知りたい", "ja") <= 10
+    assert 6 <= estimate_text_tokens("How does my crush feel?", "en") <= 9
+    # Portuguese words split into more tokens than English ones.
+    assert estimate_text_tokens("relacionamento", "pt") > estimate_text_tokens(
+        "relacionamento", "en"
+    )
+
+
+def test_estimate_messages_tokens_adds_message_overhead():
+    messages = [
+        {"role": "system", "content": "恋愛運"},
+        {"role": "user", "content": "恋愛運"},
+    ]
+
+    assert estimate_messages_tokens(messages, "ja") == (
+        REPLY_PRIMING_TOKENS + 2 * (MESSAGE_OVERHEAD_TOKENS + 3)
+    )
+
+
+def test_trim_to_token_budget():
+    text = "占いの結果を詳しく教えてください。" * 40
+
+    untouched, trimmed = trim_to_token_budget("短い質問", 100, "ja")
+    assert (untouched, trimmed) == ("短い質問", False)
+
+    fitted, trimmed = trim_to_token_budget(text, 50, "ja")
+    assert trimmed is True
+    assert fitted.endswith("…")
+    assert text.startswith(fitted[:-1])
+    assert estimate_text_tokens(fitted, "ja") <= 50
+
+
+def test_call_openai_passes_max_tokens_and_logs_estimate(monkeypatch, tmp_path, caplog):
+    import_bot_main(monkeypatch, tmp_path)
+    consult = importlib.import_module("bot.handlers.consult")
+    llm = importlib.import_module("bot.utils.llm")
+    captured: dict = {}
+
+    def fake_create(**kwargs):
+        captured.update(kwargs)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+            usage=SimpleNamespace(prompt_tokens=40, completion_tokens=5, total_tokens=45),
+        )
+
+    fake_client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create))
+    )
+    monkeypatch.setattr(llm, "client", fake_client)
+    messages = consult.build_general_chat_messages("こんにちは", lang="ja")
+
+    with caplog.at_level("INFO"):
+        answer, fatal, total = asyncio.run(
+            llm.call_openai_with_retry_and_usage(messages, lang="ja", max_tokens=321)
+        )
+
+    assert (fatal, total) == (False, 45)
+    assert captured["max_tokens"] == 321
+    usage_logs = [r for r in caplog.records if r.getMessage() == "OpenAI token usage"]
+    assert usage_logs
+    assert usage_logs[0].estimated_prompt_tokens == estimate_messages_tokens(messages, "ja")
+    assert usage_logs[0].prompt_token_delta == 40 - usage_logs[0].estimated_prompt_tokens
+
+
+def test_arisa_reservation_covers_prompt_and_reply_cap(monkeypatch, tmp_path):
+    import_bot_main(monkeypatch, tmp_path)
+    arisa = importlib.import_module("bot.handlers.arisa")
+    one = arisa.ONE_MESSAGE_TOKENS
+
+    assert arisa.ARISA_MAX_TOKENS == 600
+    monkeypatch.setattr(arisa, "ARISA_MAX_TOKENS", one)
+    assert arisa._arisa_reservation_credits(0) == 1
+    assert arisa._arisa_reservation_credits(one * 3 + 1) == 5
+    monkeypatch.setattr(arisa, "ARISA_MAX_TOKENS", 0)  # 上限なしでも返信 1 通分は見込む
+    assert arisa._arisa_reservation_credits(one) == 2
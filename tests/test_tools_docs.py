@@ -0,0 +1,15 @@
+import ast
+from pathlib import Path
+
+import pytest
+
+TOOLS = sorted((Path(__file__).resolve().parents[1] / "tools").glob("*.py"))
+
+
+@pytest.mark.parametrize("path", TOOLS, ids=lambda path: path.name)
+def test_tool_modules_keep_their_docstring(path):
+    # argparse の description=__doc__ が空にならないよう、docstring は __future__ より前に置く。
+    source = path.read_text(encoding="utf-8")
+    if "__doc__" not in source:
+        pytest.skip("does not use its docstring")
+    assert ast.get_docstring(ast.parse(source))
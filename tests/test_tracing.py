@@ -0,0 +1,100 @@
+import asyncio
+import importlib
+import json
+import sys
+
+import pytest
+
+from core.tracing import JsonlSpanExporter, Tracer, current_span, to_otlp_json
+
+
+def test_child_spans_nest_under_root_and_are_free_outside_a_trace():
+    tracer = Tracer()
+
+    with tracer.span("orphan") as orphan:
+        assert orphan is None
+
+    with tracer.span("message", root=True, request_id="r1") as root:
+        with tracer.span("db.get_user"):
+            assert current_span().parent_id == root.span_id
+        with tracer.span("llm.chat_completion", model="gpt-4o-mini"):
+            with tracer.span("db.log_app_event"):
+                pass
+    assert current_span() is None
+
+    (trace,) = tracer.recent
+    assert trace.root is root
+    names = {span.name: span for span in trace.spans}
+    assert names["db.log_app_event"].parent_id == names["llm.chat_completion"].span_id
+    assert {span.trace_id for span in trace.spans} == {root.trace_id}
+    assert [name for name, _, _ in trace.breakdown()] == sorted(
+        ["db.get_user", "llm.chat_completion", "db.log_app_event"],
+        key=lambda name: -names[name].duration_ms,
+    )
+
+
+def test_traced_async_functions_keep_context_and_record_errors():
+    tracer = Tracer()
+
+    @tracer.traced("telegram.send")
+    async def send():
+        await asyncio.sleep(0.01)
+        return current_span().name
+
+    @tracer.traced()
+    def explode():
+        raise ValueError("boom")
+
+    async def run():
+        with tracer.span("message", root=True):
+            name = await send()
+            with pytest.raises(ValueError):
+                explode()
+        return name
+
+    assert asyncio.run(run()) == "telegram.send"
+    (trace,) = tracer.slowest(1)
+    spans = {span.name: span for span in trace.spans}
+    assert spans["telegram.send"].duration_ms >= 10
+    assert spans[explode.__qualname__].status == "error"
+
+
+def test_spans_are_exported_as_jsonl_and_otlp(tmp_path):
+    exporter = JsonlSpanExporter(tmp_path / "traces.jsonl", flush_interval_sec=0.05)
+    tracer = Tracer(exporter)
+    with tracer.span("message", root=True, user_id=7):
+        with tracer.span("db.ensure_user"):
+            pass
+    tracer.shutdown()
+
+    lines = [json.loads(line) for line in (tmp_path / "traces.jsonl").read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["message", "db.ensure_user"]
+    assert lines[1]["parent_id"] == lines[0]["span_id"]
+
+    payload = to_otlp_json(tracer.recent[0].spans, "test")
+    spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert spans[0]["attributes"] == [{"key": "user_id", "value": {"intValue": "7"}}]
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+
+
+def test_admin_traces_show_db_and_format_breakdown(monkeypatch, tmp_path):
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123:ABC")
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "bot.db"))
+    for module in [name for name in sys.modules if name.startswith(("bot.handlers", "bot.utils"))]:
+        sys.modules.pop(module, None)
+    for module in ("core.config", "core.monetization", "core.db", "bot.main"):
+        sys.modules.pop(module, None)
+    admin = importlib.import_module("bot.handlers.admin")
+    formatting = importlib.import_module("bot.utils.formatting")
+    db = sys.modules["core.db"]
+
+    with admin.TRACER.span("message", root=True, request_id="u1-m1-1", handler="handle_message"):
+        db.ensure_user(1)
+        formatting.format_long_answer("結論：大丈夫です", "consult")
+
+    report = admin._format_slow_traces([admin.TRACER.recent[-1]])
+
+    assert "rid=u1-m1-1" in report
+    assert "db.ensure_user x1" in report
+    assert "format.long_answer x1" in report
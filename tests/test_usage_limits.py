@@ -3,6 +3,8 @@ import importlib
 import sys
 from datetime import datetime, timedelta, timezone
 
+from tests.test_bot_modes import patch_bot_attr
+
 
 class DummyFromUser:
     def __init__(self, user_id: int):
@@ -24,6 +26,8 @@ def import_bot_main(monkeypatch, tmp_path):
     monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123456:TESTTOKEN")
     monkeypatch.setenv("OPENAI_API_KEY", "dummy")
     monkeypatch.setenv("SUPPORT_EMAIL", "support@example.com")
+    for module in [name for name in sys.modules if name.startswith(("bot.handlers", "bot.utils"))]:
+        sys.modules.pop(module, None)
     for module in ["core.config", "core.monetization", "core.db", "bot.main"]:
         if module in sys.modules:
             del sys.modules[module]
@@ -31,56 +35,60 @@ def import_bot_main(monkeypatch, tmp_path):
 
 
 def test_consult_intent_detection(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    consult = importlib.import_module("bot.handlers.consult")
 
-    assert bot_main._is_consult_intent("最近人気のユーチューブ動画を教えて") is False
-    assert bot_main._is_consult_intent("相談: 復縁できますか？") is True
+    assert consult._is_consult_intent("最近人気のユーチューブ動画を教えて") is False
+    assert consult._is_consult_intent("相談: 復縁できますか？") is True
 
 
 def test_general_chat_trial_limits(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
+    consult = importlib.import_module("bot.handlers.consult")
     base = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: base)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: base)
 
     async def fake_call(messages):
         return "hi", False
 
-    monkeypatch.setattr(bot_main, "call_openai_with_retry", fake_call)
+    patch_bot_attr(monkeypatch, "call_openai_with_retry", fake_call)
 
     first = DummyMessage("こんにちは", user_id=1)
     second = DummyMessage("今日は寒いですね", user_id=1)
     third = DummyMessage("3通目", user_id=1)
 
-    asyncio.run(bot_main.handle_message(first))
-    asyncio.run(bot_main.handle_message(second))
-    asyncio.run(bot_main.handle_message(third))
+    asyncio.run(tarot.handle_message(first))
+    asyncio.run(tarot.handle_message(second))
+    asyncio.run(tarot.handle_message(third))
 
     assert len(first.answers) == 1
     assert len(second.answers) == 1
     assert third.answers == [
-        bot_main._build_consult_block_message(trial_active=True, short=False)
+        consult._build_consult_block_message(trial_active=True, short=False)
     ]
 
 
 def test_general_chat_block_notice_cooldown(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
     base = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: base)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: base)
 
     async def fake_call(messages):
         return "hi", False
 
-    monkeypatch.setattr(bot_main, "call_openai_with_retry", fake_call)
+    patch_bot_attr(monkeypatch, "call_openai_with_retry", fake_call)
 
     first = DummyMessage("相談: 1通目", user_id=2)
     second = DummyMessage("相談: 2通目", user_id=2)
     third = DummyMessage("相談: 3通目", user_id=2)
     fourth = DummyMessage("相談: 4通目", user_id=2)
 
-    asyncio.run(bot_main.handle_message(first))
-    asyncio.run(bot_main.handle_message(second))
-    asyncio.run(bot_main.handle_message(third))
-    asyncio.run(bot_main.handle_message(fourth))
+    asyncio.run(tarot.handle_message(first))
+    asyncio.run(tarot.handle_message(second))
+    asyncio.run(tarot.handle_message(third))
+    asyncio.run(tarot.handle_message(fourth))
 
     assert len(third.answers) == 1
     assert len(fourth.answers) == 1
@@ -90,29 +98,33 @@ def test_general_chat_block_notice_cooldown(monkeypatch, tmp_path):
 
 
 def test_general_chat_requires_pass_after_trial(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    db = importlib.import_module("core.db")
+    tarot = importlib.import_module("bot.handlers.tarot")
+    consult = importlib.import_module("bot.handlers.consult")
     base = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    bot_main.ensure_user(1, now=base)
+    db.ensure_user(1, now=base)
     future = base + timedelta(days=5)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: future)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: future)
 
     async def fake_call(messages):
         return "hi", False
 
-    monkeypatch.setattr(bot_main, "call_openai_with_retry", fake_call)
+    patch_bot_attr(monkeypatch, "call_openai_with_retry", fake_call)
 
     message = DummyMessage("6日目の雑談", user_id=1)
-    asyncio.run(bot_main.handle_message(message))
+    asyncio.run(tarot.handle_message(message))
 
     assert message.answers == [
-        bot_main._build_consult_block_message(trial_active=False, short=False)
+        consult._build_consult_block_message(trial_active=False, short=False)
     ]
 
 
 def test_one_oracle_limit_triggers_short_response(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
     base = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: base)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: base)
 
     calls: list[bool] = []
 
@@ -123,29 +135,32 @@ def test_one_oracle_limit_triggers_short_response(monkeypatch, tmp_path):
         guidance_note=None,
         short_response=False,
         theme=None,
+        charge=None,
     ):
         calls.append(short_response)
 
-    monkeypatch.setattr(bot_main, "handle_tarot_reading", fake_tarot)
+    monkeypatch.setattr(tarot, "handle_tarot_reading", fake_tarot)
 
     first = DummyMessage("占って", user_id=2)
     second = DummyMessage("占って", user_id=2)
     third = DummyMessage("占って", user_id=2)
 
-    asyncio.run(bot_main.handle_message(first))
-    asyncio.run(bot_main.handle_message(second))
-    asyncio.run(bot_main.handle_message(third))
+    asyncio.run(tarot.handle_message(first))
+    asyncio.run(tarot.handle_message(second))
+    asyncio.run(tarot.handle_message(third))
 
     assert calls == [True, True]
     assert any("無料枠" in ans for ans in third.answers)
 
 
 def test_one_oracle_limit_after_trial(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    db = importlib.import_module("core.db")
+    tarot = importlib.import_module("bot.handlers.tarot")
     base = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    bot_main.ensure_user(5, now=base)
+    db.ensure_user(5, now=base)
     day_six = base + timedelta(days=5)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: day_six)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: day_six)
 
     calls: list[bool] = []
 
@@ -156,31 +171,70 @@ def test_one_oracle_limit_after_trial(monkeypatch, tmp_path):
         guidance_note=None,
         short_response=False,
         theme=None,
+        charge=None,
     ):
         calls.append(short_response)
 
-    monkeypatch.setattr(bot_main, "handle_tarot_reading", fake_tarot)
+    monkeypatch.setattr(tarot, "handle_tarot_reading", fake_tarot)
 
     first = DummyMessage("占って", user_id=5)
     second = DummyMessage("占って", user_id=5)
 
-    asyncio.run(bot_main.handle_message(first))
-    asyncio.run(bot_main.handle_message(second))
+    asyncio.run(tarot.handle_message(first))
+    asyncio.run(tarot.handle_message(second))
 
     assert calls == [True]
     assert any("無料枠" in ans for ans in second.answers)
 
 
+def test_paid_spread_with_ticket_gets_reading(monkeypatch, tmp_path):
+    import_bot_main(monkeypatch, tmp_path)
+    db = importlib.import_module("core.db")
+    tarot = importlib.import_module("bot.handlers.tarot")
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: base)
+    monkeypatch.setattr(tarot, "PAYWALL_ENABLED", True)
+    db.ensure_user(6, now=base)
+    db.grant_purchase(6, "TICKET_3", now=base)
+
+    charges: list[str | None] = []
+
+    async def fake_tarot(
+        message,
+        user_query: str,
+        spread=None,
+        guidance_note=None,
+        short_response=False,
+        theme=None,
+        charge=None,
+    ):
+        charges.append(charge)
+
+    monkeypatch.setattr(tarot, "handle_tarot_reading", fake_tarot)
+
+    paid = DummyMessage("恋愛を見て", user_id=6)
+    no_ticket = DummyMessage("恋愛を見て", user_id=6)
+    asyncio.run(tarot.execute_tarot_request(paid, "恋愛を見て", spread=tarot.THREE_CARD_TIME_AXIS))
+    asyncio.run(tarot.execute_tarot_request(no_ticket, "恋愛を見て", spread=tarot.THREE_CARD_TIME_AXIS))
+
+    # チケットを使った 1 回目は鑑定に進み、チケットがない 2 回目だけ止まる。
+    assert charges == ["ticket"]
+    assert paid.answers == []
+    assert any("有料メニュー" in ans for ans in no_ticket.answers)
+    assert db.get_user(6, now=base).tickets_3 == 0
+
+
 def test_daily_counts_reset(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    db = importlib.import_module("core.db")
     base = datetime(2024, 1, 1, 14, 30, tzinfo=timezone.utc)
     user_id = 3
-    bot_main.ensure_user(user_id, now=base)
-    bot_main.increment_general_chat_count(user_id, now=base)
-    bot_main.increment_one_oracle_count(user_id, now=base)
+    db.ensure_user(user_id, now=base)
+    db.increment_general_chat_count(user_id, now=base)
+    db.increment_one_oracle_count(user_id, now=base)
 
     next_day = base + timedelta(hours=2)
-    user = bot_main.get_user(user_id, now=next_day)
+    user = db.get_user(user_id, now=next_day)
 
     assert user is not None
     assert user.general_chat_count_today == 0
@@ -190,14 +244,16 @@ def test_daily_counts_reset(monkeypatch, tmp_path):
 def test_admin_bypass_general_chat_limits(monkeypatch, tmp_path):
     admin_id = 1357890414
     monkeypatch.setenv("ADMIN_USER_IDS", str(admin_id))
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
+    db = importlib.import_module("core.db")
     base = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: base)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: base)
 
     async def fake_call(messages):
         return "ok", False
 
-    monkeypatch.setattr(bot_main, "call_openai_with_retry", fake_call)
+    patch_bot_attr(monkeypatch, "call_openai_with_retry", fake_call)
 
     messages = [
         DummyMessage("相談: 1通目", user_id=admin_id),
@@ -206,10 +262,10 @@ def test_admin_bypass_general_chat_limits(monkeypatch, tmp_path):
     ]
 
     for msg in messages:
-        asyncio.run(bot_main.handle_message(msg))
+        asyncio.run(tarot.handle_message(msg))
 
     assert all(len(msg.answers) == 1 for msg in messages)
-    user = bot_main.get_user(admin_id, now=base)
+    user = db.get_user(admin_id, now=base)
     assert user is not None
     assert user.general_chat_count_today == 0
 
@@ -217,9 +273,11 @@ def test_admin_bypass_general_chat_limits(monkeypatch, tmp_path):
 def test_admin_bypass_one_oracle_limits(monkeypatch, tmp_path):
     admin_id = 1357890414
     monkeypatch.setenv("ADMIN_USER_IDS", str(admin_id))
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    tarot = importlib.import_module("bot.handlers.tarot")
+    db = importlib.import_module("core.db")
     base = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    monkeypatch.setattr(bot_main, "utcnow", lambda: base)
+    patch_bot_attr(monkeypatch, "utcnow", lambda: base)
 
     calls: list[bool] = []
 
@@ -230,15 +288,16 @@ def test_admin_bypass_one_oracle_limits(monkeypatch, tmp_path):
         guidance_note=None,
         short_response=False,
         theme=None,
+        charge=None,
     ):
         calls.append(short_response)
 
-    monkeypatch.setattr(bot_main, "handle_tarot_reading", fake_tarot)
+    monkeypatch.setattr(tarot, "handle_tarot_reading", fake_tarot)
 
     for _ in range(3):
-        asyncio.run(bot_main.handle_message(DummyMessage("占って", user_id=admin_id)))
+        asyncio.run(tarot.handle_message(DummyMessage("占って", user_id=admin_id)))
 
-    user = bot_main.get_user(admin_id, now=base)
+    user = db.get_user(admin_id, now=base)
     assert user is not None
     assert user.one_oracle_count_today == 0
     assert calls == [False, False, False]
@@ -247,33 +306,38 @@ def test_admin_bypass_one_oracle_limits(monkeypatch, tmp_path):
 def test_status_shows_admin_mode(monkeypatch, tmp_path):
     admin_id = 1357890414
     monkeypatch.setenv("ADMIN_USER_IDS", str(admin_id))
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    db = importlib.import_module("core.db")
+    tarot = importlib.import_module("bot.handlers.tarot")
     now = datetime(2024, 1, 1, tzinfo=timezone.utc)
-    user = bot_main.ensure_user(admin_id, now=now)
+    user = db.ensure_user(admin_id, now=now)
 
-    status = bot_main.format_status(user, now=now)
+    status = tarot.format_status(user, now=now)
 
     assert "管理者モード" in status
 
 
 def test_arisa_status_hides_trial_when_pass_active(monkeypatch, tmp_path):
-    bot_main = import_bot_main(monkeypatch, tmp_path)
+    import_bot_main(monkeypatch, tmp_path)
+    db = importlib.import_module("core.db")
+    config = importlib.import_module("core.config")
+    arisa = importlib.import_module("bot.handlers.arisa")
     now = datetime(2024, 1, 1, tzinfo=timezone.utc)
     user_id = 4242
-    bot_main.ensure_user(user_id, now=now)
-    bot_main.set_arisa_trial_remaining(user_id, remaining=7, now=now)
-    bot_main.update_arisa_pass(
+    db.ensure_user(user_id, now=now)
+    db.set_arisa_trial_remaining(user_id, remaining=7, now=now)
+    db.update_arisa_pass(
         user_id,
         pass_until=now + timedelta(days=7),
-        daily_limit=bot_main.PASS_7D_DAILY_LIMIT,
+        daily_limit=config.PASS_7D_DAILY_LIMIT,
         now=now,
     )
 
-    user = bot_main.get_user(user_id, now=now)
+    user = db.get_user(user_id, now=now)
 
     assert user is not None
     for lang in ("ja", "en", "pt"):
-        status = bot_main.format_arisa_status(user, now=now, lang=lang)
+        status = arisa.format_arisa_status(user, now=now, lang=lang)
         assert "初回無料" not in status
         assert "テスト" not in status
         lowered = status.lower()
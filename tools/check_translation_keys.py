@@ -1,5 +1,3 @@
-from __future__ import annotations
-
 """
 Utility script to validate translation key coverage across languages.
 
@@ -11,6 +9,8 @@ keys in Japanese (ja) or Portuguese (pt). It exits with a non-zero status code
 if mismatches are found.
 """
 
+from __future__ import annotations
+
 import sys
 
 from bot.texts import en, pt
@@ -0,0 +1,275 @@
+"""
+Feed synthetic updates straight into the aiogram dispatcher and report handler latency.
+
+Usage:
+    python -m tools.dispatcher_load_test --rate 100 --duration 20 --users 2000 \
+        --openai-latency lognormal:800,0.5 --telegram-latency uniform:20,60
+
+Unlike tools/webhook_load_test.py (which only measures ingestion), this runs
+the real handlers in-process: updates are built as Telegram would send them
+(text, ``nav:*`` / ``buy:*`` / ``lang:set:*`` callbacks, pre_checkout_query,
+successful_payment) and passed to ``dp.feed_update`` at a fixed rate. The Bot
+API is answered by tools.fake_telegram and OpenAI by tools.fake_openai, each
+with its own latency distribution (see tools/latency.py). SQLite and the
+state store live in a temporary directory, so no token or network is needed.
+
+Reports throughput, p50/p95/p99 latency per update kind, handler errors by
+exception type, throttle drops and the calls made to the fake backends.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import traceback
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Callable
+
+DEFAULT_MIX = "text=50,nav=15,buy=10,lang=10,pre_checkout=8,payment=7"
+TEXTS = ("占って", "恋愛について相談したい", "/status", "仕事運を見て", "/help", "最近眠れなくて不安です")
+NAV = ("nav:menu", "nav:status", "nav:charge")
+LANGS = ("ja", "en", "pt")
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def parse_mix(raw: str) -> dict[str, float]:
+    mix: dict[str, float] = {}
+    for item in raw.split(","):
+        kind, _, weight = item.partition("=")
+        if kind.strip() not in BUILDERS:
+            raise ValueError(f"Unknown update kind: {kind!r} (choose from {', '.join(BUILDERS)})")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def _user(user_id: int) -> dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": "Load", "language_code": "ja"}
+
+
+def _message(update_id: int, user_id: int, **fields: Any) -> dict[str, Any]:
+    return {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        **fields,
+    }
+
+
+def _invoice_payload(user_id: int, sku: str) -> str:
+    return json.dumps({"sku": sku, "user_id": user_id})
+
+
+def build_text(update_id: int, user_id: int, rng: random.Random, skus: list[str]) -> dict[str, Any]:
+    text = rng.choice(TEXTS)
+    message = _message(update_id, user_id, text=text)
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+
+def _callback(update_id: int, user_id: int, data: str) -> dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": _message(update_id, user_id, text="menu"),
+        },
+    }
+
+
+def build_nav(update_id: int, user_id: int, rng: random.Random, skus: list[str]) -> dict[str, Any]:
+    return _callback(update_id, user_id, rng.choice(NAV))
+
+
+def build_buy(update_id: int, user_id: int, rng: random.Random, skus: list[str]) -> dict[str, Any]:
+    return _callback(update_id, user_id, f"buy:{rng.choice(skus)}")
+
+
+def build_lang(update_id: int, user_id: int, rng: random.Random, skus: list[str]) -> dict[str, Any]:
+    return _callback(update_id, user_id, f"lang:set:{rng.choice(LANGS)}")
+
+
+def build_pre_checkout(update_id: int, user_id: int, rng: random.Random, skus: list[str]) -> dict[str, Any]:
+    sku = rng.choice(skus)
+    return {
+        "update_id": update_id,
+        "pre_checkout_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "currency": "XTR",
+            "total_amount": 100,
+            "invoice_payload": _invoice_payload(user_id, sku),
+        },
+    }
+
+
+def build_payment(update_id: int, user_id: int, rng: random.Random, skus: list[str]) -> dict[str, Any]:
+    sku = rng.choice(skus)
+    payment = {
+        "currency": "XTR",
+        "total_amount": 100,
+        "invoice_payload": _invoice_payload(user_id, sku),
+        "telegram_payment_charge_id": f"load-{update_id}",
+        "provider_payment_charge_id": f"load-provider-{update_id}",
+    }
+    return {"update_id": update_id, "message": _message(update_id, user_id, successful_payment=payment)}
+
+
+BUILDERS: dict[str, Callable[[int, int, random.Random, list[str]], dict[str, Any]]] = {
+    "text": build_text,
+    "nav": build_nav,
+    "buy": build_buy,
+    "lang": build_lang,
+    "pre_checkout": build_pre_checkout,
+    "payment": build_payment,
+}
+
+
+def _prepare_environment(workdir: Path) -> None:
+    # core.config refuses to import without tokens; nothing here talks to the real services.
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:LOAD-TEST")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-load-test")
+    os.environ["SQLITE_DB_PATH"] = str(workdir / "bot.db")
+    os.environ["STATE_DB_PATH"] = str(workdir / "state.db")
+    os.environ["BOT_RUNTIME"] = "polling"
+    os.environ["BOT_WORKERS"] = "1"
+    os.environ.setdefault("TRACE_EXPORT", "")
+    # A root handler makes setup_logging() a no-op, keeping the console for the report.
+    handler = logging.FileHandler(workdir / "bot.log", encoding="utf-8")
+    handler.setLevel(logging.WARNING)
+    logging.basicConfig(level=logging.WARNING, handlers=[handler])
+
+
+async def run(args: argparse.Namespace, workdir: Path) -> int:
+    _prepare_environment(workdir)
+    import bot.main as bot_main
+    from bot.middlewares.send_scheduler import SendSchedulerMiddleware
+    from bot.utils import llm, telegram
+    from core.config import BOT_MODE
+    from core.store.catalog import iter_products
+    from tools.fake_openai import FakeOpenAIClient
+    from tools.fake_telegram import FakeTelegramSession
+
+    from aiogram.types import Update
+
+    session = FakeTelegramSession(args.telegram_latency)
+    session.middleware(SendSchedulerMiddleware(telegram.send_scheduler))
+    bot = telegram.get_bot()
+    bot.session = session
+    fake_openai = FakeOpenAIClient(args.openai_latency)
+    llm.client = fake_openai
+    await bot_main.prepare_runtime()
+    dp = bot_main.get_dispatcher()
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+    # Each deployment only sells its own products (the other router is not included).
+    arisa = BOT_MODE == "arisa"
+    skus = [product.sku for product in iter_products() if product.sku.startswith("ARISA_") == arisa]
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: Counter[str] = Counter()
+    first_errors: dict[str, str] = {}
+    tasks: set[asyncio.Task[None]] = set()
+    semaphore = asyncio.Semaphore(args.max_in_flight)
+
+    async def feed(kind: str, raw: dict[str, Any]) -> None:
+        async with semaphore:
+            update = Update.model_validate(raw, context={"bot": bot})
+            started = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as exc:  # noqa: BLE001 - counted, not raised
+                key = f"{kind}:{type(exc).__name__}"
+                errors[key] += 1
+                first_errors.setdefault(key, traceback.format_exc())
+            finally:
+                latencies[kind].append((time.perf_counter() - started) * 1000)
+
+    total = int(args.rate * args.duration)
+    started = time.perf_counter()
+    for index in range(total):
+        due = started + index / args.rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind = rng.choices(kinds, weights)[0]
+        user_id = 50_000_000 + rng.randrange(args.users)
+        task = asyncio.create_task(feed(kind, BUILDERS[kind](index + 1, user_id, rng, skus)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    offered = time.perf_counter() - started
+    if tasks:
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    await bot_main.stop_background_tasks()
+
+    done = sum(len(values) for values in latencies.values())
+    print(f"updates={done} offered_rate={total / offered:.1f}/s throughput={done / elapsed:.1f}/s elapsed={elapsed:.1f}s")
+    print(f"{'kind':<13}{'n':>7}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'maxms':>10}")
+    for kind in [*kinds, "all"]:
+        values = sorted(
+            latencies[kind] if kind != "all" else [value for series in latencies.values() for value in series]
+        )
+        if not values:
+            continue
+        print(
+            f"{kind:<13}{len(values):>7}{_percentile(values, 0.50):>10.1f}{_percentile(values, 0.95):>10.1f}"
+            f"{_percentile(values, 0.99):>10.1f}{values[-1]:>10.1f}"
+        )
+    print(f"errors={sum(errors.values())} {dict(errors.most_common(10))}")
+    if args.show_errors:
+        for key, trace in first_errors.items():
+            print(f"--- first {key} ---\n{trace}")
+    print(
+        f"throttled: message={bot_main.message_throttle.throttled} callback={bot_main.callback_throttle.throttled} "
+        f"(shed={bot_main.message_throttle.shed + bot_main.callback_throttle.shed})"
+    )
+    print(f"telegram calls={sum(session.calls.values())} {dict(session.calls.most_common(8))}")
+    print(f"openai calls={fake_openai.calls} max_in_flight={fake_openai.max_in_flight}")
+    print(f"send scheduler {telegram.send_scheduler.snapshot()}")
+    return 1 if errors and args.fail_on_error else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=50.0, help="updates per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--users", type=int, default=1000, help="distinct synthetic users")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"update kind weights (default {DEFAULT_MIX})")
+    parser.add_argument("--openai-latency", default="lognormal:800,0.5")
+    parser.add_argument("--telegram-latency", default="uniform:20,60")
+    parser.add_argument("--max-in-flight", type=int, default=10_000, help="cap on concurrently handled updates")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", help="keep the SQLite files and bot.log here instead of a temp dir")
+    parser.add_argument("--show-errors", action="store_true", help="print the first traceback of each error kind")
+    parser.add_argument("--fail-on-error", action="store_true")
+    args = parser.parse_args()
+    if args.workdir:
+        workdir = Path(args.workdir)
+        workdir.mkdir(parents=True, exist_ok=True)
+        return asyncio.run(run(args, workdir))
+    with tempfile.TemporaryDirectory() as tmp:
+        return asyncio.run(run(args, Path(tmp)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
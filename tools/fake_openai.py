@@ -0,0 +1,300 @@
+"""
+Offline stand-ins for the OpenAI chat completions API.
+
+``FakeOpenAIClient`` has the ``client.chat.completions.create(**kwargs)``
+surface the bot uses; assign it to ``bot.utils.llm.client`` in load tests. Calls
+block for a sampled latency (the real client is synchronous and runs in the
+default executor, so thread-pool saturation shows up as it would in
+production) and return a ``ChatCompletion`` with usage computed by
+``core.tokens``.
+
+``create_app`` is an HTTP server speaking ``POST /v1/chat/completions``
+(streaming and non-streaming) for tests that should go through the real
+``openai`` client, retries and timeouts included. It injects 429 / 5xx /
+hung requests at configurable rates. Point the bot at it with
+``OPENAI_BASE_URL``:
+
+    python -m tools.fake_openai --port 8089 --latency lognormal:800,0.5 --rate-429 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python -m bot.main
+
+In tests, ``with FakeOpenAIServer(FakeOpenAIConfig(...)) as server:`` runs it
+on a free port in a background thread (``server.base_url``).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterable
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from openai.types.chat import ChatCompletion
+
+from core.tokens import estimate_messages_tokens, estimate_text_tokens
+from tools.latency import LatencySampler, parse_latency
+from tools.local_server import LocalServer
+
+DEFAULT_REPLY = (
+    "《カード》：星（正位置）\n"
+    "いまは焦らず、少しずつ希望を形にしていく時期です。\n"
+    "・気になっていることを一つ書き出してみましょう\n"
+    "・小さな約束を守ることで流れが整います\n"
+    "・週末は心と体を休める時間をとってください"
+)
+
+
+def completion_payload(
+    messages: Iterable[dict[str, Any]],
+    *,
+    model: str = "gpt-4o-mini",
+    reply: str = DEFAULT_REPLY,
+    max_tokens: int | None = None,
+    completion_id: str = "chatcmpl-fake",
+) -> dict[str, Any]:
+    """A chat.completion response body with realistic ``usage`` numbers."""
+    prompt_tokens = estimate_messages_tokens(list(messages), "ja")
+    completion_tokens = estimate_text_tokens(reply, "ja")
+    finish_reason = "stop"
+    if max_tokens and completion_tokens > max_tokens:
+        reply = reply[: max(1, len(reply) * max_tokens // completion_tokens)]
+        completion_tokens = max_tokens
+        finish_reason = "length"
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": finish_reason,
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeOpenAIClient") -> None:
+        self._owner = owner
+
+    def create(self, **kwargs: Any) -> ChatCompletion:
+        return self._owner._create(**kwargs)
+
+
+class _FakeChat:
+    def __init__(self, owner: "FakeOpenAIClient") -> None:
+        self.completions = _FakeCompletions(owner)
+
+
+class FakeOpenAIClient:
+    def __init__(self, latency: str | LatencySampler = "lognormal:800,0.5", *, reply: str = DEFAULT_REPLY) -> None:
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.reply = reply
+        self.chat = _FakeChat(self)
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _create(
+        self,
+        *,
+        messages: Iterable[dict[str, Any]],
+        model: str = "gpt-4o-mini",
+        max_tokens: int | None = None,
+        **_: Any,
+    ) -> ChatCompletion:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            delay = self.latency()
+            if delay > 0:
+                time.sleep(delay)
+            payload = completion_payload(
+                messages,
+                model=model,
+                reply=self.reply,
+                max_tokens=max_tokens,
+                completion_id=f"chatcmpl-fake-{next(self._ids)}",
+            )
+            return ChatCompletion.model_validate(payload)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+@dataclass
+class FakeOpenAIConfig:
+    """Behaviour of the fake server. Rates are probabilities per request (0..1)."""
+
+    latency: str = "lognormal:800,0.5"
+    reply: str = DEFAULT_REPLY
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    rate_timeout: float = 0.0
+    hang_sec: float = 600.0
+    retry_after_sec: float = 1.0
+    stream_chunk_chars: int = 8
+    stream_chunk_latency: str = "0"
+    seed: int | None = None
+
+
+def _error_body(message: str, error_type: str, code: str | None = None) -> dict[str, Any]:
+    return {"error": {"message": message, "type": error_type, "param": None, "code": code}}
+
+
+def _chunk(completion_id: str, model: str, created: int, delta: dict[str, Any], finish_reason: str | None) -> dict[str, Any]:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def stream_events(payload: dict[str, Any], *, chunk_chars: int = 8, include_usage: bool = False) -> list[dict[str, Any]]:
+    """Split a chat.completion body into the chunks a streaming response would carry."""
+    choice = payload["choices"][0]
+    content = choice["message"]["content"]
+    base = (payload["id"], payload["model"], payload["created"])
+    events = [_chunk(*base, {"role": "assistant", "content": ""}, None)]
+    step = max(1, chunk_chars)
+    events.extend(_chunk(*base, {"content": content[i : i + step]}, None) for i in range(0, len(content), step))
+    events.append(_chunk(*base, {}, choice["finish_reason"]))
+    if include_usage:
+        events.append({**_chunk(*base, {}, None), "choices": [], "usage": payload["usage"]})
+    return events
+
+
+def create_app(config: FakeOpenAIConfig | None = None) -> FastAPI:
+    """Chat-completions compatible app. ``app.state.stats`` counts requests by outcome."""
+    config = config or FakeOpenAIConfig()
+    rng = random.Random(config.seed)
+    latency = parse_latency(config.latency, rng=rng)
+    chunk_latency = parse_latency(config.stream_chunk_latency, rng=rng)
+    ids = itertools.count(1)
+    stats: Counter[str] = Counter()
+    app = FastAPI(title="fake-openai")
+    app.state.config = config
+    app.state.stats = stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> Any:
+        body = await request.json()
+        stats["requests"] += 1
+        # One draw per request keeps the outcome sequence reproducible for a given seed.
+        roll = rng.random()
+        if roll < config.rate_429:
+            stats["429"] += 1
+            return JSONResponse(
+                _error_body("Rate limit reached for requests", "requests", "rate_limit_exceeded"),
+                status_code=429,
+                headers={"retry-after": f"{config.retry_after_sec:g}"},
+            )
+        roll -= config.rate_429
+        if roll < config.rate_5xx:
+            stats["5xx"] += 1
+            status = rng.choice((500, 502, 503))
+            return JSONResponse(_error_body("The server had an error while processing your request.", "server_error"), status_code=status)
+        roll -= config.rate_5xx
+        if roll < config.rate_timeout:
+            stats["timeout"] += 1
+            await asyncio.sleep(config.hang_sec)
+            return JSONResponse(_error_body("Request timed out.", "timeout"), status_code=504)
+
+        await asyncio.sleep(latency())
+        payload = completion_payload(
+            body.get("messages") or [],
+            model=body.get("model") or "gpt-4o-mini",
+            reply=config.reply,
+            max_tokens=body.get("max_tokens") or body.get("max_completion_tokens"),
+            completion_id=f"chatcmpl-fake-{next(ids)}",
+        )
+        if not body.get("stream"):
+            stats["ok"] += 1
+            return JSONResponse(payload)
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        events = stream_events(payload, chunk_chars=config.stream_chunk_chars, include_usage=include_usage)
+
+        async def _sse() -> AsyncIterator[bytes]:
+            for event in events:
+                delay = chunk_latency()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+            stats["ok"] += 1
+
+        return StreamingResponse(_sse(), media_type="text/event-stream")
+
+    @app.get("/v1/models")
+    async def models() -> dict[str, Any]:
+        return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "fake"}]}
+
+    return app
+
+
+class FakeOpenAIServer(LocalServer):
+    """``create_app`` on a free local port; use ``base_url`` for the ``openai`` client."""
+
+    def __init__(self, config: FakeOpenAIConfig | None = None, *, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__(create_app(config), host=host, port=port)
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/v1"
+
+    @property
+    def stats(self) -> Counter[str]:
+        return self.app.state.stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="lognormal:800,0.5", help="time to first byte (see tools/latency.py)")
+    parser.add_argument("--chunk-latency", default="0", help="delay between streamed chunks")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--rate-timeout", type=float, default=0.0, help="share of requests that hang for --hang-sec")
+    parser.add_argument("--hang-sec", type=float, default=600.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    config = FakeOpenAIConfig(
+        latency=args.latency,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        rate_timeout=args.rate_timeout,
+        hang_sec=args.hang_sec,
+        stream_chunk_latency=args.chunk_latency,
+        seed=args.seed,
+    )
+    print(f"fake OpenAI listening on http://{args.host}:{args.port}/v1")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
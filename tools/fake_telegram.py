@@ -0,0 +1,421 @@
+"""
+Stand-ins for the Telegram Bot API, for load tests and benchmarks.
+
+``FakeTelegramSession`` is an aiogram session: give it to ``Bot(session=...)``
+(or assign ``bot.session``) and every API call is answered locally after a
+configurable delay. Responses go through aiogram's normal response parsing,
+so deserialisation cost is still measured. Calls are counted per method.
+
+``create_app`` is a Bot API emulator over HTTP for end-to-end runs of the
+whole bot. It records every call, enforces Telegram-like flood limits (429
+with ``retry_after``), and keeps sent messages so that edits and deletes fail
+as they do on Telegram ("message to edit not found", "message is not
+modified", ...). Updates posted to ``/fake/updates`` are handed out by
+``getUpdates``:
+
+    python -m tools.fake_telegram --port 8081
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8081 python -m bot.main
+    curl -X POST localhost:8081/fake/updates -d '[{"update_id": 1, "message": {...}}]'
+    curl localhost:8081/fake/calls
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import sys
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+from email.policy import default as email_policy
+from typing import Any, AsyncGenerator, Callable
+from urllib.parse import parse_qsl
+
+import uvicorn
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from tools.latency import LatencySampler, parse_latency
+from tools.local_server import LocalServer
+
+FAKE_BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake Bot", "username": "fake_tarot_bot"}
+
+
+def message_result(chat_id: int | str, message_id: int, text: str | None = None) -> dict[str, Any]:
+    result: dict[str, Any] = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": FAKE_BOT_USER,
+    }
+    if text is not None:
+        result["text"] = text
+    return result
+
+
+def result_for(method_name: str, params: dict[str, Any], message_id: int) -> Any:
+    """Plausible ``result`` payload for a Bot API method (by its API name, e.g. ``sendMessage``)."""
+    if method_name == "getMe":
+        return FAKE_BOT_USER
+    if method_name == "getUpdates":
+        return []
+    if method_name in {"copyMessage"}:
+        return {"message_id": message_id}
+    if method_name.startswith("send") or method_name in {"forwardMessage"}:
+        return message_result(params.get("chat_id", 0), message_id, params.get("text"))
+    if method_name.startswith("edit") and "chat_id" in params:
+        return message_result(params["chat_id"], int(params.get("message_id") or message_id), params.get("text"))
+    return True
+
+
+class FakeTelegramSession(BaseSession):
+    def __init__(self, latency: str | LatencySampler = "0", **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.calls: Counter[str] = Counter()
+        self._message_ids = itertools.count(1000)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None) -> Any:
+        name = method.__api_method__
+        self.calls[name] += 1
+        delay = self.latency()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        params = {
+            key: value
+            for key in ("chat_id", "message_id", "text")
+            if isinstance(value := getattr(method, key, None), (int, str))
+        }
+        content = json.dumps({"ok": True, "result": result_for(name, params, next(self._message_ids))})
+        response = self.check_response(bot=bot, method=method, status_code=200, content=content)
+        return response.result
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict[str, Any] | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        return None
+
+
+# Methods that post or rewrite a message and so count towards the flood limits.
+FLOOD_LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+INT_PARAMS = {"chat_id", "from_chat_id", "message_id", "offset", "limit", "timeout", "user_id"}
+NOT_MODIFIED = (
+    "Bad Request: message is not modified: specified new message content and reply markup "
+    "are exactly the same as a current content and reply markup of the message"
+)
+
+
+@dataclass
+class FakeTelegramConfig:
+    latency: str = "0"
+    global_rate_per_sec: float = 30.0
+    global_burst: float = 30.0
+    chat_rate_per_sec: float = 1.0
+    chat_burst: float = 3.0
+    seed: int | None = None
+
+
+class _Bucket:
+    """Refusing token bucket: ``take`` returns 0 when allowed, else seconds until a token is due."""
+
+    def __init__(self, rate_per_sec: float, capacity: float, clock: Callable[[], float]) -> None:
+        self.rate_per_sec = rate_per_sec
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+
+    def take(self) -> float:
+        if self.rate_per_sec <= 0:
+            return 0.0
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_sec)
+        self._updated_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate_per_sec
+
+
+class TelegramApiError(Exception):
+    def __init__(self, error_code: int, description: str, parameters: dict[str, Any] | None = None) -> None:
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.parameters = parameters
+
+
+@dataclass
+class RecordedCall:
+    method: str
+    params: dict[str, Any]
+    status: int
+    at: float = field(default_factory=time.time)
+
+
+class FakeBotApi:
+    """Bot API state: sent messages, answered queries, pending updates and the call log."""
+
+    def __init__(self, config: FakeTelegramConfig | None = None, *, clock: Callable[[], float] = time.monotonic) -> None:
+        self.config = config or FakeTelegramConfig()
+        self.latency = parse_latency(self.config.latency, rng=random.Random(self.config.seed))
+        self.calls: list[RecordedCall] = []
+        self.counts: Counter[str] = Counter()
+        self.statuses: Counter[int] = Counter()
+        self.messages: dict[tuple[int | str, int], dict[str, Any]] = {}
+        self.answered_queries: set[str] = set()
+        self._clock = clock
+        self._global = _Bucket(self.config.global_rate_per_sec, self.config.global_burst, clock)
+        self._chats: dict[int | str, _Bucket] = {}
+        self._message_ids: dict[int | str, itertools.count[int]] = {}
+        self._updates: deque[dict[str, Any]] = deque()
+        self._updates_ready = asyncio.Event()
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "calls": len(self.calls),
+            "by_method": dict(self.counts.most_common()),
+            "by_status": {str(status): count for status, count in sorted(self.statuses.items())},
+            "messages": len(self.messages),
+            "pending_updates": len(self._updates),
+        }
+
+    def add_updates(self, updates: list[dict[str, Any]]) -> int:
+        for update in updates:
+            # Messages the user "sent" exist in the chat, so the bot may edit or delete them.
+            for key in ("message", "edited_message"):
+                if isinstance(update.get(key), dict):
+                    self._remember(update[key])
+            callback = update.get("callback_query") or {}
+            if isinstance(callback.get("message"), dict):
+                self._remember(callback["message"])
+            self._updates.append(update)
+        self._updates_ready.set()
+        return len(updates)
+
+    def _remember(self, message: dict[str, Any]) -> None:
+        chat_id = (message.get("chat") or {}).get("id")
+        if chat_id is not None and "message_id" in message:
+            self.messages[(chat_id, int(message["message_id"]))] = {
+                "text": message.get("text"),
+                "reply_markup": message.get("reply_markup"),
+            }
+
+    def _check_flood(self, method: str, chat_id: int | str | None) -> None:
+        if not method.startswith(FLOOD_LIMITED_PREFIXES) or method == "sendChatAction":
+            return
+        waits = [self._global.take()]
+        if chat_id is not None:
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = self._chats[chat_id] = _Bucket(self.config.chat_rate_per_sec, self.config.chat_burst, self._clock)
+            waits.append(bucket.take())
+        wait = max(waits)
+        if wait > 0:
+            retry_after = max(1, math.ceil(wait))
+            raise TelegramApiError(429, f"Too Many Requests: retry after {retry_after}", {"retry_after": retry_after})
+
+    def _send(self, chat_id: int | str, params: dict[str, Any]) -> dict[str, Any]:
+        counter = self._message_ids.setdefault(chat_id, itertools.count(1_000_000))
+        message_id = next(counter)
+        self.messages[(chat_id, message_id)] = {"text": params.get("text"), "reply_markup": params.get("reply_markup")}
+        return message_result(chat_id, message_id, params.get("text"))
+
+    def _edit(self, method: str, params: dict[str, Any]) -> Any:
+        if "inline_message_id" in params:
+            return True
+        key = (params.get("chat_id"), params.get("message_id"))
+        stored = self.messages.get(key)  # type: ignore[arg-type]
+        if stored is None:
+            raise TelegramApiError(400, "Bad Request: message to edit not found")
+        updated = dict(stored)
+        if method == "editMessageText":
+            updated["text"] = params.get("text")
+        updated["reply_markup"] = params.get("reply_markup")
+        if updated == stored:
+            raise TelegramApiError(400, NOT_MODIFIED)
+        self.messages[key] = updated  # type: ignore[index]
+        return message_result(key[0], key[1], updated.get("text"))  # type: ignore[arg-type]
+
+    async def _get_updates(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        offset = params.get("offset")
+        if isinstance(offset, int):
+            # Like Telegram: updates below the offset are confirmed and forgotten.
+            while self._updates and self._updates[0].get("update_id", 0) < offset:
+                self._updates.popleft()
+        if not self._updates and params.get("timeout"):
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), timeout=float(params["timeout"]))
+            except asyncio.TimeoutError:
+                pass
+        limit = params.get("limit") or 100
+        return list(itertools.islice(self._updates, int(limit)))
+
+    async def handle(self, method: str, params: dict[str, Any]) -> Any:
+        """Result of a Bot API call, or :class:`TelegramApiError` as Telegram would answer."""
+        chat_id = params.get("chat_id")
+        self._check_flood(method, chat_id)
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        delay = self.latency()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if method == "getMe":
+            return FAKE_BOT_USER
+        if method == "deleteMessage":
+            if self.messages.pop((chat_id, params.get("message_id")), None) is None:  # type: ignore[arg-type]
+                raise TelegramApiError(400, "Bad Request: message to delete not found")
+            return True
+        if method == "deleteMessages":
+            for message_id in params.get("message_ids") or []:
+                self.messages.pop((chat_id, message_id), None)  # type: ignore[arg-type]
+            return True
+        if method.startswith("edit"):
+            return self._edit(method, params)
+        if method == "answerCallbackQuery":
+            query_id = str(params.get("callback_query_id"))
+            if query_id in self.answered_queries:
+                raise TelegramApiError(
+                    400, "Bad Request: query is too old and response timeout expired or query ID is invalid"
+                )
+            self.answered_queries.add(query_id)
+            return True
+        if method == "copyMessage":
+            return {"message_id": self._send(chat_id, params)["message_id"]}  # type: ignore[arg-type]
+        if (method.startswith("send") and method != "sendChatAction") or method == "forwardMessage":
+            if chat_id is None:
+                raise TelegramApiError(400, "Bad Request: chat_id is empty")
+            return self._send(chat_id, params)
+        return True
+
+    def record(self, method: str, params: dict[str, Any], status: int) -> None:
+        self.calls.append(RecordedCall(method, params, status))
+        self.counts[method] += 1
+        self.statuses[status] += 1
+
+
+def _coerce(key: str, value: str) -> Any:
+    if key in INT_PARAMS:
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    if value[:1] in "[{":
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+async def read_params(request: Request) -> dict[str, Any]:
+    """Bot API parameters from a query string, urlencoded, multipart or JSON body."""
+    params: dict[str, Any] = {key: _coerce(key, value) for key, value in request.query_params.items()}
+    content_type = request.headers.get("content-type", "")
+    body = await request.body()
+    if not body:
+        return params
+    if content_type.startswith("application/json"):
+        params.update(json.loads(body))
+    elif content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=email_policy).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name and part.get_filename() is None:
+                params[name] = _coerce(name, part.get_content().strip())
+    else:
+        params.update({key: _coerce(key, value) for key, value in parse_qsl(body.decode())})
+    return params
+
+
+def create_app(config: FakeTelegramConfig | None = None) -> FastAPI:
+    """Bot API emulator; the state is ``app.state.api`` (:class:`FakeBotApi`)."""
+    api = FakeBotApi(config)
+    app = FastAPI(title="fake-telegram")
+    app.state.api = api
+
+    @app.api_route("/bot{token}/{method}", methods=["GET", "POST"])
+    async def bot_method(token: str, method: str, request: Request) -> JSONResponse:
+        params = await read_params(request)
+        try:
+            result = await api.handle(method, params)
+        except TelegramApiError as exc:
+            api.record(method, params, exc.error_code)
+            body: dict[str, Any] = {"ok": False, "error_code": exc.error_code, "description": exc.description}
+            if exc.parameters:
+                body["parameters"] = exc.parameters
+            return JSONResponse(body, status_code=exc.error_code)
+        api.record(method, params, 200)
+        return JSONResponse({"ok": True, "result": result})
+
+    @app.post("/fake/updates")
+    async def push_updates(request: Request) -> dict[str, int]:
+        payload = await request.json()
+        return {"queued": api.add_updates(payload if isinstance(payload, list) else [payload])}
+
+    @app.get("/fake/calls")
+    async def calls() -> dict[str, Any]:
+        return api.summary()
+
+    return app
+
+
+class FakeTelegramServer(LocalServer):
+    """``create_app`` on a free local port; pass ``base_url`` as ``TELEGRAM_API_BASE_URL``."""
+
+    def __init__(self, config: FakeTelegramConfig | None = None, *, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__(create_app(config), host=host, port=port)
+
+    @property
+    def base_url(self) -> str:
+        return self.url
+
+    @property
+    def api(self) -> FakeBotApi:
+        return self.app.state.api
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="uniform:20,60", help="per-call delay (see tools/latency.py)")
+    parser.add_argument("--global-rate", type=float, default=30.0, help="messages/sec before 429 (0 = unlimited)")
+    parser.add_argument("--chat-rate", type=float, default=1.0, help="messages/sec per chat before 429")
+    parser.add_argument("--chat-burst", type=float, default=3.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    config = FakeTelegramConfig(
+        latency=args.latency,
+        global_rate_per_sec=args.global_rate,
+        global_burst=max(1.0, args.global_rate),
+        chat_rate_per_sec=args.chat_rate,
+        chat_burst=args.chat_burst,
+        seed=args.seed,
+    )
+    print(f"fake Bot API listening on http://{args.host}:{args.port}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
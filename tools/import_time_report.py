@@ -0,0 +1,145 @@
+"""
+Report where ``import <module>`` spends its time, from ``python -X importtime``.
+
+Usage:
+    python -m tools.import_time_report bot.main --top 15
+    python -m tools.import_time_report bot.main --budget-ms 250   # exit 1 when over budget
+
+The import runs in a fresh interpreter with placeholder tokens and a
+throwaway SQLite path, so it measures a cold start without touching real
+data. "own" is the self time of this repository's packages (bot, core, api),
+i.e. the part we control; the rest is grouped by third-party package.
+Importing must not create the DB file: DB setup belongs to startup.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+OWN_PACKAGES = ("bot", "core", "api")
+
+
+@dataclass(frozen=True)
+class ImportEntry:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+    @property
+    def package(self) -> str:
+        return self.name.split(".", 1)[0]
+
+
+@dataclass
+class ImportReport:
+    module: str
+    entries: list[ImportEntry]
+    created_files: list[str]
+
+    @property
+    def total_us(self) -> int:
+        return sum(entry.cumulative_us for entry in self.entries if entry.depth == 0)
+
+    @property
+    def own_us(self) -> int:
+        return sum(entry.self_us for entry in self.entries if entry.package in OWN_PACKAGES)
+
+    def by_package(self) -> Counter[str]:
+        totals: Counter[str] = Counter()
+        for entry in self.entries:
+            totals[entry.package] += entry.self_us
+        return totals
+
+    def imported(self, package: str) -> bool:
+        return any(entry.package == package for entry in self.entries)
+
+
+def parse_importtime(text: str) -> list[ImportEntry]:
+    """Parse ``-X importtime`` lines: ``import time: self | cumulative | <indented name>``."""
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:") :].split("|", 2)
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # the header line
+        raw_name = parts[2].rstrip()
+        depth = max(0, (len(raw_name) - len(raw_name.lstrip()) - 1) // 2)
+        entries.append(ImportEntry(raw_name.strip(), int(parts[0]), int(parts[1]), depth))
+    return entries
+
+
+def measure(module: str, *, extra_code: str = "") -> ImportReport:
+    """Import ``module`` in a fresh interpreter and return the parsed report."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "TELEGRAM_BOT_TOKEN": os.getenv("TELEGRAM_BOT_TOKEN", "123456:IMPORT-TIME"),
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-import-time"),
+            "SQLITE_DB_PATH": str(Path(tmp) / "bot.db"),
+            "STATE_DB_PATH": "",
+            "DOTENV_FILE": str(Path(tmp) / ".env"),
+            "PYTHONDONTWRITEBYTECODE": "1",
+        }
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}\n{extra_code}"],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+        created = sorted(path.name for path in Path(tmp).iterdir())
+    return ImportReport(module, parse_importtime(result.stderr), created)
+
+
+def _ms(us: int) -> str:
+    return f"{us / 1000:9.1f}"
+
+
+def print_report(report: ImportReport, top: int) -> None:
+    print(f"import {report.module}: total={report.total_us / 1000:.1f}ms own={report.own_us / 1000:.1f}ms")
+    print(f"\n{'package':<28}{'self ms':>9}")
+    for package, self_us in report.by_package().most_common(top):
+        print(f"{package:<28}{_ms(self_us)}")
+    own = sorted(
+        (entry for entry in report.entries if entry.package in OWN_PACKAGES),
+        key=lambda entry: entry.self_us,
+        reverse=True,
+    )
+    print(f"\n{'own module':<40}{'self ms':>9}{'cum ms':>9}")
+    for entry in own[:top]:
+        print(f"{entry.name:<40}{_ms(entry.self_us)}{_ms(entry.cumulative_us)}")
+    if report.created_files:
+        print(f"\nWARNING: importing created {report.created_files}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("module", nargs="?", default="bot.main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, help="fail when own modules take longer than this")
+    args = parser.parse_args()
+    report = measure(args.module)
+    print_report(report, args.top)
+    if report.created_files:
+        return 1
+    if args.budget_ms is not None and report.own_us / 1000 > args.budget_ms:
+        print(f"\nover budget: own {report.own_us / 1000:.1f}ms > {args.budget_ms:.1f}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
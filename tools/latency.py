@@ -0,0 +1,43 @@
+"""
+Latency distributions for the fake Bot API / OpenAI backends used by load tests.
+
+Spec strings (all values in milliseconds):
+    "0" or "none"            no delay
+    "50" / "const:50"        always 50ms
+    "uniform:20,80"          uniform between 20 and 80ms
+    "lognormal:800,0.5"      median 800ms, sigma 0.5 (long right tail, like LLM calls)
+    "exp:100"                exponential with a 100ms mean
+"""
+
+from __future__ import annotations
+
+import math
+import random
+from typing import Callable
+
+LatencySampler = Callable[[], float]
+
+
+def parse_latency(spec: str, *, rng: random.Random | None = None) -> LatencySampler:
+    """Return a sampler giving a delay in seconds for ``spec``."""
+    rng = rng or random.Random()
+    kind, _, raw_args = spec.strip().lower().partition(":")
+    if not raw_args:
+        kind, raw_args = ("none", "") if kind in {"", "0", "none"} else ("const", kind)
+    try:
+        args = [float(value) for value in raw_args.split(",") if value.strip()]
+    except ValueError as exc:
+        raise ValueError(f"Invalid latency spec: {spec!r}") from exc
+
+    if kind == "none":
+        return lambda: 0.0
+    if kind == "const" and len(args) == 1:
+        return lambda: args[0] / 1000
+    if kind == "uniform" and len(args) == 2:
+        return lambda: rng.uniform(args[0], args[1]) / 1000
+    if kind == "lognormal" and len(args) == 2:
+        mu = math.log(max(args[0], 1e-6))
+        return lambda: rng.lognormvariate(mu, args[1]) / 1000
+    if kind == "exp" and len(args) == 1:
+        return lambda: rng.expovariate(1 / args[0]) / 1000 if args[0] > 0 else 0.0
+    raise ValueError(f"Invalid latency spec: {spec!r}")
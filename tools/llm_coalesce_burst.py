@@ -0,0 +1,142 @@
+"""
+Measure how many upstream LLM calls request coalescing saves under a burst.
+
+Usage:
+    python -m tools.llm_coalesce_burst --requests 500 --campaign-share 0.6 \
+        --spread-ms 300 --openai-latency lognormal:800,0.5
+
+Simulates a campaign burst against the consult flow: ``--requests`` messages
+arrive within ``--spread-ms``. A ``--campaign-share`` of them pick one of
+``--campaign-texts`` canned phrases (with random spacing / full-width / case
+variations, as users type them); the rest are unique questions. Every message
+goes through ``call_openai_with_retry(..., coalesce=True)`` with the same
+prompt as the consult handler, answered by tools.fake_openai. The burst is run
+once per ``LLM_COALESCE_KEY`` mode and the upstream calls are compared.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+CAMPAIGN_TEXTS = (
+    "今日の運勢を教えて",
+    "恋愛運はどうですか",
+    "仕事がうまくいくか不安です",
+    "おすすめの過ごし方は？",
+    "金運を上げるには",
+)
+MODES = ("off", "exact", "normalized")
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _variant(text: str, rng: random.Random) -> str:
+    """Same question, typed slightly differently."""
+    choice = rng.random()
+    if choice < 0.6:
+        return text
+    if choice < 0.8:
+        return f" {text}  "
+    return text.replace("？", "?").replace("　", " ")
+
+
+def build_burst(args: argparse.Namespace) -> list[tuple[float, str]]:
+    rng = random.Random(args.seed)
+    pool = CAMPAIGN_TEXTS[: max(1, args.campaign_texts)]
+    burst = []
+    for index in range(args.requests):
+        if rng.random() < args.campaign_share:
+            text = _variant(rng.choice(pool), rng)
+        else:
+            text = f"最近のことで相談です（{index}）"
+        burst.append((rng.uniform(0, args.spread_ms / 1000), text))
+    return sorted(burst)
+
+
+async def _child(args: argparse.Namespace) -> int:
+    from bot.handlers.consult import build_general_chat_messages
+    from bot.utils import llm
+    from core.config import CONSULT_MAX_TOKENS
+    from tools.fake_openai import FakeOpenAIClient
+
+    fake_openai = FakeOpenAIClient(args.openai_latency)
+    llm.client = fake_openai
+    latencies: list[float] = []
+    started = time.perf_counter()
+
+    async def send(delay: float, text: str) -> None:
+        await asyncio.sleep(delay)
+        sent = time.perf_counter()
+        await llm.call_openai_with_retry(
+            build_general_chat_messages(text, lang="ja"),
+            lang="ja",
+            max_tokens=CONSULT_MAX_TOKENS,
+            coalesce=True,
+        )
+        latencies.append((time.perf_counter() - sent) * 1000)
+
+    await asyncio.gather(*(send(delay, text) for delay, text in build_burst(args)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(
+        f"{os.environ['LLM_COALESCE_KEY']:<12}{len(latencies):>10}{fake_openai.calls:>10}"
+        f"{len(latencies) - fake_openai.calls:>8}{fake_openai.max_in_flight:>10}"
+        f"{_percentile(latencies, 0.5):>10.0f}{_percentile(latencies, 0.95):>10.0f}{elapsed:>9.1f}s"
+    )
+    return 0
+
+
+def run(args: argparse.Namespace) -> int:
+    print(f"{'key':<12}{'requests':>10}{'upstream':>10}{'saved':>8}{'peak':>10}{'p50ms':>10}{'p95ms':>10}{'elapsed':>10}")
+    child_args = [arg for arg in sys.argv[1:] if arg != "--child"]
+    for mode in MODES:
+        # 設定は import 時に読まれるので、モードごとに別プロセスで測る。
+        env = dict(os.environ)
+        env.update(
+            {
+                "TELEGRAM_BOT_TOKEN": env.get("TELEGRAM_BOT_TOKEN", "123456:COALESCE-BURST"),
+                "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "sk-coalesce-burst"),
+                "LLM_COALESCE_KEY": mode,
+                "TRACE_EXPORT": "",
+                "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH", "")])),
+            }
+        )
+        subprocess.run(
+            [sys.executable, "-m", "tools.llm_coalesce_burst", "--child", *child_args],
+            cwd=REPO_ROOT,
+            env=env,
+            check=True,
+        )
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="messages in the burst")
+    parser.add_argument("--campaign-share", type=float, default=0.6, help="fraction sending a campaign phrase")
+    parser.add_argument("--campaign-texts", type=int, default=3, help=f"distinct campaign phrases (max {len(CAMPAIGN_TEXTS)})")
+    parser.add_argument("--spread-ms", type=float, default=300.0, help="window the burst arrives in")
+    parser.add_argument("--openai-latency", default="lognormal:800,0.5")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return asyncio.run(_child(args))
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Compare the logging cost seen by the caller (the event loop) for the old and new setups.
+
+Usage:
+    python -m tools.logging_bench --records 50000
+
+"legacy" is the previous configuration: per-secret ``str.replace`` in a
+filter, text format and a synchronous RotatingFileHandler write. "queue-json"
+is the current one: ``LogQueueHandler`` on the caller side, JSON formatting,
+regex masking and file I/O in the listener thread. Reports records/sec and
+p50/p99 per call on the caller, plus how long the listener needed to drain.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import queue
+import sys
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+from pathlib import Path
+
+from core.logging import (
+    TEXT_FORMAT,
+    JsonLogFormatter,
+    LogQueueHandler,
+    build_secret_pattern,
+)
+
+SECRETS = [f"secret-token-{index:02d}-abcdefghijklmnopqrstuvwxyz" for index in range(4)]
+
+
+class _LegacyFilter(logging.Filter):
+    """The pre-queue SafeLogFilter: one ``str.replace`` per secret on every record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = "-"
+        message = record.getMessage()
+        for secret in SECRETS:
+            message = message.replace(secret, "***")
+        record.msg = message
+        record.args = ()
+        return True
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _emit(logger: logging.Logger, records: int) -> tuple[float, list[float]]:
+    samples = []
+    started = time.perf_counter()
+    for index in range(records):
+        call_started = time.perf_counter()
+        logger.info(
+            "Handling message %s",
+            index,
+            extra={"mode": "tarot", "user_id": index % 1000, "route": "tarot", "latency_ms": 12.5},
+        )
+        samples.append((time.perf_counter() - call_started) * 1_000_000)
+    samples.sort()
+    return time.perf_counter() - started, samples
+
+
+def _report(label: str, elapsed: float, samples: list[float], drain: float | None = None) -> None:
+    line = (
+        f"{label:<11} {len(samples) / elapsed:10.0f} rec/s  "
+        f"p50={_percentile(samples, 0.50):6.1f}us p99={_percentile(samples, 0.99):7.1f}us"
+    )
+    if drain is not None:
+        line += f"  drain={drain * 1000:.0f}ms"
+    print(line)
+
+
+def run(records: int) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_logger = logging.getLogger("bench.legacy")
+        legacy_logger.propagate = False
+        legacy_logger.setLevel(logging.INFO)
+        handler = RotatingFileHandler(Path(tmp) / "legacy.log", maxBytes=50_000_000, encoding="utf-8")
+        handler.addFilter(_LegacyFilter())
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        legacy_logger.addHandler(handler)
+        elapsed, samples = _emit(legacy_logger, records)
+        handler.close()
+        _report("legacy", elapsed, samples)
+
+        queued_logger = logging.getLogger("bench.queue")
+        queued_logger.propagate = False
+        queued_logger.setLevel(logging.INFO)
+        file_handler = RotatingFileHandler(Path(tmp) / "json.log", maxBytes=50_000_000, encoding="utf-8")
+        file_handler.setFormatter(JsonLogFormatter(build_secret_pattern(SECRETS)))
+        log_queue: queue.Queue[logging.LogRecord] = queue.Queue()
+        listener = QueueListener(log_queue, file_handler)
+        listener.start()
+        queue_handler = LogQueueHandler(log_queue)
+        queued_logger.addHandler(queue_handler)
+        elapsed, samples = _emit(queued_logger, records)
+        drain_started = time.perf_counter()
+        listener.stop()
+        drain = time.perf_counter() - drain_started
+        file_handler.close()
+        _report("queue-json", elapsed, samples, drain)
+        print(f"dropped={queue_handler.dropped}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50000)
+    args = parser.parse_args()
+    return run(args.records)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Memory soak: push many distinct users through the per-user maps and check that
+memory stays flat once the maps reach their bounds.
+
+Usage:
+    python -m tools.memory_soak --users 1000000
+
+Each simulated user takes and releases a request lock, passes the message
+throttle, gets a one-oracle counter and writes a conversation record to the
+state store (in a temporary SQLite file). Virtual time advances by
+``--interval-ms`` per user, so TTLs and the sweeper behave as in production
+at that arrival rate. Exits with 1 if traced memory keeps growing in the
+second half of the run by more than ``--max-growth-mb``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+
+
+class VirtualClock:
+    def __init__(self) -> None:
+        self.now = time.monotonic()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _User:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+        self.language_code = "ja"
+
+
+class _Message:
+    def __init__(self, user_id: int) -> None:
+        self.from_user = _User(user_id)
+
+    async def answer(self, text: str, **kwargs: object) -> None:
+        return None
+
+
+async def run(
+    users: int, interval_ms: float, max_size: int, checkpoints: int, max_growth_mb: float, tmp: Path
+) -> int:
+    os.environ.setdefault("SQLITE_DB_PATH", str(tmp / "soak.db"))
+    from bot.middlewares.throttle import ThrottleMiddleware
+    from core.expiring_map import ExpiringMap, MapSweeper, lock_is_idle
+    from core.state_store import StateField, StateStore
+
+    clock = VirtualClock()
+    locks: ExpiringMap[int, asyncio.Lock] = ExpiringMap(
+        ttl_sec=1800.0, max_size=max_size, can_evict=lock_is_idle, clock=clock
+    )
+    oracle: ExpiringMap[tuple[int, str], int] = ExpiringMap(
+        ttl_sec=2 * 24 * 3600, max_size=max_size, touch_on_get=False, clock=clock
+    )
+    throttle = ThrottleMiddleware(min_interval_sec=1.2, max_tracked_users=max_size)
+    store = StateStore(
+        tmp / "state.db", ttl=timedelta(minutes=40), max_entries=min(max_size, 10_000), clock=clock
+    )
+    modes: StateField[str] = StateField(store, "mode")
+    sweeper = MapSweeper([locks, oracle, throttle.tracked_users])
+
+    async def handler(event, data):
+        return None
+
+    step = max(1, users // checkpoints)
+    samples: list[tuple[int, float]] = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    last_sweep = clock.now
+    for user_id in range(1, users + 1):
+        clock.now += interval_ms / 1000
+        lock = locks.setdefault(user_id, asyncio.Lock())
+        await lock.acquire()
+        try:
+            await throttle(handler, _Message(user_id), {})
+            oracle[(user_id, "2026-01-01")] = oracle.get((user_id, "2026-01-01"), 0) + 1
+            modes[user_id] = "tarot"
+        finally:
+            lock.release()
+        if clock.now - last_sweep >= 60:
+            sweeper.sweep()
+            last_sweep = clock.now
+            store.flush()
+            store.purge_expired()
+        if user_id % step == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            samples.append((user_id, current / 1_048_576))
+            print(
+                f"users={user_id:>9,} traced={current / 1_048_576:7.1f}MB "
+                f"locks={len(locks):>7} throttle={len(throttle.tracked_users):>7} "
+                f"oracle={len(oracle):>7} state_cache={len(store._cache):>6}"
+            )
+    store.flush()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    elapsed = time.perf_counter() - started
+
+    half = samples[len(samples) // 2][1] if samples else 0.0
+    growth = (samples[-1][1] - half) if samples else 0.0
+    print(f"elapsed={elapsed:.1f}s peak={peak / 1_048_576:.1f}MB second-half growth={growth:+.1f}MB")
+    return 0 if growth <= max_growth_mb else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--interval-ms", type=float, default=10.0, help="virtual time between users")
+    parser.add_argument("--max-size", type=int, default=100_000, help="USER_MAP_MAX_SIZE")
+    parser.add_argument("--checkpoints", type=int, default=10)
+    parser.add_argument("--max-growth-mb", type=float, default=5.0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        return asyncio.run(
+            run(
+                args.users,
+                args.interval_ms,
+                args.max_size,
+                args.checkpoints,
+                args.max_growth_mb,
+                Path(tmp),
+            )
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Measure how much memory hosting several bots in one process saves.
+
+Usage:
+    python -m tools.multi_bot_memory --bots tarot,arisa
+
+Each bot in ``--bots`` is first started alone in its own subprocess, then all
+of them together in one process via ``EXTRA_BOTS``. A child builds the full
+runtime (settings, handlers, dispatcher, Bot objects, LLM client, character
+packs) the way prepare_runtime() does, but makes no network call, and reports
+its peak RSS. The report compares the sum of the single-bot processes with the
+combined one and prints the memory saved per extra bot.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _fake_token(index: int) -> str:
+    return f"{100000 + index}:MEMORY-REPORT-{index}"
+
+
+def _child() -> int:
+    import bot.main as bot_main
+    from bot.utils import telegram
+    from core.characters import get_character_loader
+
+    characters = [profile.character for profile in telegram.BOT_PROFILES if profile.character]
+    if characters:
+        get_character_loader().preload(characters)
+    bot_main.create_runtime()
+    # ru_maxrss is KiB on Linux.
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"bots": [profile.name for profile in telegram.BOT_PROFILES], "rss_kib": peak_kib}))
+    return 0
+
+
+def _measure(bots: list[str], workdir: Path) -> int:
+    env = dict(os.environ)
+    env.update(
+        {
+            "TELEGRAM_BOT_TOKEN": _fake_token(0),
+            "OPENAI_API_KEY": "sk-memory-report",
+            "CHARACTER": "" if bots[0] == "tarot" else bots[0],
+            "EXTRA_BOTS": ",".join(f"{name}={_fake_token(index)}" for index, name in enumerate(bots[1:], 1)),
+            "SQLITE_DB_PATH": str(workdir / "bot.db"),
+            "STATE_DB_PATH": str(workdir / "state.db"),
+            "BOT_RUNTIME": "polling",
+            "BOT_WORKERS": "1",
+            "BOT_METRICS_PORT": "0",
+            "TRACE_EXPORT": "",
+            "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH", "")])),
+        }
+    )
+    output = subprocess.run(
+        [sys.executable, "-m", "tools.multi_bot_memory", "--child"],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return int(json.loads(output.strip().splitlines()[-1])["rss_kib"])
+
+
+def run(bots: list[str]) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        singles: dict[str, int] = {}
+        for index, name in enumerate(bots):
+            workdir = Path(tmp) / f"single-{index}"
+            workdir.mkdir()
+            singles[name] = _measure([name], workdir)
+            print(f"{'single ' + name:<28}{singles[name] / 1024:>10.1f} MiB")
+        workdir = Path(tmp) / "combined"
+        workdir.mkdir()
+        combined = _measure(bots, workdir)
+    separate = sum(singles.values())
+    print(f"{'separate total':<28}{separate / 1024:>10.1f} MiB")
+    print(f"{'combined (' + '+'.join(bots) + ')':<28}{combined / 1024:>10.1f} MiB")
+    extra = max(1, len(bots) - 1)
+    saved = separate - combined
+    print(f"saved={saved / 1024:.1f} MiB total, {saved / extra / 1024:.1f} MiB per extra bot")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bots", default="tarot,arisa", help="comma-separated characters (tarot = no character)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return _child()
+    bots = [name.strip().lower() for name in args.bots.split(",") if name.strip()]
+    if len(bots) < 2:
+        parser.error("--bots needs at least two bots")
+    return run(bots)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
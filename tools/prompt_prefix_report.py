@@ -0,0 +1,144 @@
+"""
+Report the stable (cacheable) prompt prefix for every mode, language and spread.
+
+Usage:
+    python -m tools.prompt_prefix_report
+
+For each combination the script builds several sample requests that differ in
+their per-request inputs (question, cards, theme, next-step count, paid flags)
+and measures the longest prefix shared by all of them. Upstream prompt caching
+only applies to prompts whose shared prefix reaches ``CACHE_MIN_TOKENS``.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import sys
+from itertools import product
+from typing import Callable, Iterable
+
+from core.tokens import estimate_text_tokens
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:PREFIXREPORT")
+os.environ.setdefault("OPENAI_API_KEY", "prefix-report")
+
+CACHE_MIN_TOKENS = 1024
+LANGS = ("ja", "en", "pt")
+SAMPLE_QUESTIONS = {
+    "ja": ("彼の気持ちが知りたい", "転職すべきか迷っています", "今年の流れは？"),
+    "en": ("How does my crush feel?", "Should I change jobs?", "How will this year flow?"),
+    "pt": ("O que a pessoa amada sente?", "Devo trocar de emprego?", "Como será este ano?"),
+}
+
+
+def _serialize(messages: Iterable[dict[str, str]]) -> str:
+    return "".join(f"<|{msg['role']}|>{msg['content']}<|end|>" for msg in messages)
+
+
+def _measure(
+    builders: list[Callable[[], list[dict[str, str]]]], lang: str
+) -> tuple[int, int]:
+    serialized = [_serialize(build()) for build in builders]
+    prefix = os.path.commonprefix(serialized)
+    total = max(estimate_text_tokens(text, lang) for text in serialized)
+    return estimate_text_tokens(prefix, lang), total
+
+
+def _tarot_rows(tarot) -> list[tuple[str, str, str, int, int]]:
+    rows = []
+    spreads = (
+        tarot.ONE_CARD,
+        tarot.THREE_CARD_TIME_AXIS,
+        tarot.HEXAGRAM,
+        tarot.CELTIC_CROSS,
+    )
+    themes = ("love", "work", "life")
+    action_counts = (2, 3, 4)
+    for lang, spread in product(LANGS, spreads):
+        builders = []
+        for index, (theme, action_count) in enumerate(zip(themes, action_counts)):
+            rng = random.Random(index)
+            drawn = tarot.draw_cards(spread, rng=rng)
+            payload = [
+                {
+                    "id": item.position_id,
+                    "card": {
+                        "id": item.card.id,
+                        "name_ja": item.card.name_ja,
+                        "name_en": item.card.name_en,
+                        "orientation": "reversed" if item.is_reversed else "upright",
+                    },
+                }
+                for item in drawn
+            ]
+            question = SAMPLE_QUESTIONS[lang][index]
+            builders.append(
+                lambda payload=payload, question=question, theme=theme, action_count=action_count: (
+                    tarot.build_tarot_messages(
+                        spread=spread,
+                        user_query=question,
+                        drawn_cards=payload,
+                        theme=theme,
+                        action_count=action_count,
+                        lang=lang,
+                    )
+                )
+            )
+        prefix_tokens, total_tokens = _measure(builders, lang)
+        rows.append(("tarot", lang, spread.id, prefix_tokens, total_tokens))
+    return rows
+
+
+def _consult_rows(consult) -> list[tuple[str, str, str, int, int]]:
+    rows = []
+    for lang in LANGS:
+        builders = [
+            lambda question=question: consult.build_general_chat_messages(question, lang=lang)
+            for question in SAMPLE_QUESTIONS[lang]
+        ]
+        prefix_tokens, total_tokens = _measure(builders, lang)
+        rows.append(("consult", lang, "-", prefix_tokens, total_tokens))
+    return rows
+
+
+def _arisa_rows(arisa) -> list[tuple[str, str, str, int, int]]:
+    rows = []
+    previous = os.environ.get("CHARACTER")
+    os.environ["CHARACTER"] = "arisa"
+    try:
+        for lang in LANGS:
+            builders = [
+                lambda question=question, paid=paid, first=first: arisa.build_arisa_messages(
+                    question, lang=lang, paid=paid, first_paid_turn=first
+                )
+                for question, (paid, first) in zip(
+                    SAMPLE_QUESTIONS[lang], ((False, False), (True, True), (True, False))
+                )
+            ]
+            prefix_tokens, total_tokens = _measure(builders, lang)
+            rows.append(("arisa", lang, "-", prefix_tokens, total_tokens))
+    finally:
+        if previous is None:
+            os.environ.pop("CHARACTER", None)
+        else:
+            os.environ["CHARACTER"] = previous
+    return rows
+
+
+def main() -> int:
+    from bot.handlers import arisa, consult, tarot
+
+    rows = _tarot_rows(tarot) + _consult_rows(consult) + _arisa_rows(arisa)
+    print(f"{'mode':<8} {'lang':<4} {'spread':<22} {'prefix':>7} {'total':>7} {'ratio':>6}  cacheable")
+    for mode, lang, spread_id, prefix_tokens, total_tokens in rows:
+        ratio = prefix_tokens / total_tokens if total_tokens else 0.0
+        cacheable = "yes" if prefix_tokens >= CACHE_MIN_TOKENS else "no"
+        print(
+            f"{mode:<8} {lang:<4} {spread_id:<22} {prefix_tokens:>7} {total_tokens:>7} {ratio:>6.0%}  {cacheable}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Measure conversation-state get/set latency of core.state_store.StateStore.
+
+Usage:
+    python -m tools.state_store_bench --users 5000 --ops 50000
+
+Reports p50/p99 in microseconds for cached reads, cold reads (LRU miss that
+falls through to SQLite), writes (buffered), and the time of one write-behind
+flush, next to a plain dict as the in-memory baseline.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable
+
+from core.state_store import StateStore
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _time_ops(keys: list[str], op: Callable[[str], object]) -> list[float]:
+    samples = []
+    for key in keys:
+        started = time.perf_counter()
+        op(key)
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    samples.sort()
+    return samples
+
+
+def _report(label: str, samples: list[float]) -> None:
+    print(
+        f"{label:<14} n={len(samples):<7} "
+        f"p50={_percentile(samples, 0.50):8.1f}us p99={_percentile(samples, 0.99):8.1f}us"
+    )
+
+
+def run(users: int, ops: int, cache: int) -> int:
+    rng = random.Random(7)
+    record = {"mode": "tarot", "tarot_flow": "awaiting_question", "tarot_theme": "love"}
+    keys = [f"conv:{rng.randrange(users)}" for _ in range(ops)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "state.db"
+        store = StateStore(path, ttl=timedelta(minutes=40), max_entries=cache, max_pending=ops + users)
+        baseline: dict[str, dict] = {}
+
+        _report("dict set", _time_ops(keys, lambda key: baseline.__setitem__(key, record)))
+        _report("dict get", _time_ops(keys, baseline.get))
+        _report("store set", _time_ops(keys, lambda key: store.set(key, record)))
+        started = time.perf_counter()
+        flushed = store.flush()
+        print(f"{'flush':<14} rows={flushed:<6} {(time.perf_counter() - started) * 1000:8.1f}ms")
+        _report("store get", _time_ops(keys, store.get))
+
+        cold = StateStore(path, ttl=timedelta(minutes=40), max_entries=cache)
+        _report("cold get", _time_ops(keys[: min(len(keys), 2000)], cold.get))
+        stats = store.stats
+        print(f"cache: hits={stats.hits} misses={stats.misses} loads={stats.loads} evictions={stats.evictions}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--ops", type=int, default=50000)
+    parser.add_argument("--cache", type=int, default=10000, help="LRU size (STATE_CACHE_SIZE)")
+    args = parser.parse_args()
+    return run(args.users, args.ops, args.cache)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Post synthetic Telegram updates to the webhook endpoint and report latency.
+
+Usage:
+    BOT_RUNTIME=webhook TELEGRAM_WEBHOOK_SECRET=... uvicorn api.main:app --port 8080
+    python -m tools.webhook_load_test --url http://127.0.0.1:8080/webhooks/telegram/bot \
+        --total 2000 --concurrency 50 --users 500
+
+The endpoint only acknowledges and enqueues, so the numbers measure ingestion
+(secret check, parsing, queueing), not handler latency. Status 503 means the
+worker queue was full and Telegram would have redelivered the update.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+DEFAULT_URL = "http://127.0.0.1:8080/webhooks/telegram/bot"
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+SAMPLE_TEXTS = ("占って", "恋愛について相談したい", "/status", "仕事運を見て")
+
+
+def build_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load", "language_code": "ja"},
+            "text": SAMPLE_TEXTS[update_id % len(SAMPLE_TEXTS)],
+        },
+    }
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run(url: str, secret: str, total: int, concurrency: int, users: int) -> int:
+    latencies: list[float] = []
+    statuses: Counter[str] = Counter()
+    counter = iter(range(1, total + 1))
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        for update_id in counter:
+            payload = build_update(update_id, 10_000_000 + update_id % max(users, 1))
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json=payload, headers={SECRET_TOKEN_HEADER: secret})
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as exc:
+                statuses[type(exc).__name__] += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=10.0, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"updates:     {total} ({concurrency} concurrent, {users} users)")
+    print(f"elapsed:     {elapsed:.2f}s  ({total / elapsed if elapsed else 0:.0f} updates/s)")
+    print("statuses:    " + ", ".join(f"{key}={value}" for key, value in sorted(statuses.items())))
+    print(
+        "latency ms:  "
+        f"p50={_percentile(latencies, 0.50):.1f} "
+        f"p95={_percentile(latencies, 0.95):.1f} "
+        f"p99={_percentile(latencies, 0.99):.1f} "
+        f"max={latencies[-1] if latencies else 0:.1f}"
+    )
+    return 0 if statuses.get("200", 0) == total else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--secret", default=os.getenv("TELEGRAM_WEBHOOK_SECRET", ""))
+    parser.add_argument("--total", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+    if not args.secret:
+        print("TELEGRAM_WEBHOOK_SECRET (or --secret) is required", file=sys.stderr)
+        return 2
+    return asyncio.run(run(args.url, args.secret, args.total, args.concurrency, args.users))
+
+
+if __name__ == "__main__":
+    sys.exit(main())